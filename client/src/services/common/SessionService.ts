@@ -109,7 +109,17 @@ export class SessionService {
     }
 
     destroySession(): void {
+        let token = this.getToken();
         localStorage.removeItem(this._tokenKey);
+        if (token) {
+            // revoke the token on the server; there's nothing to do if that
+            // fails, because the token is gone from this client regardless
+            let headers = new Headers();
+            headers.append('Authorization', 'Bearer ' + token);
+            this.http
+                .delete(this._sessionUrl, {headers: headers})
+                .subscribe(() => {}, () => {});
+        }
     }
 
     /**
@@ -1,4 +1,5 @@
 import {Injectable} from '@angular/core';
+import {Headers} from '@angular/http';
 import {AuthHttp} from 'angular2-jwt';
 import {Observable} from 'rxjs/Observable';
 import {Subscription} from 'rxjs/Subscription';
@@ -6,9 +7,12 @@ import {BehaviorSubject} from 'rxjs/BehaviorSubject';
 
 import 'rxjs/add/observable/forkJoin';
 import 'rxjs/add/observable/of';
+import 'rxjs/add/observable/throw';
+import 'rxjs/add/observable/timer';
+import 'rxjs/add/operator/concat';
+import 'rxjs/add/operator/toArray';
 
 import {SSVState, SSVStateRequest, MainSpreadsheetStateRequest, RowStateRequest, Spreadsheet, Row, CategoricRow, NumericRow, FilterType, SortType, TimeToEventPvalue} from '../../models/knoweng/results/SpreadsheetVisualization';
-import {EveUtilities} from '../common/EveUtilities';
 import {LogService} from '../common/LogService';
 
 @Injectable()
@@ -16,10 +20,12 @@ export class SpreadsheetVisualizationService {
 
     private _jobSpreadsheetsUrl: string = '/api/v2/ssviz_jobs_spreadsheets';
     private _spreadsheetsUrl: string = '/api/v2/ssviz_spreadsheets';
-    private _rowDataUrl: string = '/api/v2/ssviz_feature_data';
+    private _rowValuesUrl: string = '/api/v2/ssviz_feature_values';
     private _rowVariancesUrl: string = '/api/v2/ssviz_feature_variances';
     private _rowCorrelationsUrl: string ='/api/v2/ssviz_feature_correlations';
     private _survivalAnalysesUrl: string = '/api/v2/ssviz_survival_analyses';
+    // how often to check on survival analyses that haven't finished
+    private _survivalPollIntervalMs: number = 1000;
     
     private _broadcast: BehaviorSubject<SSVState> = new BehaviorSubject<SSVState>(null);
 
@@ -470,24 +476,29 @@ export class SpreadsheetVisualizationService {
             nextChunkIndex = null;
         }
         let rowIdxsChunk: number[] = rowIdxs.slice(sliceStart, sliceEnd);
-        let url: string = this._rowDataUrl +
-            '?ssviz_spreadsheet_id=' + spreadsheet.spreadsheetId + '&feature_idx=' + rowIdxsChunk.join();
+        let url: string = this._rowValuesUrl +
+            '?ssviz_spreadsheet_id=' + spreadsheet.spreadsheetId + '&feature_idxs=' + rowIdxsChunk.join();
         rowIdxsChunk = undefined;
-        return EveUtilities
-            .getAllItems(url, this.authHttp)
-            .flatMap((rowData: any[]) => {
-                let itemStream: Observable<Row> = Observable.from(rowData.map((item: any) => {
-                    let returnVal: Row = null;
-                    let rowType = spreadsheet.rowTypes[item.feature_idx];
+        return this.authHttp
+            .get(url)
+            .flatMap(res => {
+                let rowValues: any = res.json();
+                let rows: Row[] = [];
+                rowValues.feature_idxs.forEach((featureIdx: number, i: number) => {
+                    let values: any[] = rowValues.values[i];
+                    if (values === null) {
+                        return;
+                    }
+                    let rowType = spreadsheet.rowTypes[featureIdx];
                     if (rowType == "categoric") {
-                        returnVal = new CategoricRow(item.values, item.feature_idx, spreadsheet);
+                        rows.push(new CategoricRow(values, featureIdx, spreadsheet));
                     } else if (rowType == "numeric") {
-                        returnVal = new NumericRow(item.values, item.feature_idx, spreadsheet);
+                        rows.push(new NumericRow(values, featureIdx, spreadsheet));
                     } else {
-                        returnVal = new Row(item.values, item.feature_idx, spreadsheet);
+                        rows.push(new Row(values, featureIdx, spreadsheet));
                     }
-                    return returnVal;
-                }));
+                });
+                let itemStream: Observable<Row> = Observable.from(rows);
                 if (nextChunkIndex !== null) {
                     itemStream = itemStream.concat(this.getRowDataChunks(spreadsheet, rowIdxs, chunkSize, nextChunkIndex));
                 }
@@ -523,46 +534,75 @@ export class SpreadsheetVisualizationService {
             !RowStateRequest.equal(lastStateRequest.timeToEventEventRowRequest, eventRR) ||
             !RowStateRequest.equal(lastStateRequest.timeToEventTimeRowRequest, timeRR) ||
             lastStateRequest.timeToEventEventValue != eventVal;
-        if (contextChanged) {
-            // fetch all
-            let pvalStreams = pvalRequests.map((req) => {
-                return this.getTimeToEventPval(timeRR, eventRR, eventVal, req);
-            });
-            return Observable.forkJoin(pvalStreams);
-        }
-        // context hasn't changed
-        // determine whether any of the pvalRequests changed
+        // if the context hasn't changed, reuse the pvals we already have
         // note we're only interested in additions, not removals--for one thing,
         // removals aren't possible with the current UI
-        let pvalStreams = pvalRequests.map((rsr) => {
-            // if we already have this value, return an Observable.of it
-            // otherwise, fetch the value from the server
-            let match = lastState.timeToEventPvals.find((pvalObj) => {
+        let knownPvals: TimeToEventPvalue[] = contextChanged ? [] : lastState.timeToEventPvals;
+        let findPval = (pvals: TimeToEventPvalue[], rsr: RowStateRequest) => {
+            return pvals.find((pvalObj) => {
                 return RowStateRequest.equal(rsr, pvalObj.request);
             });
-            if (match) {
-                return Observable.of(match);
-            }
-            return this.getTimeToEventPval(timeRR, eventRR, eventVal, rsr);
-        });
-        return Observable.forkJoin(pvalStreams);
+        };
+        let unknownRequests = pvalRequests.filter((rsr) => !findPval(knownPvals, rsr));
+        return this.getTimeToEventPvalBatch(timeRR, eventRR, eventVal, unknownRequests)
+            .map((fetchedPvals: TimeToEventPvalue[]) => {
+                let allPvals = knownPvals.concat(fetchedPvals);
+                return pvalRequests.map((rsr) => findPval(allPvals, rsr));
+            });
     }
 
-    private getTimeToEventPval(
+    /**
+     * Submits survival analyses of several grouping rows against the same
+     * time and event rows, which the server runs as one batch, and polls until
+     * they've all finished.
+     */
+    private getTimeToEventPvalBatch(
         timeRR: RowStateRequest, eventRR: RowStateRequest, eventVal: string,
-        analysisRR: RowStateRequest): Observable<TimeToEventPvalue> {
-        let url = this._survivalAnalysesUrl +
-            "?duration_spreadsheet_id=" + timeRR.spreadsheetId +
-            "&duration_feature_idx=" + timeRR.rowIdx +
-            "&grouping_spreadsheet_id=" + analysisRR.spreadsheetId +
-            "&grouping_feature_idx=" + analysisRR.rowIdx +
-            "&event_spreadsheet_id=" + eventRR.spreadsheetId +
-            "&event_feature_idx=" + eventRR.rowIdx +
-            "&event_val=" + eventVal;
+        analysisRRs: RowStateRequest[]): Observable<TimeToEventPvalue[]> {
+        if (analysisRRs.length == 0) {
+            return Observable.of([]);
+        }
+        let body = {
+            duration_spreadsheet_id: timeRR.spreadsheetId,
+            duration_feature_idx: timeRR.rowIdx,
+            event_spreadsheet_id: eventRR.spreadsheetId,
+            event_feature_idx: eventRR.rowIdx,
+            event_val: eventVal,
+            groupings: analysisRRs.map((rr) => {
+                return {spreadsheet_id: rr.spreadsheetId, feature_idx: rr.rowIdx};
+            })
+        };
+        let headers = new Headers({'Content-Type': 'application/json'});
         return this.authHttp
-            .get(url)
-            .map(res => {
-                return {request: analysisRR, pval: res.json().pval}
+            .post(this._survivalAnalysesUrl, JSON.stringify(body), {headers: headers})
+            .flatMap(res => this.pollTimeToEventResults(res.json().results))
+            .map((results: any[]) => {
+                return results.map((result: any, i: number) => {
+                    return {request: analysisRRs[i], pval: result.pval};
+                });
             });
     }
+
+    /**
+     * Given the server's results for some survival analyses, returns an
+     * Observable of the results once they've all finished.
+     */
+    private pollTimeToEventResults(results: any[]): Observable<any[]> {
+        if (results.every((result) => result.status == 'finished')) {
+            return Observable.of(results);
+        }
+        if (results.some((result) => result.status == 'failed')) {
+            return Observable.throw('Survival analysis failed');
+        }
+        return Observable.timer(this._survivalPollIntervalMs)
+            .flatMap(() => Observable.forkJoin(results.map((result) => {
+                if (result.status == 'finished') {
+                    return Observable.of(result);
+                }
+                return this.authHttp
+                    .get(this._survivalAnalysesUrl + '?handle=' + result.handle)
+                    .map(res => res.json());
+            })))
+            .flatMap((updatedResults: any[]) => this.pollTimeToEventResults(updatedResults));
+    }
 }
@@ -1,8 +1,10 @@
 import itertools
 import json
 import math
+import numpy as np
 from nest_py.core.data_types.tablelike_entry import TablelikeEntry
 from nest_py.core.data_types.nest_id import NestId
+import nest_py.core.data_types.typed_array as typed_array
 from nest_py.core.db.sqla_transcoder import SqlaJsonTranscoder
 from nest_py.core.api_clients.api_transcoder import ApiJsonTranscoder
 from nest_py.core.data_types.base_mixins import BasicPopoMixin
@@ -146,6 +148,23 @@ class TablelikeSchema(SqlaJsonTranscoder, ApiJsonTranscoder, BasicPopoMixin):
         self.attributes.append(att)
         return
 
+    def add_typed_array_attribute(\
+            self, att_name, float_encoding='float64', compress=False):
+        """
+        An attribute that is a list of numbers or of categories (e.g.
+        strings), where None means a missing value. It's stored in the
+        database as bytea in a compact binary encoding (see typed_array),
+        instead of as a json string, but over the API it looks like a
+        plain json list.
+        float_encoding is 'float32' or 'float64', and is used for lists of
+            numbers that aren't all integers. float32 halves the size, at
+            the cost of precision
+        compress is whether to zlib compress the stored bytes
+        """
+        att = TypedArrayAttribute(att_name, float_encoding, compress)
+        self.attributes.append(att)
+        return
+
     def add_index(self, list_of_attribute_names):
         """
         each call to this method adds a db index based on the fields that are
@@ -272,6 +291,8 @@ class TablelikeSchema(SqlaJsonTranscoder, ApiJsonTranscoder, BasicPopoMixin):
             att = ForeignIdListAttribute.from_jdata(att_jdata)
         elif 'IntList' == att_type:
             att = IntListAttribute.from_jdata(att_jdata)
+        elif 'TypedArray' == att_type:
+            att = TypedArrayAttribute.from_jdata(att_jdata)
         else:
              raise Exception("Problem making a column for attribute '" +
                  str(att_jdata['name']) + "' of unrecognized type: '" + 
@@ -846,6 +867,93 @@ class JsonBAttribute(BasicPopoMixin):
         return example_val
 
 
+class TypedArrayAttribute(BasicPopoMixin):
+
+    def __init__(self, attribute_name, float_encoding, compress):
+        self.name = attribute_name
+        self.float_encoding = float_encoding
+        self.compress = compress
+        return
+
+    def get_name(self):
+        return self.name
+
+    def get_type(self):
+        return 'TypedArray'
+
+    def to_jdata(self):
+        jd = dict()
+        jd['type'] = self.get_type()
+        jd['name'] = self.name
+        jd['float_encoding'] = self.float_encoding
+        jd['compress'] = self.compress
+        return jd
+
+    @staticmethod
+    def from_jdata(jd):
+        att = TypedArrayAttribute(jd['name'], jd['float_encoding'],
+            jd['compress'])
+        return att
+
+    def encode(self, val):
+        """
+        encodes a list (or numpy array) of values into the bytes stored in
+        the database
+        """
+        blob = typed_array.encode(val, float_encoding=self.float_encoding,
+            compress=self.compress)
+        return blob
+
+    def extract_jdata_from_entry(self, tablelike_entry):
+        """
+        returns the value as a list, with None for missing values
+        """
+        val = tablelike_entry.get_value(self.name)
+        if val is None:
+            jdata = None
+        elif isinstance(val, np.ndarray):
+            #round trip so NaNs become None and numpy scalars json types
+            jdata = typed_array.decode_to_list(self.encode(val))
+        else:
+            jdata = list(val)
+        return jdata
+
+    def extract_flat_jdata_from_entry(self, tablelike_entry):
+        """
+        returns the encoded bytes for a bytea column
+        """
+        val = tablelike_entry.get_value(self.name)
+        if val is None:
+            blob = None
+        else:
+            blob = self.encode(val)
+        return blob
+
+    def set_entry_value_from_flat_jdata(self, jdata, tablelike_entry):
+        blob = jdata[self.name]
+        if blob is None:
+            val = None
+        else:
+            val = typed_array.decode_to_list(blob)
+        tablelike_entry.set_value(self.name, val)
+        return
+
+    def set_entry_value_from_jdata(self, jdata, tablelike_entry):
+        """
+        extracts this attribute from a jdata representation
+        and populates the input tablelike_entry's field with
+        the value (in place).
+
+        returns None
+        """
+        val = jdata[self.name]
+        tablelike_entry.set_value(self.name, val)
+        return
+
+    def generate_example_value(self):
+        example_val = [1.5, None, 2.25]
+        return example_val
+
 class BooleanAttribute(BasicPopoMixin):
 
     def __init__(self, attribute_name):
@@ -0,0 +1,195 @@
+"""
+Encodes a list of values into compact bytes for a TypedArrayAttribute,
+and decodes them again.
+
+The bytes start with a fixed header: the encoding, a compression flag and
+the number of values. The encoding is picked from the values:
+
+ - 'int8' through 'int64': numbers that are all integers, with no missing
+    values, using the smallest type that fits them all
+ - 'float32' or 'float64': any other numbers. missing values (None) are
+    stored as NaN
+ - 'categoric': anything else (e.g. strings). the distinct values are
+    stored once, as a json list, followed by an array of codes into that
+    list, with -1 for a missing value. the codes use the smallest int type
+    that fits the number of categories
+
+If compression is requested, the part after the header is zlib
+compressed, but only when that makes it smaller.
+"""
+import json
+import struct
+import zlib
+from numbers import Integral, Number
+
+import numpy as np
+
+#the order is part of the format: the header stores the index
+ENCODINGS = ['float32', 'float64', 'int8', 'int16', 'int32', 'int64',
+    'categoric']
+INT_ENCODINGS = ['int8', 'int16', 'int32', 'int64']
+FLOAT_ENCODINGS = ['float32', 'float64']
+
+#encoding index, is_compressed, number of values
+_HEADER = struct.Struct('<BBI')
+#int encoding index of the codes, number of bytes of the categories json
+_CATEGORIC_HEADER = struct.Struct('<BI')
+
+#zlib level 1 gets most of the size reduction of higher levels on
+#numeric arrays at a fraction of the cpu
+_ZLIB_LEVEL = 1
+
+def encode(values, float_encoding='float64', compress=False):
+    """
+    values (list or numpy array): the values to encode. None means a
+        missing value
+    float_encoding (str): 'float32' or 'float64', the encoding for
+        values that are not all integers
+    compress (bool): whether to zlib compress the encoded values
+
+    returns the bytes (str)
+    """
+    if not float_encoding in FLOAT_ENCODINGS:
+        raise ValueError('Unsupported float encoding: ' + str(float_encoding))
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iuf':
+        encoding, body = _encode_numeric_array(values, float_encoding)
+    else:
+        values = list(values)
+        if _is_all_numbers(values):
+            encoding, body = _encode_numeric_list(values, float_encoding)
+        else:
+            encoding, body = 'categoric', _encode_categoric(values)
+    is_compressed = 0
+    if compress:
+        compressed_body = zlib.compress(body, _ZLIB_LEVEL)
+        if len(compressed_body) < len(body):
+            body = compressed_body
+            is_compressed = 1
+    header = _HEADER.pack(ENCODINGS.index(encoding), is_compressed,
+        len(values))
+    return header + body
+
+def decode(blob):
+    """
+    blob (str, buffer, or memoryview): bytes from encode(), e.g. as read
+        from a bytea column
+
+    returns a numpy array. numeric encodings give an int or float array
+    (NaN for missing values). the categoric encoding gives an object array
+    of the original values (None for missing values)
+    """
+    blob = bytes(blob)
+    encoding_idx, is_compressed, num_values = _HEADER.unpack_from(blob)
+    encoding = ENCODINGS[encoding_idx]
+    body = blob[_HEADER.size:]
+    if is_compressed:
+        body = zlib.decompress(body)
+    if encoding == 'categoric':
+        codes_idx, categories_len = _CATEGORIC_HEADER.unpack_from(body)
+        start = _CATEGORIC_HEADER.size
+        categories = json.loads(body[start:start + categories_len])
+        codes = np.frombuffer(body, dtype=np.dtype(INT_ENCODINGS[codes_idx]),
+            count=num_values, offset=start + categories_len)
+        #append None, so a code of -1 picks it
+        lookup = np.empty(len(categories) + 1, dtype=object)
+        lookup[:-1] = categories
+        lookup[-1] = None
+        arr = lookup[codes]
+    else:
+        #little-endian on disk, native in memory
+        arr = np.frombuffer(body, dtype=np.dtype(encoding).newbyteorder('<'),
+            count=num_values).astype(np.dtype(encoding))
+    return arr
+
+def decode_to_list(blob):
+    """
+    decodes to a python list, as a json list would be parsed: ints for
+    integer encodings, floats for float encodings, and None for every
+    missing value
+    """
+    return to_list(decode(blob))
+
+def to_list(arr):
+    """
+    converts an array from decode(), or a subset of one, to a python list
+    as decode_to_list does
+    """
+    if arr.dtype.kind == 'f':
+        lst = arr.tolist()
+        for idx in np.flatnonzero(np.isnan(arr)):
+            lst[idx] = None
+    else:
+        lst = arr.tolist()
+    return lst
+
+def get_encoding(blob):
+    """
+    returns the name of the encoding of the bytes from encode(), without
+    decoding the values
+    """
+    encoding_idx = _HEADER.unpack_from(bytes(blob[:_HEADER.size]))[0]
+    return ENCODINGS[encoding_idx]
+
+def _is_all_numbers(values):
+    """
+    true if every value is a number (but not a bool) or None
+    """
+    for val in values:
+        if val is None:
+            continue
+        if isinstance(val, bool) or not isinstance(val, Number):
+            return False
+    return True
+
+def _encode_numeric_list(values, float_encoding):
+    is_ints = len(values) > 0
+    for val in values:
+        if val is None or not isinstance(val, Integral):
+            is_ints = False
+            break
+    if is_ints:
+        arr = np.array(values, dtype=np.int64)
+    else:
+        arr = np.array([np.nan if val is None else val for val in values],
+            dtype=np.float64)
+    return _encode_numeric_array(arr, float_encoding)
+
+def _encode_numeric_array(arr, float_encoding):
+    if arr.dtype.kind in 'iu' and len(arr) > 0:
+        encoding = _smallest_int_encoding(arr.min(), arr.max())
+    else:
+        encoding = float_encoding
+    body = arr.astype(np.dtype(encoding).newbyteorder('<')).tostring()
+    return encoding, body
+
+def _encode_categoric(values):
+    categories = list()
+    codes_by_value = dict()
+    codes = np.empty(len(values), dtype=np.int64)
+    for idx, val in enumerate(values):
+        if isinstance(val, np.generic):
+            val = val.item()
+        if val is None or (isinstance(val, float) and np.isnan(val)):
+            codes[idx] = -1
+        else:
+            #a dict key alone can't tell 1 from 1.0 (or True)
+            key = (type(val), val)
+            code = codes_by_value.get(key)
+            if code is None:
+                code = len(categories)
+                codes_by_value[key] = code
+                categories.append(val)
+            codes[idx] = code
+    codes_encoding = _smallest_int_encoding(-1, len(categories))
+    categories_json = json.dumps(categories)
+    body = _CATEGORIC_HEADER.pack(INT_ENCODINGS.index(codes_encoding),
+        len(categories_json)) + categories_json + \
+        codes.astype(np.dtype(codes_encoding).newbyteorder('<')).tostring()
+    return body
+
+def _smallest_int_encoding(min_val, max_val):
+    for encoding in INT_ENCODINGS:
+        info = np.iinfo(np.dtype(encoding))
+        if info.min <= min_val and max_val <= info.max:
+            return encoding
+    raise ValueError('Integers too large to encode: ' + str(max_val))
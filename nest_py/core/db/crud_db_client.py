@@ -1,9 +1,12 @@
+import collections
 import traceback
 import math
-from sqlalchemy.sql import select, update, delete
+import threading
+from sqlalchemy.sql import select, update, delete, func
 from nest_py.core.data_types.nest_id import NestId
 from nest_py.core.db.security_policy import SecurityException
 from nest_py.core.db.security_policy import SecurityPolicy
+import nest_py.core.db.tablelike_copy as tablelike_copy
 
 class CrudDbClient(object):
     """
@@ -50,7 +53,23 @@ class CrudDbClient(object):
         return
 
     def _db_connection(self):
-        return self.sqla_engine.connect()
+        """
+        returns the connection of the SharedTransaction that is open
+        for this client's engine on the current thread, if any. Otherwise
+        checks out a new connection from the engine's pool. Either way,
+        callers should close() it when they are done.
+        """
+        db_conn = get_shared_connection(self.sqla_engine)
+        if db_conn is None:
+            db_conn = self.sqla_engine.connect()
+        return db_conn
+
+    def shared_transaction(self):
+        """
+        returns a SharedTransaction over this client's engine, for use
+        in a 'with' statement
+        """
+        return SharedTransaction(self.sqla_engine)
 
     def get_collection_name(self):
         return self.sqla_table.name
@@ -140,29 +159,97 @@ class CrudDbClient(object):
         return dto
     
     def bulk_create_entries(self, dto_lst, user=None, batch_size=100):
+        """
+        creates all the dtos in dto_lst and returns them with their
+        generated NestIds set, in the same order as dto_lst.
+
+        All batches are written in a single transaction. Against postgres,
+        each batch is one multi-row 'INSERT ... RETURNING id' statement, so
+        the number of round trips is len(dto_lst)/batch_size instead of
+        len(dto_lst). If any batch fails the whole transaction is rolled
+        back, no dto has a NestId assigned, and None is returned.
+        """
         if user is None:
             user = self.requesting_user
         if not self.security_policy.can_write_entries(user):
             raise SecurityException('User not allowed to write')
-        createds = list()
-        for dto in dto_lst:
-            c = self.create_entry(dto, user=user)
-            if c is None:
-                createds = None
-                break
-            else:
-                createds.append(c)
+        dto_batches = self._split_to_batches(dto_lst, batch_size)
+        use_returning = self._supports_multirow_returning()
+        db_conn = self._db_connection()
+        trans = db_conn.begin()
+        try:
+            generated_ids = list()
+            for dto_batch in dto_batches:
+                sqla_vals_batch = \
+                    [self._object_to_sqla_values(dto, user) for dto in dto_batch]
+                if use_returning:
+                    batch_ids = self._insert_batch_returning_ids(db_conn,
+                        sqla_vals_batch)
+                else:
+                    batch_ids = list()
+                    stmt = self.sqla_table.insert()
+                    for sqla_vals in sqla_vals_batch:
+                        db_res = db_conn.execute(stmt, sqla_vals)
+                        batch_ids.append(db_res.inserted_primary_key[0])
+                generated_ids.extend(batch_ids)
+            trans.commit()
+            db_conn.close()
+            for dto, generated_id in zip(dto_lst, generated_ids):
+                dto.set_nest_id(NestId(generated_id))
+            createds = list(dto_lst)
+        except Exception as e:
+            trans.rollback()
+            db_conn.close()
+            traceback.print_exc()
+            log("bulk_create_entries error from sqlalchemy, rolled back")
+            log("Exception: " + str(e))
+            createds = None
         return createds
 
+    def _supports_multirow_returning(self):
+        """
+        True if the database can run a multi-row INSERT with a RETURNING
+        clause, which gives back the generated ids in the order of the
+        VALUES list.
+        """
+        return self.sqla_engine.dialect.name == 'postgresql'
+
+    def _insert_batch_returning_ids(self, db_conn, sqla_vals_batch):
+        """
+        inserts a list of sqla 'values' dicts with multi-row INSERT
+        statements and returns the generated ids in the same order.
+        All rows of a multi-row INSERT must have the same keys, so the rows
+        are grouped by the columns they set and each group is one
+        statement. Columns a row leaves out are left out of its statement,
+        rather than set to NULL, so they still get their server defaults.
+        """
+        idxs_by_keys = collections.OrderedDict()
+        for idx, sqla_vals in enumerate(sqla_vals_batch):
+            keys = frozenset(sqla_vals.keys())
+            idxs_by_keys.setdefault(keys, list()).append(idx)
+        tbl = self.sqla_table
+        generated_ids = [None] * len(sqla_vals_batch)
+        for idxs in idxs_by_keys.values():
+            rows = [sqla_vals_batch[idx] for idx in idxs]
+            stmt = tbl.insert().values(rows).returning(tbl.c.id)
+            db_res = db_conn.execute(stmt)
+            group_ids = [row_res[0] for row_res in db_res.fetchall()]
+            if len(group_ids) != len(rows):
+                raise Exception('INSERT ... RETURNING gave back ' +
+                    str(len(group_ids)) + ' ids for ' + str(len(rows)) +
+                    ' rows')
+            for idx, generated_id in zip(idxs, group_ids):
+                generated_ids[idx] = generated_id
+        return generated_ids
+
     def bulk_create_entries_async(self, dto_lst, user=None, batch_size=100):
         """
         uploads entries in batches. only returns the number that
-        was uploaded. 
-        
-        TODO: currently can't return the dto's with
-        the generated primary_keys like we would want b/c of this
-        issue:
-        https://bitbucket.org/zzzeek/sqlalchemy/issues/2613/batch-insert-with-returning-specified-is
+        was uploaded. This is the cheapest way to upload when the
+        generated ids aren't needed (use bulk_create_entries if they are).
+
+        All batches are written in a single transaction, so if
+        any batch fails nothing is written and None is returned.
         """
         if user is None:
             user = self.requesting_user
@@ -172,6 +259,7 @@ class CrudDbClient(object):
         total_count = len(dto_lst)
         num_done = 0
         db_conn = self._db_connection()
+        trans = db_conn.begin()
         try:
             for dto_batch in dto_batches:
                 sqla_vals_batch = \
@@ -183,13 +271,73 @@ class CrudDbClient(object):
                 num_done += len(sqla_vals_batch)
                 log('batch uploaded entries: ' + str(num_done) + '/' + 
                     str(total_count))
+            trans.commit()
+            db_conn.close()
+        except Exception as e:
+            trans.rollback()
+            db_conn.close()
+            traceback.print_exc()
+            log("bulk_create_entries_async error from sqlalchemy, rolled back")
+            log("Exception: " + str(e))
+            num_done = None
+        return num_done
+
+    def bulk_copy_rows(self, rows, columns=None, user=None):
+        """
+        streams rows into this client's table with postgres'
+        'COPY ... FROM STDIN', which is much faster than INSERTs for
+        large uploads. Only works for clients whose transcoder is a
+        TablelikeSchema, as the schema's attribute types determine how
+        each value is encoded. No dtos are built, so no ids are
+        returned.
+
+        rows: either a pandas.DataFrame whose column names are attribute
+            names of the schema, or an iterable (e.g. a generator) of
+            sequences of values in the order given by 'columns'. Values
+            are the same types that would be put in a TablelikeEntry.
+        columns (list of str): the attribute names of the values in each
+            row. Not needed if rows is a DataFrame.
+
+        returns the number of rows written. The copy happens in a single
+        transaction, so on failure nothing is written and None is
+        returned.
+        """
+        if user is None:
+            user = self.requesting_user
+        if user is None:
+            raise SecurityException("Can't save data with no owner")
+        if not self.security_policy.can_write_entries(user):
+            raise SecurityException('User not allowed to write')
+        if columns is None:
+            columns = [str(c) for c in rows.columns]
+            rows = rows.itertuples(index=False)
+        self._validate_fields_for_table(columns)
+        formatters = tablelike_copy.make_copy_formatters(self.transcoder,
+            columns)
+        owner_id_txt = str(user.get_nest_id().get_value())
+        line_stream = tablelike_copy.CopyLineStream(rows, formatters,
+            leading_values=[owner_id_txt])
+
+        quote = self.sqla_engine.dialect.identifier_preparer.quote_identifier
+        col_names = [quote('owner_id')] + [quote(c) for c in columns]
+        copy_sql = 'COPY ' + quote(self.sqla_table.name) + \
+            ' (' + ', '.join(col_names) + ') FROM STDIN'
+
+        db_conn = self._db_connection()
+        trans = db_conn.begin()
+        try:
+            cursor = db_conn.connection.cursor()
+            cursor.copy_expert(copy_sql, line_stream)
+            cursor.close()
+            trans.commit()
             db_conn.close()
+            num_done = line_stream.get_num_rows()
+            log('copied entries: ' + str(num_done))
         except Exception as e:
+            trans.rollback()
             db_conn.close()
-            #TODO: make the bulk writes in a single transaction
-            #and roll it back if there is an error part way through
             traceback.print_exc()
-            log("bulk_create_entries error from sqlalchemy")
+            log("bulk_copy_rows error, rolled back")
             log("Exception: " + str(e))
             num_done = None
         return num_done
@@ -201,29 +349,39 @@ class CrudDbClient(object):
         """
         if user is None:
             user = self.requesting_user
-        nid = nest_id.get_value()
-        tbl = self.sqla_table
-        stmt = select([tbl]).where(tbl.c['id'] == nid)
         db_conn = self._db_connection()
         try:
-            res = db_conn.execute(stmt).fetchone()
-            #log('read entry: ' + str(res))
-            if res is None:
-                dto = None
-            else:
-                dto = self._sqla_values_to_object(res, user)
+            dto = self._read_entry_on_connection(db_conn, nest_id, user)
             db_conn.close()
         except Exception as e:
             dto = None
             db_conn.close()
         return dto
 
+    def _read_entry_on_connection(self, db_conn, nest_id, user):
+        nid = nest_id.get_value()
+        tbl = self.sqla_table
+        stmt = select([tbl]).where(tbl.c['id'] == nid)
+        res = db_conn.execute(stmt).fetchone()
+        #log('read entry: ' + str(res))
+        if res is None:
+            dto = None
+        else:
+            dto = self._sqla_values_to_object(res, user)
+        return dto
+
     def paged_filter_query(self, filter_params, user=None, 
         results_per_page=100, page_num=1, fields=None, sort_fields=None):
         """
-        TODO: Hopefully this can be much more efficient, but needing
-        to get the total number of possible results makes it
-        not straightforward.
+        same filtering, projection and sorting as simple_filter_query, but
+        only fetches a single page of results from the database. The
+        page is selected with LIMIT/OFFSET in the query itself, and the
+        'total_available' count comes from a separate COUNT(*) query
+        over the same filters, so the work done per request depends on
+        results_per_page and not on the size of the table.
+
+        returns a dict with keys 'items', 'total_available', 'num_items',
+        'last_page', and 'page'
         """
         if user is None:
             user = self.requesting_user
@@ -231,28 +389,42 @@ class CrudDbClient(object):
             results_per_page = 100
         if page_num is None:
             page_num = 1
+        offset = (page_num - 1) * results_per_page
+
+        db_conn = self._db_connection()
+        try:
+            where_clauses = self._filter_where_clauses(filter_params, user)
+
+            count_stmt = select([func.count()]).select_from(self.sqla_table)
+            for clause in where_clauses:
+                count_stmt = count_stmt.where(clause)
+            total_available = db_conn.execute(count_stmt).scalar()
 
-        found_dtos = self.simple_filter_query(filter_params, 
-            user=user, fields=fields, sort_fields=sort_fields)
-        if found_dtos is None:
-            res = None
-        else:
-            res = dict()
             page_dtos = list()
-            offset = (page_num - 1) * results_per_page 
-            end = offset + results_per_page
-            if end > len(found_dtos):
-                end = len(found_dtos)
-            for i in range(offset, end):
-                page_dtos.append(found_dtos[i])
-            res['items'] = page_dtos
-            total_available = len(found_dtos)
-            num_items = len(page_dtos)
-            last_page = int(math.ceil(float(total_available) / float(results_per_page)))
-            res['total_available'] = total_available
-            res['num_items'] = num_items
-            res['last_page'] = last_page
-            res['page'] = page_num
+            if offset < total_available:
+                stmt = self._filter_select_stmt(where_clauses, fields,
+                    sort_fields)
+                stmt = stmt.limit(results_per_page).offset(offset)
+                res = db_conn.execute(stmt).fetchall()
+                for sqla_row in res:
+                    dto = self._sqla_values_to_object(sqla_row, user,
+                        fields=fields)
+                    page_dtos.append(dto)
+            db_conn.close()
+        except Exception as e:
+            db_conn.close()
+            log('Error in paged_filter_query: ' + str(e))
+            traceback.print_exc()
+            raise e
+
+        res = dict()
+        res['items'] = page_dtos
+        num_items = len(page_dtos)
+        last_page = int(math.ceil(float(total_available) / float(results_per_page)))
+        res['total_available'] = total_available
+        res['num_items'] = num_items
+        res['last_page'] = last_page
+        res['page'] = page_num
         return res
         
     def simple_filter_query(self, filter_params, user=None, fields=None,
@@ -275,49 +447,10 @@ class CrudDbClient(object):
         if user is None:
             user = self.requesting_user
         #log('crud_db_client.simple_filter_query using user: ' + str(user.get_username()) + ' : ' + str(user.get_nest_id()))
-        tbl = self.sqla_table
         db_conn = self._db_connection()
         try:
-            #only return requested fields, or all columns in 
-            #table if returning whole objects
-            if fields is None:
-                stmt = select([tbl])
-            else:
-                self._validate_fields_for_table(fields)
-                stmt = select([tbl.c.id, tbl.c.owner_id]) #always include the primary key
-                for fieldname in fields:
-                    #print('adding projection field: ' + str(fieldname))
-                    stmt = stmt.column(tbl.c[fieldname])
-
-            #only give users back data they created if can't read all
-            if not self.security_policy.can_read_all_entries(user):
-                owner_id = user.get_nest_id().get_value()
-                stmt = stmt.where(tbl.c.owner_id == owner_id)
-
-            filter_params = self._nest_ids_to_ints(filter_params)
-            #apply matching filters using 'where' clauses
-            self._validate_fields_for_table(filter_params.keys())
-            for k in filter_params:
-                #if a list was given for the field's value in the filter, an entry
-                #whose value is any value in that list will match
-                #print('filter param [' + str(k) + '] is : ' + str(filter_params[k]))
-                col_type = self.sqla_table.c[k].type
-                if str(col_type) == 'JSONB':
-                    stmt = stmt.where(tbl.c[k].contains(filter_params[k]))
-                else:
-                    if isinstance(filter_params[k], list):
-                        stmt = stmt.where(tbl.c[k].in_(filter_params[k]))
-                    else:
-                        stmt = stmt.where(tbl.c[k] == filter_params[k])
-
-            #apply requested sort order
-            if sort_fields is not None:
-                self._validate_fields_for_table(sort_fields)
-                for fieldname in sort_fields:
-                    stmt = stmt.order_by(tbl.c[fieldname])
-            #always sort by _id as the final criteria
-            stmt = stmt.order_by(tbl.c['id'])
-
+            where_clauses = self._filter_where_clauses(filter_params, user)
+            stmt = self._filter_select_stmt(where_clauses, fields, sort_fields)
             #print('final query: ' + str(stmt))
             res = db_conn.execute(stmt).fetchall()
             found_dtos = list()
@@ -334,6 +467,68 @@ class CrudDbClient(object):
             #found_dtos = None
         return found_dtos
 
+    def _filter_where_clauses(self, filter_params, user):
+        """
+        builds the list of sqla 'where' clauses that implement the
+        filter_params of simple_filter_query, plus the clause that
+        restricts the results to the user's own entries if the
+        security_policy says they can't read everyone's.
+        """
+        tbl = self.sqla_table
+        clauses = list()
+
+        #only give users back data they created if can't read all
+        if not self.security_policy.can_read_all_entries(user):
+            owner_id = user.get_nest_id().get_value()
+            clauses.append(tbl.c.owner_id == owner_id)
+
+        filter_params = self._nest_ids_to_ints(filter_params)
+        #apply matching filters using 'where' clauses
+        self._validate_fields_for_table(filter_params.keys())
+        for k in filter_params:
+            #if a list was given for the field's value in the filter, an entry
+            #whose value is any value in that list will match
+            #print('filter param [' + str(k) + '] is : ' + str(filter_params[k]))
+            col_type = self.sqla_table.c[k].type
+            if str(col_type) == 'JSONB':
+                clauses.append(tbl.c[k].contains(filter_params[k]))
+            else:
+                if isinstance(filter_params[k], list):
+                    clauses.append(tbl.c[k].in_(filter_params[k]))
+                else:
+                    clauses.append(tbl.c[k] == filter_params[k])
+        return clauses
+
+    def _filter_select_stmt(self, where_clauses, fields, sort_fields):
+        """
+        builds the 'select' statement for a filter query, with the
+        projection given by 'fields' and the ordering given by
+        'sort_fields' (see simple_filter_query)
+        """
+        tbl = self.sqla_table
+        #only return requested fields, or all columns in 
+        #table if returning whole objects
+        if fields is None:
+            stmt = select([tbl])
+        else:
+            self._validate_fields_for_table(fields)
+            stmt = select([tbl.c.id, tbl.c.owner_id]) #always include the primary key
+            for fieldname in fields:
+                #print('adding projection field: ' + str(fieldname))
+                stmt = stmt.column(tbl.c[fieldname])
+
+        for clause in where_clauses:
+            stmt = stmt.where(clause)
+
+        #apply requested sort order
+        if sort_fields is not None:
+            self._validate_fields_for_table(sort_fields)
+            for fieldname in sort_fields:
+                stmt = stmt.order_by(tbl.c[fieldname])
+        #always sort by _id as the final criteria
+        stmt = stmt.order_by(tbl.c['id'])
+        return stmt
+
     def _validate_fields_for_table(self, fields):
         """
         validates that the given list of fields all map to columns
@@ -394,8 +589,9 @@ class CrudDbClient(object):
             tbl = self.sqla_table
             stmt = update(tbl).where(tbl.c.id == id_val).values(**jdata)
             db_conn.execute(stmt)
+            updated_dto = self._read_entry_on_connection(db_conn,
+                NestId(id_val), user)
             db_conn.close()
-            updated_dto = self.read_entry(NestId(id_val), user=user)
         except Exception as e:
             db_conn.close()
             traceback.print_exc()
@@ -471,5 +667,139 @@ class CrudDbClient(object):
     def get_sqla_connection(self):
         return self._db_connection()
 
+#engine -> _SharedConnection, for the SharedTransactions open on each thread
+_SHARED_CONNECTIONS = threading.local()
+
+def get_shared_connection(sqla_engine):
+    """
+    returns the connection of the SharedTransaction that is open for
+    sqla_engine on the current thread, or None if there isn't one
+    """
+    shared_conns = getattr(_SHARED_CONNECTIONS, 'by_engine', None)
+    if shared_conns is None:
+        db_conn = None
+    else:
+        db_conn = shared_conns.get(sqla_engine, None)
+    return db_conn
+
+class SharedTransaction(object):
+    """
+    Context manager that makes every CrudDbClient using the given
+    sqla_engine run its operations on a single connection, in a single
+    transaction, for the duration of a 'with' block on the current thread.
+    That saves a pool checkout and a commit per operation, and makes
+    the whole block atomic:
+
+        with SharedTransaction(engine):
+            spreadsheet_client.create_entry(tle)
+            feature_data_client.bulk_copy_rows(rows, columns=cols)
+
+    The transaction is committed when the block exits normally and rolled
+    back if the block raises, or if set_rollback_only() was called. The
+    CrudDbClient methods report most failures by returning None instead
+    of raising, so if any statement failed inside the block the
+    transaction is also rolled back on exit, and an Exception is raised
+    so the caller doesn't assume the writes were committed.
+
+    A SharedTransaction opened while another is already open for the
+    same engine joins the outer one.
+    """
+
+    def __init__(self, sqla_engine):
+        self.sqla_engine = sqla_engine
+        self.shared_conn = None
+        self.is_outermost = False
+        return
+
+    def __enter__(self):
+        shared_conns = getattr(_SHARED_CONNECTIONS, 'by_engine', None)
+        if shared_conns is None:
+            shared_conns = dict()
+            _SHARED_CONNECTIONS.by_engine = shared_conns
+        if self.sqla_engine in shared_conns:
+            self.shared_conn = shared_conns[self.sqla_engine]
+            self.is_outermost = False
+        else:
+            self.shared_conn = _SharedConnection(self.sqla_engine.connect())
+            shared_conns[self.sqla_engine] = self.shared_conn
+            self.is_outermost = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if self.is_outermost:
+            _SHARED_CONNECTIONS.by_engine.pop(self.sqla_engine)
+            shared_conn = self.shared_conn
+            try:
+                if exc_type is None and shared_conn.is_healthy():
+                    shared_conn.commit_shared()
+                else:
+                    shared_conn.rollback_shared()
+                    if exc_type is None and not shared_conn.rollback_only:
+                        raise Exception('A database operation failed ' +
+                            'inside a SharedTransaction. Rolled back.')
+            finally:
+                shared_conn.close_shared()
+        #never suppress the exception raised in the 'with' block
+        return False
+
+    def set_rollback_only(self):
+        """
+        makes the shared transaction roll back instead of commit when the
+        outermost block exits, without raising. For callers whose work
+        failed in a way they report by other means than an exception.
+        """
+        self.shared_conn.rollback_only = True
+        return
+
+class _SharedConnection(object):
+    """
+    Wraps the sqla Connection of a SharedTransaction so that the
+    CrudDbClient methods can use it like a connection of their own: close()
+    leaves it open, and begin() joins the shared transaction (sqla gives
+    back a 'nested' transaction whose commit() does nothing). Remembers
+    whether any statement failed so the SharedTransaction knows not to
+    commit.
+    """
+
+    def __init__(self, sqla_conn):
+        self.sqla_conn = sqla_conn
+        self.trans = sqla_conn.begin()
+        self.failed = False
+        self.rollback_only = False
+        return
+
+    def __getattr__(self, name):
+        return getattr(self.sqla_conn, name)
+
+    def execute(self, *args, **kwargs):
+        if not self.trans.is_active:
+            raise Exception('SharedTransaction was already rolled back')
+        try:
+            res = self.sqla_conn.execute(*args, **kwargs)
+        except Exception:
+            self.failed = True
+            raise
+        return res
+
+    def close(self):
+        return
+
+    def is_healthy(self):
+        return self.trans.is_active and not self.failed and \
+            not self.rollback_only
+
+    def commit_shared(self):
+        self.trans.commit()
+        return
+
+    def rollback_shared(self):
+        if self.trans.is_active:
+            self.trans.rollback()
+        return
+
+    def close_shared(self):
+        self.sqla_conn.close()
+        return
+
 def log(msg):
     print msg
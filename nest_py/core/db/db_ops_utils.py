@@ -3,7 +3,10 @@ Common high level commands. Most can be called from nest_ops.
 """
 
 import copy
-from sqlalchemy.sql import update
+import json
+from sqlalchemy import LargeBinary
+from sqlalchemy.sql import update, select, bindparam, text
+from sqlalchemy.sql import table as table_clause, column as column_clause
 
 import nest_py.core.db.nest_db as nest_db
 import nest_py.core.db.core_db as core_db
@@ -52,6 +55,99 @@ def ensure_tables_in_db():
             print(' CREATED: ' + str(tbl.name))
     return True
 
+#rows converted per statement by migrate_tables_in_db
+MIGRATION_BATCH_SIZE = 1000
+
+def migrate_tables_in_db():
+    """
+    converts the data of existing tables whose columns changed type since
+    they were created, which ensure_tables_in_db leaves alone. currently
+    that's TypedArray attributes, which used to be Json (text) attributes.
+    """
+    engine = nest_db.get_global_sqlalchemy_engine()
+    md = nest_db.get_global_sqlalchemy_metadata()
+    for tbl in md.sorted_tables:
+        if not tbl.exists(engine):
+            continue
+        for col in tbl.columns:
+            att = col.info.get('tablelike_attribute')
+            if att is not None and 'TypedArray' == att.get_type():
+                _migrate_typed_array_column(engine, tbl, att)
+    return True
+
+def _migrate_typed_array_column(engine, tbl, att):
+    """
+    converts a column of json text (or jsonb) to the bytea encoding of a
+    TypedArray attribute, in place. the table is locked for the whole
+    conversion, so a concurrent caller waits and then finds nothing to do.
+    returns the number of rows converted
+    """
+    col_name = att.get_name()
+    new_col_name = col_name + '__typed'
+    quote = engine.dialect.identifier_preparer.quote
+    conn = engine.connect()
+    trans = conn.begin()
+    try:
+        conn.execute('LOCK TABLE ' + quote(tbl.name) + \
+            ' IN ACCESS EXCLUSIVE MODE')
+        qs = text('select data_type from information_schema.columns ' + \
+            'where table_schema = current_schema() ' + \
+            'and table_name = :tbl_name and column_name = :col_name')
+        data_type = conn.execute(qs, tbl_name=tbl.name, \
+            col_name=col_name).scalar()
+        if data_type is None or data_type == 'bytea':
+            print(' up to date: ' + tbl.name + '.' + col_name)
+            trans.commit()
+            return 0
+
+        print(' MIGRATING: ' + tbl.name + '.' + col_name + ' from ' + \
+            data_type + ' to bytea')
+        conn.execute('ALTER TABLE ' + quote(tbl.name) + ' ADD COLUMN ' + \
+            quote(new_col_name) + ' bytea')
+        old_tbl = table_clause(tbl.name, column_clause('id'), \
+            column_clause(col_name))
+        new_tbl = table_clause(tbl.name, column_clause('id'), \
+            column_clause(new_col_name, LargeBinary))
+        stmt = update(new_tbl).\
+            where(new_tbl.c.id == bindparam('row_id')).\
+            values({new_col_name: bindparam('blob')})
+        num_rows = 0
+        last_id = None
+        while True:
+            qry = select([old_tbl.c.id, old_tbl.c[col_name]])
+            if last_id is not None:
+                qry = qry.where(old_tbl.c.id > last_id)
+            qry = qry.order_by(old_tbl.c.id).limit(MIGRATION_BATCH_SIZE)
+            rows = conn.execute(qry).fetchall()
+            if len(rows) == 0:
+                break
+            params = list()
+            for row_id, raw_val in rows:
+                #text columns come back as strings, jsonb already parsed
+                if isinstance(raw_val, basestring):
+                    val = json.loads(raw_val)
+                else:
+                    val = raw_val
+                blob = None if val is None else att.encode(val)
+                params.append({'row_id': row_id, 'blob': blob})
+            conn.execute(stmt, params)
+            num_rows += len(rows)
+            last_id = rows[-1][0]
+
+        conn.execute('ALTER TABLE ' + quote(tbl.name) + ' DROP COLUMN ' + \
+            quote(col_name))
+        conn.execute('ALTER TABLE ' + quote(tbl.name) + ' RENAME COLUMN ' + \
+            quote(new_col_name) + ' TO ' + quote(col_name))
+        trans.commit()
+        print(' MIGRATED: ' + tbl.name + '.' + col_name + ' (' + \
+            str(num_rows) + ' rows)')
+    except Exception:
+        trans.rollback()
+        raise
+    finally:
+        conn.close()
+    return num_rows
+
 def drop_tables_in_db():
     engine = nest_db.get_global_sqlalchemy_engine()
     nest_db.get_global_sqlalchemy_base().metadata.drop_all(engine)
@@ -19,6 +19,10 @@ def generate_db_config(project_env=None, runlevel=None, site=None):
         "port": os.getenv('POSTGRES_PORT', 5432), #exported in docker startup
         "password":os.getenv('POSTGRES_PASSWORD', "GARBAGESECRET"),
         "db_name":os.getenv('POSTGRES_DATABASE', "nest"),
+        #connections kept open in the engine's pool, and how many more
+        #can be opened on top of that when the pool is exhausted
+        "pool_size": int(os.getenv('POSTGRES_POOL_SIZE', 5)),
+        "max_overflow": int(os.getenv('POSTGRES_MAX_OVERFLOW', 10)),
         #"verbose_logging":True
         "verbose_logging":False
     }
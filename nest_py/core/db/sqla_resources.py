@@ -81,7 +81,9 @@ class JobsSqlaResources(object):
         if self.engine is None:
             engine_url = get_engine_url(self.config)
             verbose_logging = self.config['verbose_logging']
-            self.engine = create_engine(engine_url, echo=verbose_logging)
+            self.engine = create_engine(engine_url, echo=verbose_logging,
+                pool_size=self.config['pool_size'],
+                max_overflow=self.config['max_overflow'])
         return self.engine
 
     def get_declarative_base(self):
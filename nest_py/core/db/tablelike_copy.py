@@ -0,0 +1,231 @@
+"""
+Encodes rows of TablelikeSchema attribute values into the text format
+read by postgres' 'COPY ... FROM STDIN' command, so that large uploads
+can be streamed into a table without building a TablelikeEntry (and
+running the per-attribute jdata extraction) for every row.
+
+See https://www.postgresql.org/docs/current/static/sql-copy.html
+"""
+import binascii
+import json
+import math
+from nest_py.core.data_types.nest_id import NestId
+
+#how COPY's text format represents a null value
+COPY_NULL = '\\N'
+
+def make_copy_formatters(tablelike_schema, attribute_names):
+    """
+    returns a list of functions, one per attribute name (in the same
+    order), that each convert a python value of that attribute into a
+    field of a COPY line
+    """
+    atts_by_name = dict()
+    for att in tablelike_schema.get_attributes():
+        atts_by_name[att.get_name()] = att
+    formatters = list()
+    for att_name in attribute_names:
+        if not att_name in atts_by_name:
+            raise Exception("Attribute '" + str(att_name) + "' is not in " +
+                "schema '" + str(tablelike_schema.get_name()) + "'")
+        fmt = make_copy_formatter_for_attribute(atts_by_name[att_name])
+        formatters.append(fmt)
+    return formatters
+
+def make_copy_formatter_for_attribute(tablelike_attribute):
+    """
+    Given an Attribute of a TablelikeSchema, returns a function that
+    converts a value of that attribute into a (escaped) field of a COPY
+    line for the column made by tablelike_sqla.make_column_for_attribute.
+    Values are the same python types that would be stored in a
+    TablelikeEntry, except that ForeignIds can also be plain ints.
+    """
+    att_type = tablelike_attribute.get_type()
+    if 'Numeric' == att_type:
+        fmt = _nullable(_float_text)
+    elif 'Categoric' == att_type:
+        fmt = _nullable(_escaped_string_text)
+    elif 'ForeignId' == att_type:
+        fmt = _nullable(_foreignid_text)
+    elif 'Boolean' == att_type:
+        fmt = _nullable(_boolean_text)
+    elif 'Json' == att_type:
+        fmt = _json_text
+    elif 'JsonB' == att_type:
+        fmt = _json_text
+    elif 'Int' == att_type:
+        fmt = _nullable(_int_text)
+    elif 'NumericList' == att_type:
+        fmt = _nullable(_array_text_maker(_float_text))
+    elif 'CategoricList' == att_type:
+        fmt = _nullable(_array_text_maker(_quoted_array_element_text))
+    elif 'ForeignIdList' == att_type:
+        fmt = _nullable(_array_text_maker(_foreignid_text))
+    elif 'IntList' == att_type:
+        fmt = _nullable(_array_text_maker(_int_text))
+    elif 'TypedArray' == att_type:
+        fmt = _nullable(_bytea_text_maker(tablelike_attribute.encode))
+    else:
+        raise Exception("Problem making a COPY formatter for attribute '" +
+            str(tablelike_attribute.get_name()) + "' of unrecognized type: '" +
+            str(att_type))
+    return fmt
+
+def format_copy_line(formatters, row_values):
+    """
+    formatters (list of functions) from make_copy_formatters
+    row_values (sequence) one value per formatter
+    returns a single line (str) of COPY text format, including the
+    trailing newline
+    """
+    fields = [fmt(val) for (fmt, val) in zip(formatters, row_values)]
+    return '\t'.join(fields) + '\n'
+
+class CopyLineStream(object):
+    """
+    A read-only file-like object over an iterable of rows, as expected
+    by psycopg2's cursor.copy_expert(). Rows are only formatted as COPY
+    reads them, so the upload is never held in memory all at once.
+    """
+
+    def __init__(self, rows, formatters, leading_values=None):
+        """
+        rows (iterable of sequences) values in the order of formatters
+        formatters (list of functions) from make_copy_formatters
+        leading_values (list of str) already formatted fields that are
+            written at the start of every line (e.g. the owner_id)
+        """
+        self.rows = iter(rows)
+        self.formatters = formatters
+        if leading_values is None:
+            self.line_prefix = ''
+        else:
+            self.line_prefix = '\t'.join(leading_values) + '\t'
+        self.buf = ''
+        self.num_rows = 0
+        return
+
+    def get_num_rows(self):
+        """
+        number of rows that have been read out of the stream so far
+        """
+        return self.num_rows
+
+    def _next_line(self):
+        row = next(self.rows, None)
+        if row is None:
+            line = None
+        else:
+            line = self.line_prefix + format_copy_line(self.formatters, row)
+            self.num_rows += 1
+        return line
+
+    def readline(self, size=-1):
+        if self.buf == '':
+            line = self._next_line()
+            if line is None:
+                line = ''
+        else:
+            line = self.buf
+            self.buf = ''
+        return line
+
+    def read(self, size=-1):
+        chunks = [self.buf]
+        num_chars = len(self.buf)
+        while size < 0 or num_chars < size:
+            line = self._next_line()
+            if line is None:
+                break
+            chunks.append(line)
+            num_chars += len(line)
+        data = ''.join(chunks)
+        if size < 0 or len(data) <= size:
+            self.buf = ''
+        else:
+            self.buf = data[size:]
+            data = data[:size]
+        return data
+
+def _nullable(fmt):
+    def nullable_fmt(val):
+        if val is None:
+            txt = COPY_NULL
+        else:
+            txt = fmt(val)
+        return txt
+    return nullable_fmt
+
+def _escape_copy_text(txt):
+    """
+    escapes the characters that have special meaning in COPY's
+    text format
+    """
+    if isinstance(txt, unicode):
+        txt = txt.encode('utf-8')
+    txt = txt.replace('\\', '\\\\')
+    txt = txt.replace('\t', '\\t')
+    txt = txt.replace('\n', '\\n')
+    txt = txt.replace('\r', '\\r')
+    return txt
+
+def _float_text(val):
+    val = float(val)
+    if math.isnan(val):
+        txt = 'NaN'
+    else:
+        txt = repr(val)
+    return txt
+
+def _int_text(val):
+    return str(int(val))
+
+def _foreignid_text(val):
+    if isinstance(val, NestId):
+        val = val.get_value()
+    return str(int(val))
+
+def _boolean_text(val):
+    if val:
+        txt = 't'
+    else:
+        txt = 'f'
+    return txt
+
+def _escaped_string_text(val):
+    return _escape_copy_text(val)
+
+def _json_text(val):
+    return _escape_copy_text(json.dumps(val))
+
+def _quoted_array_element_text(val):
+    if isinstance(val, unicode):
+        val = val.encode('utf-8')
+    val = str(val)
+    val = val.replace('\\', '\\\\').replace('"', '\\"')
+    return '"' + val + '"'
+
+def _bytea_text_maker(encode_fn):
+    """
+    returns a function that encodes a value with encode_fn and formats the
+    bytes in bytea's hex format ('\\x0a1b...'), escaped for COPY
+    """
+    def bytea_fmt(val):
+        return '\\\\x' + binascii.hexlify(encode_fn(val))
+    return bytea_fmt
+
+def _array_text_maker(element_fmt):
+    """
+    returns a function that formats a list as a postgres array literal
+    (e.g. '{1,2,NULL}'), using element_fmt for the non-null elements,
+    and then escapes it for COPY
+    """
+    def array_fmt(vals):
+        elements = list()
+        for val in vals:
+            if val is None:
+                elements.append('NULL')
+            else:
+                elements.append(element_fmt(val))
+        return _escape_copy_text('{' + ','.join(elements) + '}')
+    return array_fmt
@@ -1,5 +1,5 @@
 from sqlalchemy import Table, Column, Index
-from sqlalchemy import Integer, Text, Numeric, ARRAY, Boolean
+from sqlalchemy import Integer, Text, Numeric, ARRAY, Boolean, LargeBinary
 from sqlalchemy.dialects.postgresql import JSONB
 from nest_py.core.db.sqla_maker import SqlaMaker
 
@@ -101,10 +101,15 @@ def make_column_for_attribute(tablelike_attribute):
         col_type = ARRAY(Integer())
     elif 'IntList' == att_type:
         col_type = ARRAY(Integer())
+    elif 'TypedArray' == att_type:
+        #bytea in postgres
+        col_type = LargeBinary()
     else:
         raise Exception("Problem making a column for attribute '" + 
             str(att_name) + "' of unrecognized type: '" + str(att_type))
 
-    col = Column(att_name, col_type)
+    #the attribute is kept so db_ops_utils.migrate_tables_in_db can convert
+    #existing data to the column's current type
+    col = Column(att_name, col_type, info={'tablelike_attribute': att})
     return col
 
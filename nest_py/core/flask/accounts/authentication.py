@@ -26,15 +26,32 @@ Here's the idea:
 
    - The Angular2 application will refuse to load certain routes unless the user
      has a valid token.
+
+   - Verified tokens are cached (see token_cache), so most requests skip
+     verifying the token and reading the user's db record. Logging out
+     (DELETE on `sessions/`) revokes the token in redis (see
+     token_revocations), which every request checks, so it's rejected by all
+     of the web app's processes.
+
+Set the config's AUTH_DEBUG_LOGGING to True to log every request's headers and
+how its token was resolved.
 """
 
+import logging
 import traceback
+from redis import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
 from werkzeug.exceptions import UnsupportedMediaType
 from nest_py.core.data_types.nest_user import NestUser
 from nest_py.core.flask.accounts.token import TokenAgent
+import nest_py.core.flask.accounts.token_cache as token_cache
+import nest_py.core.flask.accounts.token_revocations as token_revocations
 import nest_py.core.flask.accounts.password_hash as password_hash
 import nest_py.core.db.core_db as core_db
 
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
 class AuthenticationStrategy(object):
     """Base class for authentication strategies."""
 
@@ -61,16 +78,26 @@ class AuthenticationStrategy(object):
 class NativeAuthenticationStrategy(AuthenticationStrategy):
     """Authentication strategy for users defined in the local db."""
 
-    def __init__(self, app, users_db_client):
+    def __init__(self, app, users_db_client, redis_connection=None):
         """Initializes self.
 
         Args:
             app (Eve): The application object.
-            self.token_agent = token_agent
+            users_db_client (CrudDbClient): A CrudDbClient for the nest_users
+                table.
+            redis_connection (redis.Redis): The connection to the db of
+                revoked tokens. If None, one is opened to the config's
+                REDIS_HOST and AUTH_REDIS_DB.
         """
         self.users_db_client = users_db_client
         self.token_agent = None
         self._init_token_agent(app.config)
+        self.token_cache = None
+        self._init_token_cache(app.config)
+        self.token_revocations = None
+        self._init_token_revocations(app.config, redis_connection)
+        if app.config.get('AUTH_DEBUG_LOGGING', False):
+            LOGGER.setLevel(logging.DEBUG)
 
         super(NativeAuthenticationStrategy, self).__init__(app)
         return
@@ -84,6 +111,23 @@ class NativeAuthenticationStrategy(AuthenticationStrategy):
             jwt_audiences, default_lifespan=default_lifespan)
         return
 
+    def _init_token_cache(self, config):
+        max_entries = config.get('JWT_CACHE_SIZE', \
+            token_cache.DEFAULT_MAX_ENTRIES)
+        max_age = config.get('JWT_CACHE_MAX_AGE', token_cache.DEFAULT_MAX_AGE)
+        self.token_cache = token_cache.VerifiedTokenCache(\
+            max_entries=max_entries, max_age=max_age)
+        return
+
+    def _init_token_revocations(self, config, redis_connection):
+        if redis_connection is None:
+            #redis only connects when it's first used
+            redis_connection = Redis(\
+                host=config['REDIS_HOST'], db=config['AUTH_REDIS_DB'])
+        self.token_revocations = token_revocations.TokenRevocations(\
+            redis_connection)
+        return
+
     def authenticate(self, request):
         """Attempts to authenticate a user from an HTTP request by
         inspecting the username and password in the request's data
@@ -130,47 +174,103 @@ class NativeAuthenticationStrategy(AuthenticationStrategy):
     def authenticate_token(self, request):
         """
         inspects the token in the header of a request and decodes it
-        into a valid NestUser, or None if it's invalid, expired, or doesn't exist
+        into a valid NestUser, or None if it's invalid, expired, revoked,
+        or doesn't exist
         """
-        print('request headers: ' + str(request.headers))
+        LOGGER.debug('request headers: %s', request.headers)
         try:
-            if 'Authorization' in request.headers:
-                auth_field = request.headers['Authorization']
-                #should start with 'Bearer '. Not sure why.
-                if "Bearer" not in auth_field:
-                    print('token was not a Bearer token')
-                    nest_user = None
-                    return nest_user
-                skip_len = len('Bearer ')
-                tkn = auth_field[skip_len:]
-                tkn_payload = self.token_agent.decode(tkn)
-                print('token payload: ' + str(tkn_payload.data))
-                if tkn_payload is None:
-                    print('token was not decoded into a user')
-                    nest_user = None
-                else:
-                    nest_user = tkn_payload.to_nest_user()
-                    print('token was for: ' + str(nest_user))
-                    if tkn_payload.is_expired():
-                        print('token is expired')
-                        nest_user = None
-                    else:
-                        #the NestUser we have only contains info the token could hold,
-                        #we also need the full db entry to use for security_policy's
-                        user_tle = self.users_db_client.read_entry(nest_user.get_nest_id())
-                        nest_user = NestUser.from_tablelike_entry(user_tle)
-                        print('user from db: ' + str(nest_user))
-            else:
-                print('no auth header found')
+            tkn = _get_bearer_token(request)
+            if tkn is None:
                 nest_user = None
+            elif self._is_revoked(tkn):
+                #checked on every request, as another process may have
+                #revoked a token this one has cached
+                LOGGER.debug('token is revoked')
+                self.token_cache.drop(tkn)
+                nest_user = None
+            else:
+                nest_user = self.token_cache.get(tkn)
+                if nest_user is not None:
+                    LOGGER.debug('cached token was for: %s', nest_user)
+                else:
+                    nest_user = self._verify_token(tkn)
         except Exception:
             traceback.print_exc()
             raise Exception("Unrecoverable failure decoding token")
         return nest_user
 
+    def _is_revoked(self, tkn):
+        """
+        returns True if the token has been revoked. if redis can't be
+        reached, logs a warning and returns False, so the token is accepted
+        if it's otherwise valid; see token_revocations
+        """
+        try:
+            return_val = self.token_revocations.is_revoked(tkn)
+        except RedisConnectionError as ex:
+            LOGGER.warning('could not check for a revoked token: %s', ex)
+            return_val = False
+        return return_val
+
+    def _verify_token(self, tkn):
+        """
+        decodes and verifies a token that isn't in the cache, and caches
+        it if it's valid. returns its NestUser, or None
+        """
+        tkn_payload = self.token_agent.decode(tkn)
+        if tkn_payload is None:
+            LOGGER.debug('token was not decoded into a user')
+            return None
+        LOGGER.debug('token payload: %s', tkn_payload.data)
+        nest_user = tkn_payload.to_nest_user()
+        LOGGER.debug('token was for: %s', nest_user)
+        if tkn_payload.is_expired():
+            LOGGER.debug('token is expired')
+            nest_user = None
+        else:
+            #the NestUser we have only contains info the token could hold,
+            #we also need the full db entry to use for security_policy's
+            user_tle = self.users_db_client.read_entry(nest_user.get_nest_id())
+            nest_user = NestUser.from_tablelike_entry(user_tle)
+            LOGGER.debug('user from db: %s', nest_user)
+            self.token_cache.put(tkn, nest_user, tkn_payload.data['exp'])
+        return nest_user
+
+    def revoke_token(self, request):
+        """
+        revokes the token in the header of a request, e.g. at logout, so
+        it's rejected from now on. returns True if there was a valid token
+        to revoke
+        """
+        tkn = _get_bearer_token(request)
+        if tkn is None:
+            return False
+        tkn_payload = self.token_agent.decode(tkn)
+        if tkn_payload is None or tkn_payload.is_expired():
+            return False
+        self.token_revocations.revoke(tkn, tkn_payload.data['exp'])
+        self.token_cache.drop(tkn)
+        return True
+
     def create_token_for_user(self, nest_user):
         tkn = self.token_agent.create_for_user(nest_user)
         return tkn
 
+def _get_bearer_token(request):
+    """
+    returns the token in a request's Authorization header, or None if
+    there isn't one
+    """
+    if 'Authorization' not in request.headers:
+        LOGGER.debug('no auth header found')
+        return None
+    auth_field = request.headers['Authorization']
+    #should start with 'Bearer '. Not sure why.
+    if "Bearer" not in auth_field:
+        LOGGER.debug('token was not a Bearer token')
+        return None
+    skip_len = len('Bearer ')
+    return auth_field[skip_len:]
+
 def log(msg):
     print(msg)
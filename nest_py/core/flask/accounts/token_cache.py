@@ -0,0 +1,100 @@
+"""This module defines an in-process cache of verified JWT tokens.
+
+Verifying a token's signature and reading its user's db record on every
+request is a large share of the cost of small requests, so once a token has
+been verified, the NestUser it was resolved to is kept here, keyed by a hash of
+the token, until the first of:
+
+- the token expires.
+- the entry is older than `max_age`, so changes to the user's db record are
+  picked up.
+- the token is revoked in the process that holds the entry.
+- the cache holds `max_entries` and the entry is the least recently used.
+
+Each process has its own cache, so the cache can't be what rejects revoked
+tokens; see token_revocations for the revocations all processes share.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import threading
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_AGE = timedelta(minutes=5)
+
+class VerifiedTokenCache(object):
+    """Thread-safe cache from verified tokens to NestUsers."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE):
+        """Initializes self.
+
+        Args:
+            max_entries (int): The maximum number of tokens to keep.
+            max_age (datetime.timedelta): How long to keep a token before
+                verifying it again.
+
+        Returns:
+            None: None.
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        # token hash -> (NestUser, token expiration, time cached)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        return
+
+    def get(self, tkn):
+        """Returns the NestUser of a token that was verified and cached, or
+        None if it's not in the cache or its entry is no longer valid."""
+        key = _hash_token(tkn)
+        now = datetime.now()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            nest_user, expires_at, cached_at = entry
+            if now > expires_at or now - cached_at > self.max_age:
+                return None
+            self.entries[key] = entry
+        return nest_user
+
+    def put(self, tkn, nest_user, expires_at):
+        """Caches the NestUser of a verified, unexpired token.
+
+        Args:
+            tkn (str): The token.
+            nest_user (NestUser): The user, as read from the db.
+            expires_at (datetime): When the token expires.
+
+        Returns:
+            None: None.
+        """
+        key = _hash_token(tkn)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (nest_user, expires_at, datetime.now())
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return
+
+    def drop(self, tkn):
+        """Drops a token from the cache, e.g., because it was revoked.
+
+        Args:
+            tkn (str): The token.
+
+        Returns:
+            None: None.
+        """
+        key = _hash_token(tkn)
+        with self.lock:
+            self.entries.pop(key, None)
+        return
+
+    def __len__(self):
+        return len(self.entries)
+
+def _hash_token(tkn):
+    """Returns the key of a token, so the cache doesn't hold usable tokens."""
+    return hashlib.sha256(tkn.encode('utf-8')).hexdigest()
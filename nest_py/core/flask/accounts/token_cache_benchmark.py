@@ -0,0 +1,127 @@
+"""
+microbenchmark of NestEndpoint.handle_request on an endpoint that does no
+work of its own, so nearly all the time is spent authenticating the
+request's token. it compares requests whose token is already in the
+verified token cache against requests that verify the token and read the
+user record every time, as every request did before the cache.
+
+it runs without a database or redis: the users db client serves the user
+record from memory, so the benefit measured here leaves out the db round
+trip a real request saves as well, and the revoked tokens are an empty
+in-memory set, so it also leaves out the redis round trip every real
+request makes to check them.
+
+run with, e.g.,
+    python -m nest_py.core.flask.accounts.token_cache_benchmark --requests 5000
+"""
+import argparse
+from datetime import timedelta
+import timeit
+
+import flask
+
+from nest_py.core.data_types.nest_id import NestId
+from nest_py.core.data_types.nest_user import NestUser
+from nest_py.core.flask.accounts.authentication import \
+    NativeAuthenticationStrategy
+from nest_py.core.flask.nest_endpoints.nest_endpoint import NestEndpoint
+
+class PingEndpoint(NestEndpoint):
+    """
+    an endpoint that answers every GET with an empty json object
+    """
+
+    def __init__(self, authenticator):
+        super(PingEndpoint, self).__init__('ping', authenticator)
+        return
+
+    def get_flask_rule(self):
+        return 'ping'
+
+    def get_flask_endpoint(self):
+        return 'ping'
+
+    def do_GET(self, request, requesting_user):
+        return self._make_success_json_response({})
+
+class InMemoryUsersClient(object):
+    """
+    serves read_entry() for the one user, as the nest_users CrudDbClient
+    would
+    """
+
+    def __init__(self, nest_user):
+        self.user_tle = nest_user.to_tablelike_entry()
+        return
+
+    def read_entry(self, nest_id):
+        return self.user_tle
+
+class NoRevocationsRedis(object):
+    """
+    answers the token revocation checks as a redis db with no revoked
+    tokens would
+    """
+
+    def exists(self, key):
+        return False
+
+def make_app():
+    """
+    returns a flask app with just the config the authenticator needs
+    """
+    app = flask.Flask(__name__)
+    app.config.update({
+        'JWT_SECRET': 'benchmarksecret',
+        'JWT_ISSUER': 'benchmark',
+        'JWT_AUDIENCES': ['benchmark'],
+        'JWT_LIFESPAN': timedelta(hours=1)})
+    return app
+
+def run_benchmark(num_requests):
+    """
+    returns a dict of the mean seconds per handle_request() call with a
+    'warm' token cache and with a 'cold' one, which is cleared before
+    every request
+    """
+    app = make_app()
+    nest_user = NestUser(NestId(1), 'benchmarkuser', 'Benchmark', 'User', \
+        thumb_url='')
+    authenticator = NativeAuthenticationStrategy(app, \
+        InMemoryUsersClient(nest_user), redis_connection=NoRevocationsRedis())
+    endpoint = PingEndpoint(authenticator)
+    tkn = authenticator.create_token_for_user(nest_user)
+    headers = {'Authorization': 'Bearer ' + tkn}
+
+    def warm_request():
+        resp = endpoint.handle_request()
+        assert resp.status_code == 200
+
+    def cold_request():
+        authenticator.token_cache.entries.clear()
+        warm_request()
+
+    results = dict()
+    with app.test_request_context('/ping', headers=headers):
+        warm_request()
+        for name, request_fn in [('warm', warm_request), \
+            ('cold', cold_request)]:
+            secs = min(timeit.repeat(request_fn, number=num_requests, \
+                repeat=3))
+            results[name] = secs / num_requests
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=\
+        'Time NestEndpoint.handle_request with and without cached tokens.')
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+    results = run_benchmark(args.requests)
+    for name in ['cold', 'warm']:
+        print('%s cache: %.1f us per request' % \
+            (name, results[name] * 1e6))
+    print('speedup: %.1fx' % (results['cold'] / results['warm']))
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""This module defines the store of revoked JWT tokens, e.g., tokens whose
+users have logged out.
+
+A revoked token's signature is still valid, so it must be remembered until it
+expires. The web app runs in several processes, and a logout is handled by
+only one of them, so the revocations are kept in redis, where every process
+checks them. Each revoked token is stored under a hash of the token, with a
+time to live that ends when the token expires, so redis forgets it as soon as
+the token would be rejected anyway.
+
+If redis can't be reached, the authentication strategy fails open: it logs a
+warning and accepts any token that is otherwise valid, whether it's cached or
+has to be verified. A token revoked by logging out could then be used until
+redis is back, but its lifespan still limits that, and an outage of redis
+doesn't reject every request, including those that only need the database.
+"""
+
+from datetime import datetime
+import hashlib
+import math
+
+KEY_PREFIX = 'nest_auth:revoked_token:'
+
+class TokenRevocations(object):
+    """Revoked tokens, shared through redis by all of the web app's
+    processes."""
+
+    def __init__(self, redis_connection):
+        """Initializes self.
+
+        Args:
+            redis_connection (redis.Redis): The connection to the db that
+                holds the revocations.
+
+        Returns:
+            None: None.
+        """
+        self.redis_connection = redis_connection
+        return
+
+    def is_revoked(self, tkn):
+        """Returns True if the token has been revoked.
+
+        Args:
+            tkn (str): The token.
+        """
+        return bool(self.redis_connection.exists(_make_key(tkn)))
+
+    def revoke(self, tkn, expires_at):
+        """Rejects a token from now on, in every process.
+
+        Args:
+            tkn (str): The token.
+            expires_at (datetime): When the token expires, after which it
+                no longer needs to be remembered.
+
+        Returns:
+            None: None.
+        """
+        ttl_secs = int(math.ceil(\
+            (expires_at - datetime.now()).total_seconds()))
+        if ttl_secs > 0:
+            key = _make_key(tkn)
+            pipe = self.redis_connection.pipeline()
+            pipe.set(key, '1')
+            pipe.expire(key, ttl_secs)
+            pipe.execute()
+        return
+
+def _make_key(tkn):
+    """Returns the redis key of a token, so the store doesn't hold usable
+    tokens."""
+    return KEY_PREFIX + hashlib.sha256(tkn.encode('utf-8')).hexdigest()
@@ -43,6 +43,8 @@ def create_app(config, project_env, runlevel):
 def setup_db(flask_app, project_env):
     db_config = nest_db.generate_db_config(project_env=project_env)
     flask_app.config['SQLALCHEMY_DATABASE_URI'] = sqla_resources.get_engine_url(db_config)
+    flask_app.config['SQLALCHEMY_POOL_SIZE'] = db_config['pool_size']
+    flask_app.config['SQLALCHEMY_MAX_OVERFLOW'] = db_config['max_overflow']
     db = SQLAlchemy(flask_app)
     sqla_res= FlaskSqlaResources(db, db_config)
     # FIXME flask still uses JobsSqlaResources, despite all this
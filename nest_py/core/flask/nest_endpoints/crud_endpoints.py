@@ -3,6 +3,10 @@ import flask
 from nest_py.core.flask.nest_endpoints.nest_endpoint import NestEndpoint
 from nest_py.core.data_types.nest_id import NestId
 
+#number of entries written per INSERT statement when a batch of entries
+#is POSTed. the whole batch is still written in one transaction
+DB_WRITE_BATCH_SIZE = 1000
+
 class NestCrudEntryEndpoint(NestEndpoint):
     """
     Supports Read, Update, Delete of a single entry that is
@@ -267,11 +271,13 @@ class NestCrudCollectionEndpoint(NestEndpoint):
             #print('jd_to_obj for jd: ' + str(obj_jd))
             dtos.append(self.transcoder.jdata_to_object(obj_jd))
 
-        db_batch_size = len(dtos)
+        db_batch_size = DB_WRITE_BATCH_SIZE
         resp_jdata = dict()
         if reply_format == 'id':
             dtos = self.crud_client.bulk_create_entries(dtos, 
                 user=requesting_user, batch_size=db_batch_size)
+            if dtos is None:
+                return self._make_error_response('Write to DB failed')
             nids = list()
             for dto in dtos:
                 nid = dto.get_nest_id().get_value()
@@ -281,10 +287,14 @@ class NestCrudCollectionEndpoint(NestEndpoint):
         elif reply_format == 'count':
             num_created = self.crud_client.bulk_create_entries_async(
                 dtos, user=requesting_user, batch_size=db_batch_size)
+            if num_created is None:
+                return self._make_error_response('Write to DB failed')
             resp_jdata['num_created'] = num_created
         elif reply_format == 'whole':
             dtos = self.crud_client.bulk_create_entries(dtos, 
                 user=requesting_user, batch_size=db_batch_size)
+            if dtos is None:
+                return self._make_error_response('Write to DB failed')
             createds = list()
             for dto in dtos:
                 obj_jdata = self.transcoder.object_to_jdata(dto)
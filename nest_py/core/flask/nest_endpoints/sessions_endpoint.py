@@ -45,3 +45,17 @@ class SessionsEndpoint(NestEndpoint):
             response = Response(response='{}', \
                 status=403, mimetype="application/json")
         return response
+
+    def do_DELETE(self, request, requesting_user):
+        """
+        called when someone logs out by DELETEing the 'sessions' endpoint
+        with their token in the headers. the token is revoked, so it can't
+        be used again
+        """
+        if self.authenticator.revoke_token(request):
+            status = 200
+        else:
+            status = 401
+        response = Response(response='{}', \
+            status=status, mimetype="application/json")
+        return response
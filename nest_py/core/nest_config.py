@@ -87,6 +87,7 @@ def _generate_base_config():
         "XML": False, # JSON only
 
         "JOB_QUEUE_REDIS_DB": 1, # for RQ; note CACHE_REDIS_DB above
+        "AUTH_REDIS_DB": 2, # revoked tokens, shared by all web processes
         "JOB_QUEUE_DEFAULT_NAME": 'nest_default',
         "JOB_QUEUE_WORKERS": 25,
 
@@ -96,7 +97,10 @@ def _generate_base_config():
         "JWT_SECRET": os.getenv('JWT_SECRET', "GARBAGESECRET"), # TODO reject default in production
         "JWT_ISSUER": "NEST_DEMO_CHANGE_IN_PRODUCTION", # TODO reject default in production
         "JWT_AUDIENCES": ["NEST_DEMO_CHANGE_IN_PRODUCTION"], # TODO reject default in production
-        "JWT_LIFESPAN": timedelta(days=365)
+        "JWT_LIFESPAN": timedelta(days=365),
+        "JWT_CACHE_SIZE": 10000, # verified tokens kept per process
+        "JWT_CACHE_MAX_AGE": timedelta(minutes=5), # before re-reading the user
+        "AUTH_DEBUG_LOGGING": False # log request headers and token checks
     }
     return config
 
@@ -10,8 +10,9 @@ def generate_schema():
     schema = TablelikeSchema(COLLECTION_NAME)
     schema.add_foreignid_attribute('ssviz_spreadsheet_id')
     schema.add_int_attribute('feature_idx')
-    # the values for the row, ordered as they appear in the file
-    schema.add_json_attribute('values') # using json bc type can be int, float, or str
+    # the values for the row, ordered as they appear in the file; stored as a
+    # typed binary array bc type can be int, float, or str, and rows are long
+    schema.add_typed_array_attribute('values', compress=True)
 
     schema.add_index(['ssviz_spreadsheet_id', 'feature_idx'])
     return schema
@@ -32,13 +32,15 @@ class CILogonAuthenticationStrategy(NativeAuthenticationStrategy):
 
     """
 
-    def __init__(self, app, users_db_client):
+    def __init__(self, app, users_db_client, redis_connection=None):
         """Initializes self.
 
         Args:
             app (Eve): The application object.
             users_db_client (nest_py.core.db.crud_db_client.CrudDbClient): A
                 CrudDbClient for the nest_users table.
+            redis_connection (redis.Redis): The connection to the db of
+                revoked tokens, or None to open one from the config.
 
         """
         self.users_db_client = users_db_client
@@ -61,7 +63,7 @@ class CILogonAuthenticationStrategy(NativeAuthenticationStrategy):
             raise AttributeError(\
                 'CILOGON_REDIRECT_URI cannot contain spaces')
         super(CILogonAuthenticationStrategy, self).__init__(\
-            app, users_db_client)
+            app, users_db_client, redis_connection=redis_connection)
 
     def authenticate(self, request):
         """Attempts to authenticate a user from an HTTP request.
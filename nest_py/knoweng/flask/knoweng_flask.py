@@ -167,4 +167,16 @@ def _make_ssv_crud_endpoints(schema_registry, sqla_registry, authenticator, db_e
         ssviz_endpoints.SsvizSurvivalAnalysesEndpoint(authenticator)
     ssviz_eps.add_endpoint(ssv_survival_analyses_endpoint)
 
+    feature_data_client = sqla_registry[ssviz_feature_data.COLLECTION_NAME].\
+        get_db_client(db_engine, sqla_metadata)
+    ssv_feature_values_endpoint = ssviz_endpoints.SsvizFeatureValuesEndpoint(\
+        feature_data_client, authenticator)
+    ssviz_eps.add_endpoint(ssv_feature_values_endpoint)
+
+    spreadsheets_client = sqla_registry[ssviz_spreadsheets.COLLECTION_NAME].\
+        get_db_client(db_engine, sqla_metadata)
+    ssv_feature_bins_endpoint = ssviz_endpoints.SsvizFeatureBinsEndpoint(\
+        feature_data_client, spreadsheets_client, authenticator)
+    ssviz_eps.add_endpoint(ssv_feature_bins_endpoint)
+
     return ssviz_eps
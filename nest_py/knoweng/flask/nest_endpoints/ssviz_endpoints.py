@@ -1,13 +1,17 @@
 """This module is to disable single PATCH, POST on ssv related endpoints
 """
+import math
 import pickle
-import time
 
 import flask
 from redis import Redis
 from rq import Queue
 import rq.job as rqjob
+from rq.exceptions import NoSuchJobError
 
+import nest_py.core.data_types.typed_array as typed_array
+import nest_py.knoweng.jobs.ssv_heatmap_bins as ssv_heatmap_bins
+import nest_py.knoweng.jobs.survival_cache as survival_cache
 from nest_py.core.flask.nest_endpoints.nest_endpoint import NestEndpoint
 from nest_py.core.flask.nest_endpoints.nest_endpoint_set import NestEndpointSet
 from nest_py.core.flask.nest_endpoints.crud_endpoints import NestCrudEntryEndpoint
@@ -41,6 +45,31 @@ class SsvizCollectionEndpoint(NestCrudCollectionEndpoint):
         return resp
 
 class SsvizSurvivalAnalysesEndpoint(NestEndpoint):
+    """
+    runs survival analyses (log-rank tests) without tying up a web worker:
+    a request submits the analyses and returns a handle for each one right
+    away, and the p-values are computed by an rq worker and stored in the
+    survival cache, where later requests find them.
+
+    GET with the params duration_spreadsheet_id, duration_feature_idx,
+    event_spreadsheet_id, event_feature_idx, event_val,
+    grouping_spreadsheet_id and grouping_feature_idx submits one analysis
+    and returns its result (see below).
+
+    POST with a json object of the duration and event params, 'groupings',
+    a list of {'spreadsheet_id': int, 'feature_idx': int}, and optionally
+    'sample_names', the samples to analyze, submits one analysis per
+    grouping, all computed in a single batch, and returns
+    {'results': [result, ...]}, ordered to match 'groupings'.
+
+    GET with the param 'handle' returns the current result of an analysis.
+    handles are only valid for the user who submitted the analysis.
+
+    each result is {'handle': str, 'status': str, 'pval': float}, where the
+    status is 'finished' (pval is the p-value, or None if the grouping has
+    fewer than two groups), 'queued' or 'started' (pval is None, try again
+    later), or 'failed'.
+    """
 
     def __init__(self, authenticator):
         """
@@ -48,6 +77,10 @@ class SsvizSurvivalAnalysesEndpoint(NestEndpoint):
         super(SsvizSurvivalAnalysesEndpoint, self).__init__(\
             'ssviz_survival_analyses', authenticator)
 
+        self.redis_connection = None
+        """The connection to the job queue's redis db, which also holds the
+        survival cache."""
+
         self.rq_job_queue = None
         """The job queue."""
 
@@ -55,10 +88,10 @@ class SsvizSurvivalAnalysesEndpoint(NestEndpoint):
 
     def _init_resources(self):
         config = flask.current_app.config
-        redis_connection = Redis(\
+        self.redis_connection = Redis(\
             host=config['REDIS_HOST'], db=config['JOB_QUEUE_REDIS_DB'])
         self.rq_job_queue = Queue(\
-            config['JOB_QUEUE_DEFAULT_NAME'], connection=redis_connection)
+            config['JOB_QUEUE_DEFAULT_NAME'], connection=self.redis_connection)
         # see comment in jobs_endpoint
         rqjob.dumps = pickle.dumps
 
@@ -70,26 +103,362 @@ class SsvizSurvivalAnalysesEndpoint(NestEndpoint):
         return 'ssviz_survival_analyses'
 
     def do_GET(self, request, requesting_user):
-        # unpack params from MultiDict
-        flat_params = {k: v for k, v in request.args.iteritems(multi=False)}
-        timeout_secs = 30
-        remote_job = self.rq_job_queue.enqueue_call(\
-            func='nest_py.knoweng.jobs.worker_app.run_calculation', \
-            args=(requesting_user, 'ssviz_survival_analysis', flat_params), \
-            timeout=timeout_secs)
-        # monitor the job until it's done
-        start_time = time.time()
-        status = None
-        resp = None
-        while True:
-            status = remote_job.get_status()
-            if status == 'finished':
-                resp = self._make_success_json_response({'pval': \
-                    remote_job.result})
-                break
-            elif status == 'failed' or time.time() - start_time > timeout_secs:
-                resp = self._make_error_response(\
-                    'Calculation failed with status ' + str(status))
-                break
-            time.sleep(1)
+        if 'handle' in request.args:
+            handle = request.args['handle']
+            # the handle starts with its owner's id, so another user's
+            # handle is rejected before the cache is read
+            if not survival_cache.is_cache_key(handle, \
+                requesting_user.get_nest_id().get_value()):
+                return flask.make_response('unknown handle', 404)
+            result = self._get_results(requesting_user, [handle])[0]
+            if result['status'] is None:
+                return flask.make_response('unknown handle', 404)
+            return self._make_success_json_response(result)
+        try:
+            params = {k: request.args[k] for k in SURVIVAL_CONTEXT_PARAMS}
+            grouping = (int(request.args['grouping_spreadsheet_id']), \
+                int(request.args['grouping_feature_idx']))
+            results = self._submit(requesting_user, [grouping], params)
+        except (KeyError, ValueError):
+            return flask.make_response('missing or malformed params', 400)
+        return self._make_success_json_response(results[0])
+
+    def do_POST(self, request, requesting_user):
+        jdata = request.get_json()
+        try:
+            params = {k: jdata[k] for k in SURVIVAL_CONTEXT_PARAMS}
+            params['sample_names'] = jdata.get('sample_names')
+            groupings = [(int(grouping['spreadsheet_id']), \
+                int(grouping['feature_idx'])) \
+                for grouping in jdata['groupings']]
+            results = self._submit(requesting_user, groupings, params)
+        except (KeyError, ValueError, TypeError):
+            return flask.make_response('missing or malformed params', 400)
+        return self._make_success_json_response({'results': results})
+
+    def _submit(self, requesting_user, groupings, params):
+        """
+        returns the results of the analyses of the groupings, and starts a
+        job to compute the p-values that aren't cached or being computed
+        """
+        duration_spreadsheet_id = int(params['duration_spreadsheet_id'])
+        duration_feature_idx = int(params['duration_feature_idx'])
+        event_spreadsheet_id = int(params['event_spreadsheet_id'])
+        event_feature_idx = int(params['event_feature_idx'])
+        event_val = unicode(params['event_val'])
+        sample_names = params.get('sample_names')
+        if sample_names is not None:
+            sample_names = sorted(set(unicode(name) for name in sample_names))
+        handles = [survival_cache.make_cache_key(\
+            requesting_user.get_nest_id().get_value(), spreadsheet_id, \
+            feature_idx, duration_spreadsheet_id, duration_feature_idx, \
+            event_spreadsheet_id, event_feature_idx, event_val, \
+            sample_names) for spreadsheet_id, feature_idx in groupings]
+        results = self._get_results(requesting_user, handles)
+
+        # analyses of the same grouping in one request share a handle
+        to_run = dict()
+        for grouping, result in zip(groupings, results):
+            if result['status'] is None or result['status'] == 'failed':
+                to_run[result['handle']] = grouping
+        if len(to_run) > 0:
+            run_handles = sorted(to_run)
+            calculation_params = {
+                'groupings': [list(to_run[handle]) for handle in run_handles],
+                'duration_spreadsheet_id': duration_spreadsheet_id,
+                'duration_feature_idx': duration_feature_idx,
+                'event_spreadsheet_id': event_spreadsheet_id,
+                'event_feature_idx': event_feature_idx,
+                'event_val': event_val,
+                'sample_names': sample_names
+            }
+            remote_job = self.rq_job_queue.enqueue_call(\
+                func='nest_py.knoweng.jobs.worker_app.run_calculation', \
+                args=(requesting_user, 'ssviz_survival_analysis_batch', \
+                calculation_params), \
+                timeout=SURVIVAL_JOB_TIMEOUT_SECS, \
+                result_ttl=SURVIVAL_JOB_RESULT_TTL_SECS)
+            survival_cache.put_job_id(self.redis_connection, run_handles, \
+                remote_job.id, SURVIVAL_JOB_RESULT_TTL_SECS)
+            for result in results:
+                if result['handle'] in to_run:
+                    result['status'] = 'queued'
+        return results
+
+    def _get_results(self, requesting_user, handles):
+        """
+        returns the result of each handle, from the survival cache if it's
+        there, else from the job computing it. the status is None if there
+        is no such job
+        """
+        pvals = survival_cache.get_pvals(self.redis_connection, handles)
+        job_ids = survival_cache.get_job_ids(self.redis_connection, handles)
+        results = list()
+        for handle, pval, job_id in zip(handles, pvals, job_ids):
+            status = None
+            if pval is None and job_id is not None:
+                try:
+                    status = rqjob.Job.fetch(job_id, \
+                        connection=self.redis_connection).get_status()
+                except NoSuchJobError:
+                    status = None
+                if status == 'finished':
+                    # the job finished between our two reads of the cache
+                    pval = survival_cache.get_pvals(\
+                        self.redis_connection, [handle])[0]
+                elif status == 'deferred':
+                    status = 'queued'
+            if pval is not None:
+                status = 'finished'
+                # json has no NaN
+                if math.isnan(pval):
+                    pval = None
+            elif status == 'finished':
+                # the p-value expired already
+                status = None
+            results.append({'handle': handle, 'status': status, 'pval': pval})
+        return results
+
+# the params that every survival analysis request shares
+SURVIVAL_CONTEXT_PARAMS = ['duration_spreadsheet_id', 'duration_feature_idx', \
+    'event_spreadsheet_id', 'event_feature_idx', 'event_val']
+
+# how long a batch of survival analyses may run, and how long rq keeps its
+# result and the survival cache keeps its job id afterwards
+SURVIVAL_JOB_TIMEOUT_SECS = 300
+SURVIVAL_JOB_RESULT_TTL_SECS = 600
+
+class SsvizFeatureValuesEndpoint(NestEndpoint):
+    """
+    returns the values of many features of one spreadsheet in a single
+    packed response, fetched with a single query that reads only the
+    feature_idx and values columns of ssviz_feature_data. GET params:
+
+    ssviz_spreadsheet_id: the spreadsheet's id
+    feature_idxs: comma-separated feature indices
+    sample_idxs (optional): comma-separated sample indices; if given, only
+        the values of these samples are returned, in this order
+
+    the response has the params and a 'values' list with a list of values
+    per requested feature, in the requested order (None if the spreadsheet
+    has no such feature)
+    """
+
+    def __init__(self, feature_data_client, authenticator):
+        """
+        feature_data_client (CrudDbClient): client of the ssviz_feature_data
+            table
+        """
+        self.crud_client = feature_data_client
+        super(SsvizFeatureValuesEndpoint, self).__init__(\
+            'ssviz_feature_values', authenticator)
+
+    def get_flask_rule(self):
+        rule = 'ssviz_feature_values'
+        return rule
+
+    def get_flask_endpoint(self):
+        return 'ssviz_feature_values'
+
+    def do_GET(self, request, requesting_user):
+        try:
+            spreadsheet_id = int(request.args['ssviz_spreadsheet_id'])
+            feature_idxs = _parse_int_list(request.args['feature_idxs'])
+            sample_idxs = None
+            if 'sample_idxs' in request.args:
+                sample_idxs = _parse_int_list(request.args['sample_idxs'])
+        except (KeyError, ValueError):
+            return flask.make_response('ssviz_spreadsheet_id and ' + \
+                'feature_idxs are required, and all params must be ' + \
+                'non-negative integers', 400)
+        arrays = fetch_feature_arrays(self.crud_client, requesting_user, \
+            spreadsheet_id, feature_idxs)
+        values = list()
+        for feature_idx in feature_idxs:
+            arr = arrays.get(feature_idx)
+            if arr is not None:
+                if sample_idxs is not None:
+                    try:
+                        arr = arr[sample_idxs]
+                    except IndexError:
+                        return flask.make_response(\
+                            'sample_idxs out of range', 400)
+                arr = typed_array.to_list(arr)
+            values.append(arr)
+        resp = self._make_success_json_response({\
+            'ssviz_spreadsheet_id': spreadsheet_id, \
+            'feature_idxs': feature_idxs, 'sample_idxs': sample_idxs, \
+            'values': values})
         return resp
+
+class SsvizFeatureBinsEndpoint(NestEndpoint):
+    """
+    returns per-bin summaries of many features of one spreadsheet, for
+    drawing heatmaps without sending every sample's value to the client.
+    the samples are put in the requested order and split into num_bins
+    bins of nearly equal size (see ssv_heatmap_bins). GET params:
+
+    ssviz_spreadsheet_id: the spreadsheet's id
+    feature_idxs: comma-separated feature indices
+    num_bins: the number of bins, e.g. the width of the heatmap in pixels
+    sample_idxs (optional): comma-separated sample indices, the ordering
+        of the samples to bin. defaults to the order in the spreadsheet
+
+    the response has the params, 'bin_starts', the position in the
+    ordering of each bin's first sample, and a 'summaries' list with the
+    summary of each requested feature, in the requested order (None if
+    the spreadsheet has no such feature or it's neither numeric nor
+    categoric)
+
+    summaries are cached by the id of the feature's ssviz_feature_data
+    record, the number of bins and the ordering, so repeated requests only
+    pay for a query of the record ids, which also checks the user may
+    read them
+    """
+
+    def __init__(self, feature_data_client, spreadsheets_client, \
+        authenticator, cache=None):
+        """
+        feature_data_client (CrudDbClient): client of the ssviz_feature_data
+            table
+        spreadsheets_client (CrudDbClient): client of the ssviz_spreadsheets
+            table
+        cache (HeatmapBinCache): where to keep the summaries. a new one is
+            made if None
+        """
+        self.crud_client = feature_data_client
+        self.spreadsheets_client = spreadsheets_client
+        if cache is None:
+            cache = ssv_heatmap_bins.HeatmapBinCache()
+        self.cache = cache
+        super(SsvizFeatureBinsEndpoint, self).__init__(\
+            'ssviz_feature_bins', authenticator)
+
+    def get_flask_rule(self):
+        rule = 'ssviz_feature_bins'
+        return rule
+
+    def get_flask_endpoint(self):
+        return 'ssviz_feature_bins'
+
+    def do_GET(self, request, requesting_user):
+        try:
+            spreadsheet_id = int(request.args['ssviz_spreadsheet_id'])
+            feature_idxs = _parse_int_list(request.args['feature_idxs'])
+            num_bins = int(request.args['num_bins'])
+            sample_idxs = None
+            if 'sample_idxs' in request.args:
+                sample_idxs = _parse_int_list(request.args['sample_idxs'])
+        except (KeyError, ValueError):
+            return flask.make_response('ssviz_spreadsheet_id, ' + \
+                'feature_idxs and num_bins are required, and all params ' + \
+                'must be non-negative integers', 400)
+        if num_bins < 1:
+            return flask.make_response('num_bins must be positive', 400)
+
+        # the record ids tell us which features exist and are readable, and
+        # which version of each we'd be summarizing
+        record_ids = dict()
+        if len(feature_idxs) > 0:
+            id_rows = self.crud_client.simple_filter_query(\
+                {'ssviz_spreadsheet_id': spreadsheet_id, \
+                'feature_idx': sorted(set(feature_idxs))}, \
+                user=requesting_user, fields=['feature_idx'])
+            for row in id_rows:
+                record_ids[row['feature_idx']] = row['id']
+        ordering_key = ssv_heatmap_bins.make_ordering_key(sample_idxs)
+        summaries = dict()
+        bin_starts = None
+        for feature_idx, record_id in record_ids.iteritems():
+            summary = self.cache.get((record_id, num_bins, ordering_key))
+            if summary is not None:
+                summaries[feature_idx] = summary
+                bin_starts = summary['bin_starts']
+        missing_idxs = [idx for idx in record_ids if idx not in summaries]
+
+        if len(missing_idxs) > 0:
+            feature_types = self._get_feature_types(\
+                spreadsheet_id, requesting_user)
+            if feature_types is None:
+                return flask.make_response('no such spreadsheet', 404)
+            arrays = fetch_feature_arrays(self.crud_client, requesting_user, \
+                spreadsheet_id, missing_idxs)
+            for feature_idx, arr in arrays.iteritems():
+                if sample_idxs is not None:
+                    try:
+                        arr = arr[sample_idxs]
+                    except IndexError:
+                        return flask.make_response(\
+                            'sample_idxs out of range', 400)
+                starts = ssv_heatmap_bins.make_bin_starts(len(arr), num_bins)
+                feature_type = None
+                if feature_idx < len(feature_types):
+                    feature_type = feature_types[feature_idx]
+                summary = ssv_heatmap_bins.summarize_feature(\
+                    arr, feature_type, starts)
+                if summary is None:
+                    summary = dict()
+                summary['bin_starts'] = starts.tolist()
+                bin_starts = summary['bin_starts']
+                summaries[feature_idx] = summary
+                self.cache.put(\
+                    (record_ids[feature_idx], num_bins, ordering_key), summary)
+
+        results = list()
+        for feature_idx in feature_idxs:
+            summary = summaries.get(feature_idx)
+            if summary is not None and 'feature_type' in summary:
+                summary = {k: v for k, v in summary.iteritems() \
+                    if k != 'bin_starts'}
+            else:
+                summary = None
+            results.append(summary)
+        resp = self._make_success_json_response({\
+            'ssviz_spreadsheet_id': spreadsheet_id, \
+            'feature_idxs': feature_idxs, 'num_bins': num_bins, \
+            'sample_idxs': sample_idxs, 'bin_starts': bin_starts, \
+            'summaries': results})
+        return resp
+
+    def _get_feature_types(self, spreadsheet_id, requesting_user):
+        """
+        returns the feature_types of the spreadsheet, or None if there's no
+        such spreadsheet the user may read
+        """
+        rows = self.spreadsheets_client.simple_filter_query(\
+            {'id': spreadsheet_id}, user=requesting_user, \
+            fields=['feature_types'])
+        if not rows:
+            return None
+        return rows[0]['feature_types']
+
+def fetch_feature_arrays(feature_data_client, requesting_user, \
+    spreadsheet_id, feature_idxs):
+    """
+    feature_data_client (CrudDbClient): client of the ssviz_feature_data
+        table
+    returns a dict from feature_idx to the feature's values as a numpy
+    array (see typed_array.decode), for every feature in feature_idxs
+    that the spreadsheet has
+    """
+    if len(feature_idxs) == 0:
+        return dict()
+    rows = feature_data_client.simple_filter_query(\
+        {'ssviz_spreadsheet_id': spreadsheet_id, \
+        'feature_idx': sorted(set(feature_idxs))}, \
+        user=requesting_user, fields=['feature_idx', 'values'])
+    arrays = dict()
+    for row in rows:
+        arrays[row['feature_idx']] = typed_array.decode(row['values'])
+    return arrays
+
+def _parse_int_list(param):
+    """
+    parses a comma-separated list of non-negative ints, e.g. '1,2,3'.
+    raises ValueError for anything else; negative indices must not reach
+    numpy, which would count them from the end
+    """
+    vals = [int(val) for val in param.split(',') if val.strip() != '']
+    if any(val < 0 for val in vals):
+        raise ValueError('negative index in ' + param)
+    return vals
@@ -3,17 +3,15 @@ This module defines methods to read and write job-related records in the DB.
 """
 from datetime import timedelta
 import logging
-from numbers import Number
 from shutil import copyfile
 
-import numpy as np
-
 from nest_py.core.flask.accounts.token import TokenAgent
 from nest_py.core.api_clients.http_client import NestHttpClient
 from nest_py.core.data_types.nest_id import NestId
 from nest_py.core.data_types.nest_user import NestUser
 from nest_py.core.data_types.tablelike_entry import TablelikeEntry
 import nest_py.core.db.nest_db as nest_db
+from nest_py.core.db.crud_db_client import SharedTransaction
 import nest_py.knoweng.data_types.knoweng_schemas as knoweng_schemas
 import nest_py.knoweng.data_types.files as files
 from nest_py.knoweng.data_types.files import FileDTO
@@ -76,6 +74,9 @@ SCHEMA_REGISTRY = None
 #dict from schema name -> crud client (db or api)
 CLIENT_REGISTRY = None
 
+#number of ssviz_feature_correlations records per multi-row INSERT
+CORRELATIONS_BATCH_SIZE = 100
+
 
 def init_token_maker(secret, issuer, audiences):
     """Initializes TOKEN_MAKER.
@@ -132,6 +133,21 @@ def init_crud_clients():
         CLIENT_REGISTRY[name] = crud_client
     return
 
+def shared_db_transaction():
+    """Returns a SharedTransaction over the engine used by the DB clients in
+    CLIENT_REGISTRY. Use it in a 'with' statement to make all the DB
+    reads and writes in the block share one connection and one transaction
+    (committed at the end of the block, rolled back on error).
+
+    Note the clients in API_COLLECTIONS go through the API and aren't
+    part of the transaction.
+
+    Returns:
+        SharedTransaction: The transaction scope.
+
+    """
+    return SharedTransaction(nest_db.get_global_sqlalchemy_engine())
+
 def login_client(crud_client, user_id):
 
     if crud_client.get_collection_name() in DB_COLLECTIONS:
@@ -529,24 +545,23 @@ def create_ssviz_spreadsheet_and_feature_data(user_id, file_id,\
             file_id.to_slug())
     created_id = created_tle.get_nest_id()
 
-    # prepare to write the rows to the DB
+    # stream the rows to the DB; the generator means we never hold more
+    # than one feature's row in memory on top of ss_df
     collection_name = ssviz_feature_data.COLLECTION_NAME
     crud_client = get_crud_client(collection_name, user_id)
 
-    tles = []
-    for feature_idx, feature_name in enumerate(ss_df):
-        feature = ss_df[feature_name]
-        tle = TablelikeEntry(SCHEMA_REGISTRY[collection_name])
-        tle.set_value('ssviz_spreadsheet_id', created_id)
-        tle.set_value('feature_idx', feature_idx)
-        # replace any numeric NaNs with Nones
-        safe_values = [None if (isinstance(val, Number) and np.isnan(val)) \
-            else val for val in feature.tolist()]
-        tle.set_value('values', safe_values)
-        tles.append(tle)
-
-    # write the rows to the DB
-    crud_client.bulk_create_entries_async(tles, batch_size=5000)
+    def feature_rows():
+        for feature_idx in xrange(ss_df.shape[1]):
+            # the values attribute encodes numeric columns straight from the
+            # array, with NaNs as missing values, and categoric columns by
+            # category codes
+            yield (created_id, feature_idx, ss_df.iloc[:, feature_idx].values)
+
+    num_copied = crud_client.bulk_copy_rows(feature_rows(), \
+        columns=['ssviz_spreadsheet_id', 'feature_idx', 'values'])
+    if num_copied is None:
+        raise IOError("couldn't save SSV feature data for file " + \
+            file_id.to_slug())
     return created_id
 
 def create_ssviz_jobs_spreadsheets_entries(user_id, job_id,\
@@ -624,21 +639,21 @@ def get_ssviz_spreadsheets_with_correlations(\
         'ssviz_spreadsheet_id': ids_as_ints,
         'g_spreadsheet_id': ids_as_ints})
 
-def create_ssviz_feature_correlations_entry(user_id, ssviz_spreadsheet_id, \
-    g_spreadsheet_id, g_feature_idx, scores):
-    """Creates a record in ssviz_feature_correlations.
+def create_ssviz_feature_correlations_entries(user_id, correlations):
+    """Creates records in ssviz_feature_correlations with bulk inserts.
 
         Args:
         user_id (Nestid): The user_id of the user who created the job.
-        ssviz_spreadsheet_id (Nestid): The ssviz_spreadsheet_id of the
-            spreadsheet over which the correlations were calculated.
-        g_spreadsheet_id (Nestid): The ssviz_spreadsheet_id of
-            the spreadsheet that supplied the basis for grouping (see also
-            `g_feature_idx`).
-        g_feature_idx (int): The feature index of the feature within
-            the spreadsheet specified by `g_spreadsheet_id`
-            that supplied the basis for grouping.
-        scores (list): The pvals as a list of floats.
+        correlations (list): A list of tuples, one per record, each containing
+            the record's values as described in the ssviz_feature_correlations
+            schema:
+            ssviz_spreadsheet_id (Nestid): The ssviz_spreadsheet_id of the
+                spreadsheet over which the correlations were calculated.
+            g_spreadsheet_id (Nestid): The ssviz_spreadsheet_id of the
+                spreadsheet that supplied the basis for grouping.
+            g_feature_idx (int): The feature index of the grouping feature
+                within the spreadsheet specified by `g_spreadsheet_id`.
+            scores (list): The pvals as a list of floats.
 
         Returns:
             None: None
@@ -647,15 +662,19 @@ def create_ssviz_feature_correlations_entry(user_id, ssviz_spreadsheet_id, \
     collection_name = ssviz_feature_correlations.COLLECTION_NAME
     crud_client = get_crud_client(collection_name, user_id)
 
-    tle = TablelikeEntry(SCHEMA_REGISTRY[collection_name])
-    tle.set_value('ssviz_spreadsheet_id', ssviz_spreadsheet_id)
-    tle.set_value('g_spreadsheet_id', g_spreadsheet_id)
-    tle.set_value('g_feature_idx', g_feature_idx)
-    tle.set_value('scores', scores)
+    tles = []
+    for ssviz_spreadsheet_id, g_spreadsheet_id, g_feature_idx, scores in \
+            correlations:
+        tle = TablelikeEntry(SCHEMA_REGISTRY[collection_name])
+        tle.set_value('ssviz_spreadsheet_id', ssviz_spreadsheet_id)
+        tle.set_value('g_spreadsheet_id', g_spreadsheet_id)
+        tle.set_value('g_feature_idx', g_feature_idx)
+        tle.set_value('scores', scores)
+        tles.append(tle)
 
-    created_tle = crud_client.create_entry(tle)
-    if created_tle is None:
-        raise IOError("couldn't save correlations for " + \
-            ssviz_spreadsheet_id.to_slug() + " grouped by " + \
-            g_spreadsheet_id.to_slug() + " feature " + \
-            str(g_feature_idx))
+    # each record holds a score per comparison feature, so keep the
+    # multi-row insert statements to a bounded size
+    created_tles = crud_client.bulk_create_entries(tles, \
+        batch_size=CORRELATIONS_BATCH_SIZE)
+    if created_tles is None:
+        raise IOError("couldn't save " + str(len(tles)) + " correlations")
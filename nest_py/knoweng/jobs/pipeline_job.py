@@ -113,6 +113,27 @@ class PipelineJob(object):
         """
         raise NotImplementedError('Subclass must override base class method.')
 
+    def get_upstream_runners(self):
+        """Returns the runners that must be done before this job can start.
+        Subclasses that depend on other runners should override.
+
+        Returns:
+            list: The upstream runners.
+
+        """
+        return []
+
+    def get_downstream_runners(self):
+        """Returns the runners that can't start until this job is done.
+        Subclasses should override if the downstream runners don't already
+        name this job in their `get_upstream_runners`.
+
+        Returns:
+            list: The downstream runners.
+
+        """
+        return []
+
     def is_started(self):
         """Returns True if the job has been started, else returns False. Note
         this will continue to return True even after the job has finished.
@@ -161,6 +161,10 @@ class FeaturePrioritizationJob(PipelineJob):
             ' -run_file run.yml' + \
             ' && date;'
 
+    def get_upstream_runners(self):
+        """Returns the prep job, which must be done first."""
+        return [self.prep_job]
+
     def is_ready(self):
         """Returns true iff preprocessing is done."""
         return_val = self.prep_job.is_done()
@@ -181,6 +181,10 @@ class GeneSetCharacterizationComputeJob(PipelineJob):
             ' -run_file ' + yml_filename + \
             ' && date;'
 
+    def get_upstream_runners(self):
+        """Returns the prep job, which must be done first."""
+        return [self.prep_job]
+
     def is_ready(self):
         return_val = self.prep_job.is_done()
         LOGGER.debug(self.job_name + '.is_ready? ' + str(return_val))
@@ -299,6 +303,14 @@ class GeneSetCharacterizationWrapupJob(object):
     def is_started(self):
         return self.started
 
+    def get_upstream_runners(self):
+        """Returns the prep jobs, which must all be done first."""
+        return self.prep_jobs
+
+    def get_downstream_runners(self):
+        """Returns an empty list; nothing depends on this job."""
+        return []
+
     def yml_path_for_collection(self, collection):
         """Returns the yml file path for a collection's subjob.
 
@@ -201,6 +201,14 @@ class SampleClusteringComputeJob(PipelineJob):
             ' -run_file run.yml' + \
             ' && date;'
 
+    def get_upstream_runners(self):
+        """Returns the prep job, which must be done first."""
+        return [self.prep_job]
+
+    def get_downstream_runners(self):
+        """Returns the postprocessing job, which on_done configures."""
+        return [self.postprocessing_job]
+
     def is_ready(self):
         """Returns true iff preprocessing is done."""
         return_val = self.prep_job.is_done()
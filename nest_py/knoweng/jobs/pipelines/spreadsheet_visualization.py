@@ -12,14 +12,12 @@ unifying this code with the Omix data model.
 """
 
 import logging
+import multiprocessing
 import os
 from zipfile import ZipFile, ZIP_DEFLATED
 
 import numpy as np
 import pandas as pd
-from scipy import stats
-
-from lifelines.statistics import multivariate_logrank_test
 
 from nest_py.knoweng.jobs.db_utils import get_file_record, \
     get_ssviz_spreadsheets_by_ids, get_ssviz_spreadsheets_by_file_ids, \
@@ -27,7 +25,9 @@ from nest_py.knoweng.jobs.db_utils import get_file_record, \
     create_ssviz_jobs_spreadsheets_entries, \
     create_ssviz_feature_variances_entry, \
     get_ssviz_spreadsheets_with_correlations, \
-    create_ssviz_feature_correlations_entry
+    create_ssviz_feature_correlations_entries, shared_db_transaction
+import nest_py.knoweng.jobs.spreadsheet_loader as spreadsheet_loader
+import nest_py.knoweng.jobs.ssv_statistics as ssv_statistics
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -46,7 +46,8 @@ class SpreadsheetVisualizationJob(object):
 
     """Local job that handles spreadsheet visualization."""
     def __init__(self, user_id, job_id, project_id, userfiles_dir,\
-        job_dir_relative_path, job_name, spreadsheet_nest_ids):
+        job_dir_relative_path, job_name, spreadsheet_nest_ids, \
+        num_correlation_workers=1, downcast_to_float32=False):
         """Initializes self.
 
         Args:
@@ -60,6 +61,11 @@ class SpreadsheetVisualizationJob(object):
                 exist.
             job_name (str): The job name.
             spreadsheet_nest_ids: The data files in the job
+            num_correlation_workers (int): The number of processes among
+                which to divide the correlation calculations. With 1, they
+                run in this process.
+            downcast_to_float32 (bool): Whether to load numeric data as float32
+                instead of float64, halving its memory.
 
         Returns:
             None: None.
@@ -72,6 +78,8 @@ class SpreadsheetVisualizationJob(object):
         self.job_dir_path = os.path.join(userfiles_dir, job_dir_relative_path)
         self.job_name = job_name
         self.spreadsheet_nest_ids = spreadsheet_nest_ids
+        self.num_correlation_workers = num_correlation_workers
+        self.float_dtype = np.float32 if downcast_to_float32 else np.float64
         self.started = False
         self.error_message = None
 
@@ -82,6 +90,9 @@ class SpreadsheetVisualizationJob(object):
         # ssviz_spreadsheet_id
         # it'll be populated as self.spreadsheet_nest_ids are processed
         self.spreadsheets = []
+        # the correlations calculated for this job that are waiting to be
+        # recorded; see `calculate_correlations`
+        self.correlations = []
 
     def start(self):
         """Processes all spreadsheet data to populate database tables.
@@ -105,6 +116,15 @@ class SpreadsheetVisualizationJob(object):
         """
         return self.started
 
+    def get_upstream_runners(self):
+        """Returns an empty list; subclasses that depend on other runners
+        declare them from the other side."""
+        return []
+
+    def get_downstream_runners(self):
+        """Returns an empty list; nothing depends on this job."""
+        return []
+
     def get_command(self):
         pass
 
@@ -140,29 +160,45 @@ class SpreadsheetVisualizationJob(object):
         # count missing values per feature and per sample
         if not self.is_failed():
             self.count_missing_values()
-        # TODO start a DB transaction--need to limit its scope to this job only
-        # check/populate ssviz_spreadsheets table, along with
-        # ssviz_spreadsheet_id and is_new_to_db in self.spreadsheets
-        if not self.is_failed():
+        if self.is_failed():
+            return
+        # look up the spreadsheets already in the DB, then do the expensive
+        # calculations before writing anything, so the transaction below
+        # stays short and the new records are visible to other jobs soon
+        self.find_spreadsheets()
+        self.calculate_variances()
+        self.calculate_correlations()
+        if self.is_failed():
+            return
+        # the DB writes share one connection and transaction, so either all
+        # of this job's SSV records are committed or none of them are; the
+        # transaction is per-thread, so it's limited to this job
+        with shared_db_transaction() as transaction:
+            # populate ssviz_spreadsheets, ssviz_feature_data and
+            # ssviz_jobs_spreadsheets
             self.record_spreadsheets()
-        # check/populate ssviz_feature_variances
-        if not self.is_failed():
-            self.calculate_and_record_variances()
-        # check/populate ssviz_feature_correlations
-        if not self.is_failed():
-            self.calculate_and_record_correlations()
-        # TODO commit DB transaction
+            # populate ssviz_feature_variances
+            if not self.is_failed():
+                self.record_variances()
+            # populate ssviz_feature_correlations
+            if not self.is_failed():
+                self.record_correlations()
+            if self.is_failed():
+                transaction.set_rollback_only()
 
     def load_spreadsheets(self):
         """Reads files into dataframes and partially populates self.spreadsheets
         with file_id and df values.
 
         """
+        cache_dir = os.path.join(\
+            self.userfiles_dir, spreadsheet_loader.CACHE_DIR_NAME)
         for ssf_id in self.spreadsheet_nest_ids:
             ssf_dto = get_file_record(self.user_id, ssf_id)
             ssf_path = ssf_dto.get_file_path(self.userfiles_dir)
 
-            input_df = SpreadsheetVisualizationJob._load_spreadsheet(ssf_path)
+            input_df = SpreadsheetVisualizationJob._load_spreadsheet(\
+                ssf_path, float_dtype=self.float_dtype, cache_dir=cache_dir)
 
             self.spreadsheets.append({\
                 "file_id": ssf_id,
@@ -170,63 +206,23 @@ class SpreadsheetVisualizationJob(object):
                 "df": input_df})
 
     @staticmethod
-    def _load_spreadsheet(ssf_path):
+    def _load_spreadsheet(ssf_path, float_dtype=np.float64, cache_dir=None):
         """Reads one file into a dataframe, attempting some data cleanup along
         the way. Broken out into a static method for ease of testing.
 
         Args:
             ssf_path (str): The path to the spreadsheet.
+            float_dtype (numpy.dtype): The dtype for numeric data; see
+                `spreadsheet_loader.load_spreadsheet`.
+            cache_dir (str): The directory of the parsed-spreadsheet cache, or
+                None to skip the cache; see `spreadsheet_loader`.
 
         Returns:
             pandas.DataFrame: A dataframe containing the spreadsheet data.
 
         """
-        # A few comments on reading the spreadsheet:
-        # 1. The spreadsheet might use row numbers as labels # TODO handle
-        # 2. The spreadsheet might use "NA"-like strings as labels
-        # 3. There might be duplicates among the row labels and/or column
-        #    labels. Note we set mangle_dupe_cols to False. We don't want
-        #    to mangle yet, because we don't know at this point which
-        #    dimension corresponds to samples and which corresponds to
-        #    features. Once we figure out the correct orientation, we'll
-        #    drop duplicate samples (because we won't know how to join
-        #    them properly across speadsheets--unless we have only one
-        #    spreadsheet), and we'll name-mangle duplicate features (because
-        #    there's no joining to do, and while mangled names could confuse
-        #    the user, the UI provides enough clues to disambiguate if the
-        #    user is tracing back to the original file).
-        #    see `_clean_duplicate_features_and_samples()`
-        input_df = pd.read_csv(\
-            ssf_path, sep='\t', index_col=0, header=0,
-            mangle_dupe_cols=False, error_bad_lines=False,
-            warn_bad_lines=True)
-
-        # check for column labels treated as NaN
-        nan_column_labels = pd.isnull(input_df.columns)
-        if True in nan_column_labels:
-            # replace the column labels
-            with open(ssf_path) as infile:
-                line = infile.readline().rstrip()
-                headers = line.split("\t")
-                # user's file might or might not have had label on first column
-                start_index = len(headers) - len(nan_column_labels)
-                input_df.columns = headers[start_index:]
-
-        # check for row labels treated as NaN
-        nan_row_labels = pd.isnull(input_df.index)
-        if True in nan_row_labels:
-            # replace the row labels
-            # don't re-parse every row, every column
-            # (still room for improvement here)
-            row_index = -1 # first row of file is headers
-            with open(ssf_path) as infile:
-                for line in infile:
-                    if row_index >= 0 and nan_row_labels[row_index]:
-                        row_label = line.split("\t")[0]
-                        input_df.index.values[row_index] = row_label
-                    row_index += 1
-
-        return input_df
+        return spreadsheet_loader.load_spreadsheet(\
+            ssf_path, float_dtype=float_dtype, cache_dir=cache_dir)
 
     @staticmethod
     def _test_label_intersections(labels_to_match, files_metadata):
@@ -303,14 +299,24 @@ class SpreadsheetVisualizationJob(object):
         #     eligible (need agreement on variance analog)
 
         feature_types = []
+        # a shallow copy is enough, because nothing below modifies the data
+        # in place; columns are only ever replaced, and the labels are only
+        # ever reassigned
+        # this keeps large numeric spreadsheets from being copied for each
+        # orientation we consider
         clean_df = SpreadsheetVisualizationJob.\
             _clean_duplicate_features_and_samples(\
-                input_df.copy(), drop_duplicate_samples)
+                input_df.copy(deep=False), drop_duplicate_samples)
 
         # short-term step 1: attempt to convert all features to numeric
         for feature_name in clean_df:
-            clean_df[feature_name] = pd.to_numeric(\
-                clean_df[feature_name], errors='ignore')
+            # the parser already typed numeric columns, but transposing a
+            # mixed-type dataframe leaves numeric values in object columns
+            if clean_df[feature_name].dtype == object:
+                numeric_feature = pd.to_numeric(\
+                    clean_df[feature_name], errors='ignore')
+                if numeric_feature.dtype != object:
+                    clean_df[feature_name] = numeric_feature
             # at this point, just distinguish other and numeric
             feature_type = "other"
             if np.issubdtype(clean_df[feature_name].dtype, np.number):
@@ -335,9 +341,12 @@ class SpreadsheetVisualizationJob(object):
                     feature_types[feature_idx] = "other"
                 elif nunique <= MAX_UNIQUE_CATEGORICAL_VALUES:
                     feature_types[feature_idx] = "categoric"
-                    # TODO: consider consequences of this:
-                    # clean_df[feature_name] = \
-                    #     clean_df[feature_name].astype('category')
+                    # store non-numeric categoric features as integer codes
+                    # plus a few distinct values, instead of one python
+                    # object per sample; numerically-coded categoric features
+                    # stay numeric
+                    if feature.dtype == object:
+                        clean_df[feature_name] = feature.astype('category')
         return feature_types, clean_df
 
     @staticmethod
@@ -372,25 +381,32 @@ class SpreadsheetVisualizationJob(object):
         original_feature_names = input_df.columns.tolist()
         original_sample_names = input_df.index.tolist()
         # name-mangle any duplicate feature names
+        # note we assign new labels rather than modifying the existing ones in
+        # place, because input_df may share its labels with another dataframe
+        feature_names = []
         fname_counts = {}
-        for idx, fname in enumerate(original_feature_names):
+        for fname in original_feature_names:
             if fname in fname_counts:
                 fname_counts[fname] += 1
-                new_name = fname + "." + str(fname_counts[fname])
-                input_df.columns.values[idx] = new_name
+                feature_names.append(fname + "." + str(fname_counts[fname]))
             else:
                 fname_counts[fname] = 0
+                feature_names.append(fname)
+        input_df.columns = pd.Index(feature_names, name=input_df.columns.name)
         # name-mangle or drop any duplicate sample names
+        sample_names = []
         sname_counts = {}
         duplicate_samples = [] # tracking in case we need to drop
-        for idx, sname in enumerate(original_sample_names):
+        for sname in original_sample_names:
             if sname in sname_counts:
                 sname_counts[sname] += 1
                 new_name = sname + "." + str(sname_counts[sname])
-                input_df.index.values[idx] = new_name
+                sample_names.append(new_name)
                 duplicate_samples.append(new_name)
             else:
                 sname_counts[sname] = 0
+                sample_names.append(sname)
+        input_df.index = pd.Index(sample_names, name=input_df.index.name)
         if drop_duplicate_samples:
             input_df.drop(labels=duplicate_samples, axis=0, inplace=True)
         return input_df
@@ -537,34 +553,62 @@ class SpreadsheetVisualizationJob(object):
             ss_dict['sample_nan_counts'] = df_nulls.sum(axis=1).tolist()
             ss_dict['feature_nan_counts'] = df_nulls.sum(axis=0).tolist()
 
-    def record_spreadsheets(self):
+    def find_spreadsheets(self):
         """
-        Ensures that ssviz_spreadsheets contains a record for each spreadsheet
-        and that ssviz_feature_data contains a record for each feature in each
-        spreadsheet. Associates each spreadsheet with the job in
-        ssviz_jobs_spreadsheets. Sets ssviz_spreadsheet_id and is_new_to_db in
-        self.spreadsheets.
+        Sets ssviz_spreadsheet_id and is_new_to_db in self.spreadsheets for
+        the spreadsheets that already have records in ssviz_spreadsheets.
+        The others get an ssviz_spreadsheet_id of None until
+        `record_spreadsheets` creates their records.
+        """
+        existing_ids = self._get_existing_spreadsheet_ids()
+        for ss_idx, ss_dict in enumerate(self.spreadsheets):
+            ss_dict['ssviz_spreadsheet_id'] = existing_ids.get(ss_idx)
+            ss_dict['is_new_to_db'] = ss_dict['ssviz_spreadsheet_id'] is None
+
+    def _get_existing_spreadsheet_ids(self):
+        """
+        Returns a dict from index into self.spreadsheets to the NestId of the
+        spreadsheet's record in ssviz_spreadsheets, for each spreadsheet that
+        has one.
         """
         ssviz_spreadsheets_for_file_ids = get_ssviz_spreadsheets_by_file_ids(\
             self.user_id,
             [ss_dict['file_id'] for ss_dict in self.spreadsheets])
-        for ss_dict in self.spreadsheets:
+        existing_ids = {}
+        for ss_idx, ss_dict in enumerate(self.spreadsheets):
             matches = [tle for tle in ssviz_spreadsheets_for_file_ids if \
                 tle.get_value('file_id') == ss_dict['file_id'] and \
                 tle.get_value('is_file_samples_as_rows') == \
                 ss_dict['is_file_samples_as_rows']]
             if len(matches) > 0:
-                ss_dict['ssviz_spreadsheet_id'] = matches[0].get_nest_id()
-                ss_dict['is_new_to_db'] = False
+                existing_ids[ss_idx] = matches[0].get_nest_id()
                 if len(matches) > 1:
                     # this can happen when multiple ssv jobs run on the same
                     # file at the same time. it's not ideal but it doesn't
                     # break anything, either
-                    # TODO prevent this case
                     LOGGER.warning("Found " + str(len(matches)) + \
                         " records for file_id " + str(ss_dict['file_id']) + \
                         " and " + "is_file_samples_as_rows " + \
                         str(ss_dict['is_file_samples_as_rows']))
+        return existing_ids
+
+    def record_spreadsheets(self):
+        """
+        Ensures that ssviz_spreadsheets contains a record for each spreadsheet
+        and that ssviz_feature_data contains a record for each feature in each
+        spreadsheet. Associates each spreadsheet with the job in
+        ssviz_jobs_spreadsheets. Sets ssviz_spreadsheet_id and is_new_to_db in
+        self.spreadsheets.
+        """
+        # another job on the same file may have recorded it since
+        # `find_spreadsheets` ran
+        existing_ids = self._get_existing_spreadsheet_ids()
+        for ss_idx, ss_dict in enumerate(self.spreadsheets):
+            if not ss_dict['is_new_to_db']:
+                continue
+            if ss_idx in existing_ids:
+                ss_dict['ssviz_spreadsheet_id'] = existing_ids[ss_idx]
+                ss_dict['is_new_to_db'] = False
             else:
                 ssviz_spreadsheet_id = create_ssviz_spreadsheet_and_feature_data(\
                     self.user_id, ss_dict['file_id'],
@@ -573,16 +617,15 @@ class SpreadsheetVisualizationJob(object):
                     ss_dict['feature_nan_counts'], ss_dict['sample_nan_counts'],
                     ss_dict['df'])
                 ss_dict['ssviz_spreadsheet_id'] = ssviz_spreadsheet_id
-                ss_dict['is_new_to_db'] = True
         if not self.is_failed():
             create_ssviz_jobs_spreadsheets_entries(self.user_id, self.job_id,\
                 [ss_dict['ssviz_spreadsheet_id'] for ss_dict in \
                 self.spreadsheets])
 
-    def calculate_and_record_variances(self):
+    def calculate_variances(self):
         """
-        Ensures that any spreadsheets consisting entirely of numeric data have
-        records in ssviz_feature_variances.
+        Calculates the feature variances of any spreadsheets consisting
+        entirely of numeric data, updating self.spreadsheets.
         """
         for ss_dict in self.spreadsheets:
             unique_types = list(set(ss_dict['feature_types']))
@@ -591,128 +634,110 @@ class SpreadsheetVisualizationJob(object):
                 # not new to the db--we'll write them to the download zip
                 ss_dict['variances'] = [np.nanvar(ss_dict['df'][feature_name]) \
                     for feature_name in ss_dict['df']]
-                if ss_dict['is_new_to_db']:
-                    create_ssviz_feature_variances_entry(self.user_id,\
-                        ss_dict['ssviz_spreadsheet_id'], ss_dict['variances'])
 
-    def calculate_and_record_correlations(self):
+    def record_variances(self):
+        """
+        Ensures that any spreadsheets consisting entirely of numeric data have
+        records in ssviz_feature_variances.
         """
-        Ensures that all possible groupings have correlation records in
+        for ss_dict in self.spreadsheets:
+            if 'variances' in ss_dict and ss_dict['is_new_to_db']:
+                create_ssviz_feature_variances_entry(self.user_id,\
+                    ss_dict['ssviz_spreadsheet_id'], ss_dict['variances'])
+
+    def _get_existing_correlations(self):
+        """
+        Returns the set of (comparison ssviz_spreadsheet_id, grouping
+        ssviz_spreadsheet_id) pairs, as ints, that already have records in
         ssviz_feature_correlations.
         """
+        ssviz_spreadsheet_ids = [ss_dict['ssviz_spreadsheet_id'] for ss_dict \
+            in self.spreadsheets if ss_dict['ssviz_spreadsheet_id'] is not None]
+        if not ssviz_spreadsheet_ids:
+            return set()
         candidate_correlations = get_ssviz_spreadsheets_with_correlations(\
-            self.user_id, [ss_dict['ssviz_spreadsheet_id'] for ss_dict \
-            in self.spreadsheets])
-        for grouping_ss_dict in self.spreadsheets:
+            self.user_id, ssviz_spreadsheet_ids)
+        return set((cc_tle.get_value('ssviz_spreadsheet_id').get_value(), \
+            cc_tle.get_value('g_spreadsheet_id').get_value()) \
+            for cc_tle in candidate_correlations)
+
+    def calculate_correlations(self):
+        """
+        Calculates the correlations of all possible groupings that don't have
+        records in ssviz_feature_correlations yet. Stores them in
+        self.correlations as tuples (comp_ss_idx, grouping_ss_idx,
+        g_feature_idx, pvals), where the first two are indices into
+        self.spreadsheets.
+        """
+        self.correlations = []
+        existing_correlations = self._get_existing_correlations()
+        # encoding a comparison spreadsheet for the batched tests is the
+        # expensive part, so do it at most once per spreadsheet, and only for
+        # spreadsheets that actually need correlations
+        # keys are indices into self.spreadsheets
+        comparison_features_by_idx = {}
+        # each task is a tuple (comp_ss_idx, grouping_ss_idx, g_feature_idx)
+        tasks = []
+        for grouping_ss_idx, grouping_ss_dict in enumerate(self.spreadsheets):
             grouping_feature_types = grouping_ss_dict['feature_types']
             # skip this grouping spreadsheet if it doesn't contain any
             # categoric features
             if 'categoric' not in grouping_feature_types:
                 continue
-            for comp_ss_dict in self.spreadsheets:
+            for comp_ss_idx, comp_ss_dict in enumerate(self.spreadsheets):
                 # skip calculation if we've previously processed this combo
-                if [cc_tle for cc_tle in candidate_correlations if \
-                    cc_tle.get_value('ssviz_spreadsheet_id') == \
-                    comp_ss_dict['ssviz_spreadsheet_id'] and \
-                    cc_tle.get_value('g_spreadsheet_id') == \
-                    grouping_ss_dict['ssviz_spreadsheet_id']]:
+                if _get_id_pair(comp_ss_dict, grouping_ss_dict) in \
+                    existing_correlations:
                     continue
+                if comp_ss_idx not in comparison_features_by_idx:
+                    comparison_features_by_idx[comp_ss_idx] = \
+                        ssv_statistics.ComparisonFeatures(\
+                            comp_ss_dict['df'], comp_ss_dict['feature_types'])
                 for g_feature_idx, g_feature_type in \
                     enumerate(grouping_feature_types):
                     if g_feature_type == 'categoric':
-                        # grab the grouping feature so we can group the
-                        # comparison df accordingly
-                        g_feature = \
-                            grouping_ss_dict['df'].iloc[:, g_feature_idx]
-                        # pd.crosstab below won't work if series share name
-                        # https://github.com/pandas-dev/pandas/issues/6319
-                        # so rename g_feature
-                        # changing g_feature doesn't affect the df from which it
-                        # came, btw
-                        g_feature.name = "NEST_INTERNAL_RENAME_FOR_CROSSTAB"
-                        # g_feature_groups will be a dictionary in which
-                        # category values are keys and sample name arrays are
-                        # values
-                        # note missing values are not considered a group here,
-                        # and that's how we want it
-                        g_feature_groups = \
-                            g_feature.groupby(by=g_feature).groups
-                        # break comp_ss dataframe into groups
-                        # doing this once at the dataframe level, instead of
-                        # inside the loop at the feature level, to reduce time
-                        # comp_df_groups will be a dictionary in which category
-                        # values are keys and sub-dataframes (one for the set of
-                        # sample names associated with each category value) are
-                        # the values
-                        comp_df = comp_ss_dict['df']
-                        comp_df_groups = {}
-                        comp_df_sample_names_set = set(comp_df.index.tolist())
-                        for cat_value, sample_names \
-                                in g_feature_groups.iteritems():
-                            common_sample_names = [sn for sn in sample_names \
-                                if sn in comp_df_sample_names_set]
-                            if common_sample_names:
-                                # pull sample_names, not common_sample_names
-                                # that'll give us NaN rows for any samples not
-                                # found in comp_df
-                                # see TODO note in else branch about later
-                                # versions of pandas
-                                comp_df_groups[cat_value] = \
-                                    comp_df.loc[sample_names]
-                            else:
-                                # pandas will raise an error if we call .loc
-                                # without any matches, so we'll manually
-                                # create a df with NaN entries, consistent with
-                                # .loc's behavior for partial matches
-                                # TODO more recent versions of pandas might
-                                # raise errors if there are ANY unmatched
-                                # indices
-                                comp_df_groups[cat_value] = pd.DataFrame([], \
-                                    index=sample_names, \
-                                    columns=comp_df.columns.tolist())
-                        comp_feature_types = comp_ss_dict['feature_types']
-                        pvals = []
-                        for c_feature_idx, c_feature_type in \
-                            enumerate(comp_feature_types):
-                            pval = None
-                            if c_feature_type == 'numeric':
-                                groups_values = [[x for x in \
-                                    sub_df.iloc[:, c_feature_idx].values \
-                                    if not np.isnan(x)] \
-                                    for cat_value, sub_df in \
-                                    comp_df_groups.iteritems()]
-                                fval, pval = stats.f_oneway(*groups_values)
-                                # if pval is nan, treat it as no association
-                                # (happens, e.g., if there's no variance in
-                                # comparison feature)
-                                # for now, don't have to worry about case where
-                                # comparison feature IS the grouping feature,
-                                # because we're only supporting categoric
-                                # grouping features, and this branch only
-                                # concerns numeric comparison features
-                                # TODO: reconsider this case and similar case
-                                # for categoric branch below when supporting
-                                # numerically-coded categoric features
-                                if np.isnan(pval):
-                                    pval = 1.0
-                            elif c_feature_type == 'categoric':
-                                try:
-                                    cont_table = pd.crosstab(g_feature, \
-                                        comp_df.iloc[:, c_feature_idx])
-                                    chi, pval, dof, expected = \
-                                        stats.chi2_contingency(cont_table)
-                                except KeyError:
-                                    # see https://github.com/pandas-dev/pandas/issues/10291
-                                    # TODO remove after updating to pandas 0.18.0
-                                    # see KNOW-841
-                                    pval = 1.0
-                            else:
-                                pval = 1.0
-                            pvals.append(pval)
-                        create_ssviz_feature_correlations_entry(self.user_id, \
-                            comp_ss_dict['ssviz_spreadsheet_id'], \
-                            grouping_ss_dict['ssviz_spreadsheet_id'], \
-                            g_feature_idx, pvals)
+                        tasks.append(\
+                            (comp_ss_idx, grouping_ss_idx, g_feature_idx))
+        if not tasks:
+            return
+
+        # note missing values in the grouping feature are not considered a
+        # group, and that's how we want it
+        # pvals that are nan are treated as no association (happens, e.g., if
+        # there's no variance in comparison feature)
+        task_args = [(comp_ss_idx, \
+            self.spreadsheets[grouping_ss_idx]['df'].iloc[:, g_feature_idx]) \
+            for comp_ss_idx, grouping_ss_idx, g_feature_idx in tasks]
+        num_workers = min(self.num_correlation_workers, len(tasks))
+        if num_workers > 1:
+            all_pvals = _calculate_pvals_in_pool(\
+                task_args, comparison_features_by_idx, num_workers)
+        else:
+            all_pvals = [ssv_statistics.calculate_pvals(\
+                g_feature, comparison_features_by_idx[comp_ss_idx]) \
+                for comp_ss_idx, g_feature in task_args]
+        self.correlations = [task + (pvals,) for task, pvals in \
+            zip(tasks, all_pvals)]
+
+    def record_correlations(self):
+        """
+        Records the correlations calculated by `calculate_correlations` in
+        ssviz_feature_correlations, skipping any that another job on the same
+        spreadsheets has recorded since.
+        """
+        existing_correlations = self._get_existing_correlations()
+        entries = []
+        for comp_ss_idx, grouping_ss_idx, g_feature_idx, pvals in \
+            self.correlations:
+            comp_ss_dict = self.spreadsheets[comp_ss_idx]
+            grouping_ss_dict = self.spreadsheets[grouping_ss_idx]
+            if _get_id_pair(comp_ss_dict, grouping_ss_dict) not in \
+                existing_correlations:
+                entries.append((comp_ss_dict['ssviz_spreadsheet_id'], \
+                    grouping_ss_dict['ssviz_spreadsheet_id'], g_feature_idx, \
+                    pvals))
+        if entries:
+            create_ssviz_feature_correlations_entries(self.user_id, entries)
 
     def prepare_zip_file(self):
         """Creates a zip file on disk for later download by the user.
@@ -766,9 +791,60 @@ class SpreadsheetVisualizationJob(object):
                         fullname + '.variances.txt',
                         var_series.to_csv(path=None, sep="\t", header=True))
 
+def _get_id_pair(comp_ss_dict, grouping_ss_dict):
+    """Returns the ssviz_spreadsheet_ids of a comparison spreadsheet and a
+    grouping spreadsheet as a tuple of ints, with None for a spreadsheet that
+    isn't recorded yet."""
+    return tuple(ss_dict['ssviz_spreadsheet_id'].get_value() \
+        if ss_dict['ssviz_spreadsheet_id'] is not None else None \
+        for ss_dict in (comp_ss_dict, grouping_ss_dict))
+
+# the comparison spreadsheets of the correlation pool that's currently running,
+# keyed by index into SpreadsheetVisualizationJob.spreadsheets
+# the pool's worker processes are forked after this is set, so they inherit the
+# encoded spreadsheets instead of receiving a pickled copy with every task
+_POOL_COMPARISON_FEATURES = {}
+
+def _calculate_pvals_in_pool(task_args, comparison_features_by_idx, \
+    num_workers):
+    """Calculates correlation pvals in a pool of forked worker processes.
+
+    Args:
+        task_args (list): A list of tuples, one per task, each containing the
+            index of the comparison spreadsheet and the grouping feature as a
+            pandas.Series.
+        comparison_features_by_idx (dict): The encoded comparison spreadsheets
+            as ssv_statistics.ComparisonFeatures, keyed by index.
+        num_workers (int): The number of worker processes.
+
+    Returns:
+        list: The pvals for each task, in the order of `task_args`.
+
+    """
+    global _POOL_COMPARISON_FEATURES
+    _POOL_COMPARISON_FEATURES = comparison_features_by_idx
+    # the workers never touch the database, so it's safe for them to inherit
+    # this process's connections
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        all_pvals = pool.map(_calculate_pvals_for_task, task_args, \
+            chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+        _POOL_COMPARISON_FEATURES = {}
+    return all_pvals
+
+def _calculate_pvals_for_task(task_arg):
+    """Runs in a pool worker process. See `_calculate_pvals_in_pool`."""
+    comp_ss_idx, g_feature = task_arg
+    return ssv_statistics.calculate_pvals(\
+        g_feature, _POOL_COMPARISON_FEATURES[comp_ss_idx])
+
 def get_spreadsheet_visualization_runners(\
     user_id, job_id, project_id, userfiles_dir, project_dir, \
-    spreadsheet_nest_ids):
+    spreadsheet_nest_ids, num_correlation_workers=1, \
+    downcast_to_float32=False):
     """Returns a list of ChronosJob instances required to run a GP job.
 
     Args:
@@ -780,6 +856,9 @@ def get_spreadsheet_visualization_runners(\
         project_dir (str): The name of the directory containing the files
             associated with the current project.
         spreadsheet_nest_ids: The data files in this job.
+        num_correlation_workers (int): The number of processes among which to
+            divide the correlation calculations.
+        downcast_to_float32 (bool): Whether to load numeric data as float32.
 
     Returns:
         list: A list of job instances required to run an SSV job.
@@ -791,7 +870,8 @@ def get_spreadsheet_visualization_runners(\
 
     return [
         SpreadsheetVisualizationJob(user_id, job_id, project_id, userfiles_dir,\
-            job_dir_relative_path, job_name, spreadsheet_nest_ids)
+            job_dir_relative_path, job_name, spreadsheet_nest_ids, \
+            num_correlation_workers, downcast_to_float32)
     ]
 
 def calculate_survival_pval(user_id, grouping_spreadsheet_id, \
@@ -821,25 +901,62 @@ def calculate_survival_pval(user_id, grouping_spreadsheet_id, \
         float: The p-value.
 
     """
+    return calculate_survival_pvals(user_id, \
+        [(grouping_spreadsheet_id, grouping_feature_idx)], \
+        duration_spreadsheet_id, duration_feature_idx, event_spreadsheet_id, \
+        event_feature_idx, event_val)[0]
+
+def calculate_survival_pvals(user_id, groupings, duration_spreadsheet_id, \
+    duration_feature_idx, event_spreadsheet_id, event_feature_idx, event_val, \
+    sample_names=None):
+    """Returns the log-rank test p-values for survival analyses of several
+    grouping features against the same duration and event features, all
+    computed in one batch by `ssv_statistics.logrank_pvals`.
+
+    Args:
+        user_id (NestId): The user id associated with the original SSV job.
+        groupings (list(tuple(int, int))): The spreadsheet id and feature index
+            of each grouping feature.
+        duration_spreadsheet_id (int): The id of the spreadsheet containing the
+            duration feature.
+        duration_feature_idx (int): The feature index of the duration feature
+            within its spreadsheet.
+        event_spreadsheet_id (int): The id of the spreadsheet containing the
+            event feature.
+        event_feature_idx (int): The feature index of the event feature within
+            its spreadsheet.
+        event_val (str): The value within the event feature that encodes an
+            observed event. Note this is always passed as a string, even if the
+            feature is stored as numeric values.
+        sample_names (list(str)): If not None, only these samples are
+            analyzed.
 
-    # get the sample names for the three features
-    ss_tles = get_ssviz_spreadsheets_by_ids(user_id, [\
-        grouping_spreadsheet_id, duration_spreadsheet_id, event_spreadsheet_id])
-    grouping_sample_names = [tle.get_value('sample_names') for tle in ss_tles \
-        if tle.get_nest_id().get_value() == grouping_spreadsheet_id][0]
-    duration_sample_names = [tle.get_value('sample_names') for tle in ss_tles \
-        if tle.get_nest_id().get_value() == duration_spreadsheet_id][0]
-    event_sample_names = [tle.get_value('sample_names') for tle in ss_tles \
-        if tle.get_nest_id().get_value() == event_spreadsheet_id][0]
-
-    # get the values for the three features
-    # TODO consolidate calls? assuming not worth the trouble now
-    grouping_feature = get_ssviz_feature_data(user_id, \
-        grouping_spreadsheet_id, [grouping_feature_idx])[0].get_value('values')
-    duration_feature = get_ssviz_feature_data(user_id, \
-        duration_spreadsheet_id, [duration_feature_idx])[0].get_value('values')
-    event_feature = get_ssviz_feature_data(user_id, \
-        event_spreadsheet_id, [event_feature_idx])[0].get_value('values')
+    Returns:
+        list(float): The p-values, ordered to match `groupings`, with NaN for
+            a grouping feature that has fewer than two groups.
+
+    """
+    # get the sample names for the spreadsheets
+    spreadsheet_ids = set([duration_spreadsheet_id, event_spreadsheet_id] + \
+        [spreadsheet_id for spreadsheet_id, _ in groupings])
+    ss_tles = get_ssviz_spreadsheets_by_ids(user_id, sorted(spreadsheet_ids))
+    sample_names_by_id = {tle.get_nest_id().get_value(): \
+        tle.get_value('sample_names') for tle in ss_tles}
+
+    # get the values for the features, with one query per spreadsheet
+    feature_idxs_by_id = {spreadsheet_id: set() \
+        for spreadsheet_id in spreadsheet_ids}
+    for spreadsheet_id, feature_idx in groupings + \
+            [(duration_spreadsheet_id, duration_feature_idx), \
+            (event_spreadsheet_id, event_feature_idx)]:
+        feature_idxs_by_id[spreadsheet_id].add(feature_idx)
+    features = {}
+    for spreadsheet_id, feature_idxs in feature_idxs_by_id.iteritems():
+        for tle in get_ssviz_feature_data(\
+                user_id, spreadsheet_id, sorted(feature_idxs)):
+            features[(spreadsheet_id, tle.get_value('feature_idx'))] = \
+                pd.Series(data=tle.get_value('values'), \
+                index=sample_names_by_id[spreadsheet_id])
 
     # missing values will be None in original data (numeric or categoric)
 
@@ -856,27 +973,30 @@ def calculate_survival_pval(user_id, grouping_spreadsheet_id, \
     except ValueError:
         pass
     # do the conversion
-    boolean_event_feature = [val_converter(v) if v is not None else None \
-        for v in event_feature]
-
-    # assemble the features with their names into pd.Series
-    grouping_series = pd.Series(data=grouping_feature,\
-        index=grouping_sample_names, name='grouping')
-    duration_series = pd.Series(data=duration_feature,\
-        index=duration_sample_names, name='duration')
-    event_series = pd.Series(data=boolean_event_feature,\
-        index=event_sample_names, name='event')
-
-    # assemble the series into a dataframe
-    combined_data = pd.concat([grouping_series, duration_series, event_series],\
-        axis=1)
-
-    # retain only the samples that have a duration and a group
-    combined_data.dropna(subset=['duration', 'grouping'], inplace=True)
+    event_series = features[(event_spreadsheet_id, event_feature_idx)]
+    event_series = pd.Series(data=[val_converter(v) if v is not None else None \
+        for v in event_series.values], index=event_series.index)
+
+    # retain only the samples that have a duration; the log-rank test will
+    # skip the samples without a group in each grouping
+    duration_series = features[(duration_spreadsheet_id, duration_feature_idx)]
+    duration_series = duration_series.astype(np.float64).dropna()
+    if sample_names is not None:
+        duration_series = \
+            duration_series[duration_series.index.isin(sample_names)]
+    sample_index = duration_series.index
 
     # fill missing values in event (0, for censored)
-    combined_data['event'].fillna(value=0, inplace=True)
-
-    test_stats = multivariate_logrank_test(combined_data['duration'].values, \
-        combined_data['grouping'].values, combined_data['event'].values)
-    return float(test_stats.p_value)
+    events = event_series.reindex(sample_index).fillna(value=0)
+
+    group_codes = np.empty((len(groupings), len(sample_index)), dtype=np.int64)
+    num_groups = np.empty(len(groupings), dtype=np.int64)
+    for grouping_idx, grouping in enumerate(groupings):
+        codes, uniques = pd.factorize(\
+            features[grouping].reindex(sample_index).values, sort=True)
+        group_codes[grouping_idx, :] = codes
+        num_groups[grouping_idx] = len(uniques)
+
+    pvals = ssv_statistics.logrank_pvals(duration_series.values, \
+        events.values.astype(np.float64), group_codes, num_groups)
+    return pvals.tolist()
@@ -0,0 +1,267 @@
+"""
+This module defines a content-addressed cache of pipeline job outputs.
+
+A job's cache key is a hash of its pipeline name, its parameters, the
+contents of its input files, and the docker images its remote runners use.
+When a job with the same key has already succeeded, its outputs are copied
+into the new job's directory before any runner starts. The remote runners
+then find their outputs on disk and report that they're done before they're
+started, so no container is launched, and their `on_done` methods create the
+new job's database records from the copied outputs as usual.
+
+Outputs are captured just before each remote runner's `on_done` runs, because
+some `on_done` methods rewrite outputs in place, and they only become a cache
+entry if the whole job succeeds. Each capture only copies the files that
+appeared since the job started and haven't been captured yet, so every output
+is copied once, as it was before any `on_done` could modify it.
+
+The cache keeps at most a configured number of entries, evicting the least
+recently used ones as new entries are added.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+# bump this to invalidate every existing cache entry, e.g., after changing how
+# outputs are post-processed or after updating the networks
+CACHE_VERSION = 1
+
+# job parameters that name input files by NestId
+INPUT_FILE_PARAMETERS = ['features_file', 'response_file', 'gene_set_file', \
+    'query_file', 'signatures_file']
+
+# job parameters that don't affect the outputs
+IGNORED_PARAMETERS = ['cloud']
+
+# the suffix of the files that store the content hash of an input file
+HASH_FILE_SUFFIX = '.sha256'
+
+# the directory within the cache directory that holds the working copies of
+# entries for running jobs
+STAGING_DIR_NAME = 'staging'
+
+class ResultCacheEntry(object):
+    """The cache entry for one job."""
+    def __init__(self, cache_dir, cache_key, job_dir_path, job_name):
+        """Initializes self.
+
+        Args:
+            cache_dir (str): The directory containing all cache entries.
+            cache_key (str): The job's cache key, from `make_cache_key`.
+            job_dir_path (str): The path to the job's directory.
+            job_name (str): A name for the job, unique among running jobs, used
+                to name the job's working copy of the entry.
+
+        Returns:
+            None: None.
+
+        """
+        self.cache_dir = cache_dir
+        self.cache_key = cache_key
+        self.job_dir_path = job_dir_path
+        self.entry_path = os.path.join(cache_dir, cache_key)
+        self.staging_path = os.path.join(\
+            cache_dir, STAGING_DIR_NAME, cache_key + '-' + job_name)
+        self.restored = False
+        # the files in the job's directory before any runner starts, such as
+        # run files, aren't outputs; keys are paths relative to the job's
+        # directory, values are (size, mtime)
+        self.input_stamps = _get_file_stamps(job_dir_path)
+        # the relative paths of the outputs already copied into the working copy
+        self.staged_paths = set()
+
+    def is_available(self):
+        """Returns True if a previous job with the same key succeeded."""
+        return os.path.isdir(self.entry_path)
+
+    def is_restored(self):
+        """Returns True if this job's outputs came from the cache."""
+        return self.restored
+
+    def restore(self):
+        """Copies the cached outputs into the job's directory. Files that
+        already exist in the job's directory, such as the run files written
+        when the runners were created, are left alone.
+
+        Returns:
+            None: None.
+
+        """
+        LOGGER.info('Restoring cached outputs ' + self.cache_key + ' into ' + \
+            self.job_dir_path)
+        _copy_tree(self.entry_path, self.job_dir_path)
+        # the entry's mtime is its last use, for `evict_entries`
+        os.utime(self.entry_path, None)
+        self.restored = True
+
+    def stage_outputs(self):
+        """Copies the job's new outputs, i.e., the files that appeared or
+        changed since the job started and weren't copied by an earlier call,
+        into a working copy of the entry. Call this before a remote runner's
+        `on_done`.
+
+        Returns:
+            None: None.
+
+        """
+        if self.restored:
+            return
+        for rel_path, stamp in _get_file_stamps(self.job_dir_path).iteritems():
+            # once staged, a file is never staged again, because changes
+            # after that are made by an `on_done`
+            if self.input_stamps.get(rel_path) == stamp or \
+                    rel_path in self.staged_paths:
+                continue
+            dest_path = os.path.join(self.staging_path, rel_path)
+            dest_dir = os.path.dirname(dest_path)
+            if not os.path.isdir(dest_dir):
+                os.makedirs(dest_dir)
+            shutil.copy2(os.path.join(self.job_dir_path, rel_path), dest_path)
+            self.staged_paths.add(rel_path)
+
+    def close(self, succeeded, max_entries=None):
+        """Turns the working copy into the cache entry if the job succeeded,
+        else discards it.
+
+        Args:
+            succeeded (bool): Whether the job succeeded.
+            max_entries (int): The most entries to keep in the cache after
+                adding this one, or None for no limit.
+
+        Returns:
+            None: None.
+
+        """
+        if os.path.isdir(self.staging_path):
+            if succeeded and not self.is_available():
+                try:
+                    os.rename(self.staging_path, self.entry_path)
+                    LOGGER.info('Cached outputs as ' + self.cache_key)
+                    if max_entries is not None:
+                        evict_entries(self.cache_dir, max_entries)
+                except OSError:
+                    # an identical job beat us to it
+                    pass
+            shutil.rmtree(self.staging_path, ignore_errors=True)
+
+def evict_entries(cache_dir, max_entries):
+    """Removes the least recently used cache entries until at most
+    `max_entries` remain.
+
+    Args:
+        cache_dir (str): The directory containing all cache entries.
+        max_entries (int): The most entries to keep.
+
+    Returns:
+        None: None.
+
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry_path = os.path.join(cache_dir, name)
+        if name != STAGING_DIR_NAME and os.path.isdir(entry_path):
+            entries.append((os.stat(entry_path).st_mtime, entry_path))
+    entries.sort()
+    for _, entry_path in entries[:max(len(entries) - max_entries, 0)]:
+        LOGGER.info('Evicting cached outputs ' + os.path.basename(entry_path))
+        shutil.rmtree(entry_path, ignore_errors=True)
+
+def make_cache_key(pipeline, parameters, input_file_hashes, docker_images):
+    """Returns the cache key for a job.
+
+    Args:
+        pipeline (str): The pipeline name from the job record.
+        parameters (dict): The parameters from the job record.
+        input_file_hashes (dict): The content hash of each input file, keyed
+            by the name of the parameter that names the file.
+        docker_images (list(str)): The docker images used by the job's remote
+            runners.
+
+    Returns:
+        str: The cache key.
+
+    """
+    # input files are identified by their contents, not by their ids, so the
+    # same data uploaded again still hits the cache
+    normalized_parameters = dict((key, value) for key, value in \
+        parameters.iteritems() if key not in IGNORED_PARAMETERS and \
+        key not in INPUT_FILE_PARAMETERS and value is not None)
+    key_data = {
+        'version': CACHE_VERSION,
+        'pipeline': pipeline,
+        'parameters': normalized_parameters,
+        'input_file_hashes': input_file_hashes,
+        'docker_images': sorted(docker_images)
+    }
+    key_json = json.dumps(key_data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key_json).hexdigest()
+
+def get_file_hash(file_path):
+    """Returns the sha256 of a file's contents. Uploaded files don't change,
+    so the hash is stored next to the file and only recomputed if the file's
+    size or modification time changes.
+
+    Args:
+        file_path (str): The path to the file.
+
+    Returns:
+        str: The hex digest.
+
+    """
+    file_stat = os.stat(file_path)
+    stamp = str(file_stat.st_size) + ':' + repr(file_stat.st_mtime)
+    hash_path = file_path + HASH_FILE_SUFFIX
+    digest = None
+    try:
+        with open(hash_path) as hash_file:
+            saved_stamp, saved_digest = hash_file.read().split()
+        if saved_stamp == stamp:
+            digest = saved_digest
+    except (IOError, ValueError):
+        pass
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        try:
+            with open(hash_path, 'w') as hash_file:
+                hash_file.write(stamp + ' ' + digest + '\n')
+        except IOError as ex:
+            LOGGER.warning("Couldn't save hash of " + file_path + ": " + \
+                str(ex))
+    return digest
+
+def _get_file_stamps(dir_path):
+    """Returns a dict from the path, relative to `dir_path`, of each file under
+    `dir_path` to its (size, mtime)."""
+    stamps = {}
+    for dirpath, _, filenames in os.walk(dir_path):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            file_stat = os.stat(file_path)
+            stamps[os.path.relpath(file_path, dir_path)] = \
+                (file_stat.st_size, file_stat.st_mtime)
+    return stamps
+
+def _copy_tree(src_dir, dest_dir):
+    """Copies the files under `src_dir` into `dest_dir`, creating directories
+    as needed. Files are copied rather than linked, because jobs modify some
+    of their outputs in place. Files already in `dest_dir` are skipped."""
+    for dirpath, _, filenames in os.walk(src_dir):
+        rel_dir = os.path.relpath(dirpath, src_dir)
+        dest_subdir = os.path.normpath(os.path.join(dest_dir, rel_dir))
+        if not os.path.isdir(dest_subdir):
+            os.makedirs(dest_subdir)
+        for filename in filenames:
+            dest_path = os.path.join(dest_subdir, filename)
+            if not os.path.exists(dest_path):
+                shutil.copy2(os.path.join(dirpath, filename), dest_path)
@@ -0,0 +1,248 @@
+"""
+This module defines the dependency graph `worker_app.run_job` uses to
+schedule the runners of a multi-stage job.
+
+Runners declare their edges with `get_upstream_runners` and
+`get_downstream_runners`. A runner becomes a candidate to start once every
+runner upstream of it is done (i.e., its `on_done` has run), and its own
+`is_ready` is only consulted after that. Candidates are started together, in
+order of how long a chain of runners still depends on them, as long as the
+CPUs and RAM they request fit within the job's budget. For example, GSC runs
+one compute runner per gene collection, and all of them can start as soon as
+the input cleanup finishes.
+
+Once the job finishes, the critical path, the chain of dependent runners
+that took longest from start to finish, can be logged to see which stage to
+speed up.
+
+"""
+
+import logging
+from time import time
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+class RunnerDag(object):
+    """The runners of one job and the dependencies among them."""
+    def __init__(self, runners, cpu_budget=None, ram_budget_mb=None):
+        """Initializes self.
+
+        Args:
+            runners (list): The job's runners.
+            cpu_budget (int): The maximum number of CPUs the job's running
+                runners may request at once, or None for no limit.
+            ram_budget_mb (int): The maximum RAM in megabytes the job's running
+                runners may request at once, or None for no limit.
+
+        Returns:
+            None: None.
+
+        """
+        self.runners = list(runners)
+        self.cpu_budget = cpu_budget
+        self.ram_budget_mb = ram_budget_mb
+        # edges are keyed by runner index, since runners don't define hashing
+        self.upstream_idxs = [set() for _ in self.runners]
+        self.downstream_idxs = [set() for _ in self.runners]
+        for idx, runner in enumerate(self.runners):
+            for upstream in runner.get_upstream_runners():
+                self.add_edge(self._get_idx(upstream), idx)
+            for downstream in runner.get_downstream_runners():
+                self.add_edge(idx, self._get_idx(downstream))
+        self.priorities = self._get_priorities()
+        self.start_times = [None] * len(self.runners)
+        self.done_times = [None] * len(self.runners)
+
+    def add_edge(self, upstream_idx, downstream_idx):
+        """Records that the runner at `downstream_idx` can't start until the
+        runner at `upstream_idx` is done.
+
+        Args:
+            upstream_idx (int): The index of the upstream runner.
+            downstream_idx (int): The index of the downstream runner.
+
+        Returns:
+            None: None.
+
+        """
+        self.upstream_idxs[downstream_idx].add(upstream_idx)
+        self.downstream_idxs[upstream_idx].add(downstream_idx)
+
+    def mark_started(self, runner):
+        """Records that `runner` was started.
+
+        Args:
+            runner (object): The runner.
+
+        Returns:
+            None: None.
+
+        """
+        self.start_times[self._get_idx(runner)] = time()
+
+    def mark_done(self, runner):
+        """Records that `runner` is done and its `on_done` has run.
+
+        Args:
+            runner (object): The runner.
+
+        Returns:
+            None: None.
+
+        """
+        idx = self._get_idx(runner)
+        self.done_times[idx] = time()
+        if self.start_times[idx] is None:
+            # done without being started, e.g., restored from the cache
+            self.start_times[idx] = self.done_times[idx]
+
+    def is_upstream_done(self, runner):
+        """Returns True if every runner upstream of `runner` is done.
+
+        Args:
+            runner (object): The runner.
+
+        Returns:
+            bool: True if every upstream runner is done, else False.
+
+        """
+        return all(self.done_times[up_idx] is not None \
+            for up_idx in self.upstream_idxs[self._get_idx(runner)])
+
+    def get_runners_to_start(self):
+        """Returns the runners to start now: those not yet started whose
+        upstream runners are all done and whose `is_ready` returns True, in
+        order of priority, and limited to what fits within the budget.
+
+        Note a runner that executes locally might do its work within
+        `is_ready` and report itself started, in which case it's not returned.
+
+        Returns:
+            list: The runners to start.
+
+        """
+        candidate_idxs = [idx for idx in range(len(self.runners)) if \
+            self.start_times[idx] is None and self.done_times[idx] is None and \
+            self.is_upstream_done(self.runners[idx])]
+        candidate_idxs.sort(key=lambda idx: -self.priorities[idx])
+
+        running_idxs = [idx for idx in range(len(self.runners)) if \
+            self.start_times[idx] is not None and self.done_times[idx] is None]
+        cpus_in_use = sum(_get_num_cpus(self.runners[idx]) \
+            for idx in running_idxs)
+        ram_in_use = sum(_get_max_ram_mb(self.runners[idx]) \
+            for idx in running_idxs)
+
+        return_val = []
+        for idx in candidate_idxs:
+            runner = self.runners[idx]
+            num_cpus = _get_num_cpus(runner)
+            max_ram_mb = _get_max_ram_mb(runner)
+            # a runner that's bigger than the whole budget still gets to run
+            # once nothing else is running
+            nothing_running = not running_idxs and not return_val
+            fits = nothing_running or (\
+                (self.cpu_budget is None or \
+                    cpus_in_use + num_cpus <= self.cpu_budget) and \
+                (self.ram_budget_mb is None or \
+                    ram_in_use + max_ram_mb <= self.ram_budget_mb))
+            if not fits:
+                LOGGER.debug(runner.job_name + ' waiting for budget')
+                continue
+            if runner.is_ready() and not runner.is_started():
+                return_val.append(runner)
+                cpus_in_use += num_cpus
+                ram_in_use += max_ram_mb
+        return return_val
+
+    def get_critical_path(self):
+        """Returns the chain of dependent runners with the longest total
+        elapsed time, using the times recorded by `mark_started` and
+        `mark_done`. Runners that never finished count as taking no time.
+
+        Returns:
+            list: The runners on the critical path, upstream first.
+            float: The total elapsed seconds of the runners on the path.
+
+        """
+        durations = [(done - start) if start is not None and done is not None \
+            else 0.0 for start, done in zip(self.start_times, self.done_times)]
+        # longest path ending at each runner, visiting upstream runners first
+        path_lengths = {}
+        predecessors = {}
+        for idx in self._get_topological_order():
+            best_up = None
+            for up_idx in self.upstream_idxs[idx]:
+                if best_up is None or path_lengths[up_idx] > path_lengths[best_up]:
+                    best_up = up_idx
+            predecessors[idx] = best_up
+            path_lengths[idx] = durations[idx] + \
+                (path_lengths[best_up] if best_up is not None else 0.0)
+        if not path_lengths:
+            return [], 0.0
+        idx = max(path_lengths, key=lambda i: path_lengths[i])
+        total = path_lengths[idx]
+        path = []
+        while idx is not None:
+            path.append(self.runners[idx])
+            idx = predecessors[idx]
+        path.reverse()
+        return path, total
+
+    def log_critical_path(self):
+        """Logs the critical path.
+
+        Returns:
+            None: None.
+
+        """
+        path, total = self.get_critical_path()
+        if path:
+            LOGGER.info('Critical path (' + str(round(total, 1)) + 's): ' + \
+                ' -> '.join(r.job_name for r in path))
+
+    def _get_idx(self, runner):
+        """Returns the index of `runner`, comparing by identity."""
+        for idx, candidate in enumerate(self.runners):
+            if candidate is runner:
+                return idx
+        raise ValueError('Unknown runner ' + runner.job_name)
+
+    def _get_topological_order(self):
+        """Returns the runner indices ordered such that every runner comes
+        after its upstream runners. Raises ValueError if the edges form a
+        cycle."""
+        remaining = [len(up_idxs) for up_idxs in self.upstream_idxs]
+        queue = [idx for idx, count in enumerate(remaining) if count == 0]
+        order = []
+        while queue:
+            idx = queue.pop(0)
+            order.append(idx)
+            for down_idx in sorted(self.downstream_idxs[idx]):
+                remaining[down_idx] -= 1
+                if remaining[down_idx] == 0:
+                    queue.append(down_idx)
+        if len(order) != len(self.runners):
+            raise ValueError('Runner dependencies contain a cycle')
+        return order
+
+    def _get_priorities(self):
+        """Returns, for each runner, the number of runners on the longest chain
+        that starts with it, so runners that more work is waiting on start
+        first."""
+        priorities = [1] * len(self.runners)
+        for idx in reversed(self._get_topological_order()):
+            for down_idx in self.downstream_idxs[idx]:
+                priorities[idx] = max(priorities[idx], priorities[down_idx] + 1)
+        return priorities
+
+def _get_num_cpus(runner):
+    """Returns the number of CPUs `runner` requests; runners that execute
+    locally don't request any."""
+    return getattr(runner, 'num_cpus', 0) or 0
+
+def _get_max_ram_mb(runner):
+    """Returns the RAM in megabytes `runner` requests; runners that execute
+    locally don't request any."""
+    return getattr(runner, 'max_ram_mb', 0) or 0
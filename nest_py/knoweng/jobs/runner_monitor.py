@@ -0,0 +1,240 @@
+"""
+This module defines the monitor `worker_app.run_job` uses to wait for a job's
+runners to change state.
+
+Every remote runner reports its progress through the files its container
+writes to the shared userfiles directory: `is_done` looks for its outputs and
+`is_failed` looks for its error log. Those files are always created directly
+in a runner's directory or in one of its immediate subdirectories, such as
+`results`, so those are the only directories the monitor watches. Where the
+kernel supports it, the monitor registers inotify watches on them and wakes
+up as soon as a file in them is created, written, moved, or removed.
+
+inotify only sees writes made through the local kernel, and a shared volume
+may be written by containers on other hosts, so the monitor also checks the
+watched directories every `CHECK_INTERVAL_SECONDS`. A check only stats the
+watched directories and the few entries directly in the runners' own
+directories, such as run files and error logs, never the output files.
+Creating or removing a file changes its directory's modification time, which
+is all the runners' output checks depend on.
+The runners are re-checked when something changed, or after
+`MAX_WAIT_SECONDS` as a fallback for any state that isn't reflected on disk.
+
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+from time import sleep, time
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+# seconds between checks of the watched directories
+CHECK_INTERVAL_SECONDS = 2
+
+# seconds after which the runners are re-checked even if nothing changed
+MAX_WAIT_SECONDS = 30
+
+# inotify flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+    IN_DELETE
+
+class RunnerMonitor(object):
+    """Watches the directories of a job's runners for changes."""
+    def __init__(self, runners, check_interval_seconds=CHECK_INTERVAL_SECONDS,\
+            max_wait_seconds=MAX_WAIT_SECONDS, use_inotify=True):
+        """Initializes self.
+
+        Args:
+            runners (list): The job's runners. Their `job_dir_path` directories
+                and those directories' immediate subdirectories are watched.
+            check_interval_seconds (float): The number of seconds between
+                checks of the watched directories.
+            max_wait_seconds (float): The maximum number of seconds `wait`
+                blocks when nothing changes.
+            use_inotify (bool): Whether to use inotify, if it's available.
+
+        Returns:
+            None: None.
+
+        """
+        self.runner_dirs = sorted(set(\
+            os.path.normpath(r.job_dir_path) for r in runners))
+        self.check_interval_seconds = check_interval_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.inotify = _Inotify.create() if use_inotify else None
+        self.watched_dirs = []
+        self.snapshot = self.take_snapshot()
+
+    def get_dirs_to_watch(self):
+        """Returns the runners' directories and their immediate
+        subdirectories that exist.
+
+        Returns:
+            list(str): The directories.
+
+        """
+        return_val = []
+        for runner_dir in self.runner_dirs:
+            if os.path.isdir(runner_dir):
+                # some runners work in subdirectories of other runners'
+                # directories
+                subdirs = [os.path.join(runner_dir, name) for name in \
+                    _list_dir(runner_dir)]
+                for path in [runner_dir] + subdirs:
+                    if path not in return_val and os.path.isdir(path):
+                        return_val.append(path)
+        return return_val
+
+    def take_snapshot(self):
+        """Returns the size and modification time of every watched directory
+        and of every entry directly in a runner's directory, and starts
+        watching any new subdirectories. The entries of the subdirectories,
+        which hold the outputs, aren't stat'ed; the subdirectory's own
+        modification time changes when an entry is created or removed.
+
+        Returns:
+            dict: A dict from path to (size, modification time).
+
+        """
+        self.watched_dirs = self.get_dirs_to_watch()
+        if self.inotify is not None:
+            self.inotify.add_watches(self.watched_dirs)
+        snapshot = {}
+        for watched_dir in self.watched_dirs:
+            names = _list_dir(watched_dir) if watched_dir in self.runner_dirs \
+                else []
+            for name in [None] + names:
+                path = watched_dir if name is None else \
+                    os.path.join(watched_dir, name)
+                if path in snapshot:
+                    # a subdirectory we've already seen as an entry
+                    continue
+                try:
+                    path_stat = os.stat(path)
+                except OSError:
+                    # removed since we listed it
+                    continue
+                snapshot[path] = (path_stat.st_size, path_stat.st_mtime)
+        return snapshot
+
+    def mark(self):
+        """Records the current state of the watched directories, so that
+        changes made by the caller, e.g., while processing finished runners,
+        don't wake the next `wait`.
+
+        Returns:
+            None: None.
+
+        """
+        if self.inotify is not None:
+            self.inotify.read_events(0)
+        self.snapshot = self.take_snapshot()
+
+    def wait(self):
+        """Blocks until a file in the watched directories changes or
+        `max_wait_seconds` pass, whichever comes first.
+
+        Returns:
+            bool: True if a change was detected, else False.
+
+        """
+        deadline = time() + self.max_wait_seconds
+        changed = False
+        while not changed and time() < deadline:
+            timeout = min(self.check_interval_seconds, \
+                max(deadline - time(), 0))
+            if self.inotify is not None:
+                changed = self.inotify.read_events(timeout)
+            else:
+                sleep(timeout)
+            snapshot = self.take_snapshot()
+            changed = changed or snapshot != self.snapshot
+            self.snapshot = snapshot
+        LOGGER.debug('RunnerMonitor.wait changed? ' + str(changed))
+        return changed
+
+    def close(self):
+        """Releases the inotify watches, if any.
+
+        Returns:
+            None: None.
+
+        """
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+class _Inotify(object):
+    """A minimal inotify instance, called through ctypes so it needs no
+    extra packages."""
+
+    def __init__(self, libc, inotify_fd):
+        self.libc = libc
+        self.inotify_fd = inotify_fd
+        self.watched_dirs = set()
+
+    @staticmethod
+    def create():
+        """Returns a new _Inotify, or None if inotify isn't available, e.g.,
+        on a platform other than Linux."""
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            inotify_fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError) as ex:
+            LOGGER.info('inotify not available: ' + str(ex))
+            return None
+        if inotify_fd < 0:
+            LOGGER.info('inotify not available: ' + \
+                os.strerror(ctypes.get_errno()))
+            return None
+        return _Inotify(libc, inotify_fd)
+
+    def add_watches(self, dir_paths):
+        """Watches any of `dir_paths` that aren't watched yet. Directories
+        that can't be watched are left to the periodic checks."""
+        for dir_path in dir_paths:
+            if dir_path in self.watched_dirs:
+                continue
+            if self.libc.inotify_add_watch(self.inotify_fd, dir_path, \
+                    WATCH_MASK) < 0:
+                LOGGER.debug("Can't watch " + dir_path + ': ' + \
+                    os.strerror(ctypes.get_errno()))
+            else:
+                self.watched_dirs.add(dir_path)
+
+    def read_events(self, timeout):
+        """Waits up to `timeout` seconds for events and discards them.
+        Returns True if there were any."""
+        got_events = False
+        try:
+            readable, _, _ = select.select([self.inotify_fd], [], [], timeout)
+            while readable:
+                os.read(self.inotify_fd, 65536)
+                got_events = True
+                readable, _, _ = select.select([self.inotify_fd], [], [], 0)
+        except (OSError, select.error) as ex:
+            if ex.args[0] not in (errno.EAGAIN, errno.EINTR):
+                raise
+        return got_events
+
+    def close(self):
+        os.close(self.inotify_fd)
+
+def _list_dir(dir_path):
+    """Returns the names in `dir_path`, or an empty list if it was removed."""
+    try:
+        return os.listdir(dir_path)
+    except OSError:
+        return []
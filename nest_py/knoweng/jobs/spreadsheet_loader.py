@@ -0,0 +1,305 @@
+"""
+This module reads user-uploaded spreadsheets into dataframes with as little
+memory and as little repeated parsing as possible.
+
+`load_spreadsheet` parses in a single pass with per-column types chosen by the
+parser (optionally downcasting numeric columns to float32). Spreadsheets whose
+values are all numeric can be kept in a cache directory as a `.npy` array
+that's memory-mapped on load, so later jobs that load the same file skip
+parsing and only read the pages they actually touch. Spreadsheets with
+non-numeric values aren't cached, since the only way to store them whole would
+be a pickle that's as large as the dataframe itself.
+
+The cache directory is bounded by `clean_cache`, which runs after every write
+and drops the entries of deleted spreadsheets, then the least recently used
+entries until the cache fits in its size limit.
+
+"""
+
+import hashlib
+import logging
+import os
+import cPickle as pickle
+
+import numpy as np
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+# number of rows read up front to choose the per-column types for the full parse
+TYPE_SNIFF_ROWS = 100
+
+# bump this whenever a change to the parsing would produce a different
+# dataframe, so that stale caches are ignored
+CACHE_VERSION = 2
+
+# the name of the cache directory within the userfiles directory
+CACHE_DIR_NAME = 'spreadsheet_cache'
+
+# the most bytes the cache directory may hold after `clean_cache`
+CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024
+
+META_SUFFIX = '.pkl'
+VALUES_SUFFIX = '.npy'
+
+def load_spreadsheet(ssf_path, float_dtype=np.float64, cache_dir=None):
+    """Reads one tab-separated spreadsheet into a dataframe.
+
+    Row and column labels are always strings, even when they look like
+    numbers or like missing values (e.g., "NA"). Earlier versions kept row
+    labels that looked like numbers as numbers, which never matched the
+    column labels of other spreadsheets, since those are always strings.
+    Duplicate labels are kept as they are.
+
+    Args:
+        ssf_path (str): The path to the spreadsheet.
+        float_dtype (numpy.dtype): The dtype for numeric columns, either
+            numpy.float64 or numpy.float32. If numpy.float64, integer columns
+            keep their integer dtype.
+        cache_dir (str): The directory of the parsed-spreadsheet cache to read
+            from and write to, or None to skip the cache.
+
+    Returns:
+        pandas.DataFrame: A dataframe containing the spreadsheet data.
+
+    """
+    float_dtype = np.dtype(float_dtype)
+    input_df = None
+    if cache_dir is not None:
+        input_df = _read_cache(cache_dir, ssf_path, float_dtype)
+    if input_df is None:
+        input_df = _parse_spreadsheet(ssf_path, float_dtype)
+        if cache_dir is not None and _is_all_numeric(input_df):
+            if _write_cache(cache_dir, ssf_path, float_dtype, input_df):
+                clean_cache(cache_dir)
+    return input_df
+
+def get_cache_paths(cache_dir, ssf_path, float_dtype):
+    """Returns the paths of the cache files for `ssf_path`.
+
+    Args:
+        cache_dir (str): The directory of the cache.
+        ssf_path (str): The path to the spreadsheet.
+        float_dtype (numpy.dtype): The dtype the spreadsheet was loaded with.
+
+    Returns:
+        str: The path of the pickle holding the labels and cache metadata.
+        str: The path of the `.npy` holding the values.
+
+    """
+    cache_key = hashlib.sha1(os.path.abspath(ssf_path) + '|' + \
+        np.dtype(float_dtype).str).hexdigest()
+    entry_path = os.path.join(cache_dir, cache_key)
+    return entry_path + META_SUFFIX, entry_path + VALUES_SUFFIX
+
+def clean_cache(cache_dir, max_bytes=CACHE_MAX_BYTES):
+    """Removes the entries of spreadsheets that no longer exist, then the
+    least recently used entries, until the cache holds at most `max_bytes`.
+    Failures are logged but otherwise ignored, since the cache is only an
+    optimization.
+
+    Args:
+        cache_dir (str): The directory of the cache.
+        max_bytes (int): The most bytes the remaining entries may hold.
+
+    Returns:
+        None: None.
+
+    """
+    try:
+        # (last use, entry bytes, meta path, values path) per entry
+        entries = []
+        for filename in os.listdir(cache_dir):
+            if not filename.endswith(META_SUFFIX):
+                continue
+            meta_path = os.path.join(cache_dir, filename)
+            values_path = meta_path[:-len(META_SUFFIX)] + VALUES_SUFFIX
+            try:
+                with open(meta_path, 'rb') as meta_file:
+                    meta = pickle.load(meta_file)
+                if not os.path.exists(meta['source_path']):
+                    _remove_entry(meta_path, values_path)
+                    continue
+                entries.append((os.stat(meta_path).st_mtime, \
+                    os.stat(meta_path).st_size + os.stat(values_path).st_size, \
+                    meta_path, values_path))
+            except (IOError, OSError, EOFError, KeyError, ValueError, \
+                    pickle.UnpicklingError):
+                _remove_entry(meta_path, values_path)
+        total_bytes = sum(entry[1] for entry in entries)
+        for last_used, entry_bytes, meta_path, values_path in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            _remove_entry(meta_path, values_path)
+            total_bytes -= entry_bytes
+    except (IOError, OSError) as ex:
+        LOGGER.warning("Couldn't clean spreadsheet cache " + cache_dir + \
+            ": " + str(ex))
+
+def _remove_entry(meta_path, values_path):
+    """Removes one cache entry's files, if they exist."""
+    for path in [meta_path, values_path]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _is_all_numeric(input_df):
+    """Returns True if every column of `input_df` has the same numeric dtype,
+    so its values can be stored as one array."""
+    df_dtypes = set(input_df.dtypes.values)
+    return len(df_dtypes) == 1 and list(df_dtypes)[0].kind in 'fiu'
+
+def _parse_spreadsheet(ssf_path, float_dtype):
+    """Parses `ssf_path` into a dataframe. See `load_spreadsheet`."""
+    # A few comments on reading the spreadsheet:
+    # 1. The spreadsheet might use row numbers as labels
+    # 2. The spreadsheet might use "NA"-like strings as labels
+    #    Both are handled by reading the labels with a converter, which
+    #    keeps them as the strings in the file; see `_read_labeled_csv`.
+    # 3. There might be duplicates among the row labels and/or column
+    #    labels. Note we set mangle_dupe_cols to False. We don't want
+    #    to mangle yet, because we don't know at this point which
+    #    dimension corresponds to samples and which corresponds to
+    #    features. Once we figure out the correct orientation, we'll
+    #    drop duplicate samples (because we won't know how to join
+    #    them properly across speadsheets--unless we have only one
+    #    spreadsheet), and we'll name-mangle duplicate features (because
+    #    there's no joining to do, and while mangled names could confuse
+    #    the user, the UI provides enough clues to disambiguate if the
+    #    user is tracing back to the original file).
+    #    see `SpreadsheetVisualizationJob._clean_duplicate_features_and_samples()`
+    read_kwargs = {
+        'sep': '\t', 'header': 0, 'mangle_dupe_cols': False,
+        'error_bad_lines': False, 'warn_bad_lines': True
+    }
+
+    # let the parser type every column, based on a sample of the rows; numeric
+    # columns are parsed straight into `float_dtype` when downcasting, instead
+    # of being parsed as float64 and converted afterward
+    dtypes = None
+    if float_dtype != np.float64:
+        sniff_df = _read_labeled_csv(\
+            ssf_path, nrows=TYPE_SNIFF_ROWS, **read_kwargs)
+        # keys are positions in the file, where the index column is 0
+        dtypes = dict((col_idx + 1, float_dtype) for col_idx, col_dtype in \
+            enumerate(sniff_df.dtypes.values) if col_dtype.kind in 'fiu')
+    try:
+        input_df = _read_labeled_csv(ssf_path, dtype=dtypes, **read_kwargs)
+    except ValueError:
+        # a column that looked numeric in the sample has non-numeric values
+        # further down; parse without dtypes and downcast what we can
+        LOGGER.info("Reparsing " + ssf_path + " without sniffed dtypes")
+        input_df = _read_labeled_csv(ssf_path, **read_kwargs)
+        dtypes = None
+    if float_dtype != np.float64 and dtypes is None:
+        # by position, because labels can be duplicated
+        input_df = pd.concat([input_df.iloc[:, col_idx].astype(float_dtype) \
+            if col_dtype.kind in 'fiu' else input_df.iloc[:, col_idx] \
+            for col_idx, col_dtype in enumerate(input_df.dtypes.values)], \
+            axis=1)
+
+    # check for column labels treated as NaN
+    nan_column_labels = pd.isnull(input_df.columns)
+    if nan_column_labels.any():
+        # replace the column labels
+        with open(ssf_path) as infile:
+            line = infile.readline().rstrip()
+            headers = line.split("\t")
+            # user's file might or might not have had label on first column
+            start_index = len(headers) - len(nan_column_labels)
+            input_df.columns = headers[start_index:]
+
+    return input_df
+
+def _read_labeled_csv(ssf_path, **read_kwargs):
+    """Reads `ssf_path` with `pd.read_csv`, using the first field of every
+    row as the row label. The labels are read as the strings in the file,
+    whereas `index_col` would parse them as numbers or missing values.
+
+    Args:
+        ssf_path (str): The path to the spreadsheet.
+        read_kwargs (dict): Any other arguments for `pd.read_csv`.
+
+    Returns:
+        pandas.DataFrame: The dataframe, with the row labels as its index.
+
+    """
+    input_df = pd.read_csv(ssf_path, converters={0: str}, **read_kwargs)
+    if isinstance(input_df.index, pd.RangeIndex):
+        # the labels were read as the first column; when the header is one
+        # field short, the parser has already made them the index
+        label_name = input_df.columns[0]
+        labels = input_df.iloc[:, 0].values
+        # by position, because labels can be duplicated
+        input_df = input_df.iloc[:, 1:]
+        if str(label_name).startswith('Unnamed: '):
+            # the header had no label for the first column
+            label_name = None
+        input_df.index = pd.Index(labels, dtype=object, name=label_name)
+    return input_df
+
+def _read_cache(cache_dir, ssf_path, float_dtype):
+    """Returns the cached dataframe for `ssf_path`, or None if there isn't a
+    usable cache."""
+    meta_path, values_path = get_cache_paths(cache_dir, ssf_path, float_dtype)
+    input_df = None
+    try:
+        with open(meta_path, 'rb') as meta_file:
+            meta = pickle.load(meta_file)
+        source_stat = os.stat(ssf_path)
+        if meta['version'] == CACHE_VERSION and \
+                meta['source_size'] == source_stat.st_size and \
+                meta['source_mtime'] == source_stat.st_mtime:
+            # copy-on-write, so callers can still modify the dataframe
+            values = np.load(values_path, mmap_mode='c')
+            input_df = pd.DataFrame(values, index=meta['index'], \
+                columns=meta['columns'], copy=False)
+            # the entry's mtime is its last use, for `clean_cache`
+            os.utime(meta_path, None)
+    except (IOError, OSError, EOFError, KeyError, ValueError, \
+            pickle.UnpicklingError):
+        # no cache yet, or one we can't use; we'll parse instead
+        input_df = None
+    return input_df
+
+def _write_cache(cache_dir, ssf_path, float_dtype, input_df):
+    """Writes the cache entry for the all-numeric `input_df` parsed from
+    `ssf_path`. Returns True if it was written. Failures are logged but
+    otherwise ignored, since the cache is only an optimization."""
+    meta_path, values_path = get_cache_paths(cache_dir, ssf_path, float_dtype)
+    # write to temporary names and rename into place, so a concurrent job
+    # never reads a partially-written cache
+    tmp_suffix = '.tmp' + str(os.getpid())
+    try:
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # another job may have just created it
+                if not os.path.isdir(cache_dir):
+                    raise
+        source_stat = os.stat(ssf_path)
+        meta = {
+            'version': CACHE_VERSION,
+            'source_path': os.path.abspath(ssf_path),
+            'source_size': source_stat.st_size,
+            'source_mtime': source_stat.st_mtime,
+            'index': input_df.index,
+            'columns': input_df.columns
+        }
+        # write to a file object, because np.save would append '.npy' to the
+        # temporary name
+        with open(values_path + tmp_suffix, 'wb') as values_file:
+            np.save(values_file, input_df.values)
+        os.rename(values_path + tmp_suffix, values_path)
+        with open(meta_path + tmp_suffix, 'wb') as meta_file:
+            pickle.dump(meta, meta_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(meta_path + tmp_suffix, meta_path)
+    except (IOError, OSError) as ex:
+        LOGGER.warning("Couldn't cache parsed spreadsheet " + ssf_path + \
+            ": " + str(ex))
+        _remove_entry(values_path + tmp_suffix, meta_path + tmp_suffix)
+        return False
+    return True
@@ -0,0 +1,182 @@
+"""
+This module defines the per-bin summaries of spreadsheet features that back
+the spreadsheet visualization heatmaps, so the client can draw a feature from
+a few values per pixel column instead of fetching and binning every sample.
+
+The samples are binned by their position in a requested ordering, into bins
+of (nearly) equal size. Numeric features are summarized by the mean, minimum
+and maximum of each bin, ignoring missing values; categoric features are
+summarized by the count of each category in each bin.
+
+Summaries are cheap to keep and expensive to recompute from the stored
+feature values, so `HeatmapBinCache` holds the most recently used ones.
+
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+import nest_py.core.data_types.typed_array as typed_array
+
+def make_bin_starts(num_samples, num_bins):
+    """Returns the position of the first sample of each bin.
+
+    Args:
+        num_samples (int): The number of samples in the ordering.
+        num_bins (int): The requested number of bins. If there are fewer
+            samples than bins, each sample gets its own bin.
+
+    Returns:
+        numpy.ndarray: The start positions, strictly increasing from 0, or
+            empty if there are no samples.
+
+    """
+    num_bins = min(num_bins, num_samples)
+    if num_bins == 0:
+        return np.zeros(0, dtype=np.int64)
+    return (np.arange(num_bins, dtype=np.int64) * num_samples) // num_bins
+
+def summarize_numeric(values, bin_starts):
+    """Returns the mean, minimum and maximum of each bin of a numeric feature.
+
+    Args:
+        values (numpy.ndarray): The feature's values, in sample order, with
+            NaN for missing values.
+        bin_starts (numpy.ndarray): The bin starts, from `make_bin_starts`.
+
+    Returns:
+        dict: The lists 'mean', 'min' and 'max', with one value per bin, or
+            None for a bin with no values.
+
+    """
+    values = values.astype(np.float64)
+    is_missing = np.isnan(values)
+    sums = np.add.reduceat(np.where(is_missing, 0.0, values), bin_starts)
+    counts = np.add.reduceat(~is_missing, bin_starts, dtype=np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+    means[counts == 0] = np.nan
+    # fmin and fmax ignore NaNs unless a bin has nothing else
+    return {
+        'mean': typed_array.to_list(means),
+        'min': typed_array.to_list(np.fmin.reduceat(values, bin_starts)),
+        'max': typed_array.to_list(np.fmax.reduceat(values, bin_starts))
+    }
+
+def summarize_categoric(values, bin_starts):
+    """Returns the count of each category in each bin of a categoric feature.
+
+    Args:
+        values (numpy.ndarray): The feature's values, in sample order, with
+            None or NaN for missing values.
+        bin_starts (numpy.ndarray): The bin starts, from `make_bin_starts`.
+
+    Returns:
+        dict: 'categories', the sorted list of distinct values, and 'counts',
+            a list with one list per bin of the count of each category.
+
+    """
+    codes, categories = pd.factorize(values, sort=True)
+    num_categories = len(categories)
+    bin_sizes = np.diff(np.append(bin_starts, len(values)))
+    bin_idxs = np.repeat(np.arange(len(bin_starts)), bin_sizes)
+    is_present = codes >= 0
+    counts = np.bincount(\
+        bin_idxs[is_present] * num_categories + codes[is_present], \
+        minlength=len(bin_starts) * num_categories)
+    return {
+        'categories': np.asarray(categories).tolist(),
+        'counts': counts.reshape(len(bin_starts), num_categories).tolist()
+    }
+
+def summarize_feature(values, feature_type, bin_starts):
+    """Returns the summary of a feature for its type.
+
+    Args:
+        values (numpy.ndarray): The feature's values, already in the requested
+            sample ordering.
+        feature_type (str): The feature type from ssviz_spreadsheets.
+        bin_starts (numpy.ndarray): The bin starts, from `make_bin_starts`.
+
+    Returns:
+        dict: The output of `summarize_numeric` or `summarize_categoric`, plus
+            the 'feature_type', or None for a feature that's neither numeric
+            nor categoric.
+
+    """
+    summary = None
+    if feature_type == 'numeric':
+        summary = summarize_numeric(values, bin_starts)
+    elif feature_type == 'categoric':
+        summary = summarize_categoric(values, bin_starts)
+    if summary is not None:
+        summary['feature_type'] = feature_type
+    return summary
+
+def make_ordering_key(sample_idxs):
+    """Returns a short string identifying a sample ordering, for cache keys.
+
+    Args:
+        sample_idxs (list(int)): The sample ordering, or None for the order in
+            the spreadsheet.
+
+    Returns:
+        str: The key.
+
+    """
+    key = 'all'
+    if sample_idxs is not None:
+        key = hashlib.sha1(\
+            np.asarray(sample_idxs, dtype=np.int64).tostring()).hexdigest()
+    return key
+
+class HeatmapBinCache(object):
+    """A thread-safe cache of feature summaries that discards the least
+    recently used ones once it holds `max_entries`. The stored feature values
+    of a spreadsheet never change, so entries are keyed by the id of the
+    feature's ssviz_feature_data record, which identifies the version of the
+    spreadsheet the summary was computed from, and never go stale.
+
+    """
+    def __init__(self, max_entries=20000):
+        """Initializes self.
+
+        Args:
+            max_entries (int): The maximum number of summaries to keep.
+
+        Returns:
+            None: None.
+
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the summary stored under `key`, or None."""
+        with self.lock:
+            summary = self.entries.pop(key, None)
+            if summary is not None:
+                self.entries[key] = summary
+        return summary
+
+    def put(self, key, summary):
+        """Stores `summary` under `key`, discarding the least recently used
+        entries if the cache is full.
+
+        Returns:
+            None: None.
+
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = summary
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,320 @@
+"""
+This module defines the batched statistics used by spreadsheet visualization
+jobs to score the association between a categoric grouping feature and every
+feature of a comparison spreadsheet.
+
+Instead of running one `scipy.stats.f_oneway` or `pd.crosstab` +
+`scipy.stats.chi2_contingency` per comparison feature, all numeric features
+are tested at once with a one-way ANOVA computed from per-group counts, sums
+and sums of squares, and all categoric features are tested at once with
+chi-square tests on contingency tables built by a single `np.bincount`. The
+results match the scipy functions, including the Yates correction scipy
+applies to tables with one degree of freedom.
+
+Survival analyses are batched the same way: `logrank_pvals` runs the log-rank
+tests of many grouping features against the same durations and events at once,
+matching lifelines' `multivariate_logrank_test`.
+
+As with the per-feature code this replaces, any test that can't produce a
+p-value (e.g., a group with no values, or a comparison feature with no
+variance) is reported as 1.0, meaning no association.
+
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+class ComparisonFeatures(object):
+    """The features of one comparison spreadsheet, encoded for the batched
+    tests. Building this is the expensive part of the encoding, so it should
+    be built once per comparison spreadsheet and reused for every grouping
+    feature.
+
+    """
+    def __init__(self, comp_df, comp_feature_types):
+        """Initializes self.
+
+        Args:
+            comp_df (pandas.DataFrame): The comparison spreadsheet, oriented
+                such that features correspond to columns and samples
+                correspond to rows.
+            comp_feature_types (list(str)): The feature types, ordered to
+                match the columns of `comp_df`. Only features of type
+                "numeric" and "categoric" are tested.
+
+        Returns:
+            None: None.
+
+        """
+        self.sample_names = comp_df.index
+        self.num_features = len(comp_feature_types)
+
+        self.numeric_idxs = [idx for idx, ftype in \
+            enumerate(comp_feature_types) if ftype == 'numeric']
+        # float64 to match the precision of scipy's f_oneway
+        self.numeric_values = \
+            comp_df.iloc[:, self.numeric_idxs].values.astype(np.float64)
+
+        self.categoric_idxs = [idx for idx, ftype in \
+            enumerate(comp_feature_types) if ftype == 'categoric']
+        self.categoric_codes = np.empty(\
+            (len(self.sample_names), len(self.categoric_idxs)), dtype=np.int64)
+        self.num_categories = np.zeros(len(self.categoric_idxs), dtype=np.int64)
+        for col, feature_idx in enumerate(self.categoric_idxs):
+            codes, uniques = pd.factorize(comp_df.iloc[:, feature_idx])
+            self.categoric_codes[:, col] = codes
+            self.num_categories[col] = len(uniques)
+
+def encode_grouping_feature(g_feature, sample_names):
+    """Encodes a grouping feature as integer group codes aligned to
+    `sample_names`.
+
+    Args:
+        g_feature (pandas.Series): The grouping feature, indexed by sample
+            name. Missing values aren't considered a group.
+        sample_names (pandas.Index): The sample names of the comparison
+            spreadsheet.
+
+    Returns:
+        numpy.ndarray: One group code per element of `sample_names`, with -1
+            for samples that are missing from `g_feature` or have a missing
+            value there.
+        int: The number of groups, which counts every distinct value in
+            `g_feature`, including values none of whose samples appear in
+            `sample_names`.
+
+    """
+    codes, uniques = pd.factorize(g_feature)
+    codes_series = pd.Series(codes, index=g_feature.index)
+    aligned_codes = codes_series.reindex(sample_names).fillna(-1)
+    return aligned_codes.values.astype(np.int64), len(uniques)
+
+def calculate_pvals(g_feature, comparison_features):
+    """Calculates the p-value of the association between a grouping feature and
+    every feature of a comparison spreadsheet.
+
+    Args:
+        g_feature (pandas.Series): The grouping feature, indexed by sample
+            name.
+        comparison_features (ComparisonFeatures): The encoded comparison
+            spreadsheet.
+
+    Returns:
+        list(float): One p-value per comparison feature, ordered as in the
+            comparison spreadsheet. Features that are neither numeric nor
+            categoric get 1.0.
+
+    """
+    group_codes, num_groups = encode_grouping_feature(\
+        g_feature, comparison_features.sample_names)
+    pvals = np.ones(comparison_features.num_features, dtype=np.float64)
+    if comparison_features.numeric_idxs:
+        pvals[comparison_features.numeric_idxs] = anova_pvals(\
+            group_codes, num_groups, comparison_features.numeric_values)
+    if comparison_features.categoric_idxs:
+        pvals[comparison_features.categoric_idxs] = chi_square_pvals(\
+            group_codes, num_groups, comparison_features.categoric_codes,
+            comparison_features.num_categories)
+    return pvals.tolist()
+
+def anova_pvals(group_codes, num_groups, values):
+    """Runs a one-way ANOVA on every column of `values` at once.
+
+    Equivalent to calling `scipy.stats.f_oneway` once per column, with one
+    argument per group, after dropping missing values.
+
+    Args:
+        group_codes (numpy.ndarray): One group code per sample (row of
+            `values`), in the range [0, num_groups), or -1 for samples that
+            don't belong to a group.
+        num_groups (int): The number of groups. Groups that have no non-missing
+            values in a column make that column's test undefined.
+        values (numpy.ndarray): A samples x features array of floats, with NaN
+            for missing values.
+
+    Returns:
+        numpy.ndarray: One p-value per column of `values`, with 1.0 wherever
+            the test is undefined.
+
+    """
+    num_features = values.shape[1]
+    if num_groups < 1 or num_features == 0:
+        return np.ones(num_features, dtype=np.float64)
+    # samples x groups indicator matrix; samples without a group are all-zero
+    grouped = group_codes >= 0
+    indicator = np.zeros((len(group_codes), num_groups), dtype=np.float64)
+    indicator[np.nonzero(grouped)[0], group_codes[grouped]] = 1.0
+
+    present = ~np.isnan(values)
+    zero_filled = np.where(present, values, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # groups x features
+        counts = indicator.T.dot(present.astype(np.float64))
+        bign = counts.sum(axis=0)
+
+        # like f_oneway, center each feature around the mean of all its grouped
+        # values before squaring, for numerical stability
+        offsets = indicator.T.dot(zero_filled).sum(axis=0) / bign
+        centered = np.where(present, values - offsets, 0.0)
+        sums = indicator.T.dot(centered)
+        sums_of_squares = indicator.T.dot(centered * centered)
+
+        total_sums = sums.sum(axis=0)
+        sstot = sums_of_squares.sum(axis=0) - total_sums * total_sums / bign
+        ssbn = (sums * sums / counts).sum(axis=0) - \
+            total_sums * total_sums / bign
+        sswn = sstot - ssbn
+        dfbn = num_groups - 1
+        dfwn = bign - num_groups
+        msb = ssbn / dfbn
+        msw = sswn / dfwn
+        fvals = msb / msw
+        pvals = special.fdtrc(dfbn, dfwn, fvals)
+
+    pvals[np.isnan(pvals)] = 1.0
+    return pvals
+
+def chi_square_pvals(group_codes, num_groups, category_codes, num_categories):
+    """Runs a chi-square test of independence between the groups and every
+    column of `category_codes` at once.
+
+    Equivalent to calling `scipy.stats.chi2_contingency` once per column on the
+    contingency table that `pd.crosstab` would build, which only has rows and
+    columns for the values that appear in samples where both features are
+    present.
+
+    Args:
+        group_codes (numpy.ndarray): One group code per sample (row of
+            `category_codes`), in the range [0, num_groups), or -1 for samples
+            that don't belong to a group.
+        num_groups (int): The number of groups.
+        category_codes (numpy.ndarray): A samples x features array of integer
+            category codes, with -1 for missing values.
+        num_categories (numpy.ndarray): The number of categories of each
+            column of `category_codes`.
+
+    Returns:
+        numpy.ndarray: One p-value per column of `category_codes`, with 1.0
+            wherever the test is undefined or has no degrees of freedom.
+
+    """
+    num_features = category_codes.shape[1]
+    if num_groups < 1 or num_features == 0:
+        return np.ones(num_features, dtype=np.float64)
+    max_categories = max(int(num_categories.max()), 1)
+    table_size = num_groups * max_categories
+
+    # count every (feature, group, category) triple with a single bincount
+    valid = (category_codes >= 0) & (group_codes >= 0)[:, np.newaxis]
+    feature_offsets = np.arange(num_features, dtype=np.int64) * table_size
+    keys = feature_offsets[np.newaxis, :] + \
+        group_codes[:, np.newaxis] * max_categories + category_codes
+    observed = np.bincount(keys[valid], minlength=num_features * table_size)
+    observed = observed.reshape((num_features, num_groups, max_categories))
+    observed = observed.astype(np.float64)
+
+    # features x groups and features x categories marginals
+    row_sums = observed.sum(axis=2)
+    col_sums = observed.sum(axis=1)
+    totals = row_sums.sum(axis=1)
+
+    # crosstab drops rows and columns with no counts, so only nonzero
+    # marginals count toward the degrees of freedom
+    num_rows = (row_sums > 0).sum(axis=1)
+    num_cols = (col_sums > 0).sum(axis=1)
+    dof = (num_rows - 1) * (num_cols - 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = row_sums[:, :, np.newaxis] * \
+            col_sums[:, np.newaxis, :] / totals[:, np.newaxis, np.newaxis]
+        in_table = expected > 0
+        # Yates' correction, as chi2_contingency applies for one dof
+        yates = (dof == 1)[:, np.newaxis, np.newaxis]
+        corrected = np.where(yates, \
+            observed + 0.5 * np.sign(expected - observed), observed)
+        terms = np.where(in_table, \
+            (corrected - expected) ** 2 / expected, 0.0)
+        chi2 = terms.sum(axis=(1, 2))
+        pvals = special.chdtrc(dof, chi2)
+
+    pvals[dof < 1] = 1.0
+    pvals[np.isnan(pvals)] = 1.0
+    return pvals
+
+def logrank_pvals(durations, events, group_codes, num_groups):
+    """Runs a multivariate log-rank test of every grouping in `group_codes`
+    against the same durations and events at once.
+
+    Equivalent to calling `lifelines.statistics.multivariate_logrank_test` once
+    per grouping, on the samples that have a group.
+
+    Args:
+        durations (numpy.ndarray): One duration per sample.
+        events (numpy.ndarray): One event indicator per sample, 1 for an
+            observed event and 0 for a censored sample.
+        group_codes (numpy.ndarray): A groupings x samples array of integer
+            group codes, with -1 for samples that don't belong to a group.
+        num_groups (numpy.ndarray): The number of groups of each grouping. Every
+            group should have at least one sample.
+
+    Returns:
+        numpy.ndarray: One p-value per grouping, with NaN for groupings of
+            fewer than two groups, as lifelines reports them.
+
+    """
+    num_groupings = group_codes.shape[0]
+    max_groups = max(int(num_groups.max()), 1) if num_groupings > 0 else 1
+    times, time_codes = np.unique(durations, return_inverse=True)
+    num_times = len(times)
+
+    # count the samples and the events of every (grouping, group, time) with a
+    # single bincount each
+    grouped = group_codes >= 0
+    grouping_offsets = np.arange(num_groupings, dtype=np.int64) * \
+        max_groups * num_times
+    keys = grouping_offsets[:, np.newaxis] + \
+        group_codes * num_times + time_codes[np.newaxis, :]
+    table_size = num_groupings * max_groups * num_times
+    shape = (num_groupings, max_groups, num_times)
+    removed = np.bincount(keys[grouped], minlength=table_size).reshape(shape)
+    observed = np.bincount(keys[grouped], \
+        weights=np.broadcast_to(events, group_codes.shape)[grouped], \
+        minlength=table_size).reshape(shape)
+
+    # the samples at risk just before each time are those whose durations
+    # aren't shorter
+    at_risk = removed[:, :, ::-1].cumsum(axis=2)[:, :, ::-1].astype(np.float64)
+    total_at_risk = at_risk.sum(axis=1)
+    total_observed = observed.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hazard = np.where(total_at_risk > 0, \
+            total_observed / total_at_risk, 0.0)
+        # observed minus expected events per group
+        diffs = observed.sum(axis=2) - \
+            (at_risk * hazard[:, np.newaxis, :]).sum(axis=2)
+        # the hypergeometric variance factor, which lifelines takes as 1 where
+        # only one sample is at risk
+        ties = np.where(total_at_risk > 1, \
+            (total_at_risk - total_observed) / (total_at_risk - 1), 1.0)
+        factors = np.where(total_at_risk > 0, \
+            ties * total_observed / (total_at_risk * total_at_risk), 0.0)
+    covariances = -np.einsum('kt,kgt,kht->kgh', factors, at_risk, at_risk)
+    variances = np.einsum('kt,kt,kgt->kg', factors, total_at_risk, at_risk)
+    idxs = np.arange(max_groups)
+    covariances[:, idxs, idxs] += variances
+
+    # as in lifelines, the statistic drops the last group
+    pvals = np.empty(num_groupings, dtype=np.float64)
+    for grouping_idx in xrange(num_groupings):
+        dof = int(num_groups[grouping_idx]) - 1
+        if dof < 1:
+            pvals[grouping_idx] = np.nan
+            continue
+        diff = diffs[grouping_idx, :dof]
+        stat = diff.dot(np.linalg.pinv(\
+            covariances[grouping_idx, :dof, :dof])).dot(diff)
+        pvals[grouping_idx] = special.chdtrc(dof, stat)
+    return pvals
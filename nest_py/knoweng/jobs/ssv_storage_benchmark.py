@@ -0,0 +1,127 @@
+"""
+This module compares the CPU time and size of storing SSV feature rows in
+`ssviz_feature_data` as json text, as they used to be, against the typed
+binary arrays they're stored as now. It runs without a database: the write
+side formats the rows as `bulk_copy_rows` sends them to COPY, and the read
+side decodes the stored values as a query of the table would.
+
+Run with, e.g.,
+    python -m nest_py.knoweng.jobs.ssv_storage_benchmark --features 20000 \
+        --samples 1000
+
+"""
+
+import argparse
+import json
+from numbers import Number
+from time import clock
+
+import numpy as np
+import pandas as pd
+
+from nest_py.core.data_types.tablelike_schema import JsonAttribute
+import nest_py.core.data_types.typed_array as typed_array
+import nest_py.core.db.tablelike_copy as tablelike_copy
+import nest_py.knoweng.data_types.ssviz_feature_data as ssviz_feature_data
+
+def make_spreadsheet(num_features, num_samples, categoric_fraction=0.1,
+                     nan_fraction=0.05, seed=0):
+    """Returns a random spreadsheet, oriented like `ss_df` in the SSV job.
+
+    Args:
+        num_features (int): The number of features.
+        num_samples (int): The number of samples.
+        categoric_fraction (float): The fraction of features that are
+            categoric, with three string values.
+        nan_fraction (float): The fraction of values that are missing.
+        seed (int): The random seed.
+
+    Returns:
+        pandas.DataFrame: The spreadsheet, with samples as rows and features
+            as columns.
+
+    """
+    rand = np.random.RandomState(seed)
+    values = rand.randn(num_samples, num_features)
+    values[rand.rand(num_samples, num_features) < nan_fraction] = np.nan
+    ss_df = pd.DataFrame(values)
+    num_categoric = int(num_features * categoric_fraction)
+    categories = np.array(['low', 'mid', 'high'], dtype=object)
+    for feature_idx in xrange(num_categoric):
+        column = categories[rand.randint(0, 3, num_samples)]
+        column[np.isnan(values[:, feature_idx])] = np.nan
+        ss_df[feature_idx] = column
+    return ss_df
+
+def _to_json_values(values):
+    """Returns a feature's values as the SSV job wrote them to the json
+    `values` attribute, with numeric NaNs replaced by None."""
+    return [None if (isinstance(val, Number) and np.isnan(val)) else val \
+        for val in values.tolist()]
+
+def run_benchmark(ss_df):
+    """Times writing and reading every feature of `ss_df` with both
+    encodings.
+
+    Args:
+        ss_df (pandas.DataFrame): The spreadsheet, as from make_spreadsheet.
+
+    Returns:
+        pandas.DataFrame: For each encoding, the CPU seconds to format the
+            rows for COPY, the CPU seconds to decode the stored rows, the MB
+            sent to COPY, and the MB stored.
+
+    """
+    json_att = JsonAttribute('values')
+    json_fmt = tablelike_copy.make_copy_formatter_for_attribute(json_att)
+    typed_att = [att for att in \
+        ssviz_feature_data.generate_schema().get_attributes() \
+        if att.get_name() == 'values'][0]
+    typed_fmt = tablelike_copy.make_copy_formatter_for_attribute(typed_att)
+    columns = [ss_df.iloc[:, idx].values for idx in xrange(ss_df.shape[1])]
+
+    start = clock()
+    json_fields = [json_fmt(_to_json_values(column)) for column in columns]
+    json_write_secs = clock() - start
+    json_stored = [json.dumps(_to_json_values(column)) for column in columns]
+    start = clock()
+    for text in json_stored:
+        json.loads(text)
+    json_read_secs = clock() - start
+
+    start = clock()
+    typed_fields = [typed_fmt(column) for column in columns]
+    typed_write_secs = clock() - start
+    typed_stored = [typed_att.encode(column) for column in columns]
+    start = clock()
+    for blob in typed_stored:
+        typed_array.decode_to_list(buffer(blob))
+    typed_read_secs = clock() - start
+
+    return pd.DataFrame({
+        'encoding': ['json', 'typed_array'],
+        'write_cpu_secs': [json_write_secs, typed_write_secs],
+        'read_cpu_secs': [json_read_secs, typed_read_secs],
+        'copy_mb': [_total_mb(json_fields), _total_mb(typed_fields)],
+        'stored_mb': [_total_mb(json_stored), _total_mb(typed_stored)]},
+        columns=['encoding', 'write_cpu_secs', 'read_cpu_secs', 'copy_mb', \
+        'stored_mb'])
+
+def _total_mb(strs):
+    """Returns the total length of `strs` in MB."""
+    return sum(len(one_str) for one_str in strs) / 1e6
+
+def main():
+    """Parses the command line and prints the benchmark results."""
+    parser = argparse.ArgumentParser(description=\
+        'Compare json and typed binary storage of SSV feature rows.')
+    parser.add_argument('--features', type=int, default=20000)
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--categoric-fraction', type=float, default=0.1)
+    args = parser.parse_args()
+    ss_df = make_spreadsheet(args.features, args.samples, \
+        categoric_fraction=args.categoric_fraction)
+    print run_benchmark(ss_df).to_string(index=False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+This module defines the cache of spreadsheet visualization survival analysis
+p-values. The web app serves p-values from it and the rq workers that compute
+them store them in it, so it lives in the redis db the job queue uses.
+
+A p-value's cache key is a hash of everything it depends on: the user, the
+grouping feature, the duration and event features, the event value, and the
+sample subset. The key starts with the user's id, so a handle a user sends
+back can be checked against the user before the cache is read. Feature values
+never change once a spreadsheet is stored, so entries only expire to bound the
+cache's size.
+
+While a p-value is being computed, the id of the rq job computing it is stored
+under the cache key plus `JOB_KEY_SUFFIX`, so requests for it can find the job
+instead of starting another one.
+
+"""
+
+import hashlib
+import json
+
+# bump this to invalidate every existing cache entry, e.g., after changing how
+# p-values are calculated
+CACHE_VERSION = 2
+
+KEY_PREFIX = 'ssviz_survival:'
+JOB_KEY_SUFFIX = ':job'
+
+# how long to keep p-values
+CACHE_TTL_SECS = 7 * 24 * 60 * 60
+
+def make_cache_key(user_id, grouping_spreadsheet_id, grouping_feature_idx, \
+    duration_spreadsheet_id, duration_feature_idx, event_spreadsheet_id, \
+    event_feature_idx, event_val, sample_names=None):
+    """Returns the cache key for a survival analysis.
+
+    Args:
+        user_id (int): The id of the user requesting the analysis.
+        grouping_spreadsheet_id (int): The id of the spreadsheet containing the
+            grouping feature.
+        grouping_feature_idx (int): The feature index of the grouping feature
+            within its spreadsheet.
+        duration_spreadsheet_id (int): The id of the spreadsheet containing the
+            duration feature.
+        duration_feature_idx (int): The feature index of the duration feature
+            within its spreadsheet.
+        event_spreadsheet_id (int): The id of the spreadsheet containing the
+            event feature.
+        event_feature_idx (int): The feature index of the event feature within
+            its spreadsheet.
+        event_val (str): The value within the event feature that encodes an
+            observed event.
+        sample_names (list(str)): The samples to analyze, or None for all of
+            them.
+
+    Returns:
+        str: The cache key, which also serves as the analysis's handle. It's
+            `KEY_PREFIX`, the user id, a colon, and the hash.
+
+    """
+    if sample_names is not None:
+        sample_names = sorted(set(sample_names))
+    key_data = {
+        'version': CACHE_VERSION,
+        'user_id': user_id,
+        'grouping': [grouping_spreadsheet_id, grouping_feature_idx],
+        'duration': [duration_spreadsheet_id, duration_feature_idx],
+        'event': [event_spreadsheet_id, event_feature_idx],
+        'event_val': event_val,
+        'sample_names': sample_names
+    }
+    key_json = json.dumps(key_data, sort_keys=True, separators=(',', ':'))
+    return KEY_PREFIX + str(user_id) + ':' + \
+        hashlib.sha256(key_json).hexdigest()
+
+def is_cache_key(cache_key, user_id):
+    """Returns True if `cache_key` looks like the output of `make_cache_key`
+    for the user, e.g., to validate a handle from a request.
+
+    Args:
+        cache_key (str): The cache key.
+        user_id (int): The id of the user who must own the key.
+
+    Returns:
+        bool: True if `cache_key` is well formed and belongs to the user.
+
+    """
+    user_prefix = KEY_PREFIX + str(user_id) + ':'
+    digest = cache_key[len(user_prefix):]
+    return cache_key.startswith(user_prefix) and len(digest) == 64 and \
+        all(char in '0123456789abcdef' for char in digest)
+
+def get_pvals(redis_connection, cache_keys):
+    """Returns the cached p-values.
+
+    Args:
+        redis_connection (redis.Redis): The connection to the cache's db.
+        cache_keys (list(str)): The cache keys.
+
+    Returns:
+        list(float): The p-values, ordered to match `cache_keys`, with None for
+            each one that isn't cached.
+
+    """
+    if not cache_keys:
+        return []
+    return [float(val) if val is not None else None \
+        for val in redis_connection.mget(cache_keys)]
+
+def put_pvals(redis_connection, cache_keys, pvals):
+    """Stores p-values in the cache.
+
+    Args:
+        redis_connection (redis.Redis): The connection to the cache's db.
+        cache_keys (list(str)): The cache keys.
+        pvals (list(float)): The p-values, ordered to match `cache_keys`.
+
+    Returns:
+        None: None.
+
+    """
+    pipe = redis_connection.pipeline()
+    for cache_key, pval in zip(cache_keys, pvals):
+        pipe.set(cache_key, repr(float(pval)))
+        pipe.expire(cache_key, CACHE_TTL_SECS)
+        pipe.delete(cache_key + JOB_KEY_SUFFIX)
+    pipe.execute()
+
+def get_job_ids(redis_connection, cache_keys):
+    """Returns the ids of the jobs computing p-values.
+
+    Args:
+        redis_connection (redis.Redis): The connection to the cache's db.
+        cache_keys (list(str)): The cache keys of the p-values.
+
+    Returns:
+        list(str): The job ids, ordered to match `cache_keys`, with None for
+            each p-value no job has been started for.
+
+    """
+    if not cache_keys:
+        return []
+    return redis_connection.mget(\
+        [cache_key + JOB_KEY_SUFFIX for cache_key in cache_keys])
+
+def put_job_id(redis_connection, cache_keys, job_id, ttl_secs):
+    """Records the id of the job computing p-values.
+
+    Args:
+        redis_connection (redis.Redis): The connection to the cache's db.
+        cache_keys (list(str)): The cache keys of the p-values.
+        job_id (str): The job's id.
+        ttl_secs (int): How long to keep the record, which should be at least
+            as long as rq keeps the job.
+
+    Returns:
+        None: None.
+
+    """
+    pipe = redis_connection.pipeline()
+    for cache_key in cache_keys:
+        pipe.set(cache_key + JOB_KEY_SUFFIX, job_id)
+        pipe.expire(cache_key + JOB_KEY_SUFFIX, ttl_secs)
+    pipe.execute()
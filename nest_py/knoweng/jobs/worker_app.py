@@ -3,7 +3,6 @@ This module defines the rq worker methods.
 """
 import multiprocessing
 import logging
-from time import sleep
 import os
 
 from redis import Redis
@@ -13,8 +12,13 @@ import nest_py.core.nest_config as nest_config
 from nest_py.core.data_types.nest_id import NestId
 import nest_py.knoweng.data_types.projects as projects
 from nest_py.knoweng.jobs.db_utils import init_token_maker, init_crud_clients,\
-    get_job_record, update_job_record
+    get_job_record, update_job_record, get_file_record
 import nest_py.knoweng.jobs.knoweng_seed_job as knoweng_seed_job
+from nest_py.knoweng.jobs.pipeline_job import PipelineJob
+import nest_py.knoweng.jobs.result_cache as result_cache
+from nest_py.knoweng.jobs.runner_dag import RunnerDag
+from nest_py.knoweng.jobs.runner_monitor import RunnerMonitor
+import nest_py.knoweng.jobs.survival_cache as survival_cache
 
 from nest_py.knoweng.jobs.pipelines.feature_prioritization import \
     get_feature_prioritization_runners
@@ -25,11 +29,13 @@ from nest_py.knoweng.jobs.pipelines.sample_clustering import \
 from nest_py.knoweng.jobs.pipelines.signature_analysis import \
     get_signature_analysis_runners
 from nest_py.knoweng.jobs.pipelines.spreadsheet_visualization import \
-    get_spreadsheet_visualization_runners, calculate_survival_pval
+    get_spreadsheet_visualization_runners, calculate_survival_pval, \
+    calculate_survival_pvals
 
 #TODO: move the needed config out of 'nest_config'.
 CONFIG = nest_config.generate_config_from_os()
 USERFILES_DIR = CONFIG['USERFILES_DIR']
+RESULT_CACHE_DIR = os.path.join(USERFILES_DIR, 'result_cache')
 logging.basicConfig()
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -122,62 +128,105 @@ def run_job(nest_user, job_id):
             spreadsheet_nest_ids = [NestId(int(fid)) for fid in file_ids]
         runners = get_spreadsheet_visualization_runners(\
             user_id, job_id, project_id, USERFILES_DIR, rel_project_dir,
-            spreadsheet_nest_ids)
+            spreadsheet_nest_ids, CONFIG['SSV_CORRELATION_WORKERS'],
+            CONFIG['SSV_DOWNCAST_TO_FLOAT32'])
     elif pipeline == 'phenotype_prediction':
         pass
     else:
         raise ValueError('Unknown technique ' + pipeline)
 
+    # if an identical job already succeeded, copy its outputs into place, so
+    # the remote runners will be done before they're started
+    cache_entry = None
+    try:
+        cache_entry = get_result_cache_entry(\
+            user_id, pipeline, parameters, runners)
+        if cache_entry is not None and cache_entry.is_available():
+            cache_entry.restore()
+    except Exception:
+        # the cache is only an optimization, so run the job without it
+        LOGGER.exception('Result cache lookup failed; running uncached')
+        cache_entry = None
+
     # execute
+    monitor = RunnerMonitor(runners)
+    dag = RunnerDag(runners, CONFIG['PIPELINE_CPU_BUDGET'], \
+        CONFIG['PIPELINE_RAM_BUDGET_MB'])
     error_message = None
-    while runners:
-        LOGGER.debug('Looping...')
-        # first check for errors
-        failed = [r for r in runners if r.is_failed()]
-        if failed:
-            # Read the error message from the failed job
-            error_message = ' '.join([f.get_error_message() for f in failed])
-            # Delete job record
-            # we can delete all items in runners, because they're all part of
-            # the same parent job, and we're declaring the entire job a failure
-            for runner in runners:
-                LOGGER.warning('Cleaning up after failure: ' + runner.job_name)
-                try:
-                    # note locally executed jobs don't define this method
-                    # apparently try/except is the pythonic and performant way
-                    # to check
-                    # TODO either eliminate locally executed jobs or else
-                    # unify
-                    runner.delete_job_record()
-                except AttributeError:
-                    # no such method
-                    LOGGER.warning("Don't know how to delete " + \
-                        runner.job_name + " after failure.")
-            # Then end the job loop
-            runners = None
-            LOGGER.error(' >>>>>> ERROR: ' + error_message)
-        else:
-            # next remove and process anything done. note a job can be done
-            # before # it's even started, in the case that the same
-            # configuration was # previously run as another job and the results
-            # are found on disk
-            done = [r for r in runners if r.is_done()]
-            for runner in done:
-                LOGGER.info('Marking runner for ' + runner.job_name + ' as done...')
-                runner.on_done()
-            LOGGER.debug('Done runners for ' + runners[0].job_name + ': ' + \
-                str(len(done)))
-            # remove according to membership in done list, not by
-            # calling is_done() again, in case status changed since we last
-            # checked
-            runners = [r for r in runners if r not in done]
-            # now start anything ready
-            ready = [r for r in runners if r.is_ready() and not r.is_started()]
-            for runner in ready:
-                runner.start()
-            if runners:
-                LOGGER.debug('Runners left in queue: ' + str(runners))
-                sleep(5) # sleep five seconds
+    completed = False
+    try:
+        while runners:
+            LOGGER.debug('Looping...')
+            # first check for errors
+            failed = [r for r in runners if r.is_failed()]
+            if failed:
+                # Read the error message from the failed job
+                error_message = ' '.join([f.get_error_message() for f in failed])
+                # Delete job record
+                # we can delete all items in runners, because they're all part of
+                # the same parent job, and we're declaring the entire job a failure
+                for runner in runners:
+                    LOGGER.warning('Cleaning up after failure: ' + runner.job_name)
+                    try:
+                        # note locally executed jobs don't define this method
+                        # apparently try/except is the pythonic and performant way
+                        # to check
+                        # TODO either eliminate locally executed jobs or else
+                        # unify
+                        runner.delete_job_record()
+                    except AttributeError:
+                        # no such method
+                        LOGGER.warning("Don't know how to delete " + \
+                            runner.job_name + " after failure.")
+                # Then end the job loop
+                runners = None
+                LOGGER.error(' >>>>>> ERROR: ' + error_message)
+            else:
+                # next remove and process anything done. note a job can be done
+                # before # it's even started, in the case that the same
+                # configuration was # previously run as another job and the results
+                # are found on disk. runners are only marked done after their
+                # upstream runners, so each on_done sees its inputs processed
+                done = [r for r in runners if dag.is_upstream_done(r) and \
+                    r.is_done()]
+                for runner in done:
+                    LOGGER.info('Marking runner for ' + runner.job_name + ' as done...')
+                    # capture remote outputs before on_done, which might modify them
+                    if cache_entry is not None and isinstance(runner, PipelineJob):
+                        cache_entry.stage_outputs()
+                    runner.on_done()
+                    dag.mark_done(runner)
+                LOGGER.debug('Done runners for ' + runners[0].job_name + ': ' + \
+                    str(len(done)))
+                # remove according to membership in done list, not by
+                # calling is_done() again, in case status changed since we last
+                # checked
+                runners = [r for r in runners if r not in done]
+                # now start anything whose upstream runners are done, as the
+                # budget allows
+                ready = dag.get_runners_to_start()
+                for runner in ready:
+                    runner.start()
+                    dag.mark_started(runner)
+                if runners:
+                    LOGGER.debug('Runners left in queue: ' + str(runners))
+                    if done or ready:
+                        # something changed, so the remaining runners might
+                        # be ready now; don't count our own writes as changes
+                        monitor.mark()
+                    else:
+                        # wait for a runner's files to change
+                        monitor.wait()
+        completed = True
+        dag.log_critical_path()
+    finally:
+        monitor.close()
+        if cache_entry is not None:
+            try:
+                cache_entry.close(completed and error_message is None, \
+                    CONFIG['PIPELINE_RESULT_CACHE_MAX_ENTRIES'])
+            except Exception:
+                LOGGER.exception('Failed to close result cache entry')
 
     # record status
     # TODO reconsider once new data endpoints are ready
@@ -187,6 +236,40 @@ def run_job(nest_user, job_id):
         update_job_record(user_id, job_id, \
             {'status': 'failed', 'error': error_message})
 
+def get_result_cache_entry(user_id, pipeline, parameters, runners):
+    """Returns the result cache entry for a job.
+
+    Args:
+        user_id (NestId): The user_id of the user who created the job.
+        pipeline (str): The pipeline name from the job record.
+        parameters (dict): The parameters from the job record.
+        runners (list): The job's runners.
+
+    Returns:
+        ResultCacheEntry: The cache entry, or None if the cache is disabled or
+            the job has no remote runners whose outputs could be cached.
+
+    """
+    remote_runners = [r for r in runners if isinstance(r, PipelineJob)]
+    if not CONFIG['PIPELINE_RESULT_CACHE_ENABLED'] or not remote_runners:
+        return None
+    input_file_hashes = {}
+    for param_name in result_cache.INPUT_FILE_PARAMETERS:
+        file_id = parameters.get(param_name)
+        if file_id is not None:
+            fdto = get_file_record(user_id, NestId(int(file_id)))
+            if fdto is None:
+                raise ValueError('No record of ' + param_name + ' ' + \
+                    str(file_id))
+            input_file_hashes[param_name] = \
+                result_cache.get_file_hash(fdto.get_file_path(USERFILES_DIR))
+    cache_key = result_cache.make_cache_key(pipeline, parameters, \
+        input_file_hashes, [r.docker_image for r in remote_runners])
+    # some runners work in subdirectories of the job's directory
+    job_dir_path = min([r.job_dir_path for r in remote_runners], key=len)
+    return result_cache.ResultCacheEntry(RESULT_CACHE_DIR, cache_key, \
+        job_dir_path, remote_runners[0].job_name)
+
 def run_calculation(nest_user, calculation_name, params):
     return_val = None
     if calculation_name == 'ssviz_survival_analysis':
@@ -199,10 +282,47 @@ def run_calculation(nest_user, calculation_name, params):
             int(params['event_spreadsheet_id']),
             int(params['event_feature_idx']),
             params['event_val'])
+    elif calculation_name == 'ssviz_survival_analysis_batch':
+        return_val = calculate_cached_survival_pvals(nest_user, params)
     else:
         raise ValueError('Unknown calculation ' + calculation_name)
     return return_val
 
+def calculate_cached_survival_pvals(nest_user, params):
+    """Calculates the p-values of a batch of survival analyses that share the
+    same duration and event features and stores them in the survival cache.
+
+    Args:
+        nest_user (NestUser): The user requesting the analyses.
+        params (dict): 'groupings', a list of [spreadsheet id, feature index]
+            pairs, one per grouping feature; 'duration_spreadsheet_id',
+            'duration_feature_idx', 'event_spreadsheet_id',
+            'event_feature_idx', 'event_val', and 'sample_names', which is None
+            to analyze all samples.
+
+    Returns:
+        list(float): The p-values, ordered to match `params['groupings']`.
+
+    """
+    user_id = nest_user.get_nest_id()
+    groupings = [(int(spreadsheet_id), int(feature_idx)) \
+        for spreadsheet_id, feature_idx in params['groupings']]
+    duration_spreadsheet_id = int(params['duration_spreadsheet_id'])
+    duration_feature_idx = int(params['duration_feature_idx'])
+    event_spreadsheet_id = int(params['event_spreadsheet_id'])
+    event_feature_idx = int(params['event_feature_idx'])
+    event_val = params['event_val']
+    sample_names = params.get('sample_names')
+    pvals = calculate_survival_pvals(user_id, groupings, \
+        duration_spreadsheet_id, duration_feature_idx, event_spreadsheet_id, \
+        event_feature_idx, event_val, sample_names=sample_names)
+    cache_keys = [survival_cache.make_cache_key(user_id.get_value(), \
+        spreadsheet_id, feature_idx, duration_spreadsheet_id, \
+        duration_feature_idx, event_spreadsheet_id, event_feature_idx, \
+        event_val, sample_names) for spreadsheet_id, feature_idx in groupings]
+    survival_cache.put_pvals(get_current_job().connection, cache_keys, pvals)
+    return pvals
+
 def handle_error(job, ex_type, ex_value, traceback):
     """
     Handles any exception in a running job by updating the job status in the db.
@@ -24,6 +24,28 @@ def generate_project_params(runlevel):
         'MAX_JOBS_TOTAL_PER_USER': 40,
         'MAX_JOBS_RUNNING_PER_USER': 5,
 
+        # number of processes a spreadsheet visualization job may use to
+        # calculate feature correlations; 1 calculates them in the job's own
+        # process
+        'SSV_CORRELATION_WORKERS': \
+            int(os.getenv('SSV_CORRELATION_WORKERS', 1)),
+        # whether spreadsheet visualization jobs load numeric data as float32,
+        # which halves the memory needed for large spreadsheets
+        'SSV_DOWNCAST_TO_FLOAT32': \
+            os.getenv('SSV_DOWNCAST_TO_FLOAT32', 'false').lower() == 'true',
+        # the most CPUs and RAM one job's remote runners may request at once;
+        # 0 means no limit
+        'PIPELINE_CPU_BUDGET': int(os.getenv('PIPELINE_CPU_BUDGET', 0)) or None,
+        'PIPELINE_RAM_BUDGET_MB': \
+            int(os.getenv('PIPELINE_RAM_BUDGET_MB', 0)) or None,
+        # whether pipeline jobs reuse the outputs of an identical job that
+        # already succeeded instead of running again, and how many jobs'
+        # outputs to keep, evicting the least recently used
+        'PIPELINE_RESULT_CACHE_ENABLED': \
+            os.getenv('PIPELINE_RESULT_CACHE_ENABLED', 'false').lower() == 'true',
+        'PIPELINE_RESULT_CACHE_MAX_ENTRIES': \
+            int(os.getenv('PIPELINE_RESULT_CACHE_MAX_ENTRIES', 200)),
+
         'CILOGON_ENABLED': cilogon_enabled,
         'CILOGON_CLIENT_ID': cilogon_client_id,
         'CILOGON_CLIENT_SECRET': cilogon_client_secret,
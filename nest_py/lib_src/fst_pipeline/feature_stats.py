@@ -0,0 +1,282 @@
+"""
+                   University of Illinois/NCSA
+                       Open Source License
+
+        Copyright(C) 2014-2015, The Board of Trustees of the
+            University of Illinois.  All rights reserved.
+
+                          Developed by:
+
+                         Visual Analytics
+                   Applied Research Institute
+            University of Illinois at Urbana-Champaign
+
+               http://appliedresearch.illinois.edu/
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal with the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
++ Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimers.
++ Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimers in
+  the documentation and/or other materials provided with the distribution.
++ Neither the names of The PerfSuite Project, NCSA/University of Illinois
+  at Urbana-Champaign, nor the names of its contributors may be used to
+  endorse or promote products derived from this Software without specific
+  prior written permission.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS WITH THE SOFTWARE.
+"""
+
+import csv
+from joblib import Parallel, delayed
+import numpy as np
+
+MIC_ALPHA = 0.6
+MIC_C = 15
+
+def pearson_with(x, y):
+    """Computes the Pearson correlation of every column of x with y.
+
+    Args:
+      x  array of dim (n,P) with feature columns and sample rows
+      y  numeric array of length n
+
+    Returns:
+      array of length P; nan for columns, or a y, without variance
+    """
+    x_centered = x - x.mean(axis=0)
+    y_centered = y - y.mean()
+    numerators = np.dot(y_centered, x_centered)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return numerators / np.sqrt(
+            (x_centered ** 2).sum(axis=0) * (y_centered ** 2).sum())
+
+def spearman_with(x, y):
+    """Computes the Spearman correlation of every column of x with y, as the
+    Pearson correlation of their ranks.
+
+    Args:
+      x  array of dim (n,P) with feature columns and sample rows
+      y  numeric array of length n
+
+    Returns:
+      array of length P; nan for columns, or a y, without variance
+    """
+    x_ranks = rank_columns(x)[0]
+    y_ranks = rank_columns(y.reshape(-1, 1))[0][:, 0]
+    return pearson_with(x_ranks, y_ranks)
+
+def kendall_with(x, y):
+    """Computes Kendall's tau-b of every column of x with y, using Knight's
+    O(n log n) algorithm: the samples are visited in order of y, and a
+    binary indexed tree per column counts how many of the samples already
+    visited have a greater x, i.e., the discordant pairs. All columns are
+    updated together, so there are O(n log n) array operations of size P.
+
+    Args:
+      x  array of dim (n,P) with feature columns and sample rows
+      y  numeric array of length n
+
+    Returns:
+      array of length P; nan for columns, or a y, without variance
+    """
+    num_samples, num_features = x.shape
+    x_ranks, x_ties = rank_columns(x, dense=True)
+    y_ranks, y_ties = rank_columns(y.reshape(-1, 1), dense=True)
+    y_ranks = y_ranks[:, 0]
+    # pairs tied in both x and y are tied in the combined dense rank
+    joint_ties = rank_columns(
+        y_ranks.reshape(-1, 1) * num_samples + x_ranks, dense=True)[1]
+
+    # row k of the trees covers the 1-based x ranks (k - (k & -k), k]. the
+    # number of rows is a power of two, plus row 0 and a last row that only
+    # collects the walks that step past the root
+    tree_size = 1
+    while tree_size < num_samples:
+        tree_size *= 2
+    trees = np.zeros((tree_size + 2) * num_features, dtype=np.int64)
+    tree_depth = int(np.log2(tree_size)) + 1
+    all_cols = np.arange(num_features)
+    discordant = np.zeros(num_features, dtype=np.int64)
+    num_visited = 0
+    y_order = np.argsort(y_ranks, kind='mergesort')
+    y_sorted = y_ranks[y_order]
+    group_starts = np.flatnonzero(np.r_[True, y_sorted[1:] != y_sorted[:-1]])
+    group_ends = np.r_[group_starts[1:], num_samples]
+    for start, end in zip(group_starts, group_ends):
+        # samples tied in y aren't discordant with each other, so count the
+        # whole group before adding any of it to the trees
+        group = y_order[start:end]
+        for sample in group:
+            num_not_greater = __tree_prefix_sum(trees, tree_depth, all_cols,
+                x_ranks[sample] + 1)
+            discordant += num_visited - num_not_greater
+        for sample in group:
+            __tree_add(trees, tree_depth, all_cols, x_ranks[sample] + 1)
+        num_visited += len(group)
+
+    num_pairs = num_samples * (num_samples - 1) // 2
+    concordant_minus_discordant = num_pairs - x_ties - y_ties[0] + \
+        joint_ties - 2 * discordant
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return concordant_minus_discordant / np.sqrt(
+            (num_pairs - x_ties) * float(num_pairs - y_ties[0]))
+
+def rank_columns(x, dense=False):
+    """Ranks the values in each column of x, giving ties their average rank.
+
+    Args:
+      x      array of dim (n,P)
+      dense  if True, returns 0-based dense ranks instead, where tied values
+             share a rank and there are no gaps between ranks
+
+    Returns:
+      - list [0]: array of dim (n,P) with the rank of each value within its
+                  column; 1-based average ranks unless dense
+             [1]: int array of length P with the number of tied pairs of
+                  values in each column
+    """
+    num_rows, num_cols = x.shape
+    # work on the columns as contiguous rows
+    x_rows = np.ascontiguousarray(x.T)
+    order = np.argsort(x_rows, axis=1, kind='mergesort')
+    x_sorted = x_rows[np.arange(num_cols)[:, np.newaxis], order]
+    # True at the first value of each run of equal values
+    is_start = np.ones(x_rows.shape, dtype=bool)
+    is_start[:, 1:] = x_sorted[:, 1:] != x_sorted[:, :-1]
+    # number the runs of all the columns consecutively, column by column
+    run_ids = np.cumsum(is_start.ravel()).reshape(num_cols, num_rows) - 1
+    run_lengths = np.bincount(run_ids.ravel())
+    first_run_of_col = run_ids[:, 0]
+    ranks_sorted = None
+    if dense:
+        ranks_sorted = run_ids - first_run_of_col[:, np.newaxis]
+    else:
+        run_starts = np.flatnonzero(is_start.ravel()) % num_rows
+        ranks_sorted = run_starts[run_ids] + (run_lengths[run_ids] + 1) / 2.0
+    ranks = np.empty(ranks_sorted.shape, dtype=ranks_sorted.dtype)
+    ranks[np.arange(num_cols)[:, np.newaxis], order] = ranks_sorted
+    ranks = ranks.T
+    tied_pairs_per_run = run_lengths * (run_lengths - 1) // 2
+    tied_pairs = np.add.reduceat(tied_pairs_per_run, first_run_of_col)
+    return [ranks, tied_pairs]
+
+def __tree_prefix_sum(trees, tree_depth, cols, idxs):
+    """Returns, for each column, the number of values added to its binary
+    indexed tree with a 1-based rank of at most idxs[column].
+
+    Args:
+      trees       the flattened trees of all columns; see kendall_with
+      tree_depth  number of steps of the longest walk up a tree
+      cols        array with the index of each column
+      idxs        array with the rank of each column to sum up to
+    """
+    totals = np.zeros(len(cols), dtype=np.int64)
+    for _ in xrange(tree_depth):
+        # once a walk reaches row 0, which is always 0, it stays there
+        totals += trees[idxs * len(cols) + cols]
+        idxs = idxs - (idxs & -idxs)
+    return totals
+
+def __tree_add(trees, tree_depth, cols, idxs):
+    """Adds one value per column, of 1-based rank idxs[column], to the
+    columns' binary indexed trees.
+
+    Args:
+      trees       the flattened trees of all columns; see kendall_with
+      tree_depth  number of steps of the longest walk up a tree
+      cols        array with the index of each column
+      idxs        array with the rank of the value to add to each column
+    """
+    last_row = trees.shape[0] // len(cols) - 1
+    for _ in xrange(tree_depth):
+        trees[idxs * len(cols) + cols] += 1
+        idxs = np.minimum(idxs + (idxs & -idxs), last_row)
+    return
+
+def correlations_with(x, y):
+    """Computes the Pearson, Spearman and Kendall correlations of every
+    column of x with y.
+
+    Returns:
+      dict from 'pearson', 'spearman' and 'kendall' to arrays of length P
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    return {
+        'pearson': pearson_with(x, y),
+        'spearman': spearman_with(x, y),
+        'kendall': kendall_with(x, y)}
+
+def write_mic_csv(df_x, path, cores=1, block_size=200):
+    """Computes the MIC of every pair of columns of df_x, and writes the
+    square matrix of them to a csv file with a header row of feature names
+    and a first column, 'feature', of feature names.
+
+    The rows are computed in blocks of block_size features, cores blocks at
+    a time, and each block's rows are appended to the file as soon as the
+    block is done, so only a few blocks are in memory at once. Uses minepy
+    if it's installed, or else R's minerva, with the defaults of
+    minerva.mine: alpha=0.6, C=15, and the approximate MIC.
+
+    Args:
+      df_x        DataFrame of dim (n,P) with feature columns and sample rows
+      path        path of the csv file to write
+      cores       number of worker processes
+      block_size  number of features per block
+    """
+    x = np.ascontiguousarray(df_x.values, dtype=np.float64)
+    names = [str(name) for name in df_x.columns.values]
+    block_starts = range(0, len(names), block_size)
+    with open(path, 'wb') as out_file:
+        # feature names may contain commas or quotes
+        writer = csv.writer(out_file, lineterminator='\n')
+        writer.writerow(['feature'] + names)
+        for wave_start in xrange(0, len(block_starts), cores):
+            wave = block_starts[wave_start:wave_start+cores]
+            blocks = Parallel(n_jobs=min(cores, len(wave)), max_nbytes='1M',
+                mmap_mode='r')(
+                delayed(__compute_mic_block)(x, start, start + block_size)
+                for start in wave)
+            for start, block in zip(wave, blocks):
+                for i, row in enumerate(block):
+                    # repr keeps every digit of the floats, unlike str
+                    writer.writerow(
+                        [names[start+i]] + [repr(value) for value in row])
+            out_file.flush()
+    return
+
+def __compute_mic_block(x, start, end):
+    """Returns an array of dim (end-start, P) with the MIC of columns start
+    through end-1 of x with every column of x."""
+    block = x[:, start:end]
+    try:
+        from minepy import cstats
+    except ImportError:
+        cstats = None
+    if cstats is not None:
+        mic = cstats(block.T, x.T, alpha=MIC_ALPHA, c=MIC_C,
+            est='mic_approx')[0]
+    else:
+        from rpy2.robjects import numpy2ri
+        from rpy2.robjects.packages import importr
+        numpy2ri.activate()
+        minerva = importr('minerva')
+        # pylint: disable=no-member
+        mic = np.asarray(minerva.mine(block, x, alpha=MIC_ALPHA, C=MIC_C,
+            est='mic_approx').rx2('MIC'))
+        # pylint: enable=no-member
+    return mic
@@ -0,0 +1,212 @@
+"""
+                   University of Illinois/NCSA
+                       Open Source License
+
+        Copyright(C) 2014-2015, The Board of Trustees of the
+            University of Illinois.  All rights reserved.
+
+                          Developed by:
+
+                         Visual Analytics
+                   Applied Research Institute
+            University of Illinois at Urbana-Champaign
+
+               http://appliedresearch.illinois.edu/
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal with the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
++ Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimers.
++ Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimers in
+  the documentation and/or other materials provided with the distribution.
++ Neither the names of The PerfSuite Project, NCSA/University of Illinois
+  at Urbana-Champaign, nor the names of its contributors may be used to
+  endorse or promote products derived from this Software without specific
+  prior written permission.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS WITH THE SOFTWARE.
+"""
+
+import numpy as np
+
+# names accepted by get_backend, e.g. as forest_backend in fst.yaml
+BACKEND_NAMES = ['r', 'sklearn']
+
+def get_backend(name):
+    """Returns the forest backend with the given name.
+
+    Args:
+      name    one of BACKEND_NAMES
+
+    Returns:
+      a forest backend
+    """
+    if name == 'r':
+        return_val = RForestBackend()
+    elif name == 'sklearn':
+        return_val = SklearnForestBackend()
+    else:
+        raise ValueError('unknown forest backend ' + str(name) + \
+            '; expected one of ' + str(BACKEND_NAMES))
+    return return_val
+
+class RForestBackend(object):
+    """Grows forests with R's randomForest through rpy2."""
+
+    def compute_vims(self, x, s_y, ntree, mtry, node_size, mode, seed):
+        """Grows one random forest and returns its variable importance
+        measures.
+
+        Args:
+          x         array of dim (n,P) with feature columns and sample rows
+          s_y       series of length n to be predicted from x
+          ntree     number of trees in the forest
+          mtry      number of features randomly grabbed per split
+          node_size minimum size of terminal nodes
+          mode      'classification' or 'regression'
+          seed      seed for R's random number generator
+
+        Returns:
+          array of length P with MeanDecreaseAccuracy (classification) or
+          IncNodePurity (regression) for each feature
+        """
+        # imported here so that other backends don't need R
+        from rpy2 import rinterface
+        from rpy2.robjects import numpy2ri
+        from rpy2.robjects import pandas2ri
+        from rpy2.robjects import vectors
+        from rpy2.robjects import r
+        from rpy2.robjects.packages import importr
+        numpy2ri.activate()
+        pandas2ri.activate()
+
+        my_y = s_y
+        if mode == 'classification':
+            my_y = vectors.FactorVector(s_y)
+        r('set.seed(' + str(seed) + ')')
+        random_forest = importr('randomForest')
+        data_rf = random_forest.randomForest(
+            x=np.asarray(x),
+            y=my_y,
+            ntree=ntree,
+            mtry=mtry,
+            nodesize=node_size,
+            importance=rinterface.TRUE,
+            keep_forest=rinterface.TRUE,
+            proximity=rinterface.TRUE)
+
+        # data_rf is a list; we need the member named importance, whose rows
+        # are the features in the order of x's columns
+        # if we convert it directly to a pd.DataFrame, we lose the col
+        # names, so copy them from the rpy2 Matrix
+        m_vim = data_rf.rx2('importance')
+        df_vim = pandas2ri.ri2py_dataframe(m_vim)
+        df_vim.columns = m_vim.colnames
+        if mode == 'classification':
+            # one column for each class, then "MeanDecreaseAccuracy"
+            # and "MeanDecreaseGini"
+            return_val = df_vim['MeanDecreaseAccuracy'].values
+        else:
+            # "%IncMSE" and "IncNodePurity"
+            return_val = df_vim['IncNodePurity'].values
+        return return_val
+
+class SklearnForestBackend(object):
+    """Grows forests in-process from scikit-learn decision trees, computing
+    the same VIMs as R's randomForest.
+
+    Each tree is fit to its own bootstrap sample, so its out-of-bag (OOB)
+    samples are known:
+      - MeanDecreaseAccuracy, as in R, is the decrease in the fraction of OOB
+        samples a tree classifies correctly when a feature is permuted among
+        them, averaged over all trees. As in R, only features the tree splits
+        on are permuted; the others can't change its predictions.
+      - IncNodePurity, as in R, is the decrease in residual sum of squares
+        from the splits on a feature, summed within a tree and averaged over
+        all trees.
+
+    x is only read, so it can be a read-only memmap shared between workers.
+    """
+
+    def compute_vims(self, x, s_y, ntree, mtry, node_size, mode, seed):
+        """Grows one random forest and returns its variable importance
+        measures. See RForestBackend.compute_vims for the arguments.
+        """
+        # imported here so that other backends don't need scikit-learn
+        from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+        num_samples, num_features = x.shape
+        # as in R, mtry is clipped to the valid range
+        max_features = max(1, min(num_features, int(round(mtry))))
+        # R's nodesize: nodes with at most node_size samples aren't split
+        min_samples_split = max(2, node_size + 1)
+        if mode == 'classification':
+            y = np.unique(np.asarray(s_y), return_inverse=True)[1]
+        else:
+            y = np.asarray(s_y, dtype=np.float64)
+
+        rng = np.random.RandomState(seed)
+        vims = np.zeros(num_features)
+        for _ in xrange(ntree):
+            in_bag = rng.randint(0, num_samples, num_samples)
+            tree_seed = rng.randint(np.iinfo(np.int32).max)
+            if mode == 'classification':
+                tree = DecisionTreeClassifier(max_features=max_features,
+                    min_samples_split=min_samples_split,
+                    random_state=tree_seed)
+                tree.fit(x[in_bag], y[in_bag])
+                oob = np.setdiff1d(np.arange(num_samples), in_bag)
+                if oob.size > 0:
+                    vims += self.__decrease_accuracy(tree, x[oob], y[oob],
+                        rng)
+            else:
+                tree = DecisionTreeRegressor(max_features=max_features,
+                    min_samples_split=min_samples_split,
+                    random_state=tree_seed)
+                tree.fit(x[in_bag], y[in_bag])
+                vims += self.__increase_purity(tree, num_features)
+        return vims / ntree
+
+    @staticmethod
+    def __decrease_accuracy(tree, x_oob, y_oob, rng):
+        """Returns, for each feature, the decrease in the fraction of the OOB
+        samples that the tree classifies correctly when the feature is
+        permuted among them.
+        """
+        return_val = np.zeros(x_oob.shape[1])
+        num_correct = np.sum(tree.predict(x_oob) == y_oob)
+        x_permuted = np.array(x_oob)
+        for feature in np.unique(tree.tree_.feature[tree.tree_.feature >= 0]):
+            x_permuted[:, feature] = x_oob[rng.permutation(len(y_oob)), feature]
+            num_correct_permuted = np.sum(tree.predict(x_permuted) == y_oob)
+            return_val[feature] = \
+                float(num_correct - num_correct_permuted) / len(y_oob)
+            x_permuted[:, feature] = x_oob[:, feature]
+        return return_val
+
+    @staticmethod
+    def __increase_purity(tree, num_features):
+        """Returns, for each feature, the decrease in residual sum of squares
+        from the tree's splits on the feature.
+        """
+        tree_ = tree.tree_
+        rss = tree_.impurity * tree_.weighted_n_node_samples
+        split_nodes = np.nonzero(tree_.feature >= 0)[0]
+        decreases = rss[split_nodes] - \
+            rss[tree_.children_left[split_nodes]] - \
+            rss[tree_.children_right[split_nodes]]
+        return np.bincount(tree_.feature[split_nodes], weights=decreases,
+            minlength=num_features)
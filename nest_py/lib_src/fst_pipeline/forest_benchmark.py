@@ -0,0 +1,114 @@
+#!/usr/bin/python
+"""
+                   University of Illinois/NCSA
+                       Open Source License
+
+        Copyright(C) 2014-2015, The Board of Trustees of the
+            University of Illinois.  All rights reserved.
+
+                          Developed by:
+
+                         Visual Analytics
+                   Applied Research Institute
+            University of Illinois at Urbana-Champaign
+
+               http://appliedresearch.illinois.edu/
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal with the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
++ Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimers.
++ Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimers in
+  the documentation and/or other materials provided with the distribution.
++ Neither the names of The PerfSuite Project, NCSA/University of Illinois
+  at Urbana-Champaign, nor the names of its contributors may be used to
+  endorse or promote products derived from this Software without specific
+  prior written permission.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS WITH THE SOFTWARE.
+"""
+
+# Parity benchmark for the forest backends.
+#
+# Grows the same number of forests with each backend on the same data, and
+# reports how long each took and how closely the backends agree on the
+# features' mean VIMs. Run as
+#
+#     ./forest_benchmark.py /path/to/input.csv response [classification]
+#
+# or with no arguments to use a random P>>N data set in which the first
+# few features are informative.
+
+import sys
+from time import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import spearmanr
+
+import forest_backends
+
+def run_benchmark(df_x, s_y, mode, ntree=500, mtry=None, node_size=1,
+    reps=3, backend_names=None, top_k=20):
+    """Returns a DataFrame with one row per backend: its total seconds, and
+    the Spearman correlation and top_k overlap of its mean VIMs with those
+    of the first backend.
+    """
+    if mtry is None:
+        mtry = int(np.sqrt(df_x.shape[1]))
+    if backend_names is None:
+        backend_names = forest_backends.BACKEND_NAMES
+    x = np.ascontiguousarray(df_x.values, dtype=np.float64)
+    rows = []
+    reference_vims = None
+    for name in backend_names:
+        backend = forest_backends.get_backend(name)
+        start = time()
+        mean_vims = np.mean([backend.compute_vims(x, s_y, ntree=ntree,
+            mtry=mtry, node_size=node_size, mode=mode, seed=seed)
+            for seed in xrange(1, reps+1)], axis=0)
+        seconds = time() - start
+        if reference_vims is None:
+            reference_vims = mean_vims
+        top = set(np.argsort(-mean_vims)[:top_k])
+        reference_top = set(np.argsort(-reference_vims)[:top_k])
+        rows.append({'backend': name, 'seconds': seconds,
+            'spearman': spearmanr(mean_vims, reference_vims)[0],
+            'top_overlap': len(top & reference_top) / float(top_k)})
+    return pd.DataFrame(rows,
+        columns=['backend', 'seconds', 'spearman', 'top_overlap'])
+
+def make_random_data(num_samples=60, num_features=2000, num_informative=5,
+    seed=0):
+    """Returns a random classification data set whose first num_informative
+    features differ between the two classes."""
+    rng = np.random.RandomState(seed)
+    s_y = pd.Series(np.repeat(['a', 'b'], num_samples // 2))
+    values = rng.normal(size=(len(s_y), num_features))
+    values[:, :num_informative] += np.where(s_y == 'b', 1.5, 0.0)[:, None]
+    df_x = pd.DataFrame(values,
+        columns=['f' + str(i) for i in xrange(num_features)])
+    return df_x, s_y
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        df_data = pd.read_csv(sys.argv[1])
+        s_response = df_data.pop(sys.argv[2])
+        run_mode = sys.argv[3] if len(sys.argv) > 3 else 'classification'
+    else:
+        df_data, s_response = make_random_data()
+        run_mode = 'classification'
+    print run_benchmark(df_data, s_response, run_mode).to_string(index=False)
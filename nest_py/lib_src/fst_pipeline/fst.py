@@ -43,22 +43,17 @@ DEALINGS WITH THE SOFTWARE.
 
 import argparse
 import collections
+import feature_stats
 import fst_utils
 from multiprocessing import cpu_count
 import os
 import pandas as pd
 import re
 import refuse
-from rpy2.robjects import numpy2ri
-from rpy2.robjects import pandas2ri
-from rpy2.robjects.packages import importr
 import shutil
 import sys
 import textwrap
 from yaml import load
-import vis
-
-numpy2ri.activate()
 
 def _filter_by_variance(frame, threshold=0.005):
     """Removes from frame any columns with a relative variance
@@ -381,20 +376,11 @@ class FST(object):
         self.__careful_mkdir(outdir)
         # prepare data
         filtered = _filter_by_variance(self.df_x)
-        # call R
-        # TODO just a sec and we'll probably switch this to minepy
-        minerva = importr('minerva')
-        # pylint: disable=no-member
-        mine_out = minerva.mine(filtered.values)
-        # pylint: enable=no-member
-        mic_out = pandas2ri.ri2py_dataframe(mine_out.rx2(1))
-        # restore names
-        names_list = list(filtered.columns.values)
-        mic_out.rename(columns=lambda x: names_list[int(x)],
-                       index=lambda x: names_list[int(x)],
-                       inplace=True)
-        # save and return
-        mic_out.to_csv(os.path.join(outdir, 'MIC.csv'), index_label='feature')
+        # compute in blocks of features, appending each to the file as it's
+        # done; uses minepy if installed, else R's minerva
+        feature_stats.write_mic_csv(filtered,
+            os.path.join(outdir, 'MIC.csv'), cores=cpu_count(),
+            block_size=int(self._config.get('mic_block_size', 200)))
 
     def refuse(self):
         """Runs REFUSE analysis.
@@ -413,13 +399,17 @@ class FST(object):
         self.__careful_mkdir(outdir)
         original_dir = os.getcwd()
         os.chdir(outdir)
+        # which library grows the random forests; see
+        # forest_backends.BACKEND_NAMES
+        backend = self._config.get('forest_backend', 'r')
         if self._config['refuse_search_parameters']:
             # run parameter search
             refuse.parameter_search(
                 self.df_x, self.s_y, ntree_start=1000, mtry=200,
                 node_size=int(self._config['refuse_node_size']),
                 cores=cpu_count(), mode=self._config['mode'], stepsize=2500,
-                max_steps=4, plot_title="All Features Mtry = 200")
+                max_steps=4, plot_title="All Features Mtry = 200",
+                backend=backend)
         # determine feature relevance
         refuse.refuse(
             self.df_x, self.s_y, ntree=int(self._config['ntree']),
@@ -427,10 +417,11 @@ class FST(object):
             node_size=int(self._config['refuse_node_size']), cores=cpu_count(),
             outer_reps=int(self._config['refuse_subsets']),
             inner_reps=int(self._config['refuse_forests']),
-            mode=self._config['mode'], iss=False)
+            mode=self._config['mode'], iss=False, backend=backend)
         if self._config['refuse_compare_methods']:
             # compare methods
-            refuse.compare_methods(self.df_x, self.s_y, mode=self._config['mode'])
+            refuse.compare_methods(self.df_x, self.s_y, mode=self._config['mode'],
+                backend=backend)
         os.chdir(original_dir)
 
     def setup(self):
@@ -490,6 +481,8 @@ class FST(object):
         """
         print 'TODO check status'
         print 'TODO error if outputs missing'
+        # vis plots with R, so only import it (and rpy2) when it's needed
+        import vis
         # create output dir
         outdir = os.path.join(self._config['results_directory'], 'output_vis')
         self.__careful_mkdir(outdir)
@@ -542,6 +535,8 @@ class FST(object):
         print 'refuse_compare_methods: false'
         print 'refuse_search_parameters: false'
         print 'refuse_node_size: 1'
+        print 'forest_backend: r'
+        print 'mic_block_size: 200'
 
     def version(self):
         """Prints version information.
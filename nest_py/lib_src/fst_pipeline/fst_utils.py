@@ -41,8 +41,6 @@ DEALINGS WITH THE SOFTWARE.
 """
 
 import pandas as pd
-import rpy2.robjects.packages as rpackages
-from rpy2.robjects.vectors import StrVector
 import xlsxwriter
 
 def add_feature_metadata(df_target, df_feature_metadata, df_target_fn_col=None):
@@ -146,6 +144,8 @@ def create_refuse_xlsx(df_refuse_table, df_feature_metadata, outpath):
 
 def check_r_packages():
     """Ensures required R packages are installed."""
+    import rpy2.robjects.packages as rpackages
+    from rpy2.robjects.vectors import StrVector
     # import R's utility package
     utils = rpackages.importr('utils')
     # R package names
@@ -40,24 +40,19 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS WITH THE SOFTWARE.
 """
 
+import feature_stats
+import forest_backends
 from joblib import Parallel, delayed
 from multiprocessing import cpu_count
 import numpy as np
 import pandas as pd
-from rpy2 import rinterface
-from rpy2.robjects import numpy2ri
-from rpy2.robjects import pandas2ri
-from rpy2.robjects.packages import importr
-from rpy2.robjects import vectors
-from rpy2.robjects import r
-from scipy.stats import ks_2samp, mannwhitneyu, ttest_ind
-
-numpy2ri.activate()
-pandas2ri.activate()
+from shadow_features import ShadowPlan, add_shadows
+from vim_accumulator import VimAccumulator
+from scipy.stats import ks_2samp, mannwhitneyu
 
 def refuse(
     df_x, s_y, ntree, mtry, node_size, mode, cores,
-    outer_reps=10, inner_reps=10, iss=False):
+    outer_reps=10, inner_reps=10, iss=False, backend='r'):
     """REFUSE -- RElevant FeatUre SElector
 
     Implements the REFUSE method for ranking features where P>>N. Algorithm and
@@ -73,32 +68,43 @@ def refuse(
       inner_reps  number of Random Forests to build per Shadow Perturbation set
       iss         whether to use Instance Cross Validation; ask Nate for
                   guidance if setting True
+      backend     name of the forest backend that grows the forests; see
+                  forest_backends.BACKEND_NAMES
     """
-    vim_melted = None
+    # every forest's VIMs go into one row of the accumulator, with the
+    # shadows' VIMs in their own block
+    num_outer = max(outer_reps, 1)
+    reps_per_outer = inner_reps
+    if iss:
+        reps_per_outer *= df_x.shape[0]
+    num_shadows = df_x.shape[1] if outer_reps > 0 else 0
+    accumulator = VimAccumulator(df_x.columns.values,
+        num_outer * reps_per_outer, num_shadows=num_shadows)
     if outer_reps > 0:
-        vim_melted = pd.DataFrame()
         for i in xrange(outer_reps):
-            x_with_shadow = __add_shadows(df_x, i+1)
+            shadow_plan = ShadowPlan(df_x.shape[0], df_x.shape[1], i+1)
             # note: multiplying mtry by 2 because we've doubled # of features
-            df_vim = __run_rf_outer_rep(x_with_shadow, s_y, ntree=ntree,
+            __run_rf_outer_rep(df_x, s_y, shadow_plan, ntree=ntree,
                 mtry=2*mtry, node_size=node_size, mode=mode, cores=cores,
-                inner_reps=inner_reps, outer_rep_number=i, iss=iss)
-            vim_melted = vim_melted.append(df_vim, ignore_index=True)
+                inner_reps=inner_reps, outer_rep_number=i, iss=iss,
+                backend=backend, accumulator=accumulator,
+                first_rep=i*reps_per_outer)
     else:
-        vim_melted = __run_rf_outer_rep(df_x, s_y, ntree=ntree, mtry=mtry,
+        __run_rf_outer_rep(df_x, s_y, None, ntree=ntree, mtry=mtry,
             node_size=node_size, mode=mode, cores=cores, inner_reps=inner_reps,
-            outer_rep_number=0, iss=iss)
+            outer_rep_number=0, iss=iss, backend=backend,
+            accumulator=accumulator, first_rep=0)
 
     # reformt as table of features
-    vim_structured = __structure_melted(vim_melted)
+    vim_structured = accumulator.to_structured()
     vim_structured.to_csv('REFUSE_structured.csv', index_label='index')
 
     # compute mean and var of each feature's VIM
-    vim_importance = __consolidate_importance(vim_structured, ranked=False)
-    vim_stability = __consolidate_stability(vim_structured, ranked=False)
+    vim_importance = accumulator.get_means()
+    vim_stability = accumulator.get_vars()
 
     # test each feature against the max shadow
-    vim_p, top_shadow_name = __shadow_test(vim_structured)
+    vim_p, top_shadow_name = accumulator.shadow_test()
     vim_reps = __prep_importance(
         vim_structured, vim_importance, num_features=75, shadow=top_shadow_name)
     vim_reps.to_csv('vim_reps.csv', index_label='index')
@@ -111,28 +117,37 @@ def refuse(
 
     return refuse_table
 
-def __run_rf_outer_rep(df_x, s_y, ntree, mtry, node_size, mode, cores,
-    inner_reps, outer_rep_number, iss):
-    # build forests and store results
-    df_vim = None
+def __run_rf_outer_rep(df_x, s_y, shadow_plan, ntree, mtry, node_size, mode,
+    cores, inner_reps, outer_rep_number, iss, backend, accumulator, first_rep):
+    # build forests and store results in the accumulator, starting at row
+    # first_rep. the forests see df_x's features plus the shadows of
+    # shadow_plan, if any
     if iss:
-        # advanced method with instance stability wrapper
-        df_vim = __instance_stability(
-            df_x, s_y, ntree=ntree, mtry=mtry, node_size=node_size,
-            mode=mode, cores=cores, reps=inner_reps)
-        # save df_vim for iss plotting later (see vis.py for details)
+        # advanced method with instance stability wrapper. it drops samples,
+        # so build the shadows of all of them up front
+        x_with_shadow = df_x
+        if shadow_plan is not None:
+            x_with_shadow = add_shadows(df_x, shadow_plan.seed)
+        __instance_stability(
+            x_with_shadow, s_y, ntree=ntree, mtry=mtry, node_size=node_size,
+            mode=mode, cores=cores, reps=inner_reps, backend=backend,
+            accumulator=accumulator, first_rep=first_rep)
+        # save the vims for iss plotting later (see vis.py for details)
+        df_vim = accumulator.to_melted(first_rep, inner_reps * df_x.shape[0])
         df_vim.to_csv('ISS melted rep.' + str(outer_rep_number) + '.csv',
             index_label='index')
     else:
         # basic method without instance stability wrapper
-        df_vim = __run_rf_inner_reps(
+        __run_rf_inner_reps(
             df_x, s_y, ntree=ntree, mtry=mtry, node_size=node_size,
             mode=mode, set_label='REFUSE', reps=inner_reps, cores=cores,
-            plot=False, iss=True)
-    return df_vim
+            plot=False, iss=True, backend=backend, accumulator=accumulator,
+            first_rep=first_rep, shadow_plan=shadow_plan)
+    return
 
 def __run_rf_inner_reps(df_x, s_y, ntree, mtry, node_size, mode, set_label,
-    reps, cores, plot, iss):
+    reps, cores, plot, iss, backend='r', accumulator=None, first_rep=0,
+    shadow_plan=None):
     """Uses random forest to compute variable importance measures for features
     in df_x relative to s_y.
 
@@ -151,43 +166,53 @@ def __run_rf_inner_reps(df_x, s_y, ntree, mtry, node_size, mode, set_label,
                 shouldn't exceed reps or the max number of cores available
       plot      whether to generate output for plots -- TODO currently ignored
       iss       whether this is part of an Instance Cross Validation run
+      backend   name of the forest backend; see forest_backends.BACKEND_NAMES
+      accumulator VimAccumulator to store the VIMs of the forests in, or None
+                to use a new one for just these forests
+      first_rep index of the accumulator row for the first forest; the
+                forests fill rows first_rep through first_rep+reps-1
+      shadow_plan ShadowPlan of df_x, or None; if given, each forest is grown
+                on df_x's features followed by their shadows, which are built
+                in the worker process
 
     Returns:
-      iterable of variable importance measures
+      Series with the mean VIM of each feature, or None if iss, in which
+      case the VIMs are only stored in the accumulator
     """
 
-    vim_melted = pd.DataFrame()
+    if accumulator is None:
+        accumulator = VimAccumulator(df_x.columns.values, reps)
+        first_rep = 0
+    forest_backend = forest_backends.get_backend(backend)
+    # pass the features as one plain array: joblib dumps arrays bigger than
+    # max_nbytes to a file in JOBLIB_TEMP_FOLDER once, and every worker maps
+    # it read-only, instead of each replicate pickling its own copy
+    x = np.ascontiguousarray(df_x.values, dtype=np.float64)
     #apple = Parallel(n_jobs=min(reps, cores, cpu_count()), temp_folder='/code_live/data/projects/mmbdb/')(
-    apple = Parallel(n_jobs=min(reps, cores, cpu_count()))(
+    apple = Parallel(n_jobs=min(reps, cores, cpu_count()), max_nbytes='1M',
+        mmap_mode='r')(
         delayed(__run_rf_single)(
-            df_x, s_y, ntree, mtry, node_size, mode, i, set_label, plot)
+            forest_backend, x, shadow_plan, s_y, ntree, mtry, node_size,
+            mode, i, set_label, plot)
             for i in xrange(reps))
-    for vim in apple:
-        vim_melted = vim_melted.append(vim, ignore_index=True)
+    accumulator.add_reps(first_rep, apple)
 
     if iss:
-        return vim_melted
+        return None
     else:
-        vim_storage = __structure_melted(vim_melted)
-        return __consolidate_importance(vim_storage, ranked=False)
+        return accumulator.get_means()
 
-def __run_rf_single(df_x, s_y, ntree, mtry, node_size, mode, seed, set_label, plot):
-    """Runs random forest once."""
+def __run_rf_single(forest_backend, x, shadow_plan, s_y, ntree, mtry,
+    node_size, mode, seed, set_label, plot):
+    """Runs random forest once. Returns an array with the VIM of each of x's
+    columns, followed by the VIM of each shadow if shadow_plan is given."""
 
-    my_y = s_y
-    if mode == 'classification':
-        my_y = vectors.FactorVector(s_y)
-    r('set.seed(' + str(seed) + ')')
-    random_forest = importr('randomForest')
-    data_rf = random_forest.randomForest(
-        x=df_x,
-        y=my_y,
-        ntree=ntree,
-        mtry=mtry,
-        nodesize=node_size,
-        importance=rinterface.TRUE,
-        keep_forest=rinterface.TRUE,
-        proximity=rinterface.TRUE)
+    if shadow_plan is not None:
+        x = shadow_plan.append_shadows(x)
+
+    vims = forest_backend.compute_vims(
+        x, s_y, ntree=ntree, mtry=mtry, node_size=node_size, mode=mode,
+        seed=seed)
 
     # TODO do we use these plots?
     # previous implementation would produce only one set of plots for
@@ -196,103 +221,7 @@ def __run_rf_single(df_x, s_y, ntree, mtry, node_size, mode, seed, set_label, pl
     # if plot:
     #    plot.standard(data_rf, s_y, set_label)
 
-    # data_rf is a list; we need the member named importance
-    # if we convert it directly to a pd.DataFrame, we lose the col and row
-    # names for some reason, so convert first to a rpy2 Matrix, then
-    # copy the col and row names from there
-    m_vim = data_rf.rx2('importance')
-    df_vim = pandas2ri.ri2py_dataframe(data_rf.rx2('importance'))
-    df_vim.columns = m_vim.colnames
-    # restore original names, which may have been mangled by R
-    df_vim['row.names'] = df_x.columns.values
-    # df_vim has one column "row.names" then...
-    if mode == 'classification':
-        # one column for each class, then "MeanDecreaseAccuracy"
-        # and "MeanDecreaseGini"
-        df_vim = df_vim[['row.names', 'MeanDecreaseAccuracy']]
-    else:
-        # "%IncMSE" and "IncNodePurity"
-        df_vim = df_vim[['row.names', 'IncNodePurity']]
-    df_vim.columns = ['Feature.Name', 'vim']
-    return df_vim
-
-def __add_shadows(df_x, random_seed):
-    """
-    Adds shadow features to a data frame.
-    """
-
-    # make shadow features
-    # note: need to be very careful how we do this--np.random.permutation
-    # only works if all columns have the same numeric type, so we instead
-    # of applying it to the data, we have to apply it to the column indices--
-    # otherwise, a single non-numeric column in the df, or a mix of numeric
-    # types, will prevent anything from being shuffled
-    np.random.seed(random_seed)
-    df_combined = df_x.copy()
-
-    for i in xrange(df_x.shape[1]):
-        shadow_name = 'shadow_' + str(i)
-        col = df_combined.iloc[:,i]
-        shadow_col = col.reindex(np.random.permutation(col.index))
-        df_combined[shadow_name] = shadow_col.values
-
-    return df_combined
-
-def __structure_melted(df_vim_melted):
-    """Converts REFUSE_melted to REFUSE_structured.
-
-    Args:
-      - df_vim_melted: DataFrame containing at least feature names
-                       in a column called 'Feature.Name' and VIM values
-      - vim_name: Column name for VIM values in df_vim_melted
-
-    Returns:
-      - DataFrame prepped for box plots and aggregation
-    """
-    grouped = df_vim_melted.groupby('Feature.Name')
-    return pd.concat([
-        pd.Series(list(group['vim']), name=name) for name, group in grouped
-        ], axis=1)
-
-def __shadow_test(df_vim_structured):
-    """Finds top shadow feature and computes p values for all features.
-
-    Arguments:
-      - df_vim_importance -- dataframe with feature columns and vim replication
-        rows (as returned by __structure_melted)
-    Returns:
-      - list [0]: vector with a p.value for each feature
-                  + the top shadow feature
-             [1]: string with name of shadow with highest mean vim score
-    """
-
-    s_ttest = None
-    top_shadow_name = None
-
-    # find the top shadow
-    s_shadow_mean_vims = df_vim_structured.filter(regex='shadow_').mean()
-    if s_shadow_mean_vims.size > 0:
-        top_shadow_name = s_shadow_mean_vims.idxmax()
-
-        # calculate the t-test values
-        ttests = ttest_ind(df_vim_structured[top_shadow_name],
-            df_vim_structured, equal_var=False)
-
-        s_ttest = pd.Series(
-            [p/2 if t > 0 else 1-p/2 for t, p in zip(ttests[0], ttests[1])],
-            index=df_vim_structured.columns.values, name='p_val')
-
-        # disabled for now--when switching to utest, delete ttest code above
-        # and ttest include
-        #    top_shadow_col = df_vim_structured[top_shadow_name]
-        #    s_utest = pd.Series(
-        #        [utest(cdata, top_shadow_col)
-        #            for cname, cdata in df_vim_structured.iteritems()],
-        #        index=df_vim_structured.columns.values, name='p_val')
-    else:
-        s_ttest = pd.Series([-1 for x in xrange(df_vim_structured.shape[1])],
-            index=df_vim_structured.columns.values, name='p_val')
-    return [s_ttest, top_shadow_name]
+    return vims
 
 def utest(a, b):
     """
@@ -316,34 +245,32 @@ def utest(a, b):
         return val[1]
 
 
-def compare_methods(df_x, s_y, mode):
+def compare_methods(df_x, s_y, mode, backend='r'):
     """Computes statistics on each feature."""
 
     # Permutation
     permutation = __run_rf_inner_reps(
         df_x, s_y, ntree=1000, mtry=300, node_size=1, mode=mode,
         set_label="All_Data_Sources",
-        reps=30, cores=14, plot=False, iss=False)
+        reps=30, cores=14, plot=False, iss=False, backend=backend)
 
-    df_stats = pd.DataFrame(
+    my_y = s_y.values
+    if mode == 'classification':
+        my_y = s_y.factorize()[0]
+
+    # Correlation, of all features at once
+    correlations = feature_stats.correlations_with(df_x.values, my_y)
+    df_stats = pd.DataFrame({
+        'name': df_x.columns.values,
+        'vim': permutation[df_x.columns].values,
+        'pearson': correlations['pearson'],
+        'kendall': correlations['kendall'],
+        'spearman': correlations['spearman'],
+        'mean': df_x.mean().values,
+        'var': df_x.var().values},
         columns=['name', 'vim', 'pearson', 'kendall', 'spearman',
         'mean', 'var'])
 
-    my_y = s_y
-    if mode == 'classification':
-        my_y = pd.Series(s_y.factorize()[0])
-
-    # Correlation
-    for name, col in df_x.iteritems():
-        stats_dict = {'name': name}
-        stats_dict['vim'] = permutation[name]
-        stats_dict['pearson'] = col.corr(my_y, method='pearson')
-        stats_dict['kendall'] = col.corr(my_y, method='kendall')
-        stats_dict['spearman'] = col.corr(my_y, method='spearman')
-        stats_dict['mean'] = col.mean()
-        stats_dict['var'] = col.var()
-        df_stats = df_stats.append(stats_dict, ignore_index=True)
-
     # Reorder
     df_stats.sort(columns='vim', ascending=False, inplace=True)
 
@@ -351,24 +278,6 @@ def compare_methods(df_x, s_y, mode):
     df_stats['segment5'] = __auto_segment(df_stats['vim'], 5)
     df_stats.to_csv('Data_Results.csv', index_label='index')
 
-def __consolidate_importance(df_vim_structured, ranked=True):
-    """Calculates the mean of each feature's VIMs. Returns a Series.
-    """
-    return_val = df_vim_structured.mean(axis=0)
-    return_val.name = 'VIM_mean'
-    if ranked:
-        return_val.sort()
-    return return_val
-
-def __consolidate_stability(df_vim_structured, ranked=True):
-    """Calculates the variance of each feature's VIMs.
-    """
-    return_val = df_vim_structured.var(axis=0)
-    return_val.name = 'VIM_var'
-    if ranked:
-        return_val.sort()
-    return return_val
-
 def __prep_importance(
     df_vim_structured, s_vim_importance, style="tail", shadow="null",
     num_features=50):
@@ -403,7 +312,7 @@ def __scale_01(s_vim):
 
 def parameter_search(
     df_x, s_y, ntree_start, mtry, node_size, mode, cores, stepsize, max_steps,
-    plot_title):
+    plot_title, backend='r'):
     """Tries a range of ntree values and reports results."""
 
     # storage for stats @ each rep
@@ -420,7 +329,7 @@ def parameter_search(
         s_this = __run_rf_inner_reps(
             df_x, s_y, ntree=ntree, mtry=mtry, node_size=node_size, mode=mode,
             set_label=plot_title, reps=10,
-            cores=cores, plot=True, iss=False)
+            cores=cores, plot=True, iss=False, backend=backend)
         s_this = __scale_01(s_this)
         s_this.name = str(ntree)
 
@@ -453,7 +362,13 @@ def __auto_segment(s_vims, num_segments):
     """Given a Series of VIMs and a number of segments, returns a new Series
     assigning each of the VIMs to a segment.
     """
-    # use R to find segment breaks
+    # use R to find segment breaks; rpy2 is imported here so that REFUSE
+    # runs without R when the forest backend doesn't need it
+    from rpy2.robjects import numpy2ri
+    from rpy2.robjects import pandas2ri
+    from rpy2.robjects.packages import importr
+    numpy2ri.activate()
+    pandas2ri.activate()
     class_int = importr('classInt')
     segment = class_int.classIntervals(var=s_vims,
         n=num_segments,
@@ -474,23 +389,22 @@ def __find_segment(l_breaks, number):
             return i
     return len(l_breaks)
 
-def __instance_stability(df_x, s_y, ntree, mtry, node_size, mode, cores, reps=10):
+def __instance_stability(df_x, s_y, ntree, mtry, node_size, mode, cores, reps,
+    backend, accumulator, first_rep):
     """Given features df_x and response s_y, iteratively calculates VIMs
-    dropping one sample at a time.
+    dropping one sample at a time. The forests fill reps rows of the
+    accumulator per sample, starting at row first_rep.
     """
-    vim_melted = pd.DataFrame()
-
     # iteratively drop instances and recompute PRNG replicated RF run
-    for row in df_x.index:
+    for i, row in enumerate(df_x.index):
         # subset data
         df_x_i = df_x.drop(row)
         s_y_i = s_y.drop(row)
 
         # build forests and store results
-        df_vim = __run_rf_inner_reps(df_x_i, s_y_i, ntree=ntree, mtry=mtry,
+        __run_rf_inner_reps(df_x_i, s_y_i, ntree=ntree, mtry=mtry,
             node_size=node_size, mode=mode,
             set_label="Instance Stability" + str(row),
-            reps=reps, cores=cores, plot=False, iss=True)
-        vim_melted = vim_melted.append(df_vim, ignore_index=True)
-
-    return vim_melted
+            reps=reps, cores=cores, plot=False, iss=True, backend=backend,
+            accumulator=accumulator, first_rep=first_rep + i*reps)
+    return
@@ -0,0 +1,111 @@
+"""
+                   University of Illinois/NCSA
+                       Open Source License
+
+        Copyright(C) 2014-2015, The Board of Trustees of the
+            University of Illinois.  All rights reserved.
+
+                          Developed by:
+
+                         Visual Analytics
+                   Applied Research Institute
+            University of Illinois at Urbana-Champaign
+
+               http://appliedresearch.illinois.edu/
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal with the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
++ Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimers.
++ Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimers in
+  the documentation and/or other materials provided with the distribution.
++ Neither the names of The PerfSuite Project, NCSA/University of Illinois
+  at Urbana-Champaign, nor the names of its contributors may be used to
+  endorse or promote products derived from this Software without specific
+  prior written permission.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS WITH THE SOFTWARE.
+"""
+
+import numpy as np
+import pandas as pd
+
+class ShadowPlan(object):
+    """The row permutations that turn a set of features into their shadows.
+
+    Shadow i holds the values of feature i, shuffled across the samples by
+    its own permutation. The plan stores only the seed and the shape, and
+    draws the permutations again each time they're needed, so it can be
+    passed to worker processes in place of the shadow data, and the shadows
+    built there from the original features. The same seed always gives the
+    same permutations, which are the ones refuse's shadows have always used:
+    one np.random.permutation per feature, in column order.
+    """
+
+    def __init__(self, num_samples, num_features, seed):
+        """Initializes self.
+
+        Args:
+          num_samples   number of rows of the features to shadow
+          num_features  number of columns of the features to shadow
+          seed          seed of the random number generator
+        """
+        self.num_samples = num_samples
+        self.num_features = num_features
+        self.seed = seed
+
+    def get_row_idxs(self):
+        """Returns an int array of dim (num_samples, num_features) whose
+        column i is the row permutation of shadow i.
+        """
+        rand_state = np.random.RandomState(self.seed)
+        # draw by feature into contiguous rows, then view as columns
+        row_idxs = np.empty((self.num_features, self.num_samples),
+            dtype=np.int32)
+        for i in xrange(self.num_features):
+            row_idxs[i] = rand_state.permutation(self.num_samples)
+        return row_idxs.T
+
+    def make_shadows(self, x):
+        """Returns an array of dim (num_samples, num_features) with the
+        shadows of x, built with one fancy-indexing step.
+
+        Args:
+          x  array of dim (num_samples, num_features)
+        """
+        return x[self.get_row_idxs(), np.arange(self.num_features)]
+
+    def append_shadows(self, x):
+        """Returns an array with the columns of x followed by their shadows.
+
+        Args:
+          x  array of dim (num_samples, num_features)
+        """
+        return np.hstack([x, self.make_shadows(x)])
+
+def add_shadows(df_x, seed):
+    """Returns a DataFrame with the columns of df_x followed by a shadow of
+    each, named 'shadow_0', 'shadow_1', etc.
+
+    Args:
+      df_x  DataFrame of dim (n,P) with feature columns and sample rows
+      seed  seed of the random number generator; see ShadowPlan
+    """
+    plan = ShadowPlan(df_x.shape[0], df_x.shape[1], seed)
+    shadow_names = ['shadow_' + str(i) for i in xrange(df_x.shape[1])]
+    df_shadows = pd.DataFrame(plan.make_shadows(df_x.values),
+        index=df_x.index, columns=shadow_names)
+    return pd.concat([df_x, df_shadows], axis=1)
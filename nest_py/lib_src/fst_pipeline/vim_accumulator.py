@@ -0,0 +1,162 @@
+"""
+                   University of Illinois/NCSA
+                       Open Source License
+
+        Copyright(C) 2014-2015, The Board of Trustees of the
+            University of Illinois.  All rights reserved.
+
+                          Developed by:
+
+                         Visual Analytics
+                   Applied Research Institute
+            University of Illinois at Urbana-Champaign
+
+               http://appliedresearch.illinois.edu/
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal with the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
++ Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimers.
++ Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimers in
+  the documentation and/or other materials provided with the distribution.
++ Neither the names of The PerfSuite Project, NCSA/University of Illinois
+  at Urbana-Champaign, nor the names of its contributors may be used to
+  endorse or promote products derived from this Software without specific
+  prior written permission.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+CONTRIBUTORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS WITH THE SOFTWARE.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import ttest_ind
+
+class VimAccumulator(object):
+    """Collects the VIMs of every forest REFUSE grows into preallocated
+    arrays, one row per replicate, as the forests finish.
+
+    The original features and their shadows are kept in separate blocks.
+    Shadow i is named 'shadow_i', as in refuse.__add_shadows, and every
+    outer replicate's shadows share the same columns. The outputs are
+    indexed by feature name in sorted order, which is the order the
+    DataFrame-based implementation produced.
+    """
+
+    def __init__(self, feature_names, num_reps, num_shadows=0):
+        """Initializes self.
+
+        Args:
+          feature_names  names of the original features, in the order of
+                         the VIMs passed to add_reps
+          num_reps       total number of forests that will be added
+          num_shadows    number of shadow features that follow the original
+                         features in the VIMs passed to add_reps
+        """
+        self.feature_names = np.asarray(feature_names, dtype=object)
+        self.shadow_names = np.array(
+            ['shadow_' + str(i) for i in xrange(num_shadows)], dtype=object)
+        self.vims = np.empty((num_reps, len(self.feature_names)))
+        self.vims.fill(np.nan)
+        self.shadow_vims = np.empty((num_reps, num_shadows))
+        self.shadow_vims.fill(np.nan)
+        all_names = np.concatenate([self.feature_names, self.shadow_names])
+        self.sorted_order = np.argsort(all_names, kind='mergesort')
+        self.sorted_names = all_names[self.sorted_order]
+
+    def add_reps(self, first_rep, vims_list):
+        """Stores the VIMs of consecutive forests.
+
+        Args:
+          first_rep  index of the replicate of the first forest
+          vims_list  iterable of arrays, one per forest, each with a VIM for
+                     every original feature and then every shadow
+        """
+        num_features = len(self.feature_names)
+        for i, vims in enumerate(vims_list):
+            self.vims[first_rep+i, :] = vims[:num_features]
+            self.shadow_vims[first_rep+i, :] = vims[num_features:]
+
+    def get_means(self):
+        """Returns a Series with the mean VIM of each feature."""
+        return self.__to_series(np.concatenate([
+            self.vims.mean(axis=0), self.shadow_vims.mean(axis=0)]),
+            'VIM_mean')
+
+    def get_vars(self):
+        """Returns a Series with the (sample) variance of each feature's
+        VIMs."""
+        return self.__to_series(np.concatenate([
+            self.vims.var(axis=0, ddof=1),
+            self.shadow_vims.var(axis=0, ddof=1)]), 'VIM_var')
+
+    def shadow_test(self):
+        """Finds the shadow with the highest mean VIM and computes, for every
+        feature, the one-sided p value that its VIMs are greater than the
+        top shadow's.
+
+        Returns:
+          - list [0]: Series with a p value for each feature, or -1 for
+                      each if there are no shadows
+                 [1]: name of the top shadow, or None
+        """
+        s_ttest = None
+        top_shadow_name = None
+        if self.shadow_vims.shape[1] > 0:
+            shadow_means = self.shadow_vims.mean(axis=0)
+            # ties go to the first shadow by name, as with Series.idxmax
+            shadow_order = np.argsort(self.shadow_names, kind='mergesort')
+            top_shadow = shadow_order[np.argmax(shadow_means[shadow_order])]
+            top_shadow_name = self.shadow_names[top_shadow]
+            ttests = ttest_ind(self.shadow_vims[:, top_shadow],
+                np.hstack([self.vims, self.shadow_vims]), equal_var=False)
+            # p/2 if t > 0 else 1-p/2
+            p_vals = np.where(ttests[0] > 0, ttests[1]/2, 1-ttests[1]/2)
+            s_ttest = self.__to_series(p_vals, 'p_val')
+        else:
+            s_ttest = pd.Series(-1, index=self.sorted_names, name='p_val')
+        return [s_ttest, top_shadow_name]
+
+    def to_structured(self):
+        """Returns a DataFrame with a column of VIMs for every feature, in
+        sorted order, and a row for every replicate."""
+        return pd.DataFrame(
+            np.hstack([self.vims, self.shadow_vims])[:, self.sorted_order],
+            columns=self.sorted_names)
+
+    def to_melted(self, first_rep=0, num_reps=None):
+        """Returns a DataFrame with a row for every feature of every
+        replicate, with the feature names in column 'Feature.Name' and the
+        VIMs in column 'vim'.
+
+        Args:
+          first_rep  index of the first replicate to include
+          num_reps   number of replicates to include, or None for the rest
+        """
+        if num_reps is None:
+            num_reps = self.vims.shape[0] - first_rep
+        reps = slice(first_rep, first_rep + num_reps)
+        all_names = np.concatenate([self.feature_names, self.shadow_names])
+        all_vims = np.hstack([self.vims[reps], self.shadow_vims[reps]])
+        return pd.DataFrame({
+            'Feature.Name': np.tile(all_names, num_reps),
+            'vim': all_vims.ravel()},
+            columns=['Feature.Name', 'vim'])
+
+    def __to_series(self, values, name):
+        """Returns a Series of values, given for the original features and
+        then the shadows, indexed by sorted feature name."""
+        return pd.Series(values[self.sorted_order], index=self.sorted_names,
+            name=name)
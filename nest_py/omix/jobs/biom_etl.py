@@ -5,6 +5,8 @@ to tornado_runs, geno_samples and otus endpoints
 tightly coupled to mmbdb_seed_job.py
 """
 
+import numpy
+import scipy.sparse
 import biom
 from biom.table import Table as BiomTable
 from nest_py.core.jobs.jobs_logger import log
@@ -15,6 +17,7 @@ import nest_py.omix.data_types.otus as otus
 
 import nest_py.core.data_types.tablelike_entry as tablelike_entry
 from nest_py.omix.jobs.sparse_array import SparseArray
+from nest_py.omix.jobs.sparse_array import SparseMatrixRow
 
 TAXONOMY_LEVELS = otus.TAXONOMY_LEVELS
 
@@ -100,7 +103,8 @@ def extract_taxonomy_of_otu(biom_table, otu_observation_id):
             taxa_atts[level] = taxa
     return taxa_atts
 
-def upload_geno_samples(client_registry, biom_table, tornado_run_id, otu_defs):
+def upload_geno_samples(client_registry, biom_table, tornado_run_id, otu_defs,
+    use_count_matrix=True):
     """
     uploads basic description of genome sample data from the biom_table
     (one entry per sample). 
@@ -109,6 +113,11 @@ def upload_geno_samples(client_registry, biom_table, tornado_run_id, otu_defs):
     support sparse data well yet. (that data is just kept in memory in this
     seed_job)
 
+    if use_count_matrix is true, the otu counts and relative abundances of
+    all samples are built as two samples x otus csr matrices straight from
+    the biom_table's scipy matrix, and each geno_sample gets SparseMatrixRow
+    views of its rows. otherwise each sample gets its own SparseArrays
+
     returns a dict of tornado_sample_key to TablelikeEntry's that conform to
     the geno_samples schema (with eve_attributes returned by the upload)
     """
@@ -143,13 +152,24 @@ def upload_geno_samples(client_registry, biom_table, tornado_run_id, otu_defs):
     #server. the big data is then available to other analytics but
     #we don't have a good way to POST it yet (TablelikeSchema doesn't handle
     #sparse arrays yet)
-    otu_counts_of_samples = _extract_otu_counts_for_samples(biom_table, otu_defs)
-    for tle in geno_samples_list:
-        sample_tornado_key  = tle.get_value('tornado_sample_key')
-        otu_counts_of_sample = otu_counts_of_samples[sample_tornado_key]
-        tle.set_value('otu_counts', otu_counts_of_sample)
-        rel_abunds_of_sample = _compute_relative_abundances_for_sample(otu_counts_of_sample)
-        tle.set_value('otu_frac_abundances', rel_abunds_of_sample)
+    if use_count_matrix:
+        sample_row_lookup, otu_counts = _extract_otu_count_matrix(biom_table,
+            otu_defs)
+        rel_abunds = _compute_relative_abundance_matrix(otu_counts)
+        for tle in geno_samples_list:
+            sample_tornado_key  = tle.get_value('tornado_sample_key')
+            row_idx = sample_row_lookup[sample_tornado_key]
+            tle.set_value('otu_counts', SparseMatrixRow(otu_counts, row_idx))
+            tle.set_value('otu_frac_abundances',
+                SparseMatrixRow(rel_abunds, row_idx))
+    else:
+        otu_counts_of_samples = _extract_otu_counts_for_samples(biom_table, otu_defs)
+        for tle in geno_samples_list:
+            sample_tornado_key  = tle.get_value('tornado_sample_key')
+            otu_counts_of_sample = otu_counts_of_samples[sample_tornado_key]
+            tle.set_value('otu_counts', otu_counts_of_sample)
+            rel_abunds_of_sample = _compute_relative_abundances_for_sample(otu_counts_of_sample)
+            tle.set_value('otu_frac_abundances', rel_abunds_of_sample)
 
     geno_samples_lookup = dict()
     for tle in geno_samples_list:
@@ -179,6 +199,52 @@ def _compute_relative_abundances_for_sample(otu_counts_of_sample):
 
     return rel_abund_sary
 
+def _compute_relative_abundance_matrix(otu_counts):
+    """
+    input csr matrix of the otu_counts of all samples (generated by
+    _extract_otu_count_matrix). returns a csr matrix of the same
+    dimensions and sparsity with the relative abundance of every otu
+    in its sample (between 0.0 and 1.0)
+    """
+    tallies = numpy.asarray(otu_counts.sum(axis=1)).ravel()
+    rel_abunds = otu_counts.copy()
+    row_lengths = numpy.diff(rel_abunds.indptr)
+    rel_abunds.data = rel_abunds.data / numpy.repeat(tallies, row_lengths)
+    return rel_abunds
+
+def _extract_otu_count_matrix(biom_table, otu_defs):
+    """
+    builds the otu counts of all samples from the biom_table's underlying
+    scipy matrix (otus x samples) in one pass.
+
+    returns a dict of sample_tornado_key (str) -> row index, and a
+    samples x otus csr matrix of the counts, where the column of an otu
+    is its 'index_within_tornado_run' from the otu_defs. only nonzero
+    counts are stored, with the indices of every row sorted
+    """
+    otu_index_lookup = dict()
+    for otu_def in otu_defs:
+        otu_key = otu_def.get_value('tornado_observation_key')
+        otu_sparse_index = otu_def.get_value('index_within_tornado_run')
+        otu_index_lookup[otu_key] = otu_sparse_index
+
+    #map each row of the biom_table to its otu index once, and let scipy
+    #transpose and reorder all the counts together
+    otu_idx_of_row = numpy.array([otu_index_lookup[otu_key] for otu_key in
+        biom_table.ids('observation')], dtype=numpy.int64)
+    biom_counts = biom_table.matrix_data.tocoo()
+    otu_counts = scipy.sparse.csr_matrix(
+        (biom_counts.data.astype(numpy.float64),
+            (biom_counts.col, otu_idx_of_row[biom_counts.row])),
+        shape=(biom_counts.shape[1], len(otu_defs)))
+    otu_counts.eliminate_zeros()
+    otu_counts.sort_indices()
+
+    sample_row_lookup = dict()
+    for row_idx, sample_tornado_key in enumerate(biom_table.ids('sample')):
+        sample_row_lookup[sample_tornado_key] = row_idx
+    return sample_row_lookup, otu_counts
+
 def _extract_otu_counts_for_samples(biom_table, otu_defs):
     """
     creates a dict of sample_tornado_key (str) -> SparseArray (otu counts, 
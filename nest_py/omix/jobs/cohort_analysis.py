@@ -3,60 +3,161 @@ analytics functions and data structures for turning a
 an AttributeTree representing a taxonomy
 with each taxa having a set of attributes representing
 analytics of the otus below it
+
+compute_all_for_cohorts keeps the per-sample metrics of a cohort as
+samples x nodes sparse matrices (see taxonomy_matrix) and only stores the
+aggregates on the tree. the functions that walk the tree with a SparseArray
+per node are kept as the reference implementation.
 """
 import math
+import multiprocessing
+import os
+import shutil
+import tempfile
 import numpy
+import scipy.sparse
 import skbio.diversity.alpha
 import random
 
 from nest_py.omix.jobs.attribute_tree import AttributeTree
 from nest_py.omix.jobs.sparse_array import SparseArray
 import nest_py.omix.jobs.otu_analysis as otu_analysis
+import nest_py.omix.jobs.taxonomy_matrix as taxonomy_matrix
 import nest_py.omix.jobs.cohort_tree_etl as cohort_tree_etl
+import nest_py.omix.jobs.node_upload as node_upload
 
 import nest_py.omix.data_types.otus as otus
 import nest_py.core.jobs.jobs_logger as logger
 from nest_py.core.jobs.checkpoint import CheckpointTimer
 
 def compute_all_for_cohorts(client_registry, cohort_tles, all_geno_samples, otu_defs,
-    num_quantiles=8, num_bins=20, timer=CheckpointTimer("cohort_analysis")):
+    num_quantiles=8, num_bins=20, num_workers=1, spill_to_disk=False,
+    num_upload_threads=1, timer=CheckpointTimer("cohort_analysis")):
     """
     compute all analytics for each cohort in a list. they will share some
     scaling factors between all cohorts.
 
+    this runs in two phases. first the base metrics of every cohort are
+    computed once (see compute_base_metrics_for_cohorts), which also gives
+    the scaling factors. then the aggregates of every cohort are computed
+    from its base metrics and uploaded.
+
+    num_workers (int): number of processes that compute the base metrics
+        of the cohorts. 1 computes them in this process
+    spill_to_disk (bool): if true, the base metrics of every cohort are
+        written to a temp directory after the first phase and read back one
+        cohort at a time in the second, so only one cohort's metrics are in
+        memory at once
+    num_upload_threads (int): number of cohort trees that are uploaded at
+        once, in the background while the next cohorts are computed
     """
     #deduce the structure of the tree, which we will copy each time
     taxonomy_empty_tree = otu_analysis.compute_taxonomy_tree(otu_defs)
-
-    global_max_unique_otus = compute_global_max_unique_otus(cohort_tles,
-        all_geno_samples, otu_defs, taxonomy_empty_tree)
-
-    for cohort in cohort_tles:
-        tree = taxonomy_empty_tree.copy()
-        compute_cohort_metrics(cohort, all_geno_samples, otu_defs, tree, timer=timer)
-        compute_cohort_aggregates(cohort, tree, 
-            num_quantiles=num_quantiles,
-            num_bins=num_bins,
-            unique_otus_bin_max=global_max_unique_otus,
-            timer=timer)
-
-        cohort_tree_etl.upload_nodes(client_registry, cohort, tree, timer=timer)
+    tax_matrix = taxonomy_matrix.TaxonomyMatrix(taxonomy_empty_tree, otu_defs)
+
+    spill_dir = None
+    if spill_to_disk:
+        spill_dir = tempfile.mkdtemp(prefix='cohort_metrics_')
+    try:
+        base_metrics_lst, local_maxes = compute_base_metrics_for_cohorts(
+            cohort_tles, all_geno_samples, tax_matrix,
+            num_workers=num_workers, spill_dir=spill_dir, timer=timer)
+
+        global_max_unique_otus = compute_global_max_unique_otus(local_maxes)
+
+        with node_upload.TreeUploadPool(num_threads=num_upload_threads) \
+            as uploader:
+            for cohort, base_metrics in zip(cohort_tles, base_metrics_lst):
+                if spill_dir is not None:
+                    cohort_metrics = load_cohort_metrics(base_metrics)
+                else:
+                    cohort_metrics = base_metrics
+                tree = taxonomy_empty_tree.copy()
+                compute_cohort_aggregates(cohort, tree, cohort_metrics,
+                    num_quantiles=num_quantiles,
+                    num_bins=num_bins,
+                    unique_otus_bin_max=global_max_unique_otus,
+                    timer=timer)
+
+                uploader.submit(cohort_tree_etl.upload_nodes, client_registry,
+                    cohort, tree, timer)
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
     return 
 
-def compute_global_max_unique_otus(cohort_tles, all_geno_samples, otu_defs, empty_tree):
+def compute_base_metrics_for_cohorts(cohort_tles, all_geno_samples, tax_matrix,
+    num_workers=1, spill_dir=None, timer=CheckpointTimer('cohort_metrics')):
+    """
+    runs compute_cohort_metrics once for every cohort, in num_workers
+    processes if more than 1. 
+
+    returns a list with an entry per cohort, and a list of the effective
+    max unique otus of every cohort (see
+    find_effective_max_unique_otus_of_matrix). if spill_dir is None the
+    entries are the cohort metrics, otherwise each cohort's metrics are
+    saved to a file in spill_dir (see save_cohort_metrics) and the
+    entries are the file paths
+    """
+    _BASE_METRICS_STATE['cohort_tles'] = cohort_tles
+    _BASE_METRICS_STATE['all_geno_samples'] = all_geno_samples
+    _BASE_METRICS_STATE['tax_matrix'] = tax_matrix
+    _BASE_METRICS_STATE['spill_dir'] = spill_dir
+    cohort_idxs = range(len(cohort_tles))
+    try:
+        if num_workers > 1 and len(cohort_tles) > 1:
+            #the workers are forked after the state is set, so only the
+            #cohort idxs and the results are sent between processes
+            timer.checkpoint('begin base metrics of ' + str(len(cohort_tles)) +
+                ' cohorts in ' + str(num_workers) + ' processes')
+            pool = multiprocessing.Pool(min(num_workers, len(cohort_tles)))
+            try:
+                results = pool.map(_compute_base_metrics_of_cohort, cohort_idxs)
+            finally:
+                pool.close()
+                pool.join()
+            timer.checkpoint('end base metrics of ' + str(len(cohort_tles)) +
+                ' cohorts')
+        else:
+            results = [_compute_base_metrics_of_cohort(idx, timer=timer)
+                for idx in cohort_idxs]
+    finally:
+        _BASE_METRICS_STATE.clear()
+    base_metrics_lst = [result[0] for result in results]
+    local_maxes = [result[1] for result in results]
+    return base_metrics_lst, local_maxes
+
+#the inputs of compute_base_metrics_for_cohorts, for the worker processes
+_BASE_METRICS_STATE = dict()
+
+def _compute_base_metrics_of_cohort(cohort_idx,
+    timer=CheckpointTimer('cohort_metrics')):
     """
-    TODO: this is very ineffient to do sum_gross_counts_per_sample and then 
-    throw it out, but needed to free up the memory
+    computes the metrics of the cohort at cohort_idx of the
+    cohort_tles in _BASE_METRICS_STATE. returns a tuple of the metrics (or
+    the file they were saved to) and the cohort's effective max unique otus
+    """
+    cohort_def = _BASE_METRICS_STATE['cohort_tles'][cohort_idx]
+    tax_matrix = _BASE_METRICS_STATE['tax_matrix']
+    spill_dir = _BASE_METRICS_STATE['spill_dir']
+    cohort_metrics = compute_cohort_metrics(cohort_def,
+        _BASE_METRICS_STATE['all_geno_samples'], tax_matrix, timer=timer)
+    local_max_unique_otus = find_effective_max_unique_otus_of_matrix(
+        tax_matrix, cohort_metrics['num_unique_otus_per_sample'])
+    if spill_dir is not None:
+        file_path = os.path.join(spill_dir,
+            'cohort_' + str(cohort_idx) + '.npz')
+        save_cohort_metrics(cohort_metrics, file_path)
+        return (file_path, local_max_unique_otus)
+    return (cohort_metrics, local_max_unique_otus)
+
+def compute_global_max_unique_otus(local_maxes):
+    """
+    takes the effective max unique otus of every cohort and returns the
+    max of all cohorts, rounded up to the nearest 100
     """
     global_max = 0.0
-    for cohort_def in cohort_tles:
-        cohort_name = cohort_def.get_value('display_name_short')
-        log('finding max_unique_otus for ' + cohort_name)
-        taxonomy_tree = empty_tree.copy()
-        geno_sample_lst = subset_samples_by_cohort(all_geno_samples, cohort_def)
-        sum_gross_counts_per_sample(taxonomy_tree, otu_defs, geno_sample_lst)
-        compute_unique_otus_per_sample(taxonomy_tree)
-        local_max_unique_otus = find_effective_max_unique_otus(taxonomy_tree)
+    for local_max_unique_otus in local_maxes:
         if local_max_unique_otus > global_max:
             global_max = local_max_unique_otus
 
@@ -66,36 +167,76 @@ def compute_global_max_unique_otus(cohort_tles, all_geno_samples, otu_defs, empt
     #print('global max unique otus: ' + str(global_max))
     return global_max
 
+def save_cohort_metrics(cohort_metrics, file_path):
+    """
+    writes the samples x nodes sparse matrices returned by
+    compute_cohort_metrics to a single (uncompressed) .npz file
+    """
+    arrays = dict()
+    for metric_name, values in cohort_metrics.items():
+        values = values.tocsc()
+        arrays[metric_name + '__data'] = values.data
+        arrays[metric_name + '__indices'] = values.indices
+        arrays[metric_name + '__indptr'] = values.indptr
+        arrays[metric_name + '__shape'] = numpy.array(values.shape)
+    numpy.savez(file_path, **arrays)
+    return
+
+def load_cohort_metrics(file_path):
+    """
+    reads back the cohort metrics written by save_cohort_metrics
+    """
+    cohort_metrics = dict()
+    npz_file = numpy.load(file_path)
+    try:
+        metric_names = [key[:-len('__shape')] for key in npz_file.files
+            if key.endswith('__shape')]
+        for metric_name in metric_names:
+            cohort_metrics[metric_name] = scipy.sparse.csc_matrix(
+                (npz_file[metric_name + '__data'],
+                    npz_file[metric_name + '__indices'],
+                    npz_file[metric_name + '__indptr']),
+                shape=tuple(npz_file[metric_name + '__shape']))
+    finally:
+        npz_file.close()
+    return cohort_metrics
+
 
-def compute_cohort_metrics(cohort_def, all_geno_samples, otu_defs, taxonomy_tree,
+def compute_cohort_metrics(cohort_def, all_geno_samples, tax_matrix,
     timer=CheckpointTimer('cohort_metrics')):
     """
     takes a cohort def (that includes the geno_sample ids in the cohort),
     and the master list of all geno_samples that were part of the tornado run.
-    Also takes the otu defs and a copy of an AttributeTree that represents just
-    the taxonomy.
+    Also takes the TaxonomyMatrix of the otu defs.
 
-    this computes all of the core metrics that we need at every node, at every sample
+    this computes all of the core metrics that we need at every node, at every sample.
+    returns a dict of metric name (the name of the equivalent per-node
+    SparseArray attribute) to a samples x nodes sparse matrix. the gross
+    counts are only an intermediate and aren't kept
     """
     cohort_name = cohort_def.get_value('display_name_short')
     timer.checkpoint('begin cohort basic metrics: ' + cohort_name)
     geno_sample_lst = subset_samples_by_cohort(all_geno_samples, cohort_def)
-    sum_gross_counts_per_sample(taxonomy_tree, otu_defs, geno_sample_lst)
-    compute_abundance_frac_per_sample(taxonomy_tree)
-    compute_unique_otus_per_sample(taxonomy_tree)
-    compute_normalized_entropy_per_sample(taxonomy_tree)
+    counts = tax_matrix.build_counts_matrix(geno_sample_lst)
+    gross_counts = tax_matrix.sum_gross_counts(counts)
+    cohort_metrics = dict()
+    cohort_metrics['abundance_frac_per_sample'] = \
+        taxonomy_matrix.compute_abundance_fracs(gross_counts)
+    cohort_metrics['num_unique_otus_per_sample'] = \
+        tax_matrix.count_unique_otus(gross_counts)
+    cohort_metrics['normalized_entropy_per_sample'] = \
+        tax_matrix.compute_normalized_entropies(gross_counts)
     timer.checkpoint('end cohort basic metrics: ' + cohort_name)
-    return
+    return cohort_metrics
 
 
-def compute_cohort_aggregates(cohort_def, taxonomy_tree,
+def compute_cohort_aggregates(cohort_def, taxonomy_tree, cohort_metrics,
         num_quantiles=8, num_bins=20, unique_otus_bin_max=20000, 
         timer=CheckpointTimer('cohort_aggregates')):
     """
     takes a cohort def (that includes the geno_sample ids in the cohort),
-    and the master list of all geno_samples that were part of the tornado run.
-    Also takes the otu defs and a copy of an AttributeTree that represents just
-    the taxonomy.
+    a copy of an AttributeTree that represents just the taxonomy, and
+    the per-sample metrics returned by compute_cohort_metrics.
     runs all the analytics for every node on the tree using the cohort's samples
     as input data and associates the outputs to attributes of the taxonomy tree
     nodes
@@ -104,32 +245,35 @@ def compute_cohort_aggregates(cohort_def, taxonomy_tree,
     """
     cohort_name = cohort_def.get_value('display_name_short')
     timer.checkpoint('begin cohort aggregates: ' + cohort_name)
+    nodes = taxonomy_matrix.get_nodes_by_idx(taxonomy_tree)
 
-    compute_quantiles(taxonomy_tree, 'abundance_frac_per_sample', 
+    compute_matrix_quantiles(nodes, cohort_metrics['abundance_frac_per_sample'],
         'abundance_frac_quantiles', num_quantiles)
 
     compute_medians(taxonomy_tree, 'abundance_frac_quantiles',
         'abundance_frac_median')
 
-    compute_means(taxonomy_tree, 'abundance_frac_per_sample',
+    compute_matrix_means(nodes, cohort_metrics['abundance_frac_per_sample'],
         'abundance_frac_mean')
 
-    compute_zero_separated_histograms(taxonomy_tree, 'abundance_frac_per_sample',
+    compute_matrix_zero_separated_histograms(nodes,
+        cohort_metrics['abundance_frac_per_sample'],
         'abundance_frac_histo', 0.0, 1.0, num_bins)
 
-    compute_quantiles(taxonomy_tree, 'num_unique_otus_per_sample', 
+    compute_matrix_quantiles(nodes, cohort_metrics['num_unique_otus_per_sample'],
         'num_unique_otus_quantiles', num_quantiles)
 
     compute_medians(taxonomy_tree, 'num_unique_otus_quantiles',
         'num_unique_otus_median')
 
-    compute_means(taxonomy_tree, 'num_unique_otus_per_sample',
+    compute_matrix_means(nodes, cohort_metrics['num_unique_otus_per_sample'],
         'num_unique_otus_mean')
 
-    compute_means(taxonomy_tree, 'normalized_entropy_per_sample',
+    compute_matrix_means(nodes, cohort_metrics['normalized_entropy_per_sample'],
         'normalized_entropy_mean')
 
-    compute_zero_separated_histograms(taxonomy_tree, 'normalized_entropy_per_sample',
+    compute_matrix_zero_separated_histograms(nodes,
+        cohort_metrics['normalized_entropy_per_sample'],
         'normalized_entropy_histo', 0.0, 1.0, num_bins)
 
     compute_pdf_scatterplots(taxonomy_tree, 
@@ -138,7 +282,8 @@ def compute_cohort_aggregates(cohort_def, taxonomy_tree,
     compute_pdf_scatterplots(taxonomy_tree, 
         'num_unique_otus_quantiles', 'num_unique_otus_density_plot')
 
-    compute_zero_separated_histograms(taxonomy_tree, 'num_unique_otus_per_sample',
+    compute_matrix_zero_separated_histograms(nodes,
+        cohort_metrics['num_unique_otus_per_sample'],
         'num_unique_otus_histo', 0.0, unique_otus_bin_max, num_bins)
 
     timer.checkpoint('end cohort aggregates: ' + cohort_name)
@@ -310,6 +455,49 @@ def _calc_normalized_entropy(list_of_numbers):
         norm_entropy = entropy / float(num_otus)
     return norm_entropy
 
+def compute_matrix_quantiles(nodes, values, quantile_att_name, num_quantiles):
+    """
+    like compute_quantiles, but for the columns of a samples x nodes sparse
+    matrix. nodes is the list of tree nodes by node_idx
+    """
+    quantiles_per_node = taxonomy_matrix.compute_column_quantiles(values,
+        num_quantiles)
+    for node, quantiles in zip(nodes, quantiles_per_node):
+        node.set_attribute(quantile_att_name, quantiles)
+    return
+
+def compute_matrix_means(nodes, values, mean_att_name):
+    """
+    like compute_means, but for the columns of a samples x nodes sparse
+    matrix. nodes is the list of tree nodes by node_idx
+    """
+    means = taxonomy_matrix.compute_column_means(values)
+    for node, mean in zip(nodes, means):
+        node.set_attribute(mean_att_name, round(mean, 4))
+    return
+
+def compute_matrix_zero_separated_histograms(nodes, values, output_att_prefix,
+    bucket_min_val, bucket_max_val, num_bins):
+    """
+    like compute_zero_separated_histograms, but for the columns of a
+    samples x nodes sparse matrix. nodes is the list of tree nodes by node_idx
+    """
+    num_zeros, bin_edges, bin_heights = \
+        taxonomy_matrix.compute_column_zero_separated_histograms(values,
+            bucket_min_val, bucket_max_val, num_bins)
+    for i in range(len(bin_edges)):
+        bin_edges[i] = round(bin_edges[i], 2)
+    bin_starts = list(bin_edges[:-1])
+    bin_ends = list(bin_edges[1:])
+    for node_idx, node in enumerate(nodes):
+        node.set_attribute(output_att_prefix + '_num_zeros',
+            int(num_zeros[node_idx]))
+        node.set_attribute(output_att_prefix + '_bin_start_x', list(bin_starts))
+        node.set_attribute(output_att_prefix + '_bin_end_x', list(bin_ends))
+        node.set_attribute(output_att_prefix + '_bin_height_y',
+            list(bin_heights[node_idx]))
+    return
+
 def compute_quantiles(tree, source_att_name, quantile_att_name, num_quantiles):
     """
     traverses a tree computing the quantiles of the data stored in one attribute
@@ -447,6 +635,17 @@ def find_effective_max_unique_otus(tree):
         raise Exception("Can only find effective max given a tree at phyla or above")
     return eff_max
 
+def find_effective_max_unique_otus_of_matrix(tax_matrix, unique_otus):
+    """
+    like find_effective_max_unique_otus, but for the samples x nodes
+    matrix returned by TaxonomyMatrix.count_unique_otus
+    """
+    phylum_idxs = tax_matrix.get_node_idxs_at_level('phylum')
+    eff_max = 0
+    if len(phylum_idxs) > 0 and unique_otus.shape[0] > 0:
+        eff_max = unique_otus[:, phylum_idxs].max()
+    return eff_max
+
 def compute_zero_separated_histograms(tree, numbers_att, output_att_prefix, 
     bucket_min_val, bucket_max_val, num_bins):
     """
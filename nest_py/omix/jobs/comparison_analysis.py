@@ -4,19 +4,97 @@ routines for computing analytics for a cohort_comparison
 
 import random
 from random import shuffle
+import numpy
 
-def compute_all(comp_def, otu_defs, tree):
+import nest_py.omix.jobs.taxonomy_matrix as taxonomy_matrix
+
+def compute_all(comp_def, otu_defs, tree, node_rankings=None):
     """
     making a 'top_random_otu_ranking' attribute for the tree
+
+    node_rankings (NodeRankings): made from a taxonomy tree of the same
+        otu_defs. pass the same one for every comparison to only build
+        the otu and node lookups once. if None, one is made for the tree
     """
-    num_otus = len(otu_defs)
-    rankings_by_otu_idx = _derive_rankings_by_otu_idx(comp_def, otu_defs)
-    #rankings is now our order for top otus. the indexes are index_within_tornado_run,
-    #the values are the ranks of that otu
-    _aggregate_tree_rankings(tree, rankings_by_otu_idx)
+    if node_rankings is None:
+        node_rankings = NodeRankings(tree, otu_defs)
+    ranks_by_node_idx = node_rankings.compute_ranks_in_nodes(comp_def)
+    for node in taxonomy_matrix.get_nodes_by_idx(tree):
+        node_idx = node.get_attribute('node_idx')
+        node.set_attribute('ranks_in_node', ranks_by_node_idx[node_idx])
     return
 
+class NodeRankings(object):
+    """
+    computes the sorted ranks of the otus below every node of a taxonomy
+    tree for a comparison, with numpy operations over flat arrays instead
+    of merging the sorted lists of the children at every node.
+
+    the result is the same as _aggregate_tree_rankings, so the best
+    (lowest) rank below a node is the first of its ranks and the top k
+    ranks are its first k
+    """
+
+    def __init__(self, taxonomy_tree, otu_defs):
+        """
+        taxonomy_tree (AttributeTree): as returned by
+            otu_analysis.compute_taxonomy_tree(otu_defs)
+        otu_defs (list of TablelikeEntry): the otus, with nest_ids set
+        """
+        tax_matrix = taxonomy_matrix.TaxonomyMatrix(taxonomy_tree, otu_defs)
+        self.num_nodes = tax_matrix.num_nodes
+        nodes = taxonomy_matrix.get_nodes_by_idx(taxonomy_tree)
+
+        #(otu_index of the leaf, ancestor node_idx) of every leaf and every
+        #node on its path up to the root, ordered by ancestor
+        leaf_otu_idxs = numpy.zeros(self.num_nodes, dtype=numpy.int64)
+        for node in nodes:
+            if node.get_attribute('node_level') == 'otu_name':
+                leaf_otu_idxs[node.get_attribute('node_idx')] = \
+                    node.get_attribute('otu_index')
+        pairs = tax_matrix.leaf_ancestors.tocsc()
+        self.pair_otu_idxs = leaf_otu_idxs[pairs.indices]
+        self.pair_ancestors = numpy.repeat(
+            numpy.arange(self.num_nodes, dtype=numpy.int64),
+            numpy.diff(pairs.indptr))
+        self.node_starts = pairs.indptr
+
+        #keyed by the int value, as NestIds only hash by identity
+        self.otu_idx_by_eid = dict()
+        for otu_def in otu_defs:
+            eid = otu_def.get_nest_id().get_value()
+            self.otu_idx_by_eid[eid] = \
+                otu_def.get_value('index_within_tornado_run')
+        self.num_otus = len(otu_defs)
+        self.num_otu_slots = tax_matrix.num_otu_slots
+        return
+
+    def compute_ranks_in_nodes(self, comp_def):
+        """
+        returns a list, indexed by node_idx, of the sorted ranks (in the
+        comparison's 'top_fst_ranked_otu_ids') of the otus below each node
+        """
+        otu_eids_in_rank_order = comp_def.get_value('top_fst_ranked_otu_ids')
+        otu_ranks = numpy.zeros(self.num_otu_slots, dtype=numpy.int64)
+        otu_idxs = numpy.array([self.otu_idx_by_eid[eid.get_value()] for eid in
+            otu_eids_in_rank_order[:self.num_otus]],
+            dtype=numpy.int64)
+        otu_ranks[otu_idxs] = numpy.arange(len(otu_idxs))
+
+        pair_ranks = otu_ranks[self.pair_otu_idxs]
+        #sort by ancestor, then by rank within each ancestor
+        order = numpy.lexsort((pair_ranks, self.pair_ancestors))
+        sorted_ranks = pair_ranks[order].tolist()
+        ranks_by_node_idx = [sorted_ranks[self.node_starts[node_idx]:
+            self.node_starts[node_idx + 1]]
+            for node_idx in range(self.num_nodes)]
+        return ranks_by_node_idx
+
 def _aggregate_tree_rankings(tree, rankings):
+    """
+    reference implementation of NodeRankings.compute_ranks_in_nodes,
+    given the rankings from _derive_rankings_by_otu_idx
+    """
     ranks_in_node = list()
     if tree.get_attribute('node_level') == 'otu_name':
         otu_idx = tree.get_attribute('otu_index')
@@ -4,43 +4,39 @@ the api from the outputs of comparison_analysis. Also does
 the uploading to the api.
 """
 from nest_py.core.jobs.jobs_logger import log
-import nest_py.core.data_types.tablelike_entry as tablelike_entry
 import nest_py.omix.data_types.comparison_phylo_tree_nodes as comparison_phylo_tree_nodes
+import nest_py.omix.jobs.node_upload as node_upload
 
 def upload_nodes(client_registry, comparison_def, comparison_tree):
     """
+    uploads a node for every node of the comparison_tree, which
+    comparison_analysis.compute_all has populated. this is safe to run
+    in a node_upload.TreeUploadPool thread
     """
     nodes_client = client_registry[comparison_phylo_tree_nodes.COLLECTION_NAME]
 
     comparison_id = comparison_def.get_nest_id()
 
-    node_tles = _extract_comparison_node_tles(comparison_tree, comparison_id)
-    node_tles = nodes_client.bulk_create_entries_async(node_tles, batch_size=6000)
-    assert(not node_tles is None)
+    columns = ['comparison_id', 'node_level', 'node_name', 'node_idx',
+        'parent_node_idx', 'top_fst_otu_rankings_in_node']
+    node_rows = generate_comparison_node_rows(comparison_tree, comparison_id)
+    num_uploaded = node_upload.upload_node_rows(nodes_client,
+        comparison_phylo_tree_nodes.generate_schema(), columns, node_rows,
+        batch_size=6000)
+    assert(not num_uploaded is None)
     return
 
-def _extract_comparison_node_tles(comparison_tree, comparison_id):
-    nodes_schema = comparison_phylo_tree_nodes.generate_schema()
-
-    node_level = comparison_tree.get_attribute('node_level')
-    node_name = comparison_tree.get_attribute('node_name')
-    node_idx = comparison_tree.get_attribute('node_idx')
-    parent_node_idx = comparison_tree.get_attribute('parent_node_idx')
-    ranks_in_node = comparison_tree.get_attribute('ranks_in_node')
-    
-    tle = tablelike_entry.TablelikeEntry(nodes_schema)
-    tle.set_value('comparison_id', comparison_id)
-    tle.set_value('node_level', node_level)
-    tle.set_value('node_name', node_name)
-    tle.set_value('node_idx', node_idx)
-    tle.set_value('parent_node_idx', parent_node_idx)
-    tle.set_value('top_fst_otu_rankings_in_node', ranks_in_node)
-
-    tle_lst = list()
-    tle_lst.append(tle)
-    for child_tree in comparison_tree.get_children():
-        child_tles = _extract_comparison_node_tles(child_tree, comparison_id)
-        tle_lst += child_tles
-    return tle_lst
-
-
+def generate_comparison_node_rows(comparison_tree, comparison_id):
+    """
+    yields a row of comparison_phylo_tree_node values (in the order of
+    the columns in upload_nodes) for every node of the input tree, in
+    DFS order
+    """
+    for node in node_upload.iter_dfs(comparison_tree):
+        yield [comparison_id,
+            node.get_attribute('node_level'),
+            node.get_attribute('node_name'),
+            node.get_attribute('node_idx'),
+            node.get_attribute('parent_node_idx'),
+            node.get_attribute('ranks_in_node')]
+    return
@@ -9,6 +9,7 @@ import nest_py.omix.jobs.fst_etl as fst_etl
 import nest_py.omix.jobs.cohort_etl as cohort_etl
 import nest_py.omix.jobs.comparison_etl as comparison_etl
 import nest_py.omix.jobs.comparison_tree_etl as comparison_tree_etl
+import nest_py.omix.jobs.node_upload as node_upload
 
 import nest_py.omix.jobs.otu_analysis as otu_analysis
 import nest_py.omix.jobs.cohort_analysis as cohort_analysis
@@ -34,6 +35,17 @@ NUM_QUANTILES = 4 #only use even numbers or the 'median' values will be wrong
 #used by all histograms
 NUM_BINS = 20
 
+#number of processes that compute the per-sample metrics of the cohorts
+COHORT_NUM_WORKERS = 4
+
+#if true, the per-sample metrics of the cohorts are kept in a temp dir
+#between computing them and computing the aggregates, instead of in memory
+SPILL_COHORT_METRICS = True
+
+#number of cohort or comparison trees that are uploaded at once. each
+#upload uses its own db connection
+NUM_UPLOAD_THREADS = 3
+
 #if true, populates the cohort_phylo_tree_nodes and comparison_phylo_tree_nodes
 #with analytics output for all defined chorts and comparisons. if false,
 #stops after the definitions are uploaded, which included FST analysis
@@ -166,22 +178,31 @@ def run(http_client, db_engine, data_dir, subsample, data_flavor_key):
         cohort_analysis.compute_all_for_cohorts(clients, \
             all_cohort_tles.values(), \
             geno_samples, otu_defs, num_quantiles=NUM_QUANTILES, \
-            num_bins=NUM_BINS, timer=timer)
+            num_bins=NUM_BINS, num_workers=COHORT_NUM_WORKERS, \
+            spill_to_disk=SPILL_COHORT_METRICS, \
+            num_upload_threads=NUM_UPLOAD_THREADS, timer=timer)
 
         ###############
         ###Comparison Node Analytics
         ###############
         taxonomy_empty_tree = otu_analysis.compute_taxonomy_tree(otu_defs)
-        for comp in all_comparisons:
-            tree = taxonomy_empty_tree.copy()
-            log('begin analytics for comparison: ' + comp.get_value('display_name'))
-            timer.checkpoint('computing comparison analytics:begin')
-            comparison_analysis.compute_all(comp, otu_defs, tree)
-            timer.checkpoint('computing comparison analytics:end')
-
-            timer.checkpoint('uploading comparison analytics nodes:begin')
-            comparison_tree_etl.upload_nodes(clients, comp, tree)
-            timer.checkpoint('uploading comparison analytics nodes:end')
+        node_rankings = comparison_analysis.NodeRankings(taxonomy_empty_tree,
+            otu_defs)
+        with node_upload.TreeUploadPool(num_threads=NUM_UPLOAD_THREADS) \
+            as uploader:
+            for comp in all_comparisons:
+                tree = taxonomy_empty_tree.copy()
+                log('begin analytics for comparison: ' +
+                    comp.get_value('display_name'))
+                timer.checkpoint('computing comparison analytics:begin')
+                comparison_analysis.compute_all(comp, otu_defs, tree,
+                    node_rankings=node_rankings)
+                timer.checkpoint('computing comparison analytics:end')
+
+                #uploads in the background while the next comparison is computed
+                uploader.submit(comparison_tree_etl.upload_nodes, clients, comp,
+                    tree)
+        timer.checkpoint('uploading comparison analytics nodes:end')
 
     timer.checkpoint("mmbdb_seed_job: Done")
     return exit_code
@@ -0,0 +1,108 @@
+"""
+routines shared by cohort_tree_etl and comparison_tree_etl for streaming
+the nodes of an analytics tree to its endpoint.
+
+the nodes are produced one at a time, in DFS order, as flat rows of
+values, and written with the db client's COPY loader (bulk_copy_rows), so
+a TablelikeEntry is never built per node. api clients can't COPY, so for
+them the rows are turned into TablelikeEntries and posted in batches.
+
+TreeUploadPool runs the uploads of several trees at once in background
+threads, so one tree can be uploading while the next is being computed.
+"""
+from multiprocessing.pool import ThreadPool
+
+import nest_py.core.data_types.tablelike_entry as tablelike_entry
+
+def iter_dfs(tree):
+    """
+    yields every node of an AttributeTree, parents before their
+    children, in the same order as a recursive preorder walk
+    """
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.get_children()))
+    return
+
+def upload_node_rows(nodes_client, nodes_schema, columns, rows,
+    batch_size=3000):
+    """
+    nodes_client: db or api client of the nodes endpoint
+    nodes_schema (TablelikeSchema): the schema of the nodes endpoint
+    columns (list of str): the schema attribute of each value in a row
+    rows (iterable of sequences): the node rows, e.g. a generator
+
+    returns the number of nodes uploaded, or None if the upload failed
+    """
+    if hasattr(nodes_client, 'bulk_copy_rows'):
+        num_uploaded = nodes_client.bulk_copy_rows(rows, columns=columns)
+    else:
+        node_tles = list()
+        for row in rows:
+            tle = tablelike_entry.TablelikeEntry(nodes_schema)
+            for column, value in zip(columns, row):
+                tle.set_value(column, value)
+            node_tles.append(tle)
+        num_uploaded = nodes_client.bulk_create_entries_async(node_tles,
+            batch_size=batch_size)
+    return num_uploaded
+
+class TreeUploadPool(object):
+    """
+    runs tree uploads in a few threads. each upload checks out its own
+    connection from the db engine's pool, so num_threads should stay below
+    the engine's pool size (5 by default).
+
+    at most num_threads uploads are queued or running at once; submit()
+    blocks until the oldest one finishes otherwise, so that only a few
+    trees are held in memory waiting to be uploaded.
+
+    use it as a context manager, so the threads are shut down even when
+    submit() or the caller's loop raises:
+
+        with TreeUploadPool() as uploader:
+            for tree in trees:
+                uploader.submit(upload_fn, tree)
+    """
+
+    def __init__(self, num_threads=3):
+        self.num_threads = num_threads
+        self.thread_pool = ThreadPool(num_threads)
+        self.pending = list()
+        return
+
+    def submit(self, upload_fn, *args):
+        """
+        calls upload_fn(*args) in one of the threads
+        """
+        while len(self.pending) >= self.num_threads:
+            self.pending.pop(0).get()
+        self.pending.append(self.thread_pool.apply_async(upload_fn, args))
+        return
+
+    def join(self):
+        """
+        waits for all the submitted uploads to finish and shuts down the
+        threads. re-raises the exception of the first upload that failed
+        """
+        try:
+            while len(self.pending) > 0:
+                self.pending.pop(0).get()
+        finally:
+            self.thread_pool.close()
+            self.thread_pool.join()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        try:
+            self.join()
+        except Exception:
+            #don't let a failed upload hide the exception already raised
+            if exc_type is None:
+                raise
+        return False
@@ -46,6 +46,13 @@ class SparseArray(object):
             vals.append(self.data[idx])
         return vals
 
+    def extract_specified_items(self):
+        """
+        Returns (index, value) pairs for all values that do not have
+        the 'NOT_SET_VALUE'. The order is unspecified.
+        """
+        return list(self.data.items())
+
     def to_npary(self):
         """
         convert the data in this array to a numpy array. only works
@@ -69,3 +76,76 @@ class SparseArray(object):
     def to_jdata(self):
         return self.data
 
+
+class SparseMatrixRow(object):
+    """
+    read-only view of one row of a scipy csr matrix, with the same
+    getters as SparseArray. lets many samples share a single matrix
+    instead of each holding a dict of its values. 
+    """
+
+    def __init__(self, csr_matrix, row_idx, not_set_value=0.0):
+        """
+        csr_matrix is not copied, and its explicitly stored values are
+        taken to be the specified values of the row
+        """
+        self.matrix = csr_matrix
+        self.row_idx = row_idx
+        self.size = csr_matrix.shape[1]
+        self.not_set_value = not_set_value
+        self.start = csr_matrix.indptr[row_idx]
+        self.end = csr_matrix.indptr[row_idx + 1]
+        return
+
+    def __len__(self):
+        return self.size
+
+    def set_value(self, index, value):
+        raise Exception('sparse matrix row is read only')
+
+    def get_value(self, index):
+        if (index >= self.size) or (index < 0):
+            raise Exception('sparse array out of bounds')
+        indices = self.matrix.indices[self.start:self.end]
+        pos = numpy.searchsorted(indices, index)
+        ret_value = self.not_set_value
+        if pos < len(indices) and indices[pos] == index:
+            ret_value = self.matrix.data[self.start + pos]
+        return ret_value
+
+    def extract_specified_values(self):
+        """
+        Returns all values that do not have the 'NOT_SET_VALUE',
+        in index order.
+        """
+        return self.matrix.data[self.start:self.end].tolist()
+
+    def extract_specified_items(self):
+        """
+        Returns (index, value) pairs for all values that do not have
+        the 'NOT_SET_VALUE', in index order.
+        """
+        return zip(self.matrix.indices[self.start:self.end].tolist(),
+            self.matrix.data[self.start:self.end].tolist())
+
+    def to_npary(self):
+        """
+        convert the data in this row to a (dense) numpy array
+        """
+        npary = numpy.empty(self.size)
+        npary.fill(self.not_set_value)
+        npary[self.matrix.indices[self.start:self.end]] = \
+            self.matrix.data[self.start:self.end]
+        return npary
+
+    def get_max(self):
+        mx = self.not_set_value
+        if self.end > self.start:
+            mx = max(mx, self.matrix.data[self.start:self.end].max())
+        return mx
+
+    def __str__(self):
+        return str(self.to_jdata())
+
+    def to_jdata(self):
+        return dict(self.extract_specified_items())
@@ -0,0 +1,398 @@
+"""
+a columnar representation of a taxonomy AttributeTree, for computing
+per-node, per-sample metrics of a cohort in a few bulk matrix operations
+instead of walking the tree once per (sample, otu) pair.
+
+nodes are indexed by the 'node_idx' attribute that
+otu_analysis.compute_taxonomy_tree assigns. per-sample metrics are
+scipy.sparse matrices with one row per sample and one column per node,
+and the aggregates over samples (quantiles, means, histograms) are
+computed for every column at once, giving the same values as the
+per-node functions in cohort_analysis.
+"""
+import numpy
+import scipy.sparse
+
+from nest_py.omix.jobs.sparse_array import SparseMatrixRow
+import nest_py.omix.data_types.otus as otus
+
+class TaxonomyMatrix(object):
+    """
+    the structure of a taxonomy tree as arrays, plus the sparse
+    0/1 matrices that map otus and leaves to all of their ancestors
+    """
+
+    def __init__(self, taxonomy_tree, otu_defs):
+        """
+        taxonomy_tree (AttributeTree): as returned by
+            otu_analysis.compute_taxonomy_tree(otu_defs)
+        otu_defs (list of TablelikeEntry): the otus, whose
+            'index_within_tornado_run' index the otu counts of the samples
+        """
+        nodes = get_nodes_by_idx(taxonomy_tree)
+        self.num_nodes = len(nodes)
+        self.node_levels = [node.get_attribute('node_level') for node in nodes]
+        self.parent_node_idxs = numpy.array(
+            [node.get_attribute('parent_node_idx') for node in nodes],
+            dtype=numpy.int64)
+        self.leaf_mask = numpy.array([node.is_leaf() for node in nodes],
+            dtype=bool)
+
+        #(leaf, ancestor) pairs for every leaf and every node on its path
+        #up to the root, including the leaf itself
+        leaf_rows = list()
+        ancestor_cols = list()
+        for leaf_idx in numpy.nonzero(self.leaf_mask)[0]:
+            node_idx = leaf_idx
+            while node_idx >= 0:
+                leaf_rows.append(leaf_idx)
+                ancestor_cols.append(node_idx)
+                node_idx = self.parent_node_idxs[node_idx]
+        self.leaf_ancestors = scipy.sparse.csr_matrix(
+            (numpy.ones(len(leaf_rows)), (leaf_rows, ancestor_cols)),
+            shape=(self.num_nodes, self.num_nodes))
+
+        #which leaf each otu's counts go to. otus are matched to the tree by
+        #name at every taxonomy level, so otus that share a name share a leaf
+        self.num_otu_slots = 0
+        if otu_defs:
+            self.num_otu_slots = 1 + max(otu_def.get_value(
+                'index_within_tornado_run') for otu_def in otu_defs)
+        children_by_name = [_children_by_name(node) for node in nodes]
+        taxa_levels = _taxa_levels()
+        otu_slots = list()
+        otu_leaf_idxs = list()
+        for otu_def in otu_defs:
+            node_idx = 0
+            for taxa_level in taxa_levels:
+                taxa_node_name = otu_def.get_value(taxa_level)
+                node_idx = children_by_name[node_idx][taxa_node_name]
+            otu_slots.append(otu_def.get_value('index_within_tornado_run'))
+            otu_leaf_idxs.append(node_idx)
+        otu_leaves = scipy.sparse.csr_matrix(
+            (numpy.ones(len(otu_slots)), (otu_slots, otu_leaf_idxs)),
+            shape=(self.num_otu_slots, self.num_nodes))
+        self.otu_ancestors = (otu_leaves * self.leaf_ancestors).tocsr()
+        return
+
+    def get_node_idxs_at_level(self, node_level):
+        """
+        returns the node_idxs of all nodes at a taxonomy level
+        (e.g. 'phylum'), as a numpy array
+        """
+        return numpy.array([idx for idx in range(self.num_nodes) if
+            self.node_levels[idx] == node_level], dtype=numpy.int64)
+
+    def build_counts_matrix(self, geno_sample_defs):
+        """
+        returns the otu counts of the samples as a csr matrix with one
+        row per sample and one column per otu index. only the otus that
+        are in the tree are included
+        """
+        shared_counts = _get_shared_count_matrix(geno_sample_defs)
+        if shared_counts is not None:
+            #the samples are views of one matrix (see
+            #biom_etl._extract_otu_count_matrix), so slice it directly
+            row_idxs = [geno_sample_def.get_value('otu_counts').row_idx
+                for geno_sample_def in geno_sample_defs]
+            counts = shared_counts[row_idxs, :self.num_otu_slots]
+            counts.eliminate_zeros()
+            return counts.astype(numpy.float64)
+        rows = list()
+        cols = list()
+        vals = list()
+        for sample_idx, geno_sample_def in enumerate(geno_sample_defs):
+            counts_ary = geno_sample_def.get_value('otu_counts')
+            for otu_idx, otu_count in counts_ary.extract_specified_items():
+                if otu_idx < self.num_otu_slots and otu_count != 0.0:
+                    rows.append(sample_idx)
+                    cols.append(otu_idx)
+                    vals.append(otu_count)
+        counts = scipy.sparse.csr_matrix(
+            (numpy.array(vals, dtype=numpy.float64), (rows, cols)),
+            shape=(len(geno_sample_defs), self.num_otu_slots))
+        return counts
+
+    def sum_gross_counts(self, counts):
+        """
+        counts (scipy.sparse matrix): samples x otu indexes, as returned by
+            build_counts_matrix
+
+        returns the gross count of every node in every sample (the sum of
+        the counts of all otus below the node) as a samples x nodes
+        csc matrix
+        """
+        gross_counts = (counts * self.otu_ancestors).tocsc()
+        return _canonical(gross_counts)
+
+    def count_unique_otus(self, gross_counts):
+        """
+        returns the number of leaves (unique otus) below every node that
+        have a nonzero count in every sample, as a samples x nodes csc matrix
+        """
+        leaf_presence = gross_counts.tocsr().copy()
+        leaf_presence.data = (leaf_presence.data > 0.0).astype(numpy.float64)
+        leaf_presence = leaf_presence * scipy.sparse.diags(
+            self.leaf_mask.astype(numpy.float64), 0)
+        unique_otus = (leaf_presence * self.leaf_ancestors).tocsc()
+        return _canonical(unique_otus)
+
+    def compute_normalized_entropies(self, gross_counts):
+        """
+        returns the normalized entropy of every node in every sample, as a
+        samples x nodes csc matrix. like
+        cohort_analysis.compute_normalized_entropy_per_sample, this is the
+        base 2 shannon entropy of the (truncated to int) counts of the
+        nonzero leaves below the node, divided by the number of those
+        leaves, or 0.0 if there are fewer than two.
+
+        instead of collecting the leaf counts of every node, this sums
+        n (the number of nonzero leaves), s = sum(c) and p = sum(c * ln(c))
+        up the tree in one pass, and uses
+            entropy = (ln(s) - p / s) / ln(2)
+        """
+        leaf_counts = gross_counts.tocsr().copy()
+        leaf_counts.eliminate_zeros()
+        leaf_counts = (leaf_counts * scipy.sparse.diags(
+            self.leaf_mask.astype(numpy.float64), 0)).tocoo()
+        positive = leaf_counts.data > 0.0
+        truncated = numpy.floor(leaf_counts.data)
+        c_ln_c = numpy.zeros(len(truncated))
+        nonzero = truncated > 0.0
+        c_ln_c[nonzero] = truncated[nonzero] * numpy.log(truncated[nonzero])
+
+        num_leaves, count_sums, c_ln_c_sums = self._sum_leaves_to_ancestors(
+            leaf_counts, [positive.astype(numpy.float64), truncated, c_ln_c])
+
+        entropies = num_leaves.copy()
+        valid = (num_leaves.data >= 2) & (count_sums.data > 0.0)
+        entropy = numpy.zeros(len(valid))
+        sums = count_sums.data[valid]
+        entropy[valid] = (numpy.log(sums) - c_ln_c_sums.data[valid] / sums) / \
+            numpy.log(2)
+        #no negative round-off for perfectly uneven counts
+        entropy = numpy.maximum(entropy, 0.0)
+        entropies.data = numpy.where(valid, entropy / num_leaves.data, 0.0)
+        return _canonical(entropies)
+
+    def _sum_leaves_to_ancestors(self, leaf_entries, value_arrays):
+        """
+        leaf_entries (scipy.sparse.coo_matrix): samples x nodes, with
+            entries only in leaf columns
+        value_arrays (list of numpy arrays): values for each entry of
+            leaf_entries
+
+        for each array of values, returns the samples x nodes csc matrix of
+        the sum over the leaves below every node. all of the returned
+        matrices have the same entries (including explicit zeros), so their
+        data arrays line up
+        """
+        ancestors = self.leaf_ancestors
+        num_ancestors = numpy.diff(ancestors.indptr)[leaf_entries.col]
+        total = int(num_ancestors.sum())
+        #position of every (entry, ancestor) pair in ancestors.indices
+        run_starts = numpy.repeat(ancestors.indptr[leaf_entries.col] - \
+            (numpy.cumsum(num_ancestors) - num_ancestors), num_ancestors)
+        ancestor_positions = run_starts + numpy.arange(total)
+        rows = numpy.repeat(leaf_entries.row, num_ancestors)
+        cols = ancestors.indices[ancestor_positions]
+        sums = list()
+        for values in value_arrays:
+            summed = scipy.sparse.coo_matrix(
+                (numpy.repeat(values, num_ancestors), (rows, cols)),
+                shape=leaf_entries.shape).tocsc()
+            summed.sort_indices()
+            sums.append(summed)
+        return sums
+
+def _get_shared_count_matrix(geno_sample_defs):
+    """
+    returns the csr matrix that the 'otu_counts' of all the samples are
+    SparseMatrixRow views of, or None if they aren't all views of the same
+    matrix
+    """
+    shared_counts = None
+    for geno_sample_def in geno_sample_defs:
+        counts_ary = geno_sample_def.get_value('otu_counts')
+        if not isinstance(counts_ary, SparseMatrixRow):
+            return None
+        if shared_counts is None:
+            shared_counts = counts_ary.matrix
+        elif counts_ary.matrix is not shared_counts:
+            return None
+    return shared_counts
+
+def compute_abundance_fracs(gross_counts):
+    """
+    returns the gross counts of every node divided by the gross count of
+    the root (node_idx 0) in the same sample, as a samples x nodes csc matrix
+    """
+    abundance_fracs = gross_counts.tocsc(copy=True)
+    root_counts = gross_counts[:, 0].toarray().ravel()
+    abundance_fracs.data = abundance_fracs.data / \
+        root_counts[abundance_fracs.indices]
+    return _canonical(abundance_fracs)
+
+def compute_column_quantiles(values, num_quantiles):
+    """
+    values (scipy.sparse matrix): samples x nodes. values that aren't
+        stored are zeros, and no value may be negative
+
+    returns, for every column, the same list of quantile levels as
+    cohort_analysis._quantiles_of_sparse_ary returns for the column
+    """
+    num_samples, num_cols = values.shape
+    if num_samples == 0:
+        return [[0] * (num_quantiles + 1) for _ in range(num_cols)]
+    col_ids, sorted_nonzeros, col_starts = _sorted_nonzeros_by_column(values)
+    num_nonzeros = numpy.diff(col_starts)
+    num_zeros = num_samples - num_nonzeros
+
+    def value_at_rank(ranks):
+        """the value at a rank (array of one rank per column) within
+        each column's sorted values, where the zeros sort first"""
+        nonzero_ranks = ranks - num_zeros
+        is_zero = nonzero_ranks < 0
+        positions = col_starts[:-1] + numpy.where(is_zero, 0, nonzero_ranks)
+        #positions of zeros may be past the end; they get masked anyway
+        positions = numpy.minimum(positions, max(len(sorted_nonzeros) - 1, 0))
+        found = sorted_nonzeros[positions] if len(sorted_nonzeros) > 0 else \
+            numpy.zeros(num_cols)
+        return numpy.where(is_zero, 0.0, found)
+
+    #same arithmetic as numpy.percentile's default linear interpolation, so
+    #that the results match exactly
+    perc_boundaries = list()
+    for i in range(1, num_quantiles):
+        f = (float(i) * 100.0) / float(num_quantiles)
+        perc_boundaries.append(f)
+    qs = numpy.true_divide(numpy.array(perc_boundaries), 100.0)
+    positions = qs * (num_samples - 1)
+    below = numpy.floor(positions).astype(numpy.int64)
+    above = numpy.minimum(below + 1, num_samples - 1)
+    weights_above = positions - below
+    weights_below = 1.0 - weights_above
+
+    levels = [value_at_rank(numpy.zeros(num_cols, dtype=numpy.int64))]
+    for q_idx in range(len(qs)):
+        x1 = value_at_rank(numpy.repeat(below[q_idx], num_cols)) * \
+            weights_below[q_idx]
+        x2 = value_at_rank(numpy.repeat(above[q_idx], num_cols)) * \
+            weights_above[q_idx]
+        levels.append(x1 + x2)
+    levels.append(value_at_rank(numpy.repeat(num_samples - 1, num_cols)))
+
+    quantiles_per_col = list()
+    for col in range(num_cols):
+        quantiles = [round(levels[0][col], 3)]
+        for q_idx in range(1, len(levels) - 1):
+            quantiles.append(round(levels[q_idx][col], 3))
+        quantiles.append(round(levels[-1][col], 10))
+        quantiles_per_col.append(quantiles)
+    return quantiles_per_col
+
+def compute_column_means(values):
+    """
+    returns the mean of every column of a samples x nodes sparse matrix,
+    where values that aren't stored are zeros, as a numpy array
+    """
+    values = _canonical(values.tocsc())
+    num_samples = values.shape[0]
+    col_ids = numpy.repeat(numpy.arange(values.shape[1]),
+        numpy.diff(values.indptr))
+    #bincount adds in order, i.e. in sample order within a column
+    sums = numpy.bincount(col_ids, weights=values.data,
+        minlength=values.shape[1])
+    return sums / float(num_samples)
+
+def compute_column_zero_separated_histograms(values, bucket_min_val,
+    bucket_max_val, num_bins):
+    """
+    for every column of a samples x nodes sparse matrix, counts the zeros
+    (values that aren't stored), and bins the nonzero values the same way
+    numpy.histogram does with range=(bucket_min_val, bucket_max_val)
+
+    returns:
+        num_zeros (numpy array): per column
+        bin_edges (numpy array): the num_bins + 1 edges shared by all columns
+        bin_heights (numpy array): columns x num_bins
+    """
+    values = _canonical(values.tocsc())
+    num_samples, num_cols = values.shape
+    nnz_per_col = numpy.diff(values.indptr)
+    num_zeros = num_samples - nnz_per_col
+    col_ids = numpy.repeat(numpy.arange(num_cols), nnz_per_col)
+
+    first_edge = float(bucket_min_val)
+    last_edge = float(bucket_max_val)
+    if first_edge == last_edge:
+        first_edge = first_edge - 0.5
+        last_edge = last_edge + 0.5
+    bin_edges = numpy.linspace(first_edge, last_edge, num_bins + 1,
+        endpoint=True)
+
+    data = values.data.astype(numpy.float64)
+    keep = (data >= first_edge) & (data <= last_edge)
+    data = data[keep]
+    col_ids = col_ids[keep]
+    #each bin includes its left edge; the last bin also includes its right
+    bin_idxs = numpy.searchsorted(bin_edges, data, side='right') - 1
+    bin_idxs[bin_idxs == num_bins] = num_bins - 1
+    bin_heights = numpy.bincount(col_ids * num_bins + bin_idxs,
+        minlength=num_cols * num_bins).reshape((num_cols, num_bins))
+    return num_zeros, bin_edges, bin_heights
+
+def get_nodes_by_idx(taxonomy_tree):
+    """
+    returns a list of the nodes of a tree, where each node is at the
+    position of its 'node_idx' attribute
+    """
+    nodes = list()
+    _rec_collect_nodes(taxonomy_tree, nodes)
+    nodes_by_idx = [None] * len(nodes)
+    for node in nodes:
+        nodes_by_idx[node.get_attribute('node_idx')] = node
+    return nodes_by_idx
+
+def _rec_collect_nodes(tree, nodes):
+    nodes.append(tree)
+    for child_tree in tree.get_children():
+        _rec_collect_nodes(child_tree, nodes)
+    return
+
+def _children_by_name(node):
+    """
+    dict of node_name -> node_idx of the immediate children. like
+    AttributeTree.find_child, the first child wins if names repeat
+    """
+    lookup = dict()
+    for child_tree in node.get_children():
+        name = child_tree.get_attribute('node_name')
+        if name not in lookup:
+            lookup[name] = child_tree.get_attribute('node_idx')
+    return lookup
+
+def _taxa_levels():
+    taxa_levels = list(otus.TAXONOMY_LEVELS)
+    taxa_levels.append('otu_name')
+    return taxa_levels
+
+def _sorted_nonzeros_by_column(values):
+    """
+    returns the column of every stored value, the stored values sorted
+    within each column, and the start offset of each column (plus the end)
+    """
+    values = _canonical(values.tocsc())
+    col_ids = numpy.repeat(numpy.arange(values.shape[1]),
+        numpy.diff(values.indptr))
+    order = numpy.lexsort((values.data, col_ids))
+    return col_ids[order], values.data[order], values.indptr.astype(numpy.int64)
+
+def _canonical(mat):
+    """
+    drops explicit zeros and sorts the indices, so that stored values are
+    exactly the nonzeros and appear in row (sample) order within a column
+    """
+    mat.eliminate_zeros()
+    mat.sort_indices()
+    return mat
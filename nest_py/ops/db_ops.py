@@ -33,6 +33,9 @@ ACTION_ARG_DESCRIPTION = """
 check_connection: verify the db is running and accessible
 list_tables: list tables that exist in the Postgres DB
 ensure_tables: 
+migrate_tables: convert the data in existing tables whose column types have
+    changed, e.g. ssviz_feature_data.values from json text to bytea. safe
+    to run repeatedly
 drop_tables: 
 list_bindings: list tables Nest expects to be in the Postgres DB
 psql: open a psql command prompt that accesses the current Postgres DB
@@ -44,7 +47,7 @@ psql: open a psql command prompt that accesses the current Postgres DB
 SITE_DESCRIPTION="""The machine running the database to operate against.
 Default: localhost."""
 
-VALID_ACTIONS = ['check_connection', 'list_tables', 'ensure_tables', 'drop_tables', 'list_bindings', 'psql']
+VALID_ACTIONS = ['check_connection', 'list_tables', 'ensure_tables', 'migrate_tables', 'drop_tables', 'list_bindings', 'psql']
 
 def register_subcommand(nest_ops_subparsers):
     """
@@ -112,6 +115,8 @@ def _run_db_action(action, project_env, target_site):
         succeeded = db_ops_utils.list_metadata_tables()
     elif 'ensure_tables' == action:
         succeeded = db_ops_utils.ensure_tables_in_db()
+    elif 'migrate_tables' == action:
+        succeeded = db_ops_utils.migrate_tables_in_db()
     elif 'list_tables' == action:
         succeeded = db_ops_utils.list_tables_in_db()
     elif 'drop_tables' == action:
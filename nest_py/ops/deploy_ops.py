@@ -164,6 +164,9 @@ def _run_deploy_commands(project_env, git_tag_or_branch, command_runner):
         _run_step(cr,'./nest_ops db ensure_tables --project=' +
             project_name)
 
+        _run_step(cr,'./nest_ops db migrate_tables --project=' +
+            project_name)
+
         _run_step(cr,'./nest_ops seed_users --project=' +
             project_name)
 
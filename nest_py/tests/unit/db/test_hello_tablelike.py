@@ -168,8 +168,98 @@ def test_sqla_tablelike_lifecycle():
     assert(t1 in json_tles)
     assert(t3 in json_tles)
     assert(len(json_tles) == 2)
-    
+
+    print("testing paged_filter_query")
+    page_res = db_client.paged_filter_query({}, results_per_page=2, page_num=2)
+    assert(page_res['total_available'] == 3)
+    assert(page_res['last_page'] == 2)
+    assert(page_res['num_items'] == 1)
+    page_tle = page_res['items'][0]
+    page_tle.set_nest_id(None)
+    assert(page_tle == t3)
+
+    page_res = db_client.paged_filter_query({'string_val':'z'},
+        results_per_page=1, page_num=1, fields=['flt_val_0'])
+    assert(page_res['total_available'] == 2)
+    assert(page_res['num_items'] == 1)
+    assert(page_res['items'][0]['flt_val_0'] == 7.0)
+
+    page_res = db_client.paged_filter_query({}, results_per_page=2, page_num=5)
+    assert(page_res['total_available'] == 3)
+    assert(page_res['num_items'] == 0)
+
     db_client.get_sqla_connection().close()
     return
 
 
+
+def test_shared_transaction():
+    """
+    writes made inside a SharedTransaction are committed together, or
+    rolled back together if the block fails
+    """
+    setup_db()
+    sqla_md = nest_db.get_global_sqlalchemy_metadata()
+    db_engine = nest_db.get_global_sqlalchemy_engine()
+    db_registry = hw_db.get_sqla_makers()
+    db_client = db_registry['hello_tablelike'].get_db_client(db_engine, sqla_md)
+    db_client.set_requesting_user(core_db.get_system_user())
+    db_client.delete_all_entries()
+
+    t1 = HelloTablelikeDTO(1.0, 1.1, 'x', ['a','a'], [0.0, 0.0], NestId(1), [NestId(2)], {'x':'innerx'}, {'xb':'innerxb'}, 5, [6, 7]).to_tablelike_entry()
+    t2 = HelloTablelikeDTO(2.0, 2.2, 'y', ['a','b'], [0.0, 0.0], NestId(1), [NestId(2)], {'x':'innerx'}, {'xb':'innerxb'}, 5, [6, 7]).to_tablelike_entry()
+
+    print('testing commit of a shared transaction')
+    with db_client.shared_transaction():
+        created = db_client.create_entry(t1)
+        created.set_value('flt_val_0', 11.0)
+        updated = db_client.update_entry(created)
+        assert(updated.get_value('flt_val_0') == 11.0)
+    assert(len(db_client.simple_filter_query({})) == 1)
+
+    print('testing rollback of a shared transaction')
+    try:
+        with db_client.shared_transaction():
+            db_client.create_entry(t2)
+            raise ValueError('abort the transaction')
+    except ValueError:
+        pass
+    assert(len(db_client.simple_filter_query({})) == 1)
+
+    print('testing rollback of a shared transaction without an exception')
+    with db_client.shared_transaction() as transaction:
+        db_client.create_entry(t2)
+        transaction.set_rollback_only()
+    assert(len(db_client.simple_filter_query({})) == 1)
+
+    db_client.delete_all_entries()
+    return
+
+def test_bulk_create_rollback():
+    """
+    if any batch of bulk_create_entries fails, the batches already
+    written are rolled back, no entry gets a NestId, and None is returned
+    """
+    setup_db()
+    sqla_md = nest_db.get_global_sqlalchemy_metadata()
+    db_engine = nest_db.get_global_sqlalchemy_engine()
+    db_registry = hw_db.get_sqla_makers()
+    db_client = db_registry['hello_tablelike'].get_db_client(db_engine, sqla_md)
+    db_client.set_requesting_user(core_db.get_system_user())
+    db_client.delete_all_entries()
+
+    t1 = HelloTablelikeDTO(1.0, 1.1, 'x', ['a','a'], [0.0, 0.0], NestId(1), [NestId(2)], {'x':'innerx'}, {'xb':'innerxb'}, 5, [6, 7]).to_tablelike_entry()
+    t2 = HelloTablelikeDTO(2.0, 2.2, 'y', ['a','b'], [0.0, 0.0], NestId(1), [NestId(2)], {'x':'innerx'}, {'xb':'innerxb'}, 5, [6, 7]).to_tablelike_entry()
+    t3 = HelloTablelikeDTO(3.0, 3.3, 'z', ['b','b'], [0.0, 0.0], NestId(1), [NestId(2)], {'x':'innerx'}, {'xb':'innerxb'}, 5, [6, 7]).to_tablelike_entry()
+    #not a float, so the second batch fails in the db
+    t3.set_value('flt_val_0', 'not a float')
+
+    tles = [t1, t2, t3]
+    up_tles = db_client.bulk_create_entries(tles, batch_size=2)
+    assert(up_tles is None)
+    for tle in tles:
+        assert(tle.get_nest_id() is None)
+    assert(len(db_client.simple_filter_query({})) == 0)
+
+    db_client.delete_all_entries()
+    return
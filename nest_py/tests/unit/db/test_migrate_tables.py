@@ -0,0 +1,57 @@
+import json
+
+from sqlalchemy import MetaData, Table, Column, Integer, Text
+from sqlalchemy.sql import select
+
+import nest_py.core.db.nest_db as nest_db
+import nest_py.core.db.db_ops_utils as db_ops_utils
+import nest_py.core.data_types.typed_array as typed_array
+from nest_py.core.data_types.tablelike_schema import TablelikeSchema
+from nest_py.core.db.tablelike_sqla import ensure_table
+
+TABLE_NAME = 'test_migrate_typed_array'
+
+def test_migrate_typed_array_column():
+    """
+    a TypedArray column created as json text, as ssviz_feature_data.values
+    used to be, is converted to bytea in place, and converting again is a
+    no-op
+    """
+    db_engine = nest_db.get_global_sqlalchemy_engine()
+    old_md = MetaData()
+    old_tbl = Table(TABLE_NAME, old_md,
+        Column('id', Integer, primary_key=True),
+        Column('owner_id', Integer),
+        Column('values', Text))
+    old_tbl.drop(db_engine, checkfirst=True)
+    old_tbl.create(db_engine)
+    old_values = [[1, 2, 3], [0.5, None, 2.25], ['a', None, 'b'], None]
+    try:
+        db_engine.execute(old_tbl.insert(), [
+            {'id': i + 1, 'owner_id': 1, 'values': json.dumps(vals)}
+            for i, vals in enumerate(old_values)])
+        db_engine.execute(old_tbl.insert(),
+            {'id': 5, 'owner_id': 1, 'values': None})
+
+        schema = TablelikeSchema(TABLE_NAME)
+        schema.add_typed_array_attribute('values', compress=True)
+        new_tbl = ensure_table(MetaData(), schema, TABLE_NAME)
+        att = new_tbl.c['values'].info['tablelike_attribute']
+
+        db_ops_utils.MIGRATION_BATCH_SIZE = 2
+        num_rows = db_ops_utils._migrate_typed_array_column(db_engine,
+            new_tbl, att)
+        assert num_rows == 5
+        rows = db_engine.execute(
+            select([new_tbl.c.id, new_tbl.c['values']]).order_by(new_tbl.c.id)
+            ).fetchall()
+        observed = [None if blob is None else
+            typed_array.decode_to_list(bytes(blob)) for _, blob in rows]
+        assert observed == old_values + [None]
+
+        assert db_ops_utils._migrate_typed_array_column(db_engine,
+            new_tbl, att) == 0
+    finally:
+        db_ops_utils.MIGRATION_BATCH_SIZE = 1000
+        old_tbl.drop(db_engine, checkfirst=True)
+    return
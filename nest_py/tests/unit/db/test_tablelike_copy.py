@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import nest_py.core.db.tablelike_copy as tablelike_copy
+import nest_py.hello_world.data_types.hello_tablelike as hello_tablelike
+from nest_py.core.data_types.nest_id import NestId
+
+def test_format_copy_line():
+    schema = hello_tablelike.generate_schema()
+    att_names = ['flt_val_0', 'string_val', 'cat_list_val', 'num_list_val',
+        'foreignid_val', 'foreignid_list_val', 'json_val', 'int_val',
+        'int_list_val']
+    formatters = tablelike_copy.make_copy_formatters(schema, att_names)
+    row = [1.5, 'x\ty', ['a', 'b"c'], [0.25, None, float('nan')],
+        NestId(4), [NestId(1), 2], {'k': 'v\n'}, 5, [6, 7]]
+    line = tablelike_copy.format_copy_line(formatters, row)
+    print('copy line: ' + line)
+    fields = line.rstrip('\n').split('\t')
+    assert(len(fields) == len(att_names))
+    assert(fields[0] == '1.5')
+    assert(fields[1] == 'x\\ty')
+    assert(fields[2] == '{"a","b\\\\"c"}')
+    assert(fields[3] == '{0.25,NULL,NaN}')
+    assert(fields[4] == '4')
+    assert(fields[5] == '{1,2}')
+    assert(fields[6] == '{"k": "v\\\\n"}')
+    assert(fields[7] == '5')
+    assert(fields[8] == '{6,7}')
+
+    nulls_row = [None, None, None, None, None, None, None, None, None]
+    line = tablelike_copy.format_copy_line(formatters, nulls_row)
+    fields = line.rstrip('\n').split('\t')
+    assert(fields[0] == tablelike_copy.COPY_NULL)
+    #json attributes always store a json document, even for None
+    assert(fields[6] == 'null')
+    return
+
+def test_copy_line_stream():
+    schema = hello_tablelike.generate_schema()
+    formatters = tablelike_copy.make_copy_formatters(schema,
+        ['int_val', 'string_val'])
+    rows = ((i, 'x') for i in range(100))
+    stream = tablelike_copy.CopyLineStream(rows, formatters,
+        leading_values=['7'])
+    chunks = list()
+    chunk = stream.read(10)
+    while chunk != '':
+        assert(len(chunk) <= 10)
+        chunks.append(chunk)
+        chunk = stream.read(10)
+    lines = ''.join(chunks).splitlines()
+    assert(stream.get_num_rows() == 100)
+    assert(len(lines) == 100)
+    assert(lines[0] == '7\t0\tx')
+    assert(lines[99] == '7\t99\tx')
+    return
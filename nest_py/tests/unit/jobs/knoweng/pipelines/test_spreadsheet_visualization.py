@@ -1,10 +1,14 @@
 import os
 
+import numpy as np
 import pandas as pd
 import pytest
 
+from nest_py.core.data_types.nest_id import NestId
+import nest_py.knoweng.jobs.ssv_statistics as ssv_statistics
+import nest_py.knoweng.jobs.pipelines.spreadsheet_visualization as ssv
 from nest_py.knoweng.jobs.pipelines.spreadsheet_visualization import \
-    SpreadsheetVisualizationJob
+    SpreadsheetVisualizationJob, _calculate_pvals_in_pool
 
 def test_load_spreadsheet():
     """
@@ -123,4 +127,118 @@ def test_load_spreadsheet():
     input_df = SpreadsheetVisualizationJob._load_spreadsheet(\
         os.path.join(test_data_dir_path, "ssv_na_label_17.tsv"))
     assert input_df.columns.tolist() == ['sample1', 'sample2', 'NA']
-    assert input_df.index.tolist() == ['featureA', 'featureB', 'NA']
\ No newline at end of file
+    assert input_df.index.tolist() == ['featureA', 'featureB', 'NA']
+
+def test_calculate_pvals_in_pool():
+    """
+    Tests that the correlation pool returns the same pvals, in the same order,
+    as calculating them in this process.
+    """
+    rng = np.random.RandomState(0)
+    sample_names = ['s' + str(i) for i in range(40)]
+    comparison_features_by_idx = {}
+    for comp_ss_idx in range(2):
+        comp_df = pd.DataFrame(rng.normal(size=(40, 5)), index=sample_names)
+        comp_df[5] = rng.choice(['x', 'y', 'z'], 40)
+        comparison_features_by_idx[comp_ss_idx] = \
+            ssv_statistics.ComparisonFeatures(comp_df, \
+                ['numeric'] * 5 + ['categoric'])
+    task_args = []
+    for comp_ss_idx in [0, 1, 1, 0, 1]:
+        g_feature = pd.Series(rng.choice(['a', 'b', 'c'], 40), \
+            index=sample_names)
+        task_args.append((comp_ss_idx, g_feature))
+
+    expected = [ssv_statistics.calculate_pvals(\
+        g_feature, comparison_features_by_idx[comp_ss_idx]) \
+        for comp_ss_idx, g_feature in task_args]
+    actual = _calculate_pvals_in_pool(\
+        task_args, comparison_features_by_idx, 3)
+    assert actual == expected
+
+class MockTransaction(object):
+    """Records when the shared transaction opens and closes in `events`."""
+
+    def __init__(self, events):
+        self.events = events
+        self.rollback_only = False
+
+    def __enter__(self):
+        self.events.append('begin')
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.events.append('rollback' if self.rollback_only else 'commit')
+        return False
+
+    def set_rollback_only(self):
+        self.rollback_only = True
+
+def _make_mock_db_job(monkeypatch, fail_in_transaction=False):
+    """Returns a job with one spreadsheet that's new to the DB, whose DB
+    functions are replaced with ones that log to the returned list."""
+    events = []
+    job = SpreadsheetVisualizationJob(NestId(1), NestId(2), NestId(3), \
+        '/tmp', 'job', 'job', [NestId(4)])
+    sample_names = ['s' + str(i) for i in range(6)]
+    df = pd.DataFrame({'a': ['x', 'y', 'x', 'y', 'x', 'y'], \
+        'b': [1.0, 2.0, 1.5, 2.5, 1.0, 3.0]}, index=sample_names)
+    job.spreadsheets = [{'file_id': NestId(4), 'filename': 'f.tsv', \
+        'df': df, 'is_file_samples_as_rows': True, \
+        'sample_names': sample_names, 'feature_names': ['a', 'b'], \
+        'feature_types': ['categoric', 'numeric'], \
+        'sample_nan_counts': [0] * 6, 'feature_nan_counts': [0, 0]}]
+    monkeypatch.setattr(job, 'load_spreadsheets', lambda: None)
+    monkeypatch.setattr(job, 'validate_spreadsheet_files', lambda: None)
+    monkeypatch.setattr(job, 'count_missing_values', lambda: None)
+
+    def calculate_pvals(g_feature, comparison_features):
+        events.append('calculate_pvals')
+        return [0.5, 0.5]
+    def create_spreadsheet(*args):
+        events.append('create_spreadsheet')
+        return NestId(5)
+    def create_jobs_spreadsheets(user_id, job_id, ssviz_spreadsheet_ids):
+        events.append('create_jobs_spreadsheets')
+        if fail_in_transaction:
+            job.error_message = 'failed'
+    def create_correlations(user_id, entries):
+        events.append(('create_correlations', \
+            [(comp_id.get_value(), g_id.get_value(), g_feature_idx) \
+            for comp_id, g_id, g_feature_idx, pvals in entries]))
+    monkeypatch.setattr(ssv.ssv_statistics, 'calculate_pvals', calculate_pvals)
+    monkeypatch.setattr(ssv, 'get_ssviz_spreadsheets_by_file_ids', \
+        lambda user_id, file_ids: [])
+    monkeypatch.setattr(ssv, 'get_ssviz_spreadsheets_with_correlations', \
+        lambda user_id, ssviz_spreadsheet_ids: [])
+    monkeypatch.setattr(ssv, 'create_ssviz_spreadsheet_and_feature_data', \
+        create_spreadsheet)
+    monkeypatch.setattr(ssv, 'create_ssviz_jobs_spreadsheets_entries', \
+        create_jobs_spreadsheets)
+    monkeypatch.setattr(ssv, 'create_ssviz_feature_correlations_entries', \
+        create_correlations)
+    monkeypatch.setattr(ssv, 'shared_db_transaction', \
+        lambda: MockTransaction(events))
+    return job, events
+
+def test_process_data_writes_after_calculating(monkeypatch):
+    """
+    Tests that the correlations are calculated before the DB transaction
+    opens, and that the transaction only covers the writes.
+    """
+    job, events = _make_mock_db_job(monkeypatch)
+    job.process_data()
+    assert events == ['calculate_pvals', 'begin', 'create_spreadsheet', \
+        'create_jobs_spreadsheets', ('create_correlations', [(5, 5, 0)]), \
+        'commit']
+    assert job.spreadsheets[0]['is_new_to_db']
+
+def test_process_data_rolls_back_failed_job(monkeypatch):
+    """
+    Tests that a failure reported through is_failed() inside the
+    transaction rolls back the writes.
+    """
+    job, events = _make_mock_db_job(monkeypatch, fail_in_transaction=True)
+    job.process_data()
+    assert events == ['calculate_pvals', 'begin', 'create_spreadsheet', \
+        'create_jobs_spreadsheets', 'rollback']
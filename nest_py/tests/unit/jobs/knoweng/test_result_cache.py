@@ -0,0 +1,123 @@
+import os
+
+import nest_py.knoweng.jobs.result_cache as result_cache
+
+def _write_file(file_path, contents):
+    with open(file_path, 'w') as outfile:
+        outfile.write(contents)
+
+def _read_file(file_path):
+    with open(file_path) as infile:
+        return infile.read()
+
+def test_make_cache_key():
+    """
+    Tests that cache keys ignore parameter order, ignored parameters, and
+    missing parameters, but not anything that affects the outputs.
+    """
+    key = result_cache.make_cache_key('sample_clustering', \
+        {'features_file': '5', 'method': 'K-means', 'cloud': 'aws'}, \
+        {'features_file': 'abc'}, ['img:1', 'img:2'])
+    assert key == result_cache.make_cache_key('sample_clustering', \
+        {'method': 'K-means', 'features_file': '5', 'response_file': None}, \
+        {'features_file': 'abc'}, ['img:2', 'img:1'])
+    # the same contents uploaded as another file
+    assert key == result_cache.make_cache_key('sample_clustering', \
+        {'method': 'K-means', 'features_file': '6'}, \
+        {'features_file': 'abc'}, ['img:2', 'img:1'])
+    assert key != result_cache.make_cache_key('sample_clustering', \
+        {'features_file': '5', 'method': 'hclust'}, \
+        {'features_file': 'abc'}, ['img:1', 'img:2'])
+    assert key != result_cache.make_cache_key('sample_clustering', \
+        {'features_file': '5', 'method': 'K-means'}, \
+        {'features_file': 'abd'}, ['img:1', 'img:2'])
+    assert key != result_cache.make_cache_key('sample_clustering', \
+        {'features_file': '5', 'method': 'K-means'}, \
+        {'features_file': 'abc'}, ['img:1', 'img:3'])
+
+def test_get_file_hash(tmpdir):
+    """
+    Tests that file hashes are saved next to the file and recomputed when the
+    file changes.
+    """
+    file_path = os.path.join(str(tmpdir), 'input.tsv')
+    _write_file(file_path, 'a\tb\n')
+    digest = result_cache.get_file_hash(file_path)
+    assert os.path.exists(file_path + result_cache.HASH_FILE_SUFFIX)
+    assert result_cache.get_file_hash(file_path) == digest
+    _write_file(file_path, 'a\tb\tc\n')
+    assert result_cache.get_file_hash(file_path) != digest
+
+def test_entry_lifecycle(tmpdir):
+    """
+    Tests that a successful job's outputs, as they were before on_done, are
+    restored into a later job's directory without replacing its own files,
+    and that a failed job's outputs are never cached.
+    """
+    cache_dir = os.path.join(str(tmpdir), 'cache')
+    first_dir = os.path.join(str(tmpdir), 'first')
+    os.makedirs(os.path.join(first_dir, 'results'))
+    _write_file(os.path.join(first_dir, 'run.yml'), 'first')
+
+    # a failed job leaves nothing behind
+    failed = result_cache.ResultCacheEntry(cache_dir, 'key', first_dir, 'j0')
+    _write_file(os.path.join(first_dir, 'results', 'out.tsv'), 'raw')
+    failed.stage_outputs()
+    failed.close(False)
+    assert not failed.is_available()
+    assert not os.path.exists(failed.staging_path)
+    os.remove(os.path.join(first_dir, 'results', 'out.tsv'))
+
+    first = result_cache.ResultCacheEntry(cache_dir, 'key', first_dir, 'j1')
+    assert not first.is_available()
+    # a remote runner writes its output
+    _write_file(os.path.join(first_dir, 'results', 'out.tsv'), 'raw')
+    first.stage_outputs()
+    # files that existed before the runners started aren't outputs
+    assert not os.path.exists(os.path.join(first.staging_path, 'run.yml'))
+    # on_done rewrites the output in place
+    _write_file(os.path.join(first_dir, 'results', 'out.tsv'), 'processed')
+    os.utime(os.path.join(first_dir, 'results', 'out.tsv'), (0, 0))
+    # another remote runner writes its output
+    _write_file(os.path.join(first_dir, 'results', 'out2.tsv'), 'raw2')
+    first.stage_outputs()
+    first.close(True)
+    assert first.is_available()
+
+    second_dir = os.path.join(str(tmpdir), 'second')
+    os.makedirs(second_dir)
+    _write_file(os.path.join(second_dir, 'run.yml'), 'second')
+    second = result_cache.ResultCacheEntry(cache_dir, 'key', second_dir, 'j2')
+    assert second.is_available()
+    second.restore()
+    assert second.is_restored()
+    assert _read_file(os.path.join(second_dir, 'run.yml')) == 'second'
+    assert _read_file(os.path.join(second_dir, 'results', 'out.tsv')) == 'raw'
+    assert _read_file(os.path.join(second_dir, 'results', 'out2.tsv')) == \
+        'raw2'
+    second.stage_outputs()
+    second.close(True)
+    assert not os.path.exists(second.staging_path)
+
+def test_evict_entries(tmpdir):
+    """
+    Tests that adding an entry evicts the least recently used ones beyond the
+    limit.
+    """
+    cache_dir = os.path.join(str(tmpdir), 'cache')
+    for idx in range(3):
+        job_dir = os.path.join(str(tmpdir), 'job' + str(idx))
+        os.makedirs(job_dir)
+        entry = result_cache.ResultCacheEntry(\
+            cache_dir, 'key' + str(idx), job_dir, 'j' + str(idx))
+        _write_file(os.path.join(job_dir, 'out.tsv'), str(idx))
+        entry.stage_outputs()
+        entry.close(True, max_entries=2)
+        os.utime(entry.entry_path, (idx, idx))
+    assert sorted(os.listdir(cache_dir)) == ['key1', 'key2', 'staging']
+    # restoring an entry marks it as recently used
+    job_dir = os.path.join(str(tmpdir), 'job3')
+    os.makedirs(job_dir)
+    result_cache.ResultCacheEntry(cache_dir, 'key1', job_dir, 'j3').restore()
+    result_cache.evict_entries(cache_dir, 1)
+    assert sorted(os.listdir(cache_dir)) == ['key1', 'staging']
@@ -0,0 +1,75 @@
+from nest_py.knoweng.jobs.runner_dag import RunnerDag
+
+class _FakeRunner(object):
+    def __init__(self, job_name, upstream=None, num_cpus=0, max_ram_mb=0):
+        self.job_name = job_name
+        self.upstream = upstream or []
+        self.downstream = []
+        self.num_cpus = num_cpus
+        self.max_ram_mb = max_ram_mb
+        self.started = False
+
+    def get_upstream_runners(self):
+        return self.upstream
+
+    def get_downstream_runners(self):
+        return self.downstream
+
+    def is_ready(self):
+        return True
+
+    def is_started(self):
+        return self.started
+
+def _start(dag):
+    ready = dag.get_runners_to_start()
+    for runner in ready:
+        runner.started = True
+        dag.mark_started(runner)
+    return [r.job_name for r in ready]
+
+def test_fan_out_within_budget():
+    """
+    Tests a GSC-like job, where one prep runner feeds several compute runners
+    that all feed a wrapup runner, with a budget that fits two computes.
+    """
+    prep = _FakeRunner('prep', num_cpus=1, max_ram_mb=1000)
+    computes = [_FakeRunner('compute' + str(i), [prep], 2, 4000) \
+        for i in range(3)]
+    wrapup = _FakeRunner('wrapup', [prep] + computes)
+    dag = RunnerDag([prep] + computes + [wrapup], cpu_budget=4, \
+        ram_budget_mb=16000)
+
+    assert _start(dag) == ['prep']
+    assert _start(dag) == []
+    assert not dag.is_upstream_done(computes[0])
+    dag.mark_done(prep)
+    assert _start(dag) == ['compute0', 'compute1']
+    dag.mark_done(computes[1])
+    assert _start(dag) == ['compute2']
+    dag.mark_done(computes[0])
+    dag.mark_done(computes[2])
+    assert _start(dag) == ['wrapup']
+    dag.mark_done(wrapup)
+
+    path, total = dag.get_critical_path()
+    assert path[0] is prep
+    assert path[-1] is wrapup
+    assert len(path) == 3
+    assert total >= 0
+
+def test_oversized_runner_and_downstream_edges():
+    """
+    Tests that a runner bigger than the whole budget still runs once nothing
+    else is running, and that edges declared from the upstream side are
+    honored, with longer chains started first.
+    """
+    big = _FakeRunner('big', num_cpus=8)
+    small = _FakeRunner('small', num_cpus=1)
+    post = _FakeRunner('post')
+    big.downstream = [post]
+    dag = RunnerDag([small, big, post], cpu_budget=4)
+    assert _start(dag) == ['big']
+    assert _start(dag) == []
+    dag.mark_done(big)
+    assert _start(dag) == ['small', 'post']
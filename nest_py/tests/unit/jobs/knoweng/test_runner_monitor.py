@@ -0,0 +1,67 @@
+import os
+import threading
+from time import time
+
+import pytest
+
+from nest_py.knoweng.jobs.runner_monitor import RunnerMonitor
+
+class _FakeRunner(object):
+    def __init__(self, job_dir_path):
+        self.job_dir_path = job_dir_path
+
+def test_get_dirs_to_watch(tmpdir):
+    """
+    Tests that the runners' directories and their immediate subdirectories are
+    watched once each, and that deeper directories aren't.
+    """
+    job_dir = str(tmpdir)
+    results_dir = os.path.join(job_dir, 'results')
+    subjob_dir = os.path.join(job_dir, 'subjobs', 'subjob1')
+    os.mkdir(results_dir)
+    os.makedirs(os.path.join(subjob_dir, 'results', 'deeper'))
+    runners = [_FakeRunner(job_dir), _FakeRunner(job_dir + '/'), \
+        _FakeRunner(subjob_dir), _FakeRunner(os.path.join(job_dir, 'missing'))]
+    monitor = RunnerMonitor(runners, use_inotify=False)
+    assert sorted(monitor.watched_dirs) == sorted([\
+        job_dir, results_dir, os.path.join(job_dir, 'subjobs'), \
+        subjob_dir, os.path.join(subjob_dir, 'results')])
+    # entries are only stat'ed in the runners' own directories
+    assert os.path.join(subjob_dir, 'results', 'deeper') not in \
+        monitor.snapshot
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_wait(tmpdir, use_inotify):
+    """
+    Tests that wait returns as soon as a file changes, and that it gives up
+    after max_wait_seconds otherwise.
+    """
+    job_dir = str(tmpdir)
+    results_dir = os.path.join(job_dir, 'results')
+    os.mkdir(results_dir)
+    monitor = RunnerMonitor([_FakeRunner(job_dir)], \
+        check_interval_seconds=0.05, max_wait_seconds=0.3, \
+        use_inotify=use_inotify)
+    assert monitor.watched_dirs == [job_dir, results_dir]
+
+    start = time()
+    assert not monitor.wait()
+    assert time() - start >= 0.3
+
+    def _write_output():
+        with open(os.path.join(results_dir, 'done.txt'), 'w') as outfile:
+            outfile.write('done')
+    writer = threading.Timer(0.1, _write_output)
+    monitor.max_wait_seconds = 10
+    start = time()
+    writer.start()
+    assert monitor.wait()
+    assert time() - start < 5
+    writer.join()
+
+    # the caller's own changes are ignored once marked
+    os.remove(os.path.join(results_dir, 'done.txt'))
+    monitor.mark()
+    monitor.max_wait_seconds = 0.2
+    assert not monitor.wait()
+    monitor.close()
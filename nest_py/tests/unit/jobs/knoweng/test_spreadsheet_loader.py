@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+
+import nest_py.knoweng.jobs.spreadsheet_loader as spreadsheet_loader
+
+def _write_spreadsheet(dir_path, name, lines):
+    ssf_path = os.path.join(str(dir_path), name)
+    with open(ssf_path, 'w') as outfile:
+        outfile.write('\n'.join(lines) + '\n')
+    return ssf_path
+
+def test_labels_stay_strings(tmpdir):
+    """
+    Tests that row labels that look like numbers or missing values are kept
+    as strings, and that rows the parser skips don't shift the labels.
+    """
+    ssf_path = _write_spreadsheet(tmpdir, 'labels.tsv', [\
+        'id\ts1\ts2',
+        '007\t1.5\tx',
+        'NA\t2.5\ty',
+        '3\t1\t2\t3',
+        '12\tnan\tz',
+        'N/A\t3.5\tw',
+        'null\t4.5\tv',
+        '1.50\t5.5\tu'])
+    input_df = spreadsheet_loader.load_spreadsheet(ssf_path)
+    assert input_df.index.tolist() == \
+        ['007', 'NA', '12', 'N/A', 'null', '1.50']
+    assert input_df.index.name == 'id'
+    assert input_df.columns.tolist() == ['s1', 's2']
+    assert input_df['s2'].tolist() == ['x', 'y', 'z', 'w', 'v', 'u']
+
+def test_label_header_variants(tmpdir):
+    """
+    Tests that the row labels are kept as strings whether the header has a
+    blank label for the first column or no field for it at all, and when the
+    values are downcast.
+    """
+    blank_path = _write_spreadsheet(tmpdir, 'blank.tsv', [\
+        '\ts1\ts2',
+        '007\t1.5\t2.5',
+        'NA\t3.5\t4.5'])
+    short_path = _write_spreadsheet(tmpdir, 'short.tsv', [\
+        's1\ts2',
+        '007\t1.5\t2.5',
+        'NA\t3.5\t4.5'])
+    for ssf_path in [blank_path, short_path]:
+        for float_dtype in [np.float64, np.float32]:
+            input_df = spreadsheet_loader.load_spreadsheet(\
+                ssf_path, float_dtype=float_dtype)
+            assert input_df.index.tolist() == ['007', 'NA']
+            assert input_df.index.name is None
+            assert input_df.columns.tolist() == ['s1', 's2']
+            assert input_df['s1'].dtype == float_dtype
+            assert input_df['s2'].tolist() == [2.5, 4.5]
+
+def test_numeric_labels_are_strings(tmpdir):
+    """
+    Tests that row labels that are all numbers are kept as strings, so they
+    match column labels, which are always strings. Earlier versions of the
+    loader kept them as numbers.
+    """
+    ssf_path = _write_spreadsheet(tmpdir, 'numeric_labels.tsv', [\
+        'id\t1\t2',
+        '1\t1.5\t2.5',
+        '2\t3.5\t4.5'])
+    for float_dtype in [np.float64, np.float32]:
+        input_df = spreadsheet_loader.load_spreadsheet(\
+            ssf_path, float_dtype=float_dtype)
+        assert input_df.index.tolist() == ['1', '2']
+        assert input_df.index.tolist() == input_df.columns.tolist()
+        assert input_df['1'].tolist() == [1.5, 3.5]
+
+def test_float32_and_cache(tmpdir):
+    """
+    Tests downcasting to float32, including a column that only turns out to
+    be non-numeric after the rows used to sniff the types, that the cached
+    dataframes match the parsed ones, and that only all-numeric dataframes
+    are cached.
+    """
+    cache_dir = str(tmpdir.join('cache'))
+    lines = ['\ta\tb']
+    for row_idx in range(spreadsheet_loader.TYPE_SNIFF_ROWS + 10):
+        lines.append('g' + str(row_idx) + '\t' + str(row_idx + 0.5) + '\t' + \
+            str(row_idx))
+    numeric_path = _write_spreadsheet(tmpdir, 'numeric.tsv', lines)
+    mixed_path = _write_spreadsheet(tmpdir, 'mixed.tsv', lines + \
+        ['gx\t1.0\tnot_a_number'])
+
+    parsed_df = spreadsheet_loader.load_spreadsheet(\
+        numeric_path, float_dtype=np.float32, cache_dir=cache_dir)
+    assert parsed_df['a'].dtype == np.float32
+    meta_path, values_path = spreadsheet_loader.get_cache_paths(\
+        cache_dir, numeric_path, np.float32)
+    assert os.path.exists(meta_path)
+    assert os.path.exists(values_path)
+    cached_df = spreadsheet_loader.load_spreadsheet(\
+        numeric_path, float_dtype=np.float32, cache_dir=cache_dir)
+    assert cached_df.equals(parsed_df)
+    assert cached_df.index.tolist() == parsed_df.index.tolist()
+    # a different dtype doesn't use the entry; as float64, column b keeps its
+    # integer dtype, so this dataframe isn't cached
+    float64_df = spreadsheet_loader.load_spreadsheet(\
+        numeric_path, cache_dir=cache_dir)
+    assert float64_df['a'].dtype == np.float64
+    assert float64_df['b'].dtype == np.int64
+    assert len(os.listdir(cache_dir)) == 2
+
+    mixed_df = spreadsheet_loader.load_spreadsheet(\
+        mixed_path, float_dtype=np.float32, cache_dir=cache_dir)
+    assert mixed_df['a'].dtype == np.float32
+    assert mixed_df['b'].dtype == object
+    assert mixed_df['b'].tolist()[-1] == 'not_a_number'
+    # mixed dataframes aren't cached
+    assert len(os.listdir(cache_dir)) == 2
+
+    # changing the file invalidates its entry
+    _write_spreadsheet(tmpdir, 'numeric.tsv', lines[:3])
+    os.utime(numeric_path, (0, 0))
+    numeric_df = spreadsheet_loader.load_spreadsheet(\
+        numeric_path, float_dtype=np.float32, cache_dir=cache_dir)
+    assert numeric_df.shape == (2, 2)
+
+def test_clean_cache(tmpdir):
+    """
+    Tests that cleaning the cache drops the entries of deleted spreadsheets,
+    then the least recently used entries.
+    """
+    cache_dir = str(tmpdir.join('cache'))
+    lines = ['\ta\tb'] + ['g' + str(row_idx) + '\t1.0\t2.0' \
+        for row_idx in range(100)]
+    ssf_paths = [_write_spreadsheet(tmpdir, 'ss' + str(idx) + '.tsv', lines) \
+        for idx in range(3)]
+    entry_paths = []
+    for idx, ssf_path in enumerate(ssf_paths):
+        spreadsheet_loader.load_spreadsheet(ssf_path, cache_dir=cache_dir)
+        entry_paths.append(spreadsheet_loader.get_cache_paths(\
+            cache_dir, ssf_path, np.float64))
+        # oldest first
+        os.utime(entry_paths[-1][0], (idx, idx))
+    entry_bytes = sum(os.path.getsize(path) for path in entry_paths[0])
+
+    os.remove(ssf_paths[2])
+    spreadsheet_loader.clean_cache(cache_dir, max_bytes=entry_bytes)
+    assert sorted(os.listdir(cache_dir)) == \
+        sorted(os.path.basename(path) for path in entry_paths[1])
@@ -0,0 +1,75 @@
+import numpy as np
+
+import nest_py.knoweng.jobs.ssv_heatmap_bins as ssv_heatmap_bins
+
+def test_make_bin_starts():
+    assert ssv_heatmap_bins.make_bin_starts(10, 3).tolist() == [0, 3, 6]
+    assert ssv_heatmap_bins.make_bin_starts(10, 10).tolist() == range(10)
+    # never more bins than samples
+    assert ssv_heatmap_bins.make_bin_starts(3, 10).tolist() == [0, 1, 2]
+    assert ssv_heatmap_bins.make_bin_starts(0, 10).tolist() == []
+
+def test_summarize_numeric():
+    rand = np.random.RandomState(0)
+    values = rand.randn(1003)
+    values[rand.rand(1003) < 0.3] = np.nan
+    values[10:30] = np.nan
+    bin_starts = ssv_heatmap_bins.make_bin_starts(len(values), 100)
+    summary = ssv_heatmap_bins.summarize_numeric(values, bin_starts)
+    bin_ends = list(bin_starts[1:]) + [len(values)]
+    num_empty = 0
+    for bin_idx, (start, end) in enumerate(zip(bin_starts, bin_ends)):
+        bin_values = values[start:end]
+        bin_values = bin_values[~np.isnan(bin_values)]
+        if len(bin_values) == 0:
+            num_empty += 1
+            assert summary['mean'][bin_idx] is None
+            assert summary['min'][bin_idx] is None
+            assert summary['max'][bin_idx] is None
+        else:
+            assert np.isclose(summary['mean'][bin_idx], bin_values.mean())
+            assert summary['min'][bin_idx] == bin_values.min()
+            assert summary['max'][bin_idx] == bin_values.max()
+    assert num_empty > 0
+
+def test_summarize_categoric():
+    values = np.array(['b', 'a', None, 'c', 'a', 'a'], dtype=object)
+    bin_starts = ssv_heatmap_bins.make_bin_starts(len(values), 4)
+    summary = ssv_heatmap_bins.summarize_categoric(values, bin_starts)
+    assert summary['categories'] == ['a', 'b', 'c']
+    assert summary['counts'] == [[0, 1, 0], [1, 0, 0], [0, 0, 1], [2, 0, 0]]
+
+    # numerically-coded categories, with NaN for missing values
+    values = np.array([1.0, np.nan, 2.0, 1.0])
+    bin_starts = ssv_heatmap_bins.make_bin_starts(len(values), 2)
+    summary = ssv_heatmap_bins.summarize_categoric(values, bin_starts)
+    assert summary['categories'] == [1.0, 2.0]
+    assert summary['counts'] == [[1, 0], [1, 1]]
+
+def test_summarize_feature():
+    bin_starts = ssv_heatmap_bins.make_bin_starts(2, 2)
+    summary = ssv_heatmap_bins.summarize_feature(\
+        np.array([1.0, 2.0]), 'numeric', bin_starts)
+    assert summary['feature_type'] == 'numeric'
+    assert summary['mean'] == [1.0, 2.0]
+    assert ssv_heatmap_bins.summarize_feature(\
+        np.array(['x', 'y'], dtype=object), 'other', bin_starts) is None
+
+def test_heatmap_bin_cache():
+    cache = ssv_heatmap_bins.HeatmapBinCache(max_entries=2)
+    cache.put('a', {'mean': [1]})
+    cache.put('b', {'mean': [2]})
+    assert cache.get('a') == {'mean': [1]}
+    # 'b' is now the least recently used
+    cache.put('c', {'mean': [3]})
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == {'mean': [1]}
+    assert cache.get('c') == {'mean': [3]}
+
+def test_make_ordering_key():
+    assert ssv_heatmap_bins.make_ordering_key(None) == 'all'
+    assert ssv_heatmap_bins.make_ordering_key([2, 0, 1]) == \
+        ssv_heatmap_bins.make_ordering_key([2, 0, 1])
+    assert ssv_heatmap_bins.make_ordering_key([2, 0, 1]) != \
+        ssv_heatmap_bins.make_ordering_key([0, 1, 2])
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from lifelines.statistics import multivariate_logrank_test
+
+import nest_py.knoweng.jobs.ssv_statistics as ssv_statistics
+
+def _scipy_pvals(g_feature, comp_df, comp_feature_types):
+    """
+    The per-feature calculation that ssv_statistics replaces, one scipy call
+    per comparison feature.
+    """
+    g_feature = g_feature.copy()
+    g_feature.name = "NEST_INTERNAL_RENAME_FOR_CROSSTAB"
+    g_feature_groups = g_feature.groupby(by=g_feature).groups
+    pvals = []
+    for c_feature_idx, c_feature_type in enumerate(comp_feature_types):
+        c_feature = comp_df.iloc[:, c_feature_idx]
+        if c_feature_type == 'numeric':
+            groups_values = [\
+                [x for x in c_feature.reindex(sample_names).values \
+                if not np.isnan(x)] \
+                for sample_names in g_feature_groups.values()]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fval, pval = stats.f_oneway(*groups_values)
+            if np.isnan(pval):
+                pval = 1.0
+        elif c_feature_type == 'categoric':
+            cont_table = pd.crosstab(g_feature, c_feature)
+            chi, pval, dof, expected = stats.chi2_contingency(cont_table)
+        else:
+            pval = 1.0
+        pvals.append(pval)
+    return pvals
+
+def _make_spreadsheets(seed, num_g_samples, num_comp_samples, num_groups, \
+        num_categories):
+    """
+    Returns a grouping feature and a comparison df whose samples only partly
+    overlap, with missing values sprinkled through both.
+    """
+    rng = np.random.RandomState(seed)
+    g_names = ['s' + str(i) for i in range(num_g_samples)]
+    offset = num_g_samples // 4
+    comp_names = ['s' + str(i + offset) for i in range(num_comp_samples)]
+    g_feature = pd.Series(\
+        rng.choice(['grp' + str(i) for i in range(num_groups)], num_g_samples),\
+        index=g_names, dtype=object)
+    g_feature[rng.rand(num_g_samples) < 0.1] = np.nan
+
+    columns = {}
+    feature_types = []
+    for idx in range(6):
+        values = rng.normal(loc=1000.0, scale=5.0 + idx, size=num_comp_samples)
+        values[rng.rand(num_comp_samples) < 0.15] = np.nan
+        columns['num' + str(idx)] = values
+        feature_types.append('numeric')
+    for idx in range(6):
+        values = pd.Series(rng.choice(\
+            ['cat' + str(i) for i in range(num_categories)], num_comp_samples),\
+            dtype=object)
+        values[rng.rand(num_comp_samples) < 0.15] = np.nan
+        columns['cat' + str(idx)] = values.values
+        feature_types.append('categoric')
+    columns['other'] = ['txt' + str(i) for i in range(num_comp_samples)]
+    feature_types.append('other')
+    comp_df = pd.DataFrame(columns, index=comp_names, \
+        columns=['num' + str(i) for i in range(6)] + \
+        ['cat' + str(i) for i in range(6)] + ['other'])
+    return g_feature, comp_df, feature_types
+
+def _assert_parity(g_feature, comp_df, comp_feature_types):
+    expected = _scipy_pvals(g_feature, comp_df, comp_feature_types)
+    comparison_features = ssv_statistics.ComparisonFeatures(\
+        comp_df, comp_feature_types)
+    actual = ssv_statistics.calculate_pvals(g_feature, comparison_features)
+    assert len(actual) == len(expected)
+    assert np.allclose(actual, expected, rtol=1e-7, atol=1e-12), \
+        (actual, expected)
+
+def test_parity_with_scipy():
+    """
+    Tests ssv_statistics.calculate_pvals() against scipy's f_oneway and
+    chi2_contingency on random spreadsheets of several shapes.
+    """
+    for seed, num_groups, num_categories in \
+            [(0, 2, 2), (1, 3, 2), (2, 2, 4), (3, 5, 3), (4, 12, 15)]:
+        g_feature, comp_df, feature_types = \
+            _make_spreadsheets(seed, 120, 100, num_groups, num_categories)
+        _assert_parity(g_feature, comp_df, feature_types)
+
+def test_degenerate_groupings():
+    """
+    Tests the cases in which scipy can't produce a p-value, which should be
+    reported as 1.0, as well as the one-dof case that gets Yates' correction.
+    """
+    index = ['a', 'b', 'c', 'd', 'e', 'f']
+    comp_df = pd.DataFrame({\
+        'num': [1.0, 2.0, 3.0, 4.0, np.nan, 6.0],
+        'const': [5.0, 5.0, 5.0, 5.0, 5.0, 5.0],
+        'cat': ['x', 'y', 'x', 'y', 'x', np.nan]}, \
+        index=index, columns=['num', 'const', 'cat'])
+    feature_types = ['numeric', 'numeric', 'categoric']
+    comparison_features = ssv_statistics.ComparisonFeatures(\
+        comp_df, feature_types)
+
+    # a single group
+    g_feature = pd.Series(['g1'] * 6, index=index)
+    assert ssv_statistics.calculate_pvals(g_feature, comparison_features) == \
+        [1.0, 1.0, 1.0]
+
+    # a group whose samples are all missing from the comparison spreadsheet
+    g_feature = pd.Series(['g1', 'g1', 'g2', 'g2', 'g3', 'g3'], \
+        index=['a', 'b', 'c', 'd', 'z1', 'z2'])
+    pvals = ssv_statistics.calculate_pvals(g_feature, comparison_features)
+    assert pvals[0] == 1.0
+    assert pvals[1] == 1.0
+
+    # 2x2 table with Yates' correction, and a feature with no variance
+    g_feature = pd.Series(['g1', 'g1', 'g1', 'g2', 'g2', 'g2'], index=index)
+    _assert_parity(g_feature, comp_df, feature_types)
+    pvals = ssv_statistics.calculate_pvals(g_feature, comparison_features)
+    assert pvals[1] == 1.0
+
+    # no samples in common at all
+    g_feature = pd.Series(['g1', 'g2'], index=['z1', 'z2'])
+    assert ssv_statistics.calculate_pvals(g_feature, comparison_features) == \
+        [1.0, 1.0, 1.0]
+
+def test_logrank_parity_with_lifelines():
+    rand = np.random.RandomState(1)
+    num_samples = 300
+    # rounded, so there are ties
+    durations = np.round(rand.exponential(10, num_samples), 1)
+    events = (rand.rand(num_samples) < 0.6).astype(np.float64)
+    num_groupings = 12
+    group_codes = np.empty((num_groupings, num_samples), dtype=np.int64)
+    num_groups = np.empty(num_groupings, dtype=np.int64)
+    expected = []
+    for grouping_idx in range(num_groupings):
+        # from one to five groups, with some samples in none
+        groups = rand.randint(0, 1 + grouping_idx % 5, num_samples)
+        groups = groups.astype(np.float64)
+        groups[rand.rand(num_samples) < 0.1] = np.nan
+        grouped = ~np.isnan(groups)
+        codes, uniques = pd.factorize(groups, sort=True)
+        group_codes[grouping_idx, :] = codes
+        num_groups[grouping_idx] = len(uniques)
+        expected.append(multivariate_logrank_test(durations[grouped], \
+            groups[grouped], events[grouped]).p_value)
+    pvals = ssv_statistics.logrank_pvals(\
+        durations, events, group_codes, num_groups)
+    # lifelines reports NaN for a single group
+    assert np.array_equal(np.isnan(pvals), np.isnan(expected))
+    assert np.isnan(pvals[0])
+    assert np.allclose(pvals, expected, equal_nan=True)
+
+def test_logrank_no_events():
+    durations = np.array([1.0, 2.0, 3.0, 4.0])
+    events = np.zeros(4)
+    group_codes = np.array([[0, 1, 0, 1]])
+    pvals = ssv_statistics.logrank_pvals(\
+        durations, events, group_codes, np.array([2]))
+    assert pvals.tolist() == [1.0]
@@ -0,0 +1,84 @@
+import math
+
+import nest_py.knoweng.jobs.survival_cache as survival_cache
+
+class MockRedis(object):
+    """Just enough of redis.Redis for the survival cache, without expiry."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self):
+        return MockPipeline(self)
+
+class MockPipeline(object):
+    def __init__(self, redis_connection):
+        self.redis_connection = redis_connection
+        self.commands = []
+
+    def set(self, key, value):
+        self.commands.append(\
+            lambda: self.redis_connection.data.__setitem__(key, str(value)))
+
+    def expire(self, key, ttl):
+        self.commands.append(\
+            lambda: self.redis_connection.ttls.__setitem__(key, ttl))
+
+    def delete(self, key):
+        self.commands.append(\
+            lambda: self.redis_connection.data.pop(key, None))
+
+    def execute(self):
+        for command in self.commands:
+            command()
+
+def _make_key(**kwargs):
+    args = {'user_id': 1, 'grouping_spreadsheet_id': 2, \
+        'grouping_feature_idx': 3, 'duration_spreadsheet_id': 4, \
+        'duration_feature_idx': 5, 'event_spreadsheet_id': 6, \
+        'event_feature_idx': 7, 'event_val': u'dead', 'sample_names': None}
+    args.update(kwargs)
+    return survival_cache.make_cache_key(**args)
+
+def test_make_cache_key():
+    key = _make_key()
+    assert survival_cache.is_cache_key(key, 1)
+    # handles only belong to the user who made them
+    assert not survival_cache.is_cache_key(key, 11)
+    assert not survival_cache.is_cache_key(_make_key(user_id=11), 1)
+    assert key == _make_key()
+    assert key != _make_key(user_id=9)
+    assert key != _make_key(grouping_feature_idx=9)
+    assert key != _make_key(event_val=u'alive')
+    assert key != _make_key(sample_names=['a', 'b'])
+    # the sample subset is a set
+    assert _make_key(sample_names=['b', 'a', 'b']) == \
+        _make_key(sample_names=['a', 'b'])
+    assert not survival_cache.is_cache_key('ssviz_survival:../../etc', 1)
+    assert not survival_cache.is_cache_key('ssviz_survival:1:../../etc', 1)
+    assert not survival_cache.is_cache_key(key[:-1], 1)
+
+def test_pvals_and_job_ids():
+    redis_connection = MockRedis()
+    keys = [_make_key(grouping_feature_idx=idx) for idx in range(3)]
+    assert survival_cache.get_pvals(redis_connection, keys) == \
+        [None, None, None]
+
+    survival_cache.put_job_id(redis_connection, keys[:2], 'job0', 60)
+    assert survival_cache.get_job_ids(redis_connection, keys) == \
+        ['job0', 'job0', None]
+
+    survival_cache.put_pvals(redis_connection, keys[:2], \
+        [0.125, float('nan')])
+    pvals = survival_cache.get_pvals(redis_connection, keys)
+    assert pvals[0] == 0.125
+    assert math.isnan(pvals[1])
+    assert pvals[2] is None
+    assert redis_connection.ttls[keys[0]] == survival_cache.CACHE_TTL_SECS
+    # the finished job is forgotten
+    assert survival_cache.get_job_ids(redis_connection, keys) == \
+        [None, None, None]
@@ -0,0 +1,68 @@
+import numpy
+import scipy.sparse
+from biom.table import Table as BiomTable
+
+import nest_py.omix.jobs.biom_etl as biom_etl
+from nest_py.omix.jobs.sparse_array import SparseMatrixRow
+
+class _FakeOtuDef(object):
+    """
+    stands in for the otus TablelikeEntries made by upload_otu_defs
+    """
+    def __init__(self, values):
+        self.values = values
+
+    def get_value(self, key):
+        return self.values[key]
+
+def _make_biom_table(seed, num_otus, num_samples):
+    """
+    random sparse counts, with the observation ids out of numeric order
+    and one sample with no counts at all
+    """
+    rng = numpy.random.RandomState(seed)
+    counts = rng.randint(1, 100, size=(num_otus, num_samples)).astype(float)
+    counts[rng.rand(num_otus, num_samples) < 0.7] = 0.0
+    counts[:, -1] = 0.0
+    observation_ids = [str(otu_num) for otu_num in
+        rng.permutation(num_otus) * 7 + 3]
+    sample_ids = ['S' + str(sample_idx) for sample_idx in range(num_samples)]
+    biom_table = BiomTable(scipy.sparse.csr_matrix(counts), observation_ids,
+        sample_ids)
+    sorted_ids = sorted(map(int, observation_ids))
+    otu_defs = [_FakeOtuDef({'tornado_observation_key': str(otu_num),
+        'index_within_tornado_run': idx}) for idx, otu_num in
+        enumerate(sorted_ids)]
+    return biom_table, otu_defs
+
+def test_count_matrix_parity():
+    """
+    the csr-backed otu counts and relative abundances hold the same values
+    as the per-sample SparseArrays
+    """
+    biom_table, otu_defs = _make_biom_table(0, 40, 12)
+    exp_counts = biom_etl._extract_otu_counts_for_samples(biom_table,
+        otu_defs)
+    sample_row_lookup, otu_counts = biom_etl._extract_otu_count_matrix(
+        biom_table, otu_defs)
+    rel_abunds = biom_etl._compute_relative_abundance_matrix(otu_counts)
+
+    assert sorted(sample_row_lookup.keys()) == sorted(exp_counts.keys())
+    for sample_key, exp_sary in exp_counts.items():
+        row_idx = sample_row_lookup[sample_key]
+        obs_sary = SparseMatrixRow(otu_counts, row_idx)
+        assert len(obs_sary) == len(exp_sary)
+        assert obs_sary.to_jdata() == exp_sary.to_jdata()
+        assert numpy.array_equal(obs_sary.to_npary(), exp_sary.to_npary())
+        assert obs_sary.get_max() == exp_sary.get_max()
+        for otu_idx in range(len(exp_sary)):
+            assert obs_sary.get_value(otu_idx) == exp_sary.get_value(otu_idx)
+
+        exp_abunds = biom_etl._compute_relative_abundances_for_sample(
+            exp_sary)
+        obs_abunds = SparseMatrixRow(rel_abunds, row_idx)
+        assert sorted(obs_abunds.extract_specified_items()) == \
+            sorted(exp_abunds.extract_specified_items())
+    assert len(SparseMatrixRow(otu_counts, sample_row_lookup['S11'])
+        .extract_specified_values()) == 0
+    return
@@ -0,0 +1,59 @@
+import numpy
+
+from nest_py.core.data_types.nest_id import NestId
+import nest_py.omix.jobs.comparison_analysis as comparison_analysis
+import nest_py.omix.jobs.otu_analysis as otu_analysis
+import nest_py.omix.jobs.taxonomy_matrix as taxonomy_matrix
+import nest_py.omix.data_types.otus as otus
+
+class _FakeEntry(object):
+    """
+    stands in for the otu and comparison TablelikeEntries
+    """
+    def __init__(self, values, nest_id=None):
+        self.values = values
+        self.nest_id = nest_id
+
+    def get_value(self, key):
+        return self.values[key]
+
+    def get_nest_id(self):
+        return self.nest_id
+
+def test_node_rankings_parity():
+    """
+    the ranks in every node match the recursive merge of the children's
+    sorted ranks, for several comparisons sharing one NodeRankings
+    """
+    rng = numpy.random.RandomState(0)
+    otu_defs = list()
+    for otu_idx in range(80):
+        values = dict()
+        for level_idx, taxa_level in enumerate(otus.TAXONOMY_LEVELS):
+            values[taxa_level] = taxa_level + '_' + \
+                str(rng.randint(0, 2 + level_idx))
+        values['otu_name'] = 'otu_' + str(otu_idx % 75)
+        values['index_within_tornado_run'] = otu_idx
+        otu_defs.append(_FakeEntry(values, nest_id=NestId(1000 + otu_idx)))
+    empty_tree = otu_analysis.compute_taxonomy_tree(otu_defs)
+    node_rankings = comparison_analysis.NodeRankings(empty_tree, otu_defs)
+
+    for _ in range(3):
+        ranked_ids = [otu_defs[otu_idx].get_nest_id() for otu_idx in
+            rng.permutation(len(otu_defs))]
+        comp_def = _FakeEntry({'top_fst_ranked_otu_ids': ranked_ids})
+
+        exp_tree = empty_tree.copy()
+        rankings = comparison_analysis._derive_rankings_by_otu_idx(comp_def,
+            otu_defs)
+        comparison_analysis._aggregate_tree_rankings(exp_tree, rankings)
+
+        obs_tree = empty_tree.copy()
+        comparison_analysis.compute_all(comp_def, otu_defs, obs_tree,
+            node_rankings=node_rankings)
+
+        exp_nodes = taxonomy_matrix.get_nodes_by_idx(exp_tree)
+        obs_nodes = taxonomy_matrix.get_nodes_by_idx(obs_tree)
+        for exp_node, obs_node in zip(exp_nodes, obs_nodes):
+            assert exp_node.get_attribute('ranks_in_node') == \
+                obs_node.get_attribute('ranks_in_node')
@@ -0,0 +1,133 @@
+import threading
+from multiprocessing import pool
+
+import pytest
+
+from nest_py.omix.jobs.attribute_tree import AttributeTree
+import nest_py.omix.jobs.node_upload as node_upload
+import nest_py.omix.jobs.comparison_tree_etl as comparison_tree_etl
+import nest_py.omix.data_types.comparison_phylo_tree_nodes as \
+    comparison_phylo_tree_nodes
+
+def _make_tree():
+    """
+    root -> (a -> (a1, a2), b -> (b1))
+    """
+    nodes = dict()
+    for node_idx, name in enumerate(['root', 'a', 'a1', 'a2', 'b', 'b1']):
+        node = AttributeTree()
+        node.set_attribute('node_name', name)
+        node.set_attribute('node_idx', node_idx)
+        node.set_attribute('node_level', 'level_' + str(len(name)))
+        node.set_attribute('ranks_in_node', [node_idx, node_idx + 1])
+        nodes[name] = node
+    for parent, child in [('root', 'a'), ('a', 'a1'), ('a', 'a2'),
+            ('root', 'b'), ('b', 'b1')]:
+        nodes[child].set_attribute('parent_node_idx',
+            nodes[parent].get_attribute('node_idx'))
+        nodes[parent].add_child(nodes[child])
+    nodes['root'].set_attribute('parent_node_idx', -1)
+    return nodes['root']
+
+class _FakeDef(object):
+    def get_nest_id(self):
+        return 7
+
+class _FakeCopyClient(object):
+    def __init__(self):
+        self.uploads = list()
+        self.thread_names = set()
+
+    def bulk_copy_rows(self, rows, columns=None):
+        self.thread_names.add(threading.current_thread().name)
+        rows = list(rows)
+        self.uploads.append((columns, rows))
+        return len(rows)
+
+class _FakeApiClient(object):
+    def __init__(self):
+        self.tles = None
+
+    def bulk_create_entries_async(self, tles, batch_size=100):
+        self.tles = tles
+        return len(tles)
+
+def test_iter_dfs():
+    """
+    the nodes come out parents first, in the same order as a recursive
+    preorder walk
+    """
+    names = [node.get_attribute('node_name') for node in
+        node_upload.iter_dfs(_make_tree())]
+    assert names == ['root', 'a', 'a1', 'a2', 'b', 'b1']
+
+def test_upload_comparison_nodes():
+    """
+    db clients get the rows streamed to bulk_copy_rows; api clients get
+    the same values as TablelikeEntries
+    """
+    copy_client = _FakeCopyClient()
+    registry = {comparison_phylo_tree_nodes.COLLECTION_NAME: copy_client}
+    comparison_tree_etl.upload_nodes(registry, _FakeDef(), _make_tree())
+    columns, rows = copy_client.uploads[0]
+    assert columns[0] == 'comparison_id'
+    assert [row[3] for row in rows] == range(6)
+    assert rows[2] == [7, 'level_2', 'a1', 2, 1, [2, 3]]
+
+    api_client = _FakeApiClient()
+    registry = {comparison_phylo_tree_nodes.COLLECTION_NAME: api_client}
+    comparison_tree_etl.upload_nodes(registry, _FakeDef(), _make_tree())
+    assert len(api_client.tles) == 6
+    for column, value in zip(columns, rows[2]):
+        assert api_client.tles[2].get_value(column) == value
+
+def test_tree_upload_pool():
+    """
+    uploads run in the pool's threads, and a failed upload is re-raised
+    by join
+    """
+    copy_client = _FakeCopyClient()
+    registry = {comparison_phylo_tree_nodes.COLLECTION_NAME: copy_client}
+    uploader = node_upload.TreeUploadPool(num_threads=2)
+    for _ in range(5):
+        uploader.submit(comparison_tree_etl.upload_nodes, registry,
+            _FakeDef(), _make_tree())
+    uploader.join()
+    assert len(copy_client.uploads) == 5
+    assert threading.current_thread().name not in copy_client.thread_names
+
+    failing_registry = {
+        comparison_phylo_tree_nodes.COLLECTION_NAME: _FakeApiClient()}
+    failing_registry[comparison_phylo_tree_nodes.COLLECTION_NAME]\
+        .bulk_create_entries_async = lambda tles, batch_size: None
+    uploader = node_upload.TreeUploadPool(num_threads=2)
+    uploader.submit(comparison_tree_etl.upload_nodes, failing_registry,
+        _FakeDef(), _make_tree())
+    with pytest.raises(AssertionError):
+        uploader.join()
+
+def test_tree_upload_pool_context():
+    """
+    the threads are shut down when the caller's loop raises, and a failed
+    upload doesn't hide the caller's exception
+    """
+    copy_client = _FakeCopyClient()
+    registry = {comparison_phylo_tree_nodes.COLLECTION_NAME: copy_client}
+    with node_upload.TreeUploadPool(num_threads=2) as uploader:
+        uploader.submit(comparison_tree_etl.upload_nodes, registry,
+            _FakeDef(), _make_tree())
+    assert len(copy_client.uploads) == 1
+    assert uploader.pending == []
+
+    failing_registry = {
+        comparison_phylo_tree_nodes.COLLECTION_NAME: _FakeApiClient()}
+    failing_registry[comparison_phylo_tree_nodes.COLLECTION_NAME]\
+        .bulk_create_entries_async = lambda tles, batch_size: None
+    with pytest.raises(ValueError):
+        with node_upload.TreeUploadPool(num_threads=2) as uploader:
+            uploader.submit(comparison_tree_etl.upload_nodes,
+                failing_registry, _FakeDef(), _make_tree())
+            raise ValueError('computing the next tree failed')
+    assert uploader.pending == []
+    #the pool was closed and its threads joined
+    assert uploader.thread_pool._state != pool.RUN
@@ -19,6 +19,8 @@ GOOD_CONFIG = {
     'JWT_ISSUER': 'issuer0',
     'JWT_AUDIENCES': ['audience0'],
     'JWT_LIFESPAN': 1.0,
+    'REDIS_HOST': 'redis',
+    'AUTH_REDIS_DB': 2,
     'CILOGON_CLIENT_ID': 'thisismyfakeclientid',
     'CILOGON_CLIENT_SECRET': 'thisismyfakeclientsecret',
     'CILOGON_REDIRECT_URI': 'https://fakesite.com/static/index.html'}
@@ -1,7 +1,14 @@
+import math
+import numpy
+import scipy.sparse
+
 from nest_py.omix.jobs.sparse_array import SparseArray
+from nest_py.omix.jobs.sparse_array import SparseMatrixRow
 from nest_py.omix.jobs.attribute_tree import AttributeTree
 import nest_py.omix.jobs.cohort_analysis as cohort_analysis
 import nest_py.omix.jobs.otu_analysis as otu_analysis
+import nest_py.omix.jobs.taxonomy_matrix as taxonomy_matrix
+import nest_py.omix.data_types.otus as otus
 
 def test_quantiles_of_sparse_ary():
     ary_size = 12
@@ -95,3 +102,197 @@ def _assert_node_idx_agreement(test_tree):
 
 
 
+
+class _FakeEntry(object):
+    """
+    stands in for the otu and geno_sample TablelikeEntries
+    """
+    def __init__(self, values, nest_id=None):
+        self.values = values
+        self.nest_id = nest_id
+
+    def get_value(self, key):
+        return self.values[key]
+
+    def get_nest_id(self):
+        return self.nest_id
+
+def _make_otus_and_samples(seed, num_otus, num_samples):
+    """
+    random otus whose taxonomies share prefixes (including two otus with
+    the same name), and random sparse otu counts for the samples
+    """
+    rng = numpy.random.RandomState(seed)
+    otu_defs = list()
+    for otu_idx in range(num_otus):
+        values = dict()
+        for level_idx, taxa_level in enumerate(otus.TAXONOMY_LEVELS):
+            #few distinct names near the root, more near the leaves
+            values[taxa_level] = taxa_level + '_' + \
+                str(rng.randint(0, 2 + level_idx))
+        values['otu_name'] = 'otu_' + str(otu_idx)
+        values['index_within_tornado_run'] = otu_idx
+        otu_defs.append(_FakeEntry(values))
+    dup_values = dict(otu_defs[0].values)
+    dup_values['index_within_tornado_run'] = num_otus
+    otu_defs.append(_FakeEntry(dup_values))
+
+    geno_samples = dict()
+    for sample_idx in range(num_samples):
+        counts = SparseArray(num_otus + 1, not_set_value=0.0)
+        for otu_idx in range(num_otus + 1):
+            if rng.rand() < 0.2:
+                counts.set_value(otu_idx, float(rng.randint(1, 50)))
+        geno_samples['s' + str(sample_idx)] = _FakeEntry(
+            {'otu_counts': counts}, nest_id=sample_idx)
+    cohort_def = _FakeEntry({'display_name_short': 'test',
+        'sample_ids': range(num_samples)})
+    return otu_defs, geno_samples, cohort_def
+
+def test_taxonomy_matrix_parity():
+    """
+    the matrix-based cohort metrics and aggregates match the tree-walking
+    functions they replace, at every node
+    """
+    otu_defs, geno_samples, cohort_def = _make_otus_and_samples(0, 60, 37)
+    geno_sample_lst = cohort_analysis.subset_samples_by_cohort(
+        geno_samples, cohort_def)
+    empty_tree = otu_analysis.compute_taxonomy_tree(otu_defs)
+    tax_matrix = taxonomy_matrix.TaxonomyMatrix(empty_tree, otu_defs)
+
+    exp_tree = empty_tree.copy()
+    cohort_analysis.sum_gross_counts_per_sample(exp_tree, otu_defs,
+        geno_sample_lst)
+    cohort_analysis.compute_abundance_frac_per_sample(exp_tree)
+    cohort_analysis.compute_unique_otus_per_sample(exp_tree)
+    exp_max = cohort_analysis.find_effective_max_unique_otus(exp_tree)
+    for att_name in ['abundance_frac_per_sample', 'num_unique_otus_per_sample']:
+        cohort_analysis.compute_quantiles(exp_tree, att_name, 'quants', 4)
+        cohort_analysis.compute_means(exp_tree, att_name, 'mean')
+        cohort_analysis.compute_zero_separated_histograms(exp_tree, att_name,
+            'histo', 0.0, 30.0, 7)
+
+        obs_tree = empty_tree.copy()
+        metrics = cohort_analysis.compute_cohort_metrics(cohort_def,
+            geno_samples, tax_matrix)
+        nodes = taxonomy_matrix.get_nodes_by_idx(obs_tree)
+        cohort_analysis.compute_matrix_quantiles(nodes, metrics[att_name],
+            'quants', 4)
+        cohort_analysis.compute_matrix_means(nodes, metrics[att_name], 'mean')
+        cohort_analysis.compute_matrix_zero_separated_histograms(nodes,
+            metrics[att_name], 'histo', 0.0, 30.0, 7)
+
+        exp_nodes = taxonomy_matrix.get_nodes_by_idx(exp_tree)
+        for exp_node, obs_node in zip(exp_nodes, nodes):
+            exp_values = exp_node.get_attribute(att_name).to_npary()
+            obs_values = metrics[att_name][:, obs_node.get_attribute(
+                'node_idx')].toarray().ravel()
+            assert numpy.array_equal(exp_values, obs_values)
+            for summary_att in ['quants', 'mean', 'histo_num_zeros',
+                    'histo_bin_start_x', 'histo_bin_end_x',
+                    'histo_bin_height_y']:
+                assert exp_node.get_attribute(summary_att) == \
+                    obs_node.get_attribute(summary_att)
+
+    obs_max = cohort_analysis.find_effective_max_unique_otus_of_matrix(
+        tax_matrix, metrics['num_unique_otus_per_sample'])
+    assert exp_max == obs_max
+    return
+
+def test_normalized_entropy_parity():
+    """
+    the normalized entropies from sums of c and c*ln(c) match the
+    skbio-based tree-walking computation at every node
+    """
+    otu_defs, geno_samples, cohort_def = _make_otus_and_samples(1, 80, 25)
+    geno_sample_lst = cohort_analysis.subset_samples_by_cohort(
+        geno_samples, cohort_def)
+    empty_tree = otu_analysis.compute_taxonomy_tree(otu_defs)
+    tax_matrix = taxonomy_matrix.TaxonomyMatrix(empty_tree, otu_defs)
+
+    exp_tree = empty_tree.copy()
+    cohort_analysis.sum_gross_counts_per_sample(exp_tree, otu_defs,
+        geno_sample_lst)
+    cohort_analysis.compute_normalized_entropy_per_sample(exp_tree)
+
+    counts = tax_matrix.build_counts_matrix(geno_sample_lst)
+    gross_counts = tax_matrix.sum_gross_counts(counts)
+    entropies = tax_matrix.compute_normalized_entropies(gross_counts)
+
+    num_nonzero = 0
+    for node in taxonomy_matrix.get_nodes_by_idx(exp_tree):
+        exp_values = node.get_attribute(
+            'normalized_entropy_per_sample').to_npary()
+        obs_values = entropies[:, node.get_attribute(
+            'node_idx')].toarray().ravel()
+        assert numpy.allclose(exp_values, obs_values, rtol=1e-12, atol=1e-15)
+        assert numpy.array_equal(exp_values > 0.0, obs_values > 0.0)
+        num_nonzero += numpy.count_nonzero(obs_values)
+    assert num_nonzero > 0
+    return
+
+def test_base_metrics_for_cohorts(tmpdir):
+    """
+    the base metrics computed in worker processes and spilled to disk are
+    the same as computing them one cohort at a time, and give the same
+    global max unique otus
+    """
+    otu_defs, geno_samples, cohort_def = _make_otus_and_samples(2, 50, 30)
+    cohort_tles = [cohort_def,
+        _FakeEntry({'display_name_short': 'evens',
+            'sample_ids': range(0, 30, 2)}),
+        _FakeEntry({'display_name_short': 'first',
+            'sample_ids': [0]})]
+    empty_tree = otu_analysis.compute_taxonomy_tree(otu_defs)
+    tax_matrix = taxonomy_matrix.TaxonomyMatrix(empty_tree, otu_defs)
+
+    spilled_paths, spilled_maxes = \
+        cohort_analysis.compute_base_metrics_for_cohorts(cohort_tles,
+            geno_samples, tax_matrix, num_workers=2, spill_dir=str(tmpdir))
+    exp_maxes = list()
+    for cohort, file_path, obs_max in zip(cohort_tles, spilled_paths,
+            spilled_maxes):
+        exp_metrics = cohort_analysis.compute_cohort_metrics(cohort,
+            geno_samples, tax_matrix)
+        obs_metrics = cohort_analysis.load_cohort_metrics(file_path)
+        assert sorted(exp_metrics.keys()) == sorted(obs_metrics.keys())
+        for metric_name in exp_metrics:
+            assert exp_metrics[metric_name].shape == \
+                obs_metrics[metric_name].shape
+            assert (exp_metrics[metric_name] != \
+                obs_metrics[metric_name]).nnz == 0
+        exp_max = cohort_analysis.find_effective_max_unique_otus_of_matrix(
+            tax_matrix, exp_metrics['num_unique_otus_per_sample'])
+        assert exp_max == obs_max
+        exp_maxes.append(exp_max)
+
+    _, obs_maxes = cohort_analysis.compute_base_metrics_for_cohorts(
+        cohort_tles, geno_samples, tax_matrix)
+    assert obs_maxes == exp_maxes
+    assert cohort_analysis.compute_global_max_unique_otus(obs_maxes) == \
+        math.ceil(max(exp_maxes) / 100.0) * 100.0
+    return
+
+def test_build_counts_matrix_of_shared_rows():
+    """
+    samples whose otu counts are rows of one shared csr matrix give the
+    same counts matrix as samples with SparseArrays
+    """
+    otu_defs, geno_samples, cohort_def = _make_otus_and_samples(3, 40, 20)
+    empty_tree = otu_analysis.compute_taxonomy_tree(otu_defs)
+    tax_matrix = taxonomy_matrix.TaxonomyMatrix(empty_tree, otu_defs)
+    geno_sample_lst = cohort_analysis.subset_samples_by_cohort(
+        geno_samples, cohort_def)
+    exp_counts = tax_matrix.build_counts_matrix(geno_sample_lst)
+
+    shared = scipy.sparse.csr_matrix(numpy.array([
+        sample.get_value('otu_counts').to_npary() for sample in
+        reversed(geno_sample_lst)]))
+    shared.sort_indices()
+    num_samples = len(geno_sample_lst)
+    view_samples = [_FakeEntry({'otu_counts': SparseMatrixRow(shared,
+        num_samples - 1 - idx)}) for idx in range(num_samples)]
+    obs_counts = tax_matrix.build_counts_matrix(view_samples)
+    assert obs_counts.shape == exp_counts.shape
+    assert (obs_counts != exp_counts).nnz == 0
+    return
@@ -0,0 +1,61 @@
+import csv
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+import nest_py.ops.compile_ops as compile_ops
+compile_ops.load_libsrc()
+import feature_stats
+
+def _assert_close(observed, expected):
+    assert np.isnan(observed) == np.isnan(expected)
+    if not np.isnan(expected):
+        assert abs(observed - expected) < 1e-10
+
+def test_correlations_with_match_pandas():
+    """
+    Tests the correlations of all features at once against pandas'
+    one-column-at-a-time results, with ties in the features and in the
+    response, and a constant feature. The sample counts include a power of
+    two, which fills Kendall's binary indexed trees up to the root.
+    """
+    rand_state = np.random.RandomState(0)
+    for num_samples in [32, 37]:
+        x = rand_state.randint(0, 6, size=(num_samples, 12)).astype(float)
+        x[:, :6] = rand_state.rand(num_samples, 6)
+        x[:, 11] = 1.0
+        y = rand_state.randint(0, 4, size=num_samples).astype(float)
+
+        ranks, tied_pairs = feature_stats.rank_columns(x)
+        correlations = feature_stats.correlations_with(x, y)
+        for i in range(x.shape[1]):
+            assert np.array_equal(ranks[:, i], rankdata(x[:, i]))
+            counts = np.bincount(np.unique(x[:, i], return_inverse=True)[1])
+            assert tied_pairs[i] == (counts * (counts - 1) // 2).sum()
+            for method in ['pearson', 'spearman', 'kendall']:
+                expected = pd.Series(x[:, i]).corr(pd.Series(y),
+                    method=method)
+                _assert_close(correlations[method][i], expected)
+
+def test_write_mic_csv(tmpdir, monkeypatch):
+    """
+    Tests that the MIC matrix is written as csv that reads back with its
+    feature names intact, even names with commas and quotes, and its values
+    unrounded.
+    """
+    def _fake_mic_block(x, start, end):
+        return np.corrcoef(x.T)[start:end, :] / 3.0
+    monkeypatch.setattr(feature_stats, '__compute_mic_block', _fake_mic_block)
+    rand_state = np.random.RandomState(0)
+    names = ['plain', 'with,comma', 'with "quotes"', 'last']
+    df_x = pd.DataFrame(rand_state.rand(10, 4), columns=names)
+    path = str(tmpdir.join('mic.csv'))
+    feature_stats.write_mic_csv(df_x, path, block_size=3)
+
+    with open(path, 'rb') as in_file:
+        rows = list(csv.reader(in_file))
+    assert rows[0] == ['feature'] + names
+    assert [row[0] for row in rows[1:]] == names
+    mic = np.array([[float(value) for value in row[1:]] for row in rows[1:]])
+    assert np.array_equal(mic, np.corrcoef(df_x.values.T) / 3.0)
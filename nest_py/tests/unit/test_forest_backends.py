@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+import nest_py.ops.compile_ops as compile_ops
+compile_ops.load_libsrc()
+import forest_backends
+import forest_benchmark
+import refuse
+
+NUM_INFORMATIVE = 3
+
+def _make_regression_data(num_samples=60, num_features=40, seed=0):
+    """Returns a random regression data set whose response is the sum of the
+    first NUM_INFORMATIVE features plus a little noise."""
+    rng = np.random.RandomState(seed)
+    values = rng.normal(size=(num_samples, num_features))
+    s_y = pd.Series(values[:, :NUM_INFORMATIVE].sum(axis=1) + \
+        rng.normal(scale=0.1, size=num_samples))
+    df_x = pd.DataFrame(values,
+        columns=['f' + str(i) for i in range(num_features)])
+    return df_x, s_y
+
+def _assert_informative_first(df_x, s_y, mode):
+    backend = forest_backends.get_backend('sklearn')
+    x = np.ascontiguousarray(df_x.values, dtype=np.float64)
+    vims = backend.compute_vims(x, s_y, ntree=100, mtry=6, node_size=1,
+        mode=mode, seed=3)
+    assert len(vims) == df_x.shape[1]
+    assert sorted(np.argsort(-vims)[:NUM_INFORMATIVE]) == \
+        list(range(NUM_INFORMATIVE))
+    # the same seed grows the same forest
+    assert np.array_equal(vims, backend.compute_vims(x, s_y, ntree=100,
+        mtry=6, node_size=1, mode=mode, seed=3))
+    assert not np.array_equal(vims, backend.compute_vims(x, s_y, ntree=100,
+        mtry=6, node_size=1, mode=mode, seed=4))
+
+def test_classification_vims():
+    """
+    Tests that the sklearn backend's MeanDecreaseAccuracy ranks the
+    informative features first, and that it only depends on the seed.
+    """
+    df_x, s_y = forest_benchmark.make_random_data(num_samples=60,
+        num_features=40, num_informative=NUM_INFORMATIVE)
+    _assert_informative_first(df_x, s_y, 'classification')
+
+def test_regression_vims():
+    """
+    Tests that the sklearn backend's IncNodePurity ranks the informative
+    features first, and that it only depends on the seed.
+    """
+    df_x, s_y = _make_regression_data()
+    _assert_informative_first(df_x, s_y, 'regression')
+
+def test_refuse_with_sklearn(tmpdir, monkeypatch):
+    """
+    Tests a small REFUSE run end to end on the sklearn backend, with and
+    without Instance Cross Validation.
+    """
+    # refuse writes its tables to the working directory
+    monkeypatch.chdir(str(tmpdir))
+    df_x, s_y = forest_benchmark.make_random_data(num_samples=12,
+        num_features=10, num_informative=NUM_INFORMATIVE)
+    for iss in [False, True]:
+        refuse_table = refuse.refuse(df_x, s_y, ntree=20, mtry=3,
+            node_size=1, mode='classification', cores=1, outer_reps=2,
+            inner_reps=2, iss=iss, backend='sklearn')
+        # a row for each feature, then one for each shadow
+        assert refuse_table.index.tolist()[:df_x.shape[1]] == \
+            df_x.columns.tolist()
+        assert len(refuse_table) == 2 * df_x.shape[1]
+        assert not refuse_table.isnull().values.any()
+        assert tmpdir.join('REFUSE_Table.csv').check()
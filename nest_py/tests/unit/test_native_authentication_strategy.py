@@ -16,7 +16,9 @@ class MockApp(object):
             'JWT_SECRET': 'secret0',
             'JWT_ISSUER': 'issuer0',
             'JWT_AUDIENCES': ['audience0'],
-            'JWT_LIFESPAN': 1.0})
+            'JWT_LIFESPAN': 1.0,
+            'REDIS_HOST': 'redis',
+            'AUTH_REDIS_DB': 2})
         return
 
 GOOD_USER_CONFIGS = [
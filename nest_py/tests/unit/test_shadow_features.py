@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+import nest_py.ops.compile_ops as compile_ops
+compile_ops.load_libsrc()
+import shadow_features
+
+def _make_features(num_samples, num_features):
+    rand_state = np.random.RandomState(0)
+    return pd.DataFrame(rand_state.rand(num_samples, num_features),
+        index=['sample' + str(i) for i in range(num_samples)],
+        columns=['feature' + str(i) for i in range(num_features)])
+
+def test_same_seed_same_permutations():
+    """
+    Tests that a plan's permutations only depend on its seed, and that each
+    shadow is its feature shuffled by its own permutation.
+    """
+    plan = shadow_features.ShadowPlan(20, 50, 7)
+    row_idxs = plan.get_row_idxs()
+    assert row_idxs.shape == (20, 50)
+    assert np.array_equal(row_idxs,
+        shadow_features.ShadowPlan(20, 50, 7).get_row_idxs())
+    assert not np.array_equal(row_idxs,
+        shadow_features.ShadowPlan(20, 50, 8).get_row_idxs())
+    for i in range(50):
+        assert sorted(row_idxs[:, i]) == list(range(20))
+
+    x = _make_features(20, 50).values
+    shadows = plan.make_shadows(x)
+    for i in range(50):
+        assert np.array_equal(shadows[:, i], x[row_idxs[:, i], i])
+    assert np.array_equal(plan.append_shadows(x), np.hstack([x, shadows]))
+
+def test_add_shadows_matches_column_by_column():
+    """
+    Tests that add_shadows gives the same shadows as shuffling one column at
+    a time with the global random state, as refuse used to.
+    """
+    df_x = _make_features(15, 30)
+    np.random.seed(3)
+    expected = df_x.copy()
+    for i in range(df_x.shape[1]):
+        col = df_x.iloc[:, i]
+        expected['shadow_' + str(i)] = \
+            col.reindex(np.random.permutation(col.index)).values
+
+    df_combined = shadow_features.add_shadows(df_x, 3)
+    assert list(df_combined.columns) == list(expected.columns)
+    assert list(df_combined.index) == list(df_x.index)
+    assert np.array_equal(df_combined.values, expected.values)
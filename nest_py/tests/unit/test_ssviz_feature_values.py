@@ -0,0 +1,156 @@
+"""Tests the SsvizFeatureValuesEndpoint and SsvizFeatureBinsEndpoint in
+nest_py.knoweng.flask.nest_endpoints.ssviz_endpoints"""
+import json
+
+import flask
+import pytest
+
+import nest_py.core.data_types.typed_array as typed_array
+
+#the endpoints module needs the job queue client
+pytest.importorskip('redis')
+import nest_py.knoweng.flask.nest_endpoints.ssviz_endpoints as ssviz_endpoints
+
+class MockFeatureDataClient(object):
+    """Serves ssviz_feature_data rows from memory and records the queries."""
+
+    def __init__(self, values_by_idx):
+        self.rows = [{'id': 100 + idx, 'feature_idx': idx, \
+            'ssviz_spreadsheet_id': 7, \
+            'values': buffer(typed_array.encode(vals, compress=True))} \
+            for idx, vals in values_by_idx.items()]
+        self.queries = list()
+        return
+
+    def simple_filter_query(self, filter_params, user=None, fields=None,
+        sort_fields=None):
+        self.queries.append((filter_params, fields))
+        found = list()
+        for row in self.rows:
+            if row['ssviz_spreadsheet_id'] == filter_params['ssviz_spreadsheet_id'] \
+                and row['feature_idx'] in filter_params['feature_idx']:
+                found_row = {field: row[field] for field in fields}
+                found_row['id'] = row['id']
+                found.append(found_row)
+        return found
+
+class MockSpreadsheetsClient(object):
+    """Serves the one ssviz_spreadsheets row."""
+
+    def __init__(self, rows=None):
+        if rows is None:
+            rows = [{'id': 7, \
+                'feature_types': ['numeric', 'categoric', 'other']}]
+        self.rows = rows
+        return
+
+    def simple_filter_query(self, filter_params, user=None, fields=None,
+        sort_fields=None):
+        return self.rows
+
+VALUES_BY_IDX = {
+    0: [1.5, None, -2.0, 4.25],
+    1: ['a', 'b', None, 'a'],
+    2: [3, 1, 4, 1]}
+
+def _get_bins(endpoint, query_string):
+    app = flask.Flask(__name__)
+    with app.test_request_context('/?' + query_string):
+        resp = endpoint.do_GET(flask.request, None)
+    return resp
+
+def _get(query_string):
+    client = MockFeatureDataClient(VALUES_BY_IDX)
+    endpoint = ssviz_endpoints.SsvizFeatureValuesEndpoint(client, None)
+    app = flask.Flask(__name__)
+    with app.test_request_context('/?' + query_string):
+        resp = endpoint.do_GET(flask.request, None)
+    return client, resp
+
+def test_feature_values():
+    """Tests fetching several features in one query."""
+    client, resp = _get('ssviz_spreadsheet_id=7&feature_idxs=2,0,9,0,1')
+    assert resp.status_code == 200
+    payload = json.loads(resp.get_data())
+    assert payload['feature_idxs'] == [2, 0, 9, 0, 1]
+    assert payload['sample_idxs'] is None
+    assert payload['values'] == [VALUES_BY_IDX[2], VALUES_BY_IDX[0], None, \
+        VALUES_BY_IDX[0], VALUES_BY_IDX[1]]
+    assert len(client.queries) == 1
+    filter_params, fields = client.queries[0]
+    assert filter_params['feature_idx'] == [0, 1, 2, 9]
+    assert fields == ['feature_idx', 'values']
+
+def test_feature_values_sample_subset():
+    """Tests fetching the values of only some samples."""
+    _, resp = _get('ssviz_spreadsheet_id=7&feature_idxs=0,1&sample_idxs=3,0')
+    assert resp.status_code == 200
+    payload = json.loads(resp.get_data())
+    assert payload['sample_idxs'] == [3, 0]
+    assert payload['values'] == [[4.25, 1.5], ['a', 'a']]
+
+def test_feature_values_bad_params():
+    """Tests the responses to missing or malformed params."""
+    _, resp = _get('feature_idxs=0')
+    assert resp.status_code == 400
+    _, resp = _get('ssviz_spreadsheet_id=7&feature_idxs=0,x')
+    assert resp.status_code == 400
+    _, resp = _get('ssviz_spreadsheet_id=7&feature_idxs=0&sample_idxs=10')
+    assert resp.status_code == 400
+    #numpy would count a negative index from the end
+    _, resp = _get('ssviz_spreadsheet_id=7&feature_idxs=0&sample_idxs=0,-1')
+    assert resp.status_code == 400
+    _, resp = _get('ssviz_spreadsheet_id=7&feature_idxs=-1')
+    assert resp.status_code == 400
+
+def test_feature_bins():
+    """Tests summarizing several features, and that the summaries are
+    cached."""
+    client = MockFeatureDataClient(VALUES_BY_IDX)
+    endpoint = ssviz_endpoints.SsvizFeatureBinsEndpoint(\
+        client, MockSpreadsheetsClient(), None)
+    query_string = \
+        'ssviz_spreadsheet_id=7&feature_idxs=1,0,2,9&num_bins=2&sample_idxs=3,2,1,0'
+    resp = _get_bins(endpoint, query_string)
+    assert resp.status_code == 200
+    payload = json.loads(resp.get_data())
+    assert payload['bin_starts'] == [0, 2]
+    assert payload['summaries'] == [\
+        {'feature_type': 'categoric', 'categories': ['a', 'b'], \
+            'counts': [[1, 0], [1, 1]]},
+        {'feature_type': 'numeric', 'mean': [1.125, 1.5], \
+            'min': [-2.0, 1.5], 'max': [4.25, 1.5]},
+        None,
+        None]
+    # one query for the record ids, one for the values
+    assert len(client.queries) == 2
+    assert client.queries[1][1] == ['feature_idx', 'values']
+    assert len(endpoint.cache) == 3
+
+    resp = _get_bins(endpoint, query_string)
+    assert json.loads(resp.get_data()) == payload
+    # only the record ids the second time
+    assert len(client.queries) == 3
+    assert client.queries[2][1] == ['feature_idx']
+
+def test_feature_bins_bad_params():
+    """Tests the responses to missing or malformed params."""
+    endpoint = ssviz_endpoints.SsvizFeatureBinsEndpoint(\
+        MockFeatureDataClient(VALUES_BY_IDX), MockSpreadsheetsClient(), None)
+    resp = _get_bins(endpoint, 'ssviz_spreadsheet_id=7&feature_idxs=0')
+    assert resp.status_code == 400
+    resp = _get_bins(endpoint, \
+        'ssviz_spreadsheet_id=7&feature_idxs=0&num_bins=0')
+    assert resp.status_code == 400
+    resp = _get_bins(endpoint, \
+        'ssviz_spreadsheet_id=7&feature_idxs=0&num_bins=2&sample_idxs=0,-1')
+    assert resp.status_code == 400
+
+def test_feature_bins_missing_spreadsheet():
+    """Tests that features whose spreadsheet row is gone, or unreadable,
+    get a 404."""
+    endpoint = ssviz_endpoints.SsvizFeatureBinsEndpoint(\
+        MockFeatureDataClient(VALUES_BY_IDX), MockSpreadsheetsClient([]), \
+        None)
+    resp = _get_bins(endpoint, 'ssviz_spreadsheet_id=7&feature_idxs=0&num_bins=2')
+    assert resp.status_code == 404
@@ -0,0 +1,149 @@
+"""Tests nest_py.core.flask.accounts.token_cache and its use by
+NativeAuthenticationStrategy.authenticate_token"""
+from datetime import datetime, timedelta
+
+import flask
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from nest_py.core.data_types.nest_id import NestId
+from nest_py.core.data_types.nest_user import NestUser
+from nest_py.core.flask.accounts.authentication import \
+    NativeAuthenticationStrategy
+from nest_py.core.flask.accounts.token_cache import VerifiedTokenCache
+from nest_py.tests.unit.test_token_revocations import MockRedis
+
+def make_user(nid=11):
+    nu = NestUser(NestId(nid), 'usernm1', 'given_nm1', 'family_nm1', \
+        thumb_url='thumbu1')
+    return nu
+
+def test_get_put():
+    cache = VerifiedTokenCache()
+    user = make_user()
+    in_an_hour = datetime.now() + timedelta(hours=1)
+    assert cache.get('tkn1') is None
+    cache.put('tkn1', user, in_an_hour)
+    assert cache.get('tkn1') == user
+    assert cache.get('tkn2') is None
+
+def test_expiry():
+    cache = VerifiedTokenCache(max_age=timedelta(hours=1))
+    user = make_user()
+    cache.put('expired', user, datetime.now() - timedelta(seconds=1))
+    assert cache.get('expired') is None
+    assert len(cache) == 0
+
+    cache = VerifiedTokenCache(max_age=timedelta(seconds=-1))
+    cache.put('too_old', user, datetime.now() + timedelta(hours=1))
+    assert cache.get('too_old') is None
+
+def test_max_entries():
+    cache = VerifiedTokenCache(max_entries=2)
+    in_an_hour = datetime.now() + timedelta(hours=1)
+    cache.put('tkn1', make_user(1), in_an_hour)
+    cache.put('tkn2', make_user(2), in_an_hour)
+    assert cache.get('tkn1') is not None
+    #tkn2 is now the least recently used
+    cache.put('tkn3', make_user(3), in_an_hour)
+    assert len(cache) == 2
+    assert cache.get('tkn2') is None
+    assert cache.get('tkn1') is not None
+    assert cache.get('tkn3') is not None
+
+def test_drop():
+    cache = VerifiedTokenCache()
+    in_an_hour = datetime.now() + timedelta(hours=1)
+    cache.put('tkn1', make_user(), in_an_hour)
+    cache.put('tkn2', make_user(), in_an_hour)
+    cache.drop('tkn1')
+    cache.drop('tkn3')
+    assert cache.get('tkn1') is None
+    assert cache.get('tkn2') is not None
+
+class MockUsersClient(object):
+    """Serves the user's db record from memory and counts the reads."""
+
+    def __init__(self, nest_user):
+        self.user_tle = nest_user.to_tablelike_entry()
+        self.num_reads = 0
+        return
+
+    def read_entry(self, nest_id):
+        self.num_reads += 1
+        return self.user_tle
+
+def _make_app():
+    app = flask.Flask(__name__)
+    app.config.update({
+        'JWT_SECRET': 'secret0',
+        'JWT_ISSUER': 'issuer0',
+        'JWT_AUDIENCES': ['audience0'],
+        'JWT_LIFESPAN': timedelta(hours=1)})
+    return app
+
+def test_authenticate_token():
+    app = _make_app()
+    user = make_user()
+    users_client = MockUsersClient(user)
+    auth = NativeAuthenticationStrategy(app, users_client, \
+        redis_connection=MockRedis())
+    tkn = auth.create_token_for_user(user)
+    headers = {'Authorization': 'Bearer ' + tkn}
+    with app.test_request_context('/', headers=headers):
+        assert auth.authenticate_token(flask.request) == user
+        assert auth.authenticate_token(flask.request) == user
+        #the second request was served from the cache
+        assert users_client.num_reads == 1
+
+        #logging out
+        assert auth.revoke_token(flask.request)
+        assert auth.authenticate_token(flask.request) is None
+
+    with app.test_request_context('/'):
+        assert auth.authenticate_token(flask.request) is None
+        assert not auth.revoke_token(flask.request)
+
+def test_revoke_in_other_process():
+    """
+    a token revoked by one process is rejected by another that has it
+    cached, as the web app's processes share the revocations in redis
+    """
+    app = _make_app()
+    user = make_user(12)
+    redis_connection = MockRedis()
+    auth0 = NativeAuthenticationStrategy(app, MockUsersClient(user), \
+        redis_connection=redis_connection)
+    auth1 = NativeAuthenticationStrategy(app, MockUsersClient(user), \
+        redis_connection=redis_connection)
+    tkn = auth0.create_token_for_user(user)
+    headers = {'Authorization': 'Bearer ' + tkn}
+    with app.test_request_context('/', headers=headers):
+        assert auth0.authenticate_token(flask.request) == user
+        assert auth1.authenticate_token(flask.request) == user
+        assert auth1.revoke_token(flask.request)
+        assert auth0.authenticate_token(flask.request) is None
+        #and it's dropped from the other process's cache
+        assert len(auth0.token_cache) == 0
+
+class UnreachableRedis(object):
+    """A redis connection whose server is down."""
+
+    def exists(self, key):
+        raise RedisConnectionError('Error 111 connecting to redis:6379.')
+
+def test_authenticate_token_without_redis():
+    """
+    if redis can't be reached, revocations can't be checked, and tokens that
+    are otherwise valid are accepted rather than failing every request
+    """
+    app = _make_app()
+    user = make_user(13)
+    users_client = MockUsersClient(user)
+    auth = NativeAuthenticationStrategy(app, users_client, \
+        redis_connection=UnreachableRedis())
+    tkn = auth.create_token_for_user(user)
+    headers = {'Authorization': 'Bearer ' + tkn}
+    with app.test_request_context('/', headers=headers):
+        assert auth.authenticate_token(flask.request) == user
+        assert auth.authenticate_token(flask.request) == user
+        assert users_client.num_reads == 1
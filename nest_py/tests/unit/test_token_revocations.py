@@ -0,0 +1,55 @@
+"""Tests nest_py.core.flask.accounts.token_revocations"""
+from datetime import datetime, timedelta
+
+from nest_py.core.flask.accounts.token_revocations import TokenRevocations
+
+class MockRedis(object):
+    """Just enough of redis.Redis for the token revocations, without
+    expiry."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def exists(self, key):
+        return key in self.data
+
+    def pipeline(self):
+        return MockPipeline(self)
+
+class MockPipeline(object):
+    def __init__(self, redis_connection):
+        self.redis_connection = redis_connection
+        self.commands = []
+
+    def set(self, key, value):
+        self.commands.append(\
+            lambda: self.redis_connection.data.__setitem__(key, str(value)))
+
+    def expire(self, key, ttl):
+        self.commands.append(\
+            lambda: self.redis_connection.ttls.__setitem__(key, ttl))
+
+    def execute(self):
+        for command in self.commands:
+            command()
+
+def test_revoke():
+    redis_connection = MockRedis()
+    revocations = TokenRevocations(redis_connection)
+    in_an_hour = datetime.now() + timedelta(hours=1)
+    assert not revocations.is_revoked('tkn1')
+    revocations.revoke('tkn1', in_an_hour)
+    assert revocations.is_revoked('tkn1')
+    assert not revocations.is_revoked('tkn2')
+    # the token itself isn't stored
+    assert not any('tkn1' in key for key in redis_connection.data)
+    # redis forgets the revocation when the token expires
+    assert redis_connection.ttls.values() == [3600]
+    # an expired token is rejected anyway, so it isn't stored
+    revocations.revoke('tkn3', datetime.now() - timedelta(seconds=1))
+    assert not revocations.is_revoked('tkn3')
+    assert len(redis_connection.data) == 1
+
+    # another process sees the revocation
+    assert TokenRevocations(redis_connection).is_revoked('tkn1')
@@ -0,0 +1,73 @@
+import binascii
+
+import numpy as np
+
+import nest_py.core.data_types.typed_array as typed_array
+import nest_py.core.db.tablelike_copy as tablelike_copy
+from nest_py.core.data_types.tablelike_entry import TablelikeEntry
+from nest_py.core.data_types.tablelike_schema import TablelikeSchema
+
+def test_round_trips():
+    cases = [
+        ([1, 2, 300], 'int16', [1, 2, 300]),
+        (np.array([-5, 7], dtype=np.int64), 'int8', [-5, 7]),
+        ([0.5, None, 2], 'float64', [0.5, None, 2.0]),
+        (np.array([0.25, np.nan]), 'float64', [0.25, None]),
+        ([u'b', None, u'a', u'b', float('nan')], 'categoric',
+            [u'b', None, u'a', u'b', None]),
+        ([1, u'x', 1.0, True], 'categoric', [1, u'x', 1.0, True]),
+        ([], 'float64', []),
+        ]
+    for values, exp_encoding, exp_list in cases:
+        for compress in [False, True]:
+            blob = typed_array.encode(values, compress=compress)
+            assert(typed_array.get_encoding(blob) == exp_encoding)
+            obs_list = typed_array.decode_to_list(buffer(blob))
+            assert(obs_list == exp_list)
+            assert([type(v) for v in obs_list] == \
+                [type(v) for v in exp_list])
+    return
+
+def test_float32_and_compression():
+    values = np.arange(1000) / 3.0
+    blob64 = typed_array.encode(values)
+    blob32 = typed_array.encode(values, float_encoding='float32')
+    assert(typed_array.get_encoding(blob32) == 'float32')
+    assert(len(blob32) < len(blob64))
+    obs = typed_array.decode(blob32)
+    assert(obs.dtype == np.float32)
+    assert(np.allclose(obs, values))
+
+    #compression is only used if it helps
+    repetitive = [u'case', u'control'] * 500
+    plain = typed_array.encode(repetitive)
+    compressed = typed_array.encode(repetitive, compress=True)
+    assert(len(compressed) < len(plain))
+    assert(typed_array.decode_to_list(compressed) == repetitive)
+    return
+
+def test_typed_array_attribute():
+    schema = TablelikeSchema('typed_test')
+    schema.add_typed_array_attribute('values', compress=True)
+    schema = TablelikeSchema.from_jdata(schema.to_jdata())
+    att = schema.get_attributes()[0]
+    assert(att.get_type() == 'TypedArray')
+    assert(att.compress)
+
+    tle = TablelikeEntry(schema)
+    tle.set_value('values', np.array([1.5, np.nan]))
+    #over the api, a plain list
+    assert(schema.object_to_jdata(tle)['values'] == [1.5, None])
+    #in the db, the encoded bytes
+    flat = schema.object_to_flat_jdata(tle)
+    assert(typed_array.get_encoding(flat['values']) == 'float64')
+    assert(schema.flat_jdata_to_object(flat).get_value('values') == \
+        [1.5, None])
+
+    formatters = tablelike_copy.make_copy_formatters(schema, ['values'])
+    field = formatters[0]([u'a', None])
+    assert(field.startswith('\\\\x'))
+    blob = binascii.unhexlify(field[3:])
+    assert(typed_array.decode_to_list(blob) == [u'a', None])
+    assert(formatters[0](None) == tablelike_copy.COPY_NULL)
+    return
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_frame_equal, assert_series_equal
+from scipy.stats import ttest_ind
+
+import nest_py.ops.compile_ops as compile_ops
+compile_ops.load_libsrc()
+from vim_accumulator import VimAccumulator
+
+# the DataFrame-based implementation VimAccumulator replaced, from refuse.py
+
+def _structure_melted(df_vim_melted):
+    grouped = df_vim_melted.groupby('Feature.Name')
+    return pd.concat([
+        pd.Series(list(group['vim']), name=name) for name, group in grouped
+        ], axis=1)
+
+def _consolidate_importance(df_vim_structured):
+    return_val = df_vim_structured.mean(axis=0)
+    return_val.name = 'VIM_mean'
+    return return_val
+
+def _consolidate_stability(df_vim_structured):
+    return_val = df_vim_structured.var(axis=0)
+    return_val.name = 'VIM_var'
+    return return_val
+
+def _shadow_test(df_vim_structured):
+    s_ttest = None
+    top_shadow_name = None
+    s_shadow_mean_vims = df_vim_structured.filter(regex='shadow_').mean()
+    if s_shadow_mean_vims.size > 0:
+        top_shadow_name = s_shadow_mean_vims.idxmax()
+        ttests = ttest_ind(df_vim_structured[top_shadow_name],
+            df_vim_structured, equal_var=False)
+        s_ttest = pd.Series(
+            [p/2 if t > 0 else 1-p/2 for t, p in zip(ttests[0], ttests[1])],
+            index=df_vim_structured.columns.values, name='p_val')
+    else:
+        s_ttest = pd.Series([-1 for x in xrange(df_vim_structured.shape[1])],
+            index=df_vim_structured.columns.values, name='p_val')
+    return [s_ttest, top_shadow_name]
+
+def _fill(feature_names, num_shadows, vims):
+    """
+    Adds the rows of vims to a new VimAccumulator in two batches, and returns
+    it with the melted frame the old implementation would have built.
+    """
+    accumulator = VimAccumulator(feature_names, vims.shape[0],
+        num_shadows=num_shadows)
+    half = vims.shape[0] // 2
+    accumulator.add_reps(0, list(vims[:half]))
+    accumulator.add_reps(half, list(vims[half:]))
+    all_names = list(feature_names) + \
+        ['shadow_' + str(i) for i in range(num_shadows)]
+    df_vim_melted = pd.DataFrame()
+    for rep_vims in vims:
+        df_vim_melted = df_vim_melted.append(pd.DataFrame(
+            {'Feature.Name': all_names, 'vim': rep_vims},
+            columns=['Feature.Name', 'vim']), ignore_index=True)
+    return accumulator, df_vim_melted
+
+def _check_same_as_old(accumulator, df_vim_melted):
+    assert_frame_equal(accumulator.to_melted(), df_vim_melted)
+    df_vim_structured = _structure_melted(df_vim_melted)
+    assert_frame_equal(accumulator.to_structured(), df_vim_structured)
+    assert_series_equal(accumulator.get_means(),
+        _consolidate_importance(df_vim_structured))
+    assert_series_equal(accumulator.get_vars(),
+        _consolidate_stability(df_vim_structured))
+    s_ttest, top_shadow_name = accumulator.shadow_test()
+    old_ttest, old_top_shadow_name = _shadow_test(df_vim_structured)
+    assert_series_equal(s_ttest, old_ttest)
+    assert top_shadow_name == old_top_shadow_name
+    return top_shadow_name
+
+def test_same_as_dataframes():
+    """
+    Tests that the accumulator's outputs match the DataFrame-based
+    implementation's, including which shadow wins a tie for the highest
+    mean, where 'shadow_10' sorts before 'shadow_2'.
+    """
+    feature_names = ['gene_b', 'gene_a', 'gene_c']
+    num_shadows = 12
+    rand_state = np.random.RandomState(0)
+    vims = rand_state.rand(6, len(feature_names) + num_shadows)
+    # shadow_2 and shadow_10 tie for the highest mean
+    vims[:, len(feature_names):] *= 0.5
+    vims[:, len(feature_names) + 2] = 2.0
+    vims[:, len(feature_names) + 10] = 2.0
+    accumulator, df_vim_melted = _fill(feature_names, num_shadows, vims)
+    assert _check_same_as_old(accumulator, df_vim_melted) == 'shadow_10'
+    assert list(accumulator.to_structured().columns[:5]) == \
+        ['gene_a', 'gene_b', 'gene_c', 'shadow_0', 'shadow_1']
+
+def test_no_shadows():
+    """
+    Tests that without shadows every p value is -1 and there's no top
+    shadow, as before.
+    """
+    feature_names = ['gene_b', 'gene_a', 'gene_c']
+    vims = np.random.RandomState(1).rand(4, len(feature_names))
+    accumulator, df_vim_melted = _fill(feature_names, 0, vims)
+    assert _check_same_as_old(accumulator, df_vim_melted) is None
+    assert list(accumulator.shadow_test()[0]) == [-1, -1, -1]